@@ -0,0 +1,71 @@
+"""Benchmark of image decoding, serial `cv2.imread` vs `ImageLoader`
+
+When no `--images` directory is given, synthetic jpeg images are written
+to a temporary directory.
+
+To get started using this script, try:
+```
+$ python scripts/benchmark/image_loader.py --n-images 64 --width 1920 --height 1080
+$ python scripts/benchmark/image_loader.py --images path/to/images --min-size 640
+```
+"""
+
+import argparse
+import tempfile
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+
+import utils
+
+from vortex.runtime import ImageLoader
+
+
+def make_images(directory, n_images, width, height):
+    rng = np.random.RandomState(0)
+    ## smooth random image, so it is compressed like natural image
+    base = cv2.resize(rng.randint(0, 255, (height // 16, width // 16, 3), dtype=np.uint8), (width, height))
+    filenames = []
+    for i in range(n_images):
+        filename = Path(directory) / '{:04d}.jpg'.format(i)
+        cv2.imwrite(str(filename), np.roll(base, i, axis=1))
+        filenames.append(filename)
+    return filenames
+
+
+def timed(name, fn, n_images):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print("{:<28} total={:8.1f}ms per image={:7.2f}ms".format(name, elapsed * 1e3, elapsed * 1e3 / n_images))
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.images is None:
+            filenames = make_images(tmpdir, args.n_images, args.width, args.height)
+        else:
+            filenames = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png'))
+        n = len(filenames)
+        print("images: {}".format(n))
+        timed('serial cv2.imread', lambda: [cv2.imread(str(f)) for f in filenames], n)
+        loader = ImageLoader(n_workers=args.n_workers)
+        timed('ImageLoader.load', lambda: loader.load(filenames), n)
+        loader = ImageLoader(n_workers=args.n_workers, min_size=(args.min_size, args.min_size))
+        timed('ImageLoader.load reduced', lambda: loader.load(filenames), n)
+        loader = ImageLoader(n_workers=args.n_workers, prefetch=2)
+        timed('ImageLoader.batches', lambda: list(loader.batches(filenames, batch_size=args.batch_size)), n)
+        print(loader.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--images', type=str, default=None, help="directory of images, default to synthetic images")
+    parser.add_argument('--n-images', type=int, default=64, help="number of synthetic images")
+    parser.add_argument('--width', type=int, default=1920, help="width of synthetic images")
+    parser.add_argument('--height', type=int, default=1080, help="height of synthetic images")
+    parser.add_argument('--n-workers', type=int, default=4, help="number of decoding threads")
+    parser.add_argument('--batch-size', type=int, default=8, help="batch size for `batches`")
+    parser.add_argument('--min-size', type=int, default=224, help="minimum decoded size for reduced decoding")
+    main(parser.parse_args())
@@ -0,0 +1,92 @@
+"""Benchmark of runtime nms, `vortex.runtime.apply_nms` vs onnxruntime's NonMaxSuppression
+
+Random detection candidates of shape [batch, n_candidates], each with a
+single class label as decoded from model exported without nms, are
+suppressed with class-aware nms by `apply_nms` on decoded results and by
+a graph with only onnx NonMaxSuppression on the same candidates, where
+the score of other classes are zero.
+
+To get started using this script, try:
+```
+$ python scripts/benchmark/nms.py --batch-size 8 --n-candidates 2000 --n-classes 20
+```
+"""
+
+import argparse
+import numpy as np
+from collections import OrderedDict
+
+from utils import measure, summarize
+
+from vortex.runtime import apply_nms
+
+
+def make_candidates(batch_size, n_candidates, n_classes, image_size=640):
+    rng = np.random.RandomState(0)
+    xy = rng.uniform(0, image_size, (batch_size, n_candidates, 2))
+    wh = rng.uniform(8, image_size / 4, (batch_size, n_candidates, 2))
+    boxes = np.concatenate([xy, xy + wh], axis=2).astype(np.float32)
+    scores = rng.uniform(0, 1, (batch_size, n_candidates)).astype(np.float32)
+    labels = rng.randint(0, n_classes, (batch_size, n_candidates))
+    return boxes, scores, labels
+
+
+def make_nms_session(n_threads=1):
+    import onnx
+    import onnxruntime
+    from onnx import helper, TensorProto
+
+    inputs = [
+        helper.make_tensor_value_info('boxes', TensorProto.FLOAT, ['n', 'k', 4]),
+        helper.make_tensor_value_info('scores', TensorProto.FLOAT, ['n', 'c', 'k']),
+        helper.make_tensor_value_info('max_output_boxes_per_class', TensorProto.INT64, [1]),
+        helper.make_tensor_value_info('iou_threshold', TensorProto.FLOAT, [1]),
+        helper.make_tensor_value_info('score_threshold', TensorProto.FLOAT, [1]),
+    ]
+    output = helper.make_tensor_value_info('selected', TensorProto.INT64, ['m', 3])
+    node = helper.make_node('NonMaxSuppression', [i.name for i in inputs], ['selected'])
+    graph = helper.make_graph([node], 'nms', inputs, [output])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 7
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = n_threads
+    return onnxruntime.InferenceSession(model.SerializeToString(), options, providers=['CPUExecutionProvider'])
+
+
+def main(args):
+    boxes, scores, labels = make_candidates(args.batch_size, args.n_candidates, args.n_classes)
+    print("candidates: [{}, {}], classes: {}".format(args.batch_size, args.n_candidates, args.n_classes))
+
+    results = [
+        OrderedDict(bounding_box=b, class_confidence=s[:,None], class_label=l[:,None].astype(np.float32))
+            for b, s, l in zip(boxes, scores, labels)
+    ]
+    nms_args = dict(iou_threshold=args.iou_threshold, score_threshold=args.score_threshold)
+    n_numpy = sum(len(r['bounding_box']) for r in apply_nms(results, **nms_args) if r['bounding_box'] is not None)
+    timings = measure(lambda: apply_nms(results, **nms_args), n_iter=args.iterations)
+    print(summarize('numpy apply_nms', timings, unit=1e3, unit_name='ms'), "kept={}".format(n_numpy))
+
+    session = make_nms_session(args.n_threads)
+    class_scores = np.zeros((args.batch_size, args.n_classes, args.n_candidates), dtype=np.float32)
+    np.put_along_axis(class_scores, labels[:,None,:], scores[:,None,:], axis=1)
+    feeds = dict(
+        boxes=boxes, scores=class_scores,
+        max_output_boxes_per_class=np.array([args.n_candidates], dtype=np.int64),
+        iou_threshold=np.array([args.iou_threshold], dtype=np.float32),
+        score_threshold=np.array([args.score_threshold], dtype=np.float32),
+    )
+    n_onnx = len(session.run(None, feeds)[0])
+    timings = measure(lambda: session.run(None, feeds), n_iter=args.iterations)
+    print(summarize('onnxruntime NonMaxSuppression', timings, unit=1e3, unit_name='ms'), "kept={}".format(n_onnx))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--batch-size', type=int, default=8, help="batch size")
+    parser.add_argument('--n-candidates', type=int, default=2000, help="number of candidates per image")
+    parser.add_argument('--n-classes', type=int, default=20, help="number of classes")
+    parser.add_argument('--iou-threshold', type=float, default=0.5, help="nms iou threshold")
+    parser.add_argument('--score-threshold', type=float, default=0.3, help="candidates score threshold")
+    parser.add_argument('--n-threads', type=int, default=1, help="onnxruntime intra-op threads")
+    parser.add_argument('--iterations', type=int, default=100, help="number of measured calls")
+    main(parser.parse_args())
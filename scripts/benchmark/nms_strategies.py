@@ -0,0 +1,152 @@
+"""Benchmark of nms strategies, latency and mAP of torch and runtime (numpy) implementation
+
+Candidates are synthesized from ground truth of the test detection dataset
+(`tests/test_dataset/obj_det`, darknet format): each object gets jittered
+duplicates with scores decreasing with their overlap, some with wrong
+class, plus low-score false positives; the dataset is repeated with random
+shifts to get `--n-images` images. mAP is the mean over classes of all-point
+interpolated AP, at IoU 0.5 and averaged over IoU 0.5:0.95 (COCO).
+
+To get started using this script, try:
+```
+$ python scripts/benchmark/nms_strategies.py --n-images 64 --n-per-object 30
+```
+"""
+
+import argparse
+import time
+import numpy as np
+import torch
+from collections import OrderedDict
+from pathlib import Path
+
+from utils import proj_path
+
+from vortex.development.networks.modules.postprocess.utils.nms_strategy import NMS_STRATEGIES
+from vortex.runtime import apply_nms
+from vortex.runtime.nms import _pairwise_iou
+
+strategy_args = OrderedDict([
+    ('hard', {}),
+    ('soft_gaussian', dict(sigma=0.5, min_score=1e-3)),
+    ('soft_linear', dict(min_score=1e-3)),
+    ('diou', dict(beta=1.)),
+    ('wbf', {}),
+])
+
+
+def load_ground_truth(dataset, image_size):
+    ground_truth = []
+    for filename in sorted((Path(dataset) / 'labels').glob('*.txt')):
+        labels = np.loadtxt(filename, ndmin=2)
+        cxcy, wh = labels[:, 1:3] * image_size, labels[:, 3:5] * image_size
+        ground_truth.append((np.concatenate([cxcy - wh / 2, cxcy + wh / 2], axis=1), labels[:, 0].astype(np.int64)))
+    return ground_truth
+
+
+def make_candidates(ground_truth, n_images, n_per_object, n_classes, image_size, seed=0):
+    rng = np.random.RandomState(seed)
+    images = []
+    for i in range(n_images):
+        boxes, labels = ground_truth[i % len(ground_truth)]
+        boxes = boxes + rng.uniform(-0.1, 0.1, 2).repeat(2) * image_size
+        wh = np.tile(boxes[:, 2:] - boxes[:, :2], 2)
+        candidates = np.repeat(boxes, n_per_object, axis=0) + rng.normal(0, 0.08, (len(boxes) * n_per_object, 4)) * np.repeat(wh, n_per_object, axis=0)
+        candidates = np.concatenate([np.minimum(candidates[:, :2], candidates[:, 2:]), np.maximum(candidates[:, :2], candidates[:, 2:])], axis=1)
+        quality = _pairwise_iou(np.concatenate([boxes, candidates]))[:len(boxes), len(boxes):].max(axis=0)
+        scores = np.clip(quality * rng.uniform(0.6, 1., len(candidates)), 0, 1)
+        candidate_labels = np.repeat(labels, n_per_object)
+        wrong = rng.rand(len(candidates)) < 0.1
+        candidate_labels[wrong] = rng.randint(0, n_classes, wrong.sum())
+        scores[wrong] *= 0.5
+        ## false positives
+        n_false = len(boxes) * n_per_object // 4
+        xy = rng.uniform(0, image_size * 0.9, (n_false, 2))
+        false_boxes = np.concatenate([xy, xy + rng.uniform(8, image_size / 3, (n_false, 2))], axis=1)
+        images.append(dict(
+            ground_truth=(boxes, labels),
+            boxes=np.concatenate([candidates, false_boxes]).astype(np.float32),
+            scores=np.concatenate([scores, rng.uniform(0, 0.3, n_false)]).astype(np.float32),
+            labels=np.concatenate([candidate_labels, rng.randint(0, n_classes, n_false)]),
+        ))
+    return images
+
+
+def average_precision(detections, images, n_classes, iou_threshold):
+    """all-point interpolated AP of each class with ground truth, `detections` is
+    list of (boxes, scores, labels) of each image"""
+    aps = []
+    for c in range(n_classes):
+        n_gt = sum(int(np.sum(image['ground_truth'][1] == c)) for image in images)
+        if not n_gt:
+            continue
+        scores, matched = [], []
+        for (boxes, det_scores, labels), image in zip(detections, images):
+            gt_boxes = image['ground_truth'][0][image['ground_truth'][1] == c]
+            mask = labels == c
+            boxes, det_scores = boxes[mask], det_scores[mask]
+            order = np.argsort(-det_scores, kind='stable')
+            used = np.zeros(len(gt_boxes), dtype=bool)
+            iou = _pairwise_iou(np.concatenate([gt_boxes, boxes[order]]).astype(np.float64))[:len(gt_boxes), len(gt_boxes):]
+            for k in range(len(order)):
+                j = int(np.argmax(iou[:, k])) if len(gt_boxes) else -1
+                hit = j >= 0 and iou[j, k] >= iou_threshold and not used[j]
+                if hit:
+                    used[j] = True
+                matched.append(hit)
+            scores.append(det_scores[order])
+        order = np.argsort(-np.concatenate(scores), kind='stable')
+        tp = np.cumsum(np.asarray(matched, dtype=np.float64)[order])
+        recall = np.concatenate([[0.], tp / n_gt])
+        precision = np.concatenate([[1.], tp / np.arange(1, len(tp) + 1)])
+        precision = np.maximum.accumulate(precision[::-1])[::-1]
+        aps.append(np.sum(np.diff(recall) * precision[1:]))
+    return float(np.mean(aps))
+
+
+def evaluate(name, detections, images, n_classes, elapsed):
+    map50 = average_precision(detections, images, n_classes, 0.5)
+    map = np.mean([average_precision(detections, images, n_classes, t) for t in np.arange(0.5, 0.96, 0.05)])
+    n_kept = sum(len(d[0]) for d in detections)
+    print("{:<28} latency/image={:8.3f}ms mAP@0.5={:.4f} mAP@0.5:0.95={:.4f} kept={}".format(
+        name, elapsed * 1e3 / len(images), map50, map, n_kept))
+
+
+def main(args):
+    names = (proj_path / 'tests' / 'test_dataset' / 'obj_det' / 'names.txt').read_text().split()
+    ground_truth = load_ground_truth(args.dataset, args.image_size)
+    images = make_candidates(ground_truth, args.n_images, args.n_per_object, len(names), args.image_size)
+    print("images: {}, candidates/image: {:.0f}".format(len(images), np.mean([len(i['boxes']) for i in images])))
+    evaluate('no nms', [(i['boxes'], i['scores'], i['labels']) for i in images], images, len(names), 0.)
+    for name, strategy_arg in strategy_args.items():
+        strategy = NMS_STRATEGIES.create_from_dict(name, strategy_arg)
+        tensors = [(torch.from_numpy(i['boxes']), torch.from_numpy(i['scores']), torch.from_numpy(i['labels'])) for i in images]
+        strategy(*tensors[0], torch.tensor([args.iou_threshold]))
+        start = time.perf_counter()
+        outputs = [strategy(boxes, scores, labels, torch.tensor([args.iou_threshold])) for boxes, scores, labels in tensors]
+        elapsed = time.perf_counter() - start
+        detections = [(b.numpy(), s.numpy(), t[2][k].numpy()) for (k, b, s), t in zip(outputs, tensors)]
+        evaluate('torch ' + name, detections, images, len(names), elapsed)
+
+        results = [OrderedDict(bounding_box=i['boxes'], class_confidence=i['scores'][:, None],
+            class_label=i['labels'][:, None]) for i in images]
+        apply_nms(results[:1], iou_threshold=args.iou_threshold, strategy=dict(name=name, **strategy_arg))
+        start = time.perf_counter()
+        outputs = apply_nms(results, iou_threshold=args.iou_threshold, strategy=dict(name=name, **strategy_arg))
+        elapsed = time.perf_counter() - start
+        detections = [
+            (o['bounding_box'], o['class_confidence'][:, 0], o['class_label'][:, 0]) if o['bounding_box'] is not None
+                else (np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.int64)) for o in outputs
+        ]
+        evaluate('numpy ' + name, detections, images, len(names), elapsed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--dataset', type=str, default=str(proj_path / 'tests' / 'test_dataset' / 'obj_det'),
+        help="darknet format detection dataset, with 'labels' directory")
+    parser.add_argument('--n-images', type=int, default=64, help="number of images, dataset is repeated")
+    parser.add_argument('--n-per-object', type=int, default=30, help="number of candidates per object")
+    parser.add_argument('--image-size', type=int, default=640, help="image size, for normalized labels")
+    parser.add_argument('--iou-threshold', type=float, default=0.5, help="nms iou threshold")
+    main(parser.parse_args())
@@ -0,0 +1,57 @@
+"""Micro-benchmark of OnnxRuntime per-call overhead, with and without io binding
+
+When no `--model` is given, a small synthetic model is generated, so the
+model's compute is small and the measured time is dominated by per-call
+overhead (feed marshalling and output allocation).
+
+To get started using this script, try:
+```
+$ python scripts/benchmark/onnx_io_binding.py --batch-size 8 --image-size 64
+$ python scripts/benchmark/onnx_io_binding.py --model experiments/outputs/model.onnx
+```
+"""
+
+import argparse
+import tempfile
+import numpy as np
+from pathlib import Path
+
+from utils import make_synthetic_model, measure, summarize
+
+from vortex.runtime import create_runtime_model
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        model_path = args.model
+        if model_path is None:
+            model_path = Path(tmpdir) / 'synthetic.onnx'
+            make_synthetic_model(model_path, batch_size=args.batch_size, image_size=args.image_size)
+
+        runtime_args = dict(model_path=model_path, runtime=args.runtime)
+        models = dict(
+            session_run=create_runtime_model(**runtime_args),
+            io_binding=create_runtime_model(**runtime_args, io_binding=True),
+        )
+        print("model: {}".format(model_path))
+        print("input: {}".format(models['session_run'].input_specs['input']['shape']))
+        for name, model in models.items():
+            input_shape = model.input_specs['input']['shape']
+            n, h, w, c = type(model).batch_shape(input_shape)
+            images = [np.random.randint(0, 255, (h, w, c), dtype=np.uint8) for _ in range(n)]
+            batch = model.prepare_batch(images)
+            kwargs = {k: 0.5 for k in model.input_specs if k != 'input'}
+            timings = measure(lambda: model.predict(batch, **kwargs), n_iter=args.iterations)
+            print(summarize('{} predict'.format(name), timings))
+            timings = measure(lambda: model(batch, **kwargs), n_iter=args.iterations)
+            print(summarize('{} __call__'.format(name), timings))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--model', type=str, default=None, help="onnx model, default to synthetic model")
+    parser.add_argument('--runtime', type=str, default='cpu', help="runtime backend")
+    parser.add_argument('--batch-size', type=int, default=8, help="batch size of synthetic model")
+    parser.add_argument('--image-size', type=int, default=32, help="input size of synthetic model")
+    parser.add_argument('--iterations', type=int, default=2000, help="number of measured calls")
+    main(parser.parse_args())
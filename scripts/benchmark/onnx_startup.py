@@ -0,0 +1,149 @@
+"""Benchmark of OnnxRuntime cold-start time and peak memory
+
+Compares creating `OnnxRuntime`, which reads model's properties from the
+inference session, against the previous approach where the model's protobuf
+is additionally loaded with `onnx.load` just to read its metadata. Each
+measurement runs in a fresh process so peak RSS is not shared.
+
+When no `--model` is given, a synthetic model is generated for each model
+family in `experiments/configs`, at its largest input size and with weights
+count roughly equal to the family's network, since the exported models are
+not available offline.
+
+To get started using this script, try:
+```
+$ python scripts/benchmark/onnx_startup.py
+$ python scripts/benchmark/onnx_startup.py --model experiments/outputs/yolov3_darknet_608/yolov3_darknet_608.onnx
+```
+"""
+
+import argparse
+import multiprocessing
+import resource
+import tempfile
+import time
+import numpy as np
+import yaml
+from pathlib import Path
+
+from utils import make_synthetic_model, proj_path
+
+# approximate number of weights of each network, keyed by (model, backbone)
+family_params = {
+    ('softmax', 'efficientnet_b0') : 4.0e6,
+    ('softmax', 'efficientnet_lite0') : 3.4e6,
+    ('softmax', 'mobilenet_v2') : 2.2e6,
+    ('softmax', 'resnet18') : 11.2e6,
+    ('softmax', 'shufflenetv2_x0.5') : 0.4e6,
+    ('softmax', 'shufflenetv2_x1.0') : 1.3e6,
+    ('DETR', 'resnet50') : 41.3e6,
+    ('FPNSSD', 'shufflenetv2_x1.0') : 5.0e6,
+    ('FPNSSD', 'shufflenetv2_x2.0') : 13.0e6,
+    ('RetinaFace', 'shufflenetv2_x1.0') : 1.7e6,
+    ('YoloV3', 'darknet53') : 61.9e6,
+}
+
+
+def model_families(config_dir):
+    """find model families from experiment configs, with its largest input size
+    """
+    families = {}
+    for config_file in sorted(Path(config_dir).glob('*.yml')):
+        config = yaml.safe_load(config_file.read_text())
+        model = config['model']
+        key = (model['name'], model['network_args'].get('backbone'))
+        input_size = model['preprocess_args']['input_size']
+        families[key] = max(families.get(key, 0), input_size)
+    return families
+
+
+def create_legacy(model_path):
+    """previous `OnnxRuntime` startup, load the protobuf again to parse its metadata
+    """
+    import onnx
+    import onnxruntime
+    from vortex.runtime.onnx.graph_ops.embed_model_property import parse_model_property
+    from vortex.runtime.onnx.graph_ops.helper import get_input_specs, get_output_names
+    session = onnxruntime.InferenceSession(str(model_path), providers=['CPUExecutionProvider'])
+    onnx_protobuf = onnx.load(str(model_path))
+    parse_model_property(onnx_protobuf)
+    get_input_specs(onnx_protobuf)
+    get_output_names(onnx_protobuf)
+    return session
+
+
+def create_runtime(model_path):
+    from vortex.runtime import create_runtime_model
+    return create_runtime_model(model_path, 'cpu')
+
+
+def peak_rss():
+    """peak resident set size of this process in kilobytes
+    """
+    # ru_maxrss is kept across exec, so prefer linux's VmHWM of the new process
+    status = Path('/proc/self/status')
+    if status.exists():
+        for line in status.read_text().splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _startup(fn, model_path, queue):
+    # import runtime modules first, only measure model creation
+    import onnx, onnxruntime, vortex.runtime
+    rss_start = peak_rss()
+    start = time.perf_counter()
+    fn(model_path)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, peak_rss() - rss_start))
+
+
+def measure_startup(fn, model_path, n_iter):
+    """create model `n_iter` times, each in new process;
+    returns startup time (seconds) and peak RSS increase (MB) of each run
+    """
+    ctx = multiprocessing.get_context('spawn')
+    timings, rss = [], []
+    for _ in range(n_iter):
+        queue = ctx.Queue()
+        process = ctx.Process(target=_startup, args=(fn, model_path, queue))
+        process.start()
+        elapsed, peak = queue.get()
+        process.join()
+        timings.append(elapsed)
+        rss.append(peak / 1024)
+    return np.array(timings), np.array(rss)
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if args.model:
+            models = {Path(model).stem : model for model in args.model}
+        else:
+            models = {}
+            for (name, backbone), input_size in model_families(args.configs).items():
+                n_params = int(family_params.get((name, backbone), 0))
+                model_path = Path(tmpdir) / '{}_{}.onnx'.format(name, backbone)
+                make_synthetic_model(model_path, image_size=input_size, n_params=n_params)
+                models['{} {} {}'.format(name, backbone, input_size)] = model_path
+
+        print("{:<36} {:>9} {:>14} {:>14} {:>12} {:>12}".format(
+            'model', 'size', 'legacy', 'runtime', 'legacy rss', 'runtime rss'))
+        for name, model_path in models.items():
+            size = Path(model_path).stat().st_size / 2**20
+            legacy_time, legacy_rss = measure_startup(create_legacy, model_path, args.n_iter)
+            runtime_time, runtime_rss = measure_startup(create_runtime, model_path, args.n_iter)
+            print("{:<36} {:>7.1f}MB {:>12.1f}ms {:>12.1f}ms {:>10.1f}MB {:>10.1f}MB".format(
+                name, size, np.median(legacy_time) * 1e3, np.median(runtime_time) * 1e3,
+                np.median(legacy_rss), np.median(runtime_rss)
+            ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', type=str, nargs='*', help="path to onnx model(s), synthetic models are used if not given")
+    parser.add_argument('--configs', type=str, default=str(proj_path / 'experiments' / 'configs'),
+                        help="directory of experiment configs, to get model families for synthetic models")
+    parser.add_argument('--n-iter', type=int, default=3, help="number of startup (process) per model")
+    main(parser.parse_args())
@@ -0,0 +1,72 @@
+"""Micro-benchmark of runtime output decoding, per-field `np.take` vs precompiled plan
+
+Decodes random detection-like output of shape [batch, n_detections, 16]
+(bounding box, confidence, label and 5 landmarks) into per-image
+dictionary, as done by `BaseRuntime.__call__` after `predict`.
+
+To get started using this script, try:
+```
+$ python scripts/benchmark/output_decode.py --batch-size 16 --n-detections 300
+```
+"""
+
+import argparse
+import numpy as np
+from collections import OrderedDict
+
+from utils import measure, summarize
+
+from vortex.runtime.basic_runtime import BaseRuntime
+
+output_format = dict(
+    bounding_box=dict(indices=[0, 1, 2, 3], axis=1),
+    class_confidence=dict(indices=[4], axis=1),
+    class_label=dict(indices=[5], axis=1),
+    landmarks=dict(indices=list(range(6, 16)), axis=1),
+)
+
+
+class DecodeRuntime(BaseRuntime):
+    def __init__(self):
+        super().__init__(
+            input_specs=OrderedDict(input=dict(shape=[1, 8, 8, 3], type='uint8')),
+            output_name='output', output_format=output_format, class_names=['a'],
+        )
+
+    def predict(self, *args, **kwargs) -> np.ndarray:
+        raise NotImplementedError
+
+
+def decode_take(outputs, output_format, output_fields):
+    """previous `BaseRuntime.__call__` decoding
+    """
+    results = []
+    for output in outputs:
+        result = OrderedDict()
+        for key in output_fields:
+            result[key] = np.take(
+                output, axis=int(output_format[key]['axis']),
+                indices=output_format[key]['indices'],
+            ) if all(output.shape) else None
+        results.append(result)
+    return results
+
+
+def main(args):
+    model = DecodeRuntime()
+    outputs = np.random.rand(args.batch_size, args.n_detections, 16).astype(np.float32)
+    print("output: {}".format(list(outputs.shape)))
+    timings = measure(lambda: decode_take(outputs, model.output_format, model.output_fields), n_iter=args.iterations)
+    print(summarize('np.take', timings))
+    timings = measure(lambda: model.decode(outputs), n_iter=args.iterations)
+    print(summarize('decode', timings))
+    timings = measure(lambda: model.decode_batch(outputs), n_iter=args.iterations)
+    print(summarize('decode_batch', timings))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--batch-size', type=int, default=16, help="batch size")
+    parser.add_argument('--n-detections', type=int, default=300, help="number of detections per image")
+    parser.add_argument('--iterations', type=int, default=2000, help="number of measured calls")
+    main(parser.parse_args())
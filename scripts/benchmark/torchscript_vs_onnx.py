@@ -0,0 +1,103 @@
+"""Benchmark of TorchScriptRuntime options against OnnxRuntime, on the same model
+
+The synthetic onnx model from `utils.make_synthetic_model` is rebuilt as
+torch module with the same weights and traced to torchscript, embedded with
+the same properties as torchscript exporter, so both runtimes compute the
+same output.
+
+To get started using this script, try:
+```
+$ python scripts/benchmark/torchscript_vs_onnx.py --batch-size 8 --image-size 224
+```
+"""
+
+import argparse
+import tempfile
+import numpy as np
+from pathlib import Path
+
+from utils import make_synthetic_model, measure, summarize
+
+from vortex.runtime import create_runtime_model
+
+
+def make_torchscript_model(filename, onnx_model, batch_size, image_size):
+    """trace torch module equivalent to `make_synthetic_model`, with its weights
+    """
+    import onnx
+    import torch
+    from onnx import numpy_helper
+
+    weights = {w.name: torch.from_numpy(numpy_helper.to_array(w).copy())
+        for w in onnx.load(str(onnx_model)).graph.initializer}
+
+    class Predictor(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.conv = torch.nn.Conv2d(3, weights['conv_w'].shape[0], 3, stride=2, padding=1, bias=False)
+            self.conv.weight.data.copy_(weights['conv_w'])
+            self.hidden = torch.nn.Parameter(weights['hidden_w']) if 'hidden_w' in weights else None
+            self.fc = torch.nn.Parameter(weights['fc_w'])
+
+        def forward(self, input):
+            x = input.float().permute(0, 3, 1, 2)
+            x = torch.relu(self.conv(x)).mean(dim=(2, 3))
+            if self.hidden is not None:
+                x = torch.relu(x @ self.hidden)
+            prob = (x @ self.fc).softmax(dim=1)
+            confidence, label = prob.max(dim=1, keepdim=True)
+            return torch.cat([label.float(), confidence], dim=1)
+
+    predictor = Predictor().eval()
+    n_classes = predictor.fc.shape[1]
+    predictor.register_buffer('input_input_shape', torch.tensor([batch_size, image_size, image_size, 3]))
+    predictor.register_buffer('input_input_pos', torch.tensor(0))
+    for idx, name in enumerate(['class_label', 'class_confidence']):
+        predictor.register_buffer(name + '_indices', torch.tensor([idx]))
+        predictor.register_buffer(name + '_axis', torch.tensor(0))
+    for idx in range(n_classes):
+        predictor.register_buffer('class_{}_label'.format(idx), torch.tensor(idx))
+    example = torch.zeros(batch_size, image_size, image_size, 3, dtype=torch.uint8)
+    with torch.no_grad():
+        model = torch.jit.trace(predictor, example)
+    model.save(str(filename))
+    return filename
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        onnx_model = Path(tmpdir) / 'synthetic.onnx'
+        make_synthetic_model(onnx_model, batch_size=args.batch_size, image_size=args.image_size,
+            channels=args.channels)
+        torchscript_model = make_torchscript_model(Path(tmpdir) / 'synthetic.pt', onnx_model,
+            args.batch_size, args.image_size)
+
+        models = dict(
+            onnx=create_runtime_model(onnx_model, 'cpu'),
+            torchscript=create_runtime_model(torchscript_model, 'cpu'),
+            torchscript_optimize=create_runtime_model(torchscript_model, 'cpu', optimize=True),
+            torchscript_channels_last=create_runtime_model(torchscript_model, 'cpu', optimize=True, channels_last=True),
+            torchscript_bfloat16=create_runtime_model(torchscript_model, 'cpu', dtype='bfloat16'),
+        )
+        print("input: {}".format([args.batch_size, args.image_size, args.image_size, 3]))
+        rng = np.random.RandomState(0)
+        images = [rng.randint(0, 255, (args.image_size, args.image_size, 3), dtype=np.uint8)
+            for _ in range(args.batch_size)]
+        expected = None
+        for name, model in models.items():
+            batch = model.prepare_batch(images)
+            output = model.predict(batch)
+            if expected is None:
+                expected = output
+            diff = np.abs(output[:, 1] - expected[:, 1]).max()
+            timings = measure(lambda: model(batch), n_iter=args.iterations)
+            print("{} max confidence diff={:.2e}".format(summarize(name, timings, 1e3, 'ms'), diff))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--batch-size', type=int, default=8, help="batch size")
+    parser.add_argument('--image-size', type=int, default=224, help="input image size")
+    parser.add_argument('--channels', type=int, default=32, help="number of conv channels of synthetic model")
+    parser.add_argument('--iterations', type=int, default=100, help="number of measured calls")
+    main(parser.parse_args())
@@ -0,0 +1,91 @@
+"""Shared helpers for runtime benchmark scripts
+"""
+import sys
+import time
+import numpy as np
+from pathlib import Path
+
+proj_path = Path(__file__).parents[2]
+sys.path.append(str(proj_path.joinpath('src', 'development')))
+sys.path.append(str(proj_path.joinpath('src', 'runtime')))
+
+
+def make_synthetic_model(filename, batch_size=1, image_size=224, n_classes=10, channels=16, n_params=0):
+    """create small classification onnx model (conv -> global pool -> gemm -> argmax),
+    embedded with vortex metadata so it can be loaded by `create_runtime_model`;
+    when `n_params` is given, a hidden fully-connected layer is added so the
+    model has roughly `n_params` weights, e.g. to measure loading time
+    """
+    import onnx
+    from onnx import helper, numpy_helper, TensorProto
+    from vortex.runtime.onnx.graph_ops.embed_model_property import embed_model_property
+
+    rng = np.random.RandomState(0)
+    weights = [
+        numpy_helper.from_array(rng.randn(channels, 3, 3, 3).astype(np.float32) * .1, 'conv_w'),
+    ]
+    hidden = n_params // (channels + n_classes)
+    if hidden > 0:
+        weights.append(numpy_helper.from_array(rng.randn(channels, hidden).astype(np.float32) * .1, 'hidden_w'))
+        weights.append(numpy_helper.from_array(rng.randn(hidden, n_classes).astype(np.float32) * .1, 'fc_w'))
+    else:
+        weights.append(numpy_helper.from_array(rng.randn(channels, n_classes).astype(np.float32), 'fc_w'))
+    input = helper.make_tensor_value_info('input', TensorProto.UINT8, [batch_size, image_size, image_size, 3])
+    output = helper.make_tensor_value_info('output', TensorProto.FLOAT, [batch_size, 2])
+    nodes = [
+        helper.make_node('Cast', ['input'], ['x_float'], to=TensorProto.FLOAT),
+        helper.make_node('Transpose', ['x_float'], ['x_nchw'], perm=[0, 3, 1, 2]),
+        helper.make_node('Conv', ['x_nchw', 'conv_w'], ['conv'], pads=[1, 1, 1, 1], strides=[2, 2]),
+        helper.make_node('Relu', ['conv'], ['relu']),
+        helper.make_node('GlobalAveragePool', ['relu'], ['pool']),
+        helper.make_node('Flatten', ['pool'], ['flat']),
+    ]
+    if hidden > 0:
+        nodes.append(helper.make_node('MatMul', ['flat', 'hidden_w'], ['hidden']))
+        nodes.append(helper.make_node('Relu', ['hidden'], ['fc_in']))
+    else:
+        nodes.append(helper.make_node('Identity', ['flat'], ['fc_in']))
+    nodes += [
+        helper.make_node('MatMul', ['fc_in', 'fc_w'], ['logits']),
+        helper.make_node('Softmax', ['logits'], ['prob'], axis=1),
+        helper.make_node('ArgMax', ['prob'], ['label_int'], axis=1, keepdims=1),
+        helper.make_node('Cast', ['label_int'], ['label'], to=TensorProto.FLOAT),
+        helper.make_node('ReduceMax', ['prob'], ['confidence'], axes=[1], keepdims=1),
+        helper.make_node('Concat', ['label', 'confidence'], ['output'], axis=1),
+    ]
+    graph = helper.make_graph(nodes, 'synthetic', [input], [output], initializer=weights)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 7
+    props = dict(
+        output_format=dict(
+            class_label=dict(indices=[0], axis=0),
+            class_confidence=dict(indices=[1], axis=0),
+        ),
+        class_names=['class_{}'.format(i) for i in range(n_classes)],
+    )
+    model = embed_model_property(model, props)
+    onnx.save(model, str(filename))
+    return filename
+
+
+def measure(fn, n_iter=1000, n_warmup=10):
+    """call `fn` repeatedly, returns array of per-call time in seconds
+    """
+    for _ in range(n_warmup):
+        fn()
+    timings = np.empty(n_iter)
+    for i in range(n_iter):
+        start = time.perf_counter()
+        fn()
+        timings[i] = time.perf_counter() - start
+    return timings
+
+
+def summarize(name, timings, unit=1e6, unit_name='us'):
+    """format per-call timings as single line
+    """
+    timings = timings * unit
+    return "{:<28} mean={:9.1f}{u} median={:9.1f}{u} p99={:9.1f}{u} min={:9.1f}{u}".format(
+        name, np.mean(timings), np.median(timings),
+        np.percentile(timings, 99), np.min(timings), u=unit_name
+    )
@@ -0,0 +1,80 @@
+"""Benchmark of drawing prediction results, per-item cv2 calls vs `VisualRenderer`
+
+Dense random detections (bounding box, label and landmarks) on a batch of
+frames are drawn by calling `cv2.rectangle`, `cv2.putText` and
+`cv2.circle` for each item, as `Visual` used to, and by `VisualRenderer`
+with cached label sprites, single-threaded and on a thread pool.
+
+To get started using this script, try:
+```
+$ python scripts/benchmark/visual.py --batch-size 8 --n-boxes 300 --n-landmarks 5
+```
+"""
+
+import argparse
+import cv2
+import numpy as np
+
+from utils import measure, summarize
+
+from vortex.runtime.visual import VisualRenderer
+
+class_names = ['class_{}'.format(i) for i in range(80)]
+
+
+def make_results(batch_size, n_boxes, n_landmarks, width, height):
+    rng = np.random.RandomState(0)
+    results = []
+    for _ in range(batch_size):
+        xy = rng.uniform(0, 1, (n_boxes, 2)) * (width, height)
+        wh = rng.uniform(0.02, 0.3, (n_boxes, 2)) * (width, height)
+        results.append(dict(
+            bounding_box=np.concatenate([xy, xy + wh], axis=1).astype(np.float32),
+            class_confidence=rng.uniform(0, 1, (n_boxes, 1)).astype(np.float32),
+            class_label=rng.randint(0, len(class_names), (n_boxes, 1)).astype(np.float32),
+            landmarks=(rng.uniform(0, 1, (n_boxes, n_landmarks, 2)) * (width, height)).reshape(n_boxes, -1),
+        ))
+    return results
+
+
+def draw_per_item(vis, result, color_map=VisualRenderer.colors):
+    for (x1, y1, x2, y2), label, confidence in zip(result['bounding_box'].astype(int).tolist(),
+            result['class_label'][:,0].astype(int), result['class_confidence'][:,0]):
+        cv2.rectangle(vis, (x1, y1), (x2, y2), color_map[label], 1)
+        text = '{0} : {1:.2f}'.format(class_names[label], confidence)
+        cv2.putText(vis, text, (x1, y1), cv2.FONT_HERSHEY_SIMPLEX, 1, color_map[label], 2)
+    for landmark in result['landmarks']:
+        for x, y in zip(landmark[0::2], landmark[1::2]):
+            cv2.circle(vis, (int(x), int(y)), radius=2, color=color_map[0], thickness=-1)
+    return vis
+
+
+def main(args):
+    results = make_results(args.batch_size, args.n_boxes, args.n_landmarks, args.width, args.height)
+    frames = [np.zeros((args.height, args.width, 3), dtype=np.uint8) for _ in results]
+    print("batch: {}, frame: {}x{}, boxes/frame: {}, landmarks/box: {}".format(
+        args.batch_size, args.width, args.height, args.n_boxes, args.n_landmarks))
+
+    timings = measure(lambda: [draw_per_item(vis.copy(), result) for vis, result in zip(frames, results)],
+        n_iter=args.iterations, n_warmup=2)
+    print(summarize('per-item cv2', timings, unit=1e3, unit_name='ms'))
+    timings = measure(lambda: [vis.copy() for vis in frames], n_iter=args.iterations, n_warmup=2)
+    print(summarize('(frame copy only)', timings, unit=1e3, unit_name='ms'))
+    for n_workers in sorted({1, args.n_workers}):
+        renderer = VisualRenderer(n_workers=n_workers)
+        timings = measure(lambda: renderer.render([vis.copy() for vis in frames], results, class_names=class_names),
+            n_iter=args.iterations, n_warmup=2)
+        print(summarize('VisualRenderer n_workers={}'.format(n_workers), timings, unit=1e3, unit_name='ms'))
+        renderer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--batch-size', type=int, default=8, help="number of frames")
+    parser.add_argument('--n-boxes', type=int, default=300, help="number of detections per frame")
+    parser.add_argument('--n-landmarks', type=int, default=5, help="number of landmark points per detection")
+    parser.add_argument('--width', type=int, default=1280, help="frame width")
+    parser.add_argument('--height', type=int, default=720, help="frame height")
+    parser.add_argument('--n-workers', type=int, default=4, help="rendering threads")
+    parser.add_argument('--iterations', type=int, default=20, help="number of measured calls")
+    main(parser.parse_args())
@@ -55,7 +55,10 @@ class ONNXExporter():
         max_output_per_class = g.op('Constant', value_t=torch.tensor([sys.maxsize], dtype=torch.long))
         iou_threshold = g.op('Constant', value_t=torch.tensor([iou_threshold], dtype=torch.float))
         nms_out = g.op('NonMaxSuppression', boxes, scores, max_output_per_class, iou_threshold)
-        return squeeze(g, select(g, nms_out, 1, g.op('Constant', value_t=torch.tensor([2], dtype=torch.long))), 1)
+        keep = squeeze(g, select(g, nms_out, 1, g.op('Constant', value_t=torch.tensor([2], dtype=torch.long))), 1)
+        ## number of kept boxes is data-dependent, don't let its traced size be folded as constant
+        keep.setType(keep.type().with_sizes([None]))
+        return keep
 
     @staticmethod
     @parse_args('v', 'v', 'f', 'i', 'i', 'i', 'i')
@@ -144,8 +147,17 @@ class ONNXExporter():
         g_ops = []
         props = dict(
             output_format=output_format,
-            class_names=class_names
+            class_names=class_names,
+            resize_kind=getattr(model, 'resize_kind', 'stretch'),
         )
+        # exported without nms, runtime applies it on decoded output;
+        # flagged by detection postprocess, e.g. `BasicNMSPostProcess`
+        postprocess = getattr(model, 'postprocess', None)
+        if getattr(postprocess, 'runtime_nms', False) or getattr(model, 'runtime_nms', False):
+            props['runtime_nms'] = True
+            strategy = getattr(postprocess, 'nms_strategy', None)
+            if strategy is not None:
+                props['nms_strategy'] = strategy.spec
         g_ops.append(get_op('EmbedModelProperty', props))
         g_ops.append(get_op('EmbedMetrics', metrics))
         if shape_inference is None:
@@ -1,16 +1,34 @@
 import torch
 import os
+import time
 
 from typing import Union
 from vortex.development.networks.modules.postprocess.utils import nms
 from vortex.development.networks.modules.postprocess.base_postprocess import BasicNMSPostProcess, BatchedNMSPostProcess
 
 from vortex.development.exporter.base_exporter import BaseExporter
+from vortex.runtime.basic_runtime import BaseRuntime
+from vortex.runtime.nms import nms_strategies
 
 class TorchScriptExporter(BaseExporter):
 
     def __init__(self, filename: str, image_size: int, input_dtype: str = 'uint8', 
-                 n_channels=3, n_batch=1, check_tolerance:Union[float,str]=1e-6, **kwargs):
+                 n_channels=3, n_batch=1, check_tolerance:Union[float,str]=1e-6,
+                 freeze: bool = False, parity_tolerance: Union[float,str] = 1e-4,
+                 n_parity_samples: int = 4, n_benchmark: int = 10, **kwargs):
+        """
+        Args:
+            freeze (bool, optional): freeze traced module for inference, inlining weights as
+                constants with constant propagation, conv-bn folding and removal of
+                training-only branches; the frozen module is checked against eager predictor
+                and latency before and after is logged. Requires torch>=1.8. Defaults to False.
+            parity_tolerance (float, optional): maximum absolute difference of frozen module's
+                output to eager predictor's output. Defaults to 1e-4.
+            n_parity_samples (int, optional): number of random inputs used for parity check,
+                in addition to example input. Defaults to 4.
+            n_benchmark (int, optional): number of calls to measure latency, 0 to skip. Defaults to 10.
+            **kwargs: additional arguments to `torch.jit.trace`
+        """
         if not isinstance(filename, str):
             filename = str(filename)
         if len(filename.split('.')) == 1:
@@ -21,6 +39,13 @@ class TorchScriptExporter(BaseExporter):
         )
         self.export_args = kwargs
         self.export_args.update({'check_tolerance' : float(check_tolerance)})
+        if freeze and not hasattr(torch.jit, 'freeze'):
+            raise RuntimeError("freeze requires `torch.jit.freeze` (torch>=1.8), got torch {}".format(torch.__version__))
+        self.freeze = freeze
+        self.parity_tolerance = float(parity_tolerance)
+        self.n_parity_samples = n_parity_samples
+        self.n_benchmark = n_benchmark
+        self.report = {}
 
     def export(self, predictor, example_input, class_names, output_format, additional_inputs) :
         predictor = predictor.eval()
@@ -42,11 +67,85 @@ class TorchScriptExporter(BaseExporter):
         type(self).embed_input_spec(predictor, input_spec)
         type(self).embed_output_format(predictor, output_format)
         type(self).embed_class_names(predictor, class_names)
+        type(self).embed_resize_kind(predictor, getattr(predictor.model, 'resize_kind', 'stretch'))
+        if getattr(predictor.postprocess, 'runtime_nms', False):
+            ## exported without nms, runtime applies it on decoded output
+            predictor.register_buffer('runtime_nms', torch.tensor(True))
+            strategy = getattr(predictor.postprocess, 'nms_strategy', None)
+            if strategy is not None:
+                type(self).embed_nms_strategy(predictor, strategy.spec)
         exported = torch.jit.trace(predictor, example_inputs=tuple(inputs), 
             **self.export_args)
+        if self.freeze:
+            exported = self.freeze_module(predictor, exported, inputs)
         exported.save(self.filename)
         return os.path.exists(self.filename)
 
+    def freeze_module(self, predictor, exported, inputs):
+        """freeze traced module, check parity to eager predictor and report latency
+        """
+        ## embedded properties are read from buffers by runtime, keep them as attributes
+        metadata = [name for name, _ in predictor.named_buffers(recurse=False)]
+        frozen = torch.jit.freeze(exported.eval(), preserved_attrs=metadata)
+
+        samples = [tuple(inputs)]
+        for _ in range(self.n_parity_samples):
+            x = torch.rand(*inputs[0].shape)
+            if inputs[0].dtype == torch.uint8:
+                x = (x * 255).type(torch.uint8)
+            samples.append((x, *inputs[1:]))
+        max_diff = 0.
+        with torch.no_grad():
+            for sample in samples:
+                expected, output = predictor(*sample), frozen(*sample)
+                max_diff = max(max_diff, type(self).max_difference(expected, output))
+        self.report = {'max_difference': max_diff}
+        if max_diff > self.parity_tolerance:
+            raise RuntimeError("frozen torchscript model output differs from eager predictor by "
+                "{:.3e}, exceeding parity tolerance {:.3e}".format(max_diff, self.parity_tolerance))
+
+        if self.n_benchmark > 0:
+            self.report['latency'] = {
+                'eager': type(self).measure_latency(predictor, inputs, self.n_benchmark),
+                'traced': type(self).measure_latency(exported, inputs, self.n_benchmark),
+                'frozen': type(self).measure_latency(frozen, inputs, self.n_benchmark),
+            }
+            type(self).logger.info("torchscript median latency (ms): " + ', '.join(
+                '{}={:.3f}'.format(name, t * 1e3) for name, t in self.report['latency'].items()))
+        type(self).logger.info("frozen torchscript max difference to eager predictor: {:.3e}".format(max_diff))
+        return frozen
+
+    @staticmethod
+    def max_difference(expected, output) -> float:
+        """maximum absolute difference of (nested) tensor outputs, inf if the structure or shape differs
+        """
+        if isinstance(expected, torch.Tensor):
+            if not isinstance(output, torch.Tensor) or expected.shape != output.shape:
+                return float('inf')
+            if not expected.numel():
+                return 0.
+            return (expected.double() - output.double()).abs().max().item()
+        if isinstance(expected, (tuple, list)):
+            if not isinstance(output, (tuple, list)) or len(expected) != len(output):
+                return float('inf')
+            return max([TorchScriptExporter.max_difference(e, o) for e, o in zip(expected, output)] or [0.])
+        return 0. if expected == output else float('inf')
+
+    @staticmethod
+    def measure_latency(module, inputs, n_iter) -> float:
+        """median time of `n_iter` calls in seconds, after warmup calls
+        """
+        timings = []
+        with torch.no_grad():
+            ## first calls of torchscript module run its profiling and optimization
+            for _ in range(2):
+                module(*inputs)
+            for _ in range(n_iter):
+                start = time.perf_counter()
+                module(*inputs)
+                timings.append(time.perf_counter() - start)
+        return sorted(timings)[len(timings) // 2]
+
     @staticmethod
     def embed_output_format(predictor, output_format):
         for name, value in output_format.items():
@@ -65,6 +164,23 @@ class TorchScriptExporter(BaseExporter):
             predictor.register_buffer(name + '_input_shape', shape)
             predictor.register_buffer(name + '_input_pos', pos)
 
+    @staticmethod
+    def embed_resize_kind(predictor, resize_kind: str):
+        ## embedded as index to runtime's resize kinds
+        resize_kinds = BaseRuntime.resize_kinds
+        assert resize_kind in resize_kinds
+        predictor.register_buffer('resize_kind', torch.tensor(resize_kinds.index(resize_kind)))
+
+    @staticmethod
+    def embed_nms_strategy(predictor, strategy: dict):
+        ## embedded as index to runtime's nms strategies, with its arguments
+        strategy = dict(strategy)
+        name = strategy.pop('name')
+        assert name in nms_strategies
+        predictor.register_buffer('nms_strategy', torch.tensor(list(nms_strategies).index(name)))
+        for key, value in strategy.items():
+            predictor.register_buffer('nms_strategy_{}'.format(key), torch.tensor(float(value)))
+
     @staticmethod
     def embed_class_names(predictor, class_names : dict):
         assert isinstance(class_names, dict)
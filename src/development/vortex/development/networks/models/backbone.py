@@ -44,11 +44,13 @@ class Backbone(nn.Sequential):
 
         stages = None
         reduce_stages_channel = False
+        default_config = None
         if isinstance(module, str):
             module = get_backbone(module, **kwargs)
 
         if isinstance(module, BackboneBase):
             name = module.name
+            default_config = module.default_config
             stages = module.get_stages()
             stages.add_module("classifier", module.get_classifier())
             if stages_channel is None:
@@ -77,6 +79,8 @@ class Backbone(nn.Sequential):
         self.freeze = freeze
 
         self._name = name if name else "backbone"
+        ## config of backbone module (e.g. its input resize), None if not given as 'BackboneBase'
+        self.default_config = default_config
         self.hooks_handle = [ModuleIOHook(m) for n,m in enumerate(self) if n in self.stages_output]
 
         if stages_channel is None:
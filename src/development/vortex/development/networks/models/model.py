@@ -6,6 +6,7 @@ from abc import abstractmethod
 from typing import List, Union, Callable
 
 from vortex.development.utils import create_optimizer, create_scheduler
+from vortex.development.networks.modules.backbones import BackboneConfig
 
 
 class ModelBase(pl.LightningModule):
@@ -113,6 +114,28 @@ class ModelBase(pl.LightningModule):
         """
         pass
 
+    @property
+    def resize_kind(self) -> str:
+        """How input image is resized to model input size on inference,
+        embedded to exported model to be used by runtime. One of
+        'stretch', 'pad' (preserve aspect ratio and centered, letterbox)
+        or 'scale' (preserve aspect ratio, padded at bottom-right).
+        Defaults to the configured 'resize' of model's backbone.
+        """
+        for module in self.modules():
+            config = getattr(module, 'default_config', None)
+            if isinstance(config, BackboneConfig):
+                return config.resize
+        return 'stretch'
+
+    @property
+    def runtime_nms(self) -> bool:
+        """Whether detection model is exported without nms, e.g. for
+        backend without NonZero or NonMaxSuppression; embedded to exported
+        model so the runtime applies score threshold and nms on its output.
+        """
+        return False
+
     def on_export_start(self, exporter):
         """This method will be called at the start of export
         session.
@@ -2,7 +2,7 @@ import torch
 import torch.nn as nn
 import warnings
 
-from typing import Tuple, Callable, Union
+from typing import Tuple, Callable, Union, Optional
 
 
 def check_annotations(lhs, rhs):
@@ -33,6 +33,10 @@ class BasicNMSPostProcess(nn.Module):
         decoder (input : Tensor) -> Tuple[Tensor,Tensor,Tensor,Tensor]
         nms (bboxes : Tensor, class_indexes : Tensor, scores : Tensor, iou_threshold : Tensor) -> Union[Tensor,Tuple[Tensor,Tensor]]
     ```
+    `nms_strategy` is the name of registered nms strategy (see `NMS_STRATEGIES`
+    in `utils.nms_strategy`: 'hard', 'soft_gaussian', 'soft_linear', 'diou' or
+    'wbf') with `nms_strategy_args`; strategy other than 'hard' is not exported,
+    exported model outputs the candidates and the runtime applies the strategy
     """
     decoder_signature = {
         'input': torch.Tensor,
@@ -46,11 +50,17 @@ class BasicNMSPostProcess(nn.Module):
         'return': Union[torch.Tensor, Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]],
     }
 
-    def __init__(self, decoder: Callable, nms: bool = True):
+    def __init__(self, decoder: Callable, nms: bool = True, nms_strategy: str = 'hard',
+                 nms_strategy_args: Union[dict,None] = None):
         from .utils.nms import BatchedNMS, NoNMS
+        from .utils.nms_strategy import NMS_STRATEGIES
         super(BasicNMSPostProcess, self).__init__()
         self.decoder = decoder
-        self.nms = BatchedNMS() if nms else NoNMS()
+        self.nms_strategy = NMS_STRATEGIES.create_from_dict(nms_strategy, nms_strategy_args or {})
+        self.nms = BatchedNMS(self.nms_strategy) if nms else NoNMS()
+        ## exported without nms (or with strategy not exportable), embedded
+        ## in model so the runtime applies the strategy
+        self.runtime_nms = not nms or not self.nms_strategy.exportable
 
         # skip for now, 
         # TODO: fix or remove
@@ -125,11 +135,66 @@ class BasicNMSPostProcess(nn.Module):
         return self._forward(input, score_threshold, iou_threshold)
 
 class BatchedNMSPostProcess(BasicNMSPostProcess) :
-    def __init__(self, decoder: Callable, nms: bool = True) :
-        super(BatchedNMSPostProcess,self).__init__(decoder, nms)
+    """
+    Detector post-process for batched input; with `max_detections`, all images
+    are decoded and suppressed at once (requires decoder to have `decode_batch`)
+    and the output is padded :
+    ```
+        bboxes, scores, class_indexes, batch_indexes, detections = decoder.decode_batch(
+            input, score_threshold, pre_nms_topk
+        )
+        detections, n_valid = nms(
+            detections, class_indexes, bboxes, scores,
+            batch_indexes, n_batch, iou_threshold, max_detections
+        )
+    ```
+    where `detections` is [n_batch, max_detections, D] and `n_valid` is number of
+    valid detections of each image; otherwise each image is processed separately
+    and tuple of each image's detections is returned.
 
-    def forward(self, input: torch.Tensor, score_threshold: torch.Tensor, iou_threshold: torch.Tensor) :
+    `pre_nms_topk` (maximum candidates of each image passed to nms, 0 means
+    no limit) and `max_detections` are additional inputs of exported model,
+    with the given values as default when not given in `forward`
+    """
+    def __init__(self, decoder: Callable, nms: bool = True, max_detections: Union[int,None] = None,
+                 pre_nms_topk: Union[int,None] = None, nms_strategy: str = 'hard',
+                 nms_strategy_args: Union[dict,None] = None) :
+        from .utils.nms import PaddedBatchedNMS
+        super(BatchedNMSPostProcess,self).__init__(decoder, nms, nms_strategy, nms_strategy_args)
+        if pre_nms_topk is not None and max_detections is None:
+            raise ValueError("'pre_nms_topk' requires 'max_detections' to be set")
+        self.max_detections = max_detections
+        self.pre_nms_topk = pre_nms_topk
+        if max_detections is not None:
+            self.nms = PaddedBatchedNMS(max_detections, suppress=nms, strategy=self.nms_strategy)
+            self.additional_inputs += (
+                ('pre_nms_topk', (1,)),
+                ('max_detections', (1,)),
+            )
+
+    def forward(self, input: torch.Tensor, score_threshold: torch.Tensor, iou_threshold: torch.Tensor,
+                pre_nms_topk: Optional[torch.Tensor] = None, max_detections: Optional[torch.Tensor] = None) :
         n_batch = input.size(0)
+        if self.max_detections is not None:
+            if pre_nms_topk is None:
+                pre_nms_topk = torch.tensor([self.pre_nms_topk or 0], device=input.device)
+            if max_detections is None:
+                max_detections = torch.tensor([self.max_detections], device=input.device)
+            bboxes, scores, class_indexes, batch_indexes, detections = self.decoder.decode_batch(
+                input=input,
+                score_threshold=score_threshold,
+                pre_nms_topk=pre_nms_topk
+            )
+            return self.nms(
+                detections=detections,
+                class_indexes=class_indexes,
+                bboxes=bboxes,
+                scores=scores,
+                batch_indexes=batch_indexes,
+                n_batch=n_batch,
+                iou_threshold=iou_threshold,
+                max_detections=max_detections
+            )
         results = []
         for i in range(n_batch) :
             results.append(self._forward(
@@ -1,8 +1,9 @@
+import sys
 import torch
 import torch.nn as nn
 import torchvision.ops as ops
 
-from typing import Tuple
+from typing import Tuple, Optional
 
 
 class NoNMS:
@@ -85,22 +86,129 @@ def batched_nms(boxes, scores, idxs, iou_threshold):
     """
     if boxes.numel() == 0:
         return torch.empty((0,), dtype=torch.int64, device=boxes.device)
-    # offsets = _get_offsets(idxs, boxes)
-    # strategy: in order to perform NMS independently per class.
-    # we add an offset to all the boxes. The offset is dependent
-    # only on the class idx, and is large enough so that boxes
-    # from different classes do not overlap
-    ## workaround for onnx exporting, note maybe need to fix when input size > 2048
-    max_coordinate = 2048 
-    offsets = idxs * (max_coordinate + 1)
-    boxes_for_nms = boxes + offsets[:, None]
-    keep = ops.nms(boxes_for_nms, scores, iou_threshold)
+    boxes_for_nms = offset_boxes(boxes, idxs)
+    keep = ops.nms(boxes_for_nms, scores.to(boxes_for_nms.dtype), iou_threshold)
     return keep
 
+
+def offset_boxes(boxes, idxs):
+    # type: (torch.Tensor, torch.Tensor) -> torch.Tensor
+    """
+    strategy: in order to perform NMS independently per class,
+    we add an offset to all the boxes. The offset is dependent
+    only on the class idx, and is large enough so that boxes
+    from different classes do not overlap.
+
+    The offset is computed from the extent of the given boxes, so there
+    is no limit on the coordinates; boxes are also moved to start at zero
+    so the offset is as small as possible. Outside of tracing (i.e. not
+    exported to onnx, whose NonMaxSuppression only takes float), boxes are
+    offset in double precision so the coordinates of high class indices
+    don't lose precision.
+
+    Parameters
+    ----------
+    boxes : Tensor[N, 4]
+        boxes in (x1, y1, x2, y2) format
+    idxs : Tensor[N]
+        group index (e.g. category) of each box
+
+    Returns
+    -------
+    boxes : Tensor[N, 4]
+        boxes of different groups separated by offset
+    """
+    if not torch.jit.is_tracing():
+        boxes = boxes.double()
+    # trailing zero avoids reducing empty tensor when there is no box
+    coordinates = torch.cat((boxes.view(-1), boxes.new_zeros(1)))
+    min_coordinate = coordinates.min()
+    extent = coordinates.max() - min_coordinate + 1
+    offsets = idxs.to(boxes.dtype) * extent
+    return boxes - min_coordinate + offsets[:, None]
+
+
+class _MultiClassNMS(torch.autograd.Function):
+    """
+    nms of boxes [K, 4] with scores [C, K] of each class (-inf for boxes not
+    in the class), exported to onnx as single `NonMaxSuppression` with the
+    per-class scores layout, so classes don't need to be separated by offset
+    """
+    @staticmethod
+    def forward(ctx, boxes, scores, iou_threshold):
+        if boxes.size(0) == 0:
+            return torch.empty((0,), dtype=torch.int64, device=boxes.device)
+        class_scores, idxs = scores.max(0)
+        boxes_for_nms = offset_boxes(boxes.double(), idxs)
+        return ops.nms(boxes_for_nms, class_scores.double(), float(iou_threshold))
+
+    @staticmethod
+    def symbolic(g, boxes, scores, iou_threshold):
+        boxes = g.op('Unsqueeze', boxes, axes_i=[0])
+        scores = g.op('Unsqueeze', scores, axes_i=[0])
+        max_output_per_class = g.op('Constant', value_t=torch.tensor([sys.maxsize], dtype=torch.long))
+        # boxes not in the class have -inf score
+        score_threshold = g.op('Constant', value_t=torch.tensor([torch.finfo(torch.float32).min]))
+        nms_out = g.op('NonMaxSuppression', boxes, scores, max_output_per_class, iou_threshold, score_threshold)
+        keep = g.op('Gather', nms_out, g.op('Constant', value_t=torch.tensor(2)), axis_i=1)
+        # number of kept boxes is data-dependent, don't let its traced size be folded as constant
+        keep.setType(keep.type().with_sizes([None]))
+        return keep
+
+
+@torch.jit.unused
+def is_in_onnx_export():
+    # type: () -> bool
+    return torch.onnx.is_in_onnx_export()
+
+
+@torch.jit.unused
+def multiclass_nms(boxes, scores, class_indexes, n_classes, iou_threshold):
+    # type: (torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor) -> torch.Tensor
+    """
+    nms not applied between elements of different categories, as onnx
+    `NonMaxSuppression` with scores of shape [1, n_classes, K] when exported
+
+    Returns
+    -------
+    keep : Tensor
+        int64 tensor with the indices of the elements that have been kept,
+        in decreasing order of scores (grouped by category when exported)
+    """
+    classes = torch.arange(n_classes, device=class_indexes.device)
+    member = class_indexes.unsqueeze(0) == classes.unsqueeze(1)
+    mask = torch.zeros_like(member, dtype=torch.float32).masked_fill(~member, float('-inf'))
+    return _MultiClassNMS.apply(boxes.float(), scores.float().unsqueeze(0) + mask,
+        iou_threshold.float().view(1))
+
+
+def apply_strategy(strategy, detections, bboxes, scores, idxs, iou_threshold):
+    """
+    apply non-exportable nms strategy (see `nms_strategy.NMSStrategy`) on
+    detections [K, D] whose first 4 columns are the boxes and 5th column
+    is the confidence; boxes are replaced with the strategy's updated boxes
+    and confidence is scaled by the change of score
+
+    Returns
+    -------
+    keep, detections, bboxes, scores : Tensor
+        indices of kept candidates and their updated detections, boxes and scores
+    """
+    keep, kept_bboxes, kept_scores = strategy(bboxes, scores, idxs, iou_threshold)
+    detections = detections.index_select(0, keep).clone()
+    old_scores = scores.index_select(0, keep)
+    ratio = torch.where(old_scores > 0, kept_scores / old_scores, torch.zeros_like(old_scores))
+    detections[:, :4] = kept_bboxes
+    detections[:, 4] = detections[:, 4] * ratio
+    return keep, detections, kept_bboxes, kept_scores
+
+
 class BatchedNMS(nn.Module):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, strategy=None, *args, **kwargs):
         super(type(self),self).__init__()
         self.nms_fn = batched_nms
+        # strategy other than hard nms, left to runtime when exported
+        self.strategy = strategy if strategy is not None and not strategy.exportable else None
 
     def forward(self, detections: torch.Tensor, class_indexes: torch.Tensor, bboxes: torch.Tensor, scores: torch.Tensor, iou_threshold: torch.Tensor) -> torch.Tensor:
         if not len(class_indexes.shape) == 1:
@@ -117,7 +225,130 @@ class BatchedNMS(nn.Module):
                                (len(detections.shape), detections.shape))
         if detections.size()[0] > 1:
             raise RuntimeError("current version only support single batch")
+        if self.strategy is not None:
+            if torch.jit.is_tracing():
+                return detections
+            detections = apply_strategy(self.strategy, detections.squeeze(0),
+                bboxes, scores, class_indexes, iou_threshold)[1]
+            return detections.unsqueeze(0)
         keep = self.nms_fn(
             bboxes, scores, class_indexes, iou_threshold)
         detections = detections.index_select(1, keep)
         return detections
+
+
+def padded_batched_nms(detections, bboxes, scores, class_indexes, batch_indexes, n_batch, iou_threshold, max_detections, suppress=True):
+    # type: (torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, int, torch.Tensor, torch.Tensor, bool) -> Tuple[torch.Tensor, torch.Tensor]
+    """
+    Performs non-maximum suppression on candidates of all images in the batch
+    at once, with a single nms call (a single `NonMaxSuppression` when exported
+    to onnx), and pads the result to fixed size.
+
+    NMS is not applied between elements of different images or categories.
+
+    Parameters
+    ----------
+    detections : Tensor[K, D]
+        detection of each candidate of all images
+    bboxes : Tensor[K, 4]
+        boxes where NMS will be performed, in (x1, y1, x2, y2) format
+    scores : Tensor[K]
+        scores for each one of the boxes
+    class_indexes : Tensor[K]
+        indices of the categories for each one of the boxes
+    batch_indexes : Tensor[K]
+        index of the image in batch for each one of the boxes
+    n_batch : int
+        number of images in batch
+    iou_threshold : Tensor
+        discards all overlapping boxes with IoU > iou_threshold
+    max_detections : Tensor[1]
+        maximum number of detections of each image, may be model's input
+    suppress : bool
+        if False, only sort and pad the candidates, without suppression
+
+    Returns
+    -------
+    detections : Tensor[n_batch, max_detections, D]
+        detections of each image in decreasing order of scores,
+        padded with zeros
+    n_valid : Tensor[n_batch]
+        int64 tensor with the number of valid detections of each image
+    """
+    if suppress:
+        # same strategy as `batched_nms`, the offset additionally depends on the batch index
+        # trailing zero avoids reducing empty tensor when there is no candidate
+        n_classes = torch.cat((class_indexes, class_indexes.new_zeros(1))).max() + 1
+        idxs = batch_indexes * n_classes + class_indexes
+        if torch.jit.is_scripting():
+            # scripted nms takes threshold as scalar
+            iou_threshold = iou_threshold.view(())
+        if not torch.jit.is_scripting() and is_in_onnx_export():
+            # offset of image and class in float32 exceeds 2^24 with large images and many classes,
+            # so exported with per-class scores and only images separated by offset
+            keep = multiclass_nms(offset_boxes(bboxes, batch_indexes), scores, class_indexes,
+                n_classes, iou_threshold)
+        else:
+            boxes_for_nms = offset_boxes(bboxes, idxs)
+            keep = ops.nms(boxes_for_nms, scores.to(boxes_for_nms.dtype), iou_threshold)
+    else:
+        keep = torch.topk(scores, scores.size(0))[1]
+    # group kept candidates by image, keeping decreasing order of scores in each image
+    kept_batch = batch_indexes.index_select(0, keep)
+    kept_scores = scores.index_select(0, keep)
+    n_keep = keep.size(0)
+    # sort by batch index then decreasing score, as single topk (exportable to onnx opset 10)
+    score_range = torch.cat((kept_scores.abs(), kept_scores.new_zeros(1))).max() * 2 + 1
+    order = torch.topk(kept_scores - kept_batch.to(kept_scores.dtype) * score_range, n_keep)[1]
+    keep = keep.index_select(0, order)
+    kept_batch = kept_batch.index_select(0, order)
+    # number of detections and first position of each image, without cumsum (onnx opset < 11)
+    images = torch.arange(n_batch, dtype=torch.long, device=keep.device)
+    counts = (kept_batch.unsqueeze(1) == images.unsqueeze(0)).long().sum(0)
+    preceding = (images.unsqueeze(0) < images.unsqueeze(1)).float()
+    starts = torch.matmul(preceding, counts.float().unsqueeze(1)).squeeze(1).long()
+    # gather into padded output, invalid slots gather the trailing zero row
+    if torch.jit.is_scripting():
+        slots = torch.arange(int(max_detections.item()), dtype=torch.long, device=keep.device)
+    else:
+        # traced as dynamic range, so it can be model's input when exported
+        slots = torch.arange(max_detections.view(()).long(), device=keep.device)
+    valid = slots.unsqueeze(0) < counts.unsqueeze(1)
+    index = starts.unsqueeze(1) + slots.unsqueeze(0)
+    index = torch.where(valid, index, torch.full_like(index, n_keep))
+    rows = torch.cat((detections.index_select(0, keep), detections.new_zeros((1, detections.size(1)))), 0)
+    output = rows.index_select(0, index.view(-1)).view(n_batch, -1, detections.size(1))
+    n_valid = valid.long().sum(1)
+    return output, n_valid
+
+
+class PaddedBatchedNMS(nn.Module):
+    def __init__(self, max_detections: int = 100, suppress: bool = True, strategy=None, *args, **kwargs):
+        super(type(self),self).__init__()
+        self.max_detections = max_detections
+        self.suppress = suppress
+        self.nms_fn = padded_batched_nms
+        # strategy other than hard nms, left to runtime when exported
+        self.strategy = strategy if suppress and strategy is not None and not strategy.exportable else None
+
+    def forward(self, detections: torch.Tensor, class_indexes: torch.Tensor, bboxes: torch.Tensor, scores: torch.Tensor, batch_indexes: torch.Tensor, n_batch: int, iou_threshold: torch.Tensor, max_detections: Optional[torch.Tensor] = None) -> Tuple[torch.Tensor, torch.Tensor]:
+        if not len(batch_indexes.shape) == 1:
+            raise RuntimeError("expects `batch_indexes` to be 1-dimensional tensor, got %s with shape of %s" %
+                               (len(batch_indexes.shape), batch_indexes.shape))
+        if not len(detections.shape) == 2:
+            raise RuntimeError("expects `detections` to be 2-dimensional tensor, got %s with shape of %s" %
+                               (len(detections.shape), detections.shape))
+        if max_detections is None:
+            max_detections = torch.tensor([self.max_detections], device=detections.device)
+        if self.strategy is not None:
+            if torch.jit.is_tracing():
+                return self.nms_fn(detections, bboxes, scores, class_indexes, batch_indexes,
+                    n_batch, iou_threshold, max_detections, False)
+            # suppressed by the strategy, then only sorted and padded
+            n_classes = torch.cat((class_indexes, class_indexes.new_zeros(1))).max() + 1
+            keep, detections, bboxes, scores = apply_strategy(self.strategy, detections, bboxes, scores,
+                batch_indexes * n_classes + class_indexes, iou_threshold)
+            return self.nms_fn(detections, bboxes, scores, class_indexes.index_select(0, keep),
+                batch_indexes.index_select(0, keep), n_batch, iou_threshold, max_detections, False)
+        return self.nms_fn(detections, bboxes, scores, class_indexes, batch_indexes,
+            n_batch, iou_threshold, max_detections, self.suppress)
@@ -0,0 +1,209 @@
+import torch
+import torchvision.ops as ops
+
+from typing import Tuple, Dict, Any
+
+from vortex.development.utils.registry import Registry
+from .nms import batched_nms, offset_boxes
+
+
+class NMSStrategy:
+    """
+    Base class of nms strategy, called with candidates of all groups
+    (e.g. categories, or categories of each image) :
+    ```
+        keep, boxes, scores = strategy(boxes, scores, idxs, iou_threshold)
+    ```
+    where `keep` is indices of kept boxes in decreasing order of (updated)
+    scores, `boxes` and `scores` are the kept boxes and scores, possibly
+    updated by the strategy (e.g. fused boxes or decayed scores).
+
+    Strategy that is not `exportable` is applied by the runtime on exported
+    model's output, with the runtime's numpy counterpart of the same name
+    (see `vortex.runtime.nms.nms_strategies`) and `args`.
+    """
+    exportable = False
+
+    def __init__(self, **args):
+        self.args = args
+
+    @property
+    def spec(self) -> Dict[str,Any]:
+        """name and arguments, embedded in exported model"""
+        return dict(name=self.name, **self.args)
+
+    @staticmethod
+    def pairwise_iou(boxes: torch.Tensor, idxs: torch.Tensor) -> torch.Tensor:
+        """pairwise iou of boxes, zero between boxes of different groups"""
+        boxes = offset_boxes(boxes, idxs)
+        return ops.box_iou(boxes, boxes)
+
+    @staticmethod
+    def sort_descending(scores: torch.Tensor, idxs: torch.Tensor) -> torch.Tensor:
+        """
+        indices of scores in decreasing order, ties in increasing order of
+        group then index, as the runtime's (without stable sort of torch>=1.9)
+        """
+        index = torch.arange(scores.size(0), device=scores.device)
+        tie = (idxs.unsqueeze(0) < idxs.unsqueeze(1)) \
+            | ((idxs.unsqueeze(0) == idxs.unsqueeze(1)) & (index.unsqueeze(0) < index.unsqueeze(1)))
+        before = (scores.unsqueeze(0) > scores.unsqueeze(1)) \
+            | ((scores.unsqueeze(0) == scores.unsqueeze(1)) & tie)
+        ## rank of each score is unique, so is the order
+        return torch.argsort(before.sum(1))
+
+    @staticmethod
+    def suppress(overlap: torch.Tensor) -> torch.Tensor:
+        """
+        greedy suppression given whether two boxes (in decreasing order of
+        scores) overlap; box is kept iff no kept box before it overlaps, solved
+        by fixed-point iteration from keeping all boxes, which converges to
+        the greedy result in as many iterations as the longest chain of
+        suppression
+        """
+        overlap = overlap.triu(1).to(torch.float32)
+        keep = torch.ones(overlap.size(0), dtype=torch.bool, device=overlap.device)
+        while True:
+            updated = torch.matmul(keep.to(torch.float32).unsqueeze(0), overlap).squeeze(0) == 0
+            if torch.equal(updated, keep):
+                return keep
+            keep = updated
+
+    def __call__(self, boxes: torch.Tensor, scores: torch.Tensor, idxs: torch.Tensor,
+                 iou_threshold: torch.Tensor) -> Tuple[torch.Tensor,torch.Tensor,torch.Tensor]:
+        raise NotImplementedError
+
+
+NMS_STRATEGIES = Registry("nms_strategies", base_class=NMSStrategy)
+
+register_nms_strategy = NMS_STRATEGIES.register
+remove_nms_strategy = NMS_STRATEGIES.pop
+
+
+@register_nms_strategy(name='hard')
+class HardNMS(NMSStrategy):
+    """greedy nms with `torchvision.ops.nms`, exported as onnx NonMaxSuppression"""
+    name = 'hard'
+    exportable = True
+
+    def __call__(self, boxes, scores, idxs, iou_threshold):
+        keep = batched_nms(boxes, scores, idxs, iou_threshold)
+        return keep, boxes.index_select(0, keep), scores.index_select(0, keep)
+
+
+@register_nms_strategy(name='soft_gaussian')
+class SoftGaussianNMS(NMSStrategy):
+    """
+    Soft-NMS (Bodla et al., 2017), scores of boxes overlapping each kept box
+    are decayed by `exp(-iou^2 / sigma)` instead of discarded, boxes with
+    decayed score below `min_score` are discarded; `iou_threshold` is not used.
+
+    Sequential by definition, but each step keeps the next box of all groups
+    at once, so it takes as many steps as the largest group; pairwise iou of
+    all candidates is computed, which should be bounded with `pre_nms_topk`
+    """
+    name = 'soft_gaussian'
+
+    def __init__(self, sigma: float = 0.5, min_score: float = 1e-3):
+        super().__init__(sigma=sigma, min_score=min_score)
+
+    def decay(self, iou: torch.Tensor, iou_threshold: float) -> torch.Tensor:
+        return torch.exp(-iou.pow(2) / self.args['sigma'])
+
+    def __call__(self, boxes, scores, idxs, iou_threshold):
+        iou_threshold = float(iou_threshold)
+        iou = type(self).pairwise_iou(boxes, idxs)
+        groups = torch.unique(idxs)
+        member = idxs.unsqueeze(0) == groups.unsqueeze(1)
+        decayed = scores.to(iou.dtype)
+        alive = torch.ones_like(scores, dtype=torch.bool)
+        keep = torch.zeros_like(alive)
+        kept_scores = torch.zeros_like(decayed)
+        for _ in range(int(member.sum(1).max()) if len(groups) else 0):
+            ## the next kept box of each group is the one with highest decayed score
+            best, i = torch.where(member & alive, decayed, decayed.new_full((), -1.)).max(1)
+            active = best >= self.args['min_score']
+            if not active.any():
+                break
+            i = i[active]
+            keep[i] = True
+            kept_scores[i] = best[active]
+            alive[i] = False
+            ## no overlap (no decay) between groups
+            decayed = decayed * self.decay(iou.index_select(0, i), iou_threshold).prod(0)
+        keep = keep.nonzero().squeeze(1)
+        kept_scores = kept_scores.index_select(0, keep)
+        order = type(self).sort_descending(kept_scores, idxs.index_select(0, keep))
+        keep = keep.index_select(0, order)
+        return keep, boxes.index_select(0, keep), kept_scores.index_select(0, order)
+
+
+@register_nms_strategy(name='soft_linear')
+class SoftLinearNMS(SoftGaussianNMS):
+    """
+    Soft-NMS with linear decay, scores of boxes overlapping each kept box with
+    IoU > iou_threshold are multiplied by `1 - iou`
+    """
+    name = 'soft_linear'
+
+    def __init__(self, min_score: float = 1e-3):
+        NMSStrategy.__init__(self, min_score=min_score)
+
+    def decay(self, iou, iou_threshold):
+        return torch.where(iou > iou_threshold, 1 - iou, torch.ones_like(iou))
+
+
+@register_nms_strategy(name='diou')
+class DIoUNMS(NMSStrategy):
+    """
+    DIoU-NMS (Zheng et al., 2020), suppresses boxes whose IoU minus normalized
+    center distance, `(d^2 / c^2)^beta`, is above `iou_threshold`, so
+    overlapping boxes with distant centers (e.g. occluded objects) are kept
+    """
+    name = 'diou'
+
+    def __init__(self, beta: float = 1.):
+        super().__init__(beta=beta)
+
+    def __call__(self, boxes, scores, idxs, iou_threshold):
+        order = type(self).sort_descending(scores, idxs)
+        sorted_boxes = boxes.index_select(0, order)
+        iou = type(self).pairwise_iou(sorted_boxes, idxs.index_select(0, order))
+        # penalty in double precision as the difference is compared to threshold
+        sorted_boxes = sorted_boxes.double()
+        centers = (sorted_boxes[:, :2] + sorted_boxes[:, 2:]) / 2
+        distance = (centers.unsqueeze(1) - centers.unsqueeze(0)).pow(2).sum(2)
+        enclosing = torch.max(sorted_boxes[:, None, 2:], sorted_boxes[None, :, 2:]) \
+            - torch.min(sorted_boxes[:, None, :2], sorted_boxes[None, :, :2])
+        penalty = distance / enclosing.pow(2).sum(2)
+        penalty = torch.where(torch.isfinite(penalty), penalty, torch.zeros_like(penalty)).pow(self.args['beta'])
+        keep = order[type(self).suppress((iou - penalty) > float(iou_threshold))]
+        return keep, boxes.index_select(0, keep), scores.index_select(0, keep)
+
+
+@register_nms_strategy(name='wbf')
+class WeightedBoxFusion(NMSStrategy):
+    """
+    weighted box fusion (Solovyev et al., 2019) of single model's boxes, each
+    box kept by nms is replaced by the score-weighted average of the boxes it
+    suppresses (including itself), with their average score
+    """
+    name = 'wbf'
+
+    def __call__(self, boxes, scores, idxs, iou_threshold):
+        keep = batched_nms(boxes, scores, idxs, iou_threshold)
+        if keep.numel() == 0:
+            return keep, boxes[:0], scores[:0]
+        offset = offset_boxes(boxes, idxs)
+        member = ops.box_iou(offset.index_select(0, keep), offset) > float(iou_threshold)
+        member[torch.arange(keep.size(0), device=keep.device), keep] = True
+        ## first (highest score) kept box overlapping each box
+        cluster = member.to(torch.uint8).argmax(0)
+        weights = scores.to(torch.float64)
+        total = weights.new_zeros(keep.size(0)).index_add_(0, cluster, weights)
+        counts = weights.new_zeros(keep.size(0)).index_add_(0, cluster, torch.ones_like(weights))
+        fused = weights.new_zeros(keep.size(0), 4).index_add_(0, cluster, boxes.to(torch.float64) * weights.unsqueeze(1))
+        fused = (fused / total.unsqueeze(1)).to(boxes.dtype)
+        fused_scores = (total / counts).to(scores.dtype)
+        order = torch.argsort(fused_scores, descending=True)
+        return keep.index_select(0, order), fused.index_select(0, order), fused_scores.index_select(0, order)
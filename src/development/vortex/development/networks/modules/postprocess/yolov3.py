@@ -1,7 +1,7 @@
 import torch
 import torch.nn as nn
 
-from typing import Tuple
+from typing import Tuple, Optional
 
 from .base_postprocess import BatchedNMSPostProcess
 
@@ -67,6 +67,47 @@ class YoloV3Decoder(nn.Module):
         detections = torch.cat((bboxes, class_conf, class_pred.float()), 2)
         return bboxes.squeeze(0), scores.squeeze(0), class_pred.squeeze(0).squeeze(1), detections
 
+    def decode_batch(self, input: torch.Tensor, score_threshold: torch.Tensor, pre_nms_topk: Optional[torch.Tensor] = None) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        decode candidates of all images in the batch at once, thresholded
+        with a single `nonzero` over the whole batch; returns bboxes, scores,
+        class indexes, batch indexes and detections of all candidates,
+        flattened over the batch; with `pre_nms_topk` (0 or less means no limit),
+        only candidates with highest scores of each image are kept
+        """
+        predictions = input
+        if not (len(predictions.size()) == 3):
+            raise RuntimeError(
+                "this routine expects predictions is a 3-dimensional tensor! got %s dimension" % len(predictions.size()))
+        n_anchors = predictions.size(1)
+        # yolo darknet format : cx cy w h is_obj class...
+        class_conf, class_pred = predictions[..., 5:].max(2)
+        bboxes = yolo2xywh(predictions[..., :4] / self.img_size)
+        scores = predictions[..., 4] * class_conf
+        detections = torch.cat((bboxes, class_conf.unsqueeze(2), class_pred.unsqueeze(2).float()), 2)
+        if pre_nms_topk is not None:
+            # sort candidates of each image by score, then keep the first `pre_nms_topk`
+            # passing the threshold; limit is compared to rank so it can be model's input
+            keep = predictions[..., 4] > score_threshold if self.threshold \
+                else torch.ones_like(scores, dtype=torch.bool)
+            order = torch.topk(torch.where(keep, scores, torch.full_like(scores, -float('inf'))), n_anchors, dim=1)[1]
+            rank = torch.arange(n_anchors, dtype=torch.long, device=predictions.device).unsqueeze(0)
+            topk = pre_nms_topk.view(-1)[:1].long()
+            topk = torch.where(topk > 0, topk, torch.full_like(topk, n_anchors))
+            selected = torch.nonzero((keep.gather(1, order) & (rank < topk)).view(-1), as_tuple=False).squeeze(1)
+            indices = selected // n_anchors * n_anchors + order.view(-1).index_select(0, selected)
+        elif self.threshold:
+            indices = torch.nonzero((predictions[..., 4] > score_threshold).view(-1), as_tuple=False).squeeze(1)
+        else:
+            indices = torch.arange(predictions.size(0) * n_anchors, dtype=torch.long, device=predictions.device)
+        ## non-negative indices, `//` instead of `torch.div(rounding_mode=...)` (torch>=1.8)
+        batch_indexes = indices // n_anchors
+        bboxes = bboxes.reshape(-1, 4).index_select(0, indices)
+        scores = scores.reshape(-1).index_select(0, indices)
+        class_pred = class_pred.reshape(-1).index_select(0, indices)
+        detections = detections.reshape(-1, detections.size(2)).index_select(0, indices)
+        return bboxes, scores, class_pred, batch_indexes, detections
+
 
 class YoloV3PostProcess(BatchedNMSPostProcess):
     """ Post-Process for yolo, comply with basic detector post process
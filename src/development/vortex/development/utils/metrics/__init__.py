@@ -1 +1,4 @@
-from .registry import METRICS
\ No newline at end of file
+from .registry import METRICS
+from .metric_base import MetricBase
+from .classification import ClassificationMetrics
+from .detection import DetectionMetrics
@@ -10,66 +10,113 @@ import matplotlib.pyplot as plt
 
 from itertools import cycle
 from typing import Union, List, Dict, Type, Any
-from sklearn.metrics import confusion_matrix
-from sklearn.metrics import average_precision_score, precision_recall_curve
-from sklearn.metrics import roc_curve, roc_auc_score
-from sklearn.metrics import precision_recall_fscore_support
 
 @METRICS.register()
 class ClassificationMetrics(MetricBase):
-    def __init__(self, class_names=None, *args, **kwargs):
+    """
+    Accuracy, precision, recall and f1 score from a confusion matrix, and
+    precision-recall and ROC curve of each class (one-vs-rest) from
+    histograms of prediction confidence with `n_bins` fixed bins in [0,1].
+
+    States are tensors of fixed size (number of classes) summed across
+    processes, so memory doesn't grow with the number of samples and results
+    of multiple workers can be combined with `merge`. When `class_names` is
+    not given, states grow with the largest label seen; give `class_names`
+    for distributed training so every process has the same state size.
+    """
+    def __init__(self, class_names=None, n_bins: int = 1000, *args, **kwargs):
         super().__init__()
-        self.eval_init()
         self.class_names = class_names
+        self.n_bins = n_bins
+        n_classes = len(class_names) if class_names else 0
+        ## confusion[truth, prediction]
+        self.add_state('confusion', torch.zeros(n_classes, n_classes, dtype=torch.long), dist_reduce_fx='sum')
+        ## confidence histogram of correct (true positive) and incorrect
+        ## (false positive) predictions, by predicted class
+        self.add_state('tp_hist', torch.zeros(n_classes, n_bins, dtype=torch.long), dist_reduce_fx='sum')
+        self.add_state('fp_hist', torch.zeros(n_classes, n_bins, dtype=torch.long), dist_reduce_fx='sum')
 
     def eval_init(self, *args, **kwargs) :
-        self.correct = 0
-        self.results = {
-            'truths' : {}, 
-            'predictions' : {}, 
-            'scores' : {},
-        } ## {str : {int : []}}
-        self.n_data = 0
+        self.reset()
+
+    def _grow(self, n_classes: int):
+        """grow states to at least `n_classes`, capacity is doubled to amortize growing"""
+        capacity = self.confusion.size(0)
+        if n_classes <= capacity:
+            return
+        capacity = max(n_classes, 2 * capacity)
+        pad = capacity - self.confusion.size(0)
+        self.confusion = torch.nn.functional.pad(self.confusion, (0, pad, 0, pad))
+        self.tp_hist = torch.nn.functional.pad(self.tp_hist, (0, 0, 0, pad))
+        self.fp_hist = torch.nn.functional.pad(self.fp_hist, (0, 0, 0, pad))
 
     def update(self, inputs, targets):
         if isinstance(inputs, torch.Tensor):
             # assume has [batch_index, 2] shape
-            result_class_label = inputs[:,0].flatten().numpy()
-            result_class_confidence = inputs[:,1].flatten().numpy()
+            result_class_label = inputs[:,0].flatten()
+            result_class_confidence = inputs[:,1].flatten()
         else:
-            result_class_label = list(map(lambda x: int(x['class_label']), inputs))
-            result_class_confidence = list(map(lambda x: float(x['class_confidence']), inputs))
-        label = targets
-        if isinstance(label, np.ndarray):
-            label = label.flatten()
-        elif isinstance(label, torch.Tensor):
-            label = label.flatten().cpu().numpy()
-        correct = np.sum(np.equal(result_class_label, label))
-        self.correct += correct
-        self.n_data  += len(targets)
-        for batch_idx, (gt, result_class, result_confidence) in enumerate(zip(label, result_class_label, result_class_confidence)) :
-            gt = int(gt)
-            if gt in self.results['truths']:
-                self.results['truths'][gt].append(gt)
-                self.results['predictions'][gt].append(result_class)
-                self.results['scores'][gt].append(result_confidence)
-            else:
-                self.results['truths'][gt] = [gt]
-                self.results['predictions'][gt] = [result_class]
-                self.results['scores'][gt] = [result_confidence]
-    
-    def compute(self):
-        metrics = {'accuracy': self.correct / self.n_data}
+            result_class_label = torch.tensor([np.asarray(x['class_label']).item() for x in inputs])
+            result_class_confidence = torch.tensor([np.asarray(x['class_confidence']).item() for x in inputs])
+        label = torch.as_tensor(targets).flatten()
+        device = self.confusion.device
+        prediction = result_class_label.to(device=device, dtype=torch.long)
+        label = label.to(device=device, dtype=torch.long)
+        confidence = result_class_confidence.to(device=device, dtype=torch.float)
+        if label.numel() == 0:
+            return
+        self._grow(int(max(prediction.max(), label.max())) + 1)
+        ones = torch.ones_like(label)
+        self.confusion.index_put_((label, prediction), ones, accumulate=True)
+        bins = (confidence * self.n_bins).long().clamp_(0, self.n_bins - 1)
+        correct = prediction == label
+        self.tp_hist.index_put_((prediction[correct], bins[correct]), ones[correct], accumulate=True)
+        self.fp_hist.index_put_((prediction[~correct], bins[~correct]), ones[~correct], accumulate=True)
+
+    def merge(self, *others: Union['ClassificationMetrics',Dict[str,Any]]) -> 'ClassificationMetrics':
+        """add states of other metrics (e.g. from other workers), or its `states()`, to this metric,
+        states are grown to the largest number of classes
+        """
+        for other in others:
+            confusion, tp_hist, fp_hist = (MetricBase.get_state(other, name)
+                for name in ('confusion', 'tp_hist', 'fp_hist'))
+            n = confusion.size(0)
+            self._grow(n)
+            self.confusion[:n,:n] += confusion.to(self.confusion.device)
+            self.tp_hist[:n] += tp_hist.to(self.tp_hist.device)
+            self.fp_hist[:n] += fp_hist.to(self.fp_hist.device)
+        if getattr(self, '_computed', None) is not None:
+            self._computed = None
+        return self
+
+    @property
+    def n_classes(self) -> int:
+        """number of classes, given by `class_names` or largest label seen"""
+        if self.class_names:
+            return len(self.class_names)
+        seen = torch.nonzero(self.confusion.sum(0) + self.confusion.sum(1))
+        return int(seen.max()) + 1 if len(seen) else 0
 
-        num_classes = len(self.results['truths'])
-        y_true, y_pred, score = [], [], []
-        for i in range(num_classes):
-            y_true.extend(self.results['truths'][i])
-            y_pred.extend(self.results['predictions'][i])
-            score.extend(self.results['scores'][i])
-
-        for avg in ('micro', 'macro', 'weighted'):
-            p, r, f1, _ = precision_recall_fscore_support(y_true, y_pred, average=avg)
+    def compute(self):
+        cm = self.confusion.double()
+        n_data = cm.sum()
+        tp, truths, predictions = cm.diagonal(), cm.sum(1), cm.sum(0)
+        metrics = {'accuracy': (tp.sum() / n_data).item()}
+
+        ## as sklearn, classes that are neither in truths nor predictions are ignored,
+        ## and zero division results in zero
+        present = (truths + predictions) > 0
+        tp, truths, predictions = tp[present], truths[present], predictions[present]
+        precision = torch.where(predictions > 0, tp / predictions, torch.zeros_like(tp))
+        recall = torch.where(truths > 0, tp / truths, torch.zeros_like(tp))
+        f1 = torch.where(precision + recall > 0, 2 * precision * recall / (precision + recall), torch.zeros_like(tp))
+        micro = (tp.sum() / n_data).item()
+        averages = {
+            'micro': (micro, micro, micro),
+            'macro': (precision.mean().item(), recall.mean().item(), f1.mean().item()),
+            'weighted': tuple((x * truths).sum().item() / truths.sum().item() for x in (precision, recall, f1)),
+        }
+        for avg, (p, r, f1) in averages.items():
             metrics.update({
                 "precision ({})".format(avg): p,
                 "recall ({})".format(avg): r,
@@ -77,56 +124,50 @@ class ClassificationMetrics(MetricBase):
             })
         return metrics
 
-    def save_metrics(self, output_directory, experiment_name='classification_results') :
-        results = pd.DataFrame(self.results)
-        n_classes = len(results['truths'])
-
-        ## compute confusion matrix
-        y_true_flat, y_pred_flat = [], []
-        for i in range(n_classes) :
-            y_true_flat.extend(results['truths'][i])
-            y_pred_flat.extend(results['predictions'][i])
-        cm = confusion_matrix(
-            y_true=y_true_flat,
-            y_pred=y_pred_flat,
+    def curves(self) -> Dict[str,np.ndarray]:
+        """precision-recall and ROC curve of each class (one-vs-rest, the score of a class is
+        the confidence when it's the predicted class and zero otherwise), all classes at once
+
+        Returns:
+            Dict[str,np.ndarray]: 'precision', 'recall', 'fpr' and 'tpr' of shape
+                [n_classes, n_bins + 2] at decreasing thresholds, 'average_precision' and
+                'roc_auc' of shape [n_classes], nan for class without samples
+        """
+        n = self.n_classes
+        ## states may be on gpu, curves are returned as numpy
+        cm = self.confusion[:n,:n].double().cpu()
+        positives = cm.sum(1, keepdim=True)
+        negatives = cm.sum() - positives
+        tp_hist, fp_hist = self.tp_hist[:n].double().cpu(), self.fp_hist[:n].double().cpu()
+        ## cumulative counts from highest score bin, last threshold includes zero scores
+        zeros = torch.zeros_like(positives)
+        tp = torch.cat([zeros, tp_hist.flip(1), positives - tp_hist.sum(1, keepdim=True)], 1).cumsum(1)
+        fp = torch.cat([zeros, fp_hist.flip(1), negatives - fp_hist.sum(1, keepdim=True)], 1).cumsum(1)
+        precision = torch.where(tp + fp > 0, tp / (tp + fp).clamp(min=1), torch.ones_like(tp))
+        recall = tp / positives
+        fpr, tpr = fp / negatives, tp / positives
+        average_precision = ((recall[:,1:] - recall[:,:-1]) * precision[:,1:]).sum(1)
+        roc_auc = torch.trapz(tpr, fpr, dim=1)
+        return dict(
+            precision=precision.numpy(), recall=recall.numpy(),
+            fpr=fpr.numpy(), tpr=tpr.numpy(),
+            average_precision=average_precision.numpy(), roc_auc=roc_auc.numpy(),
         )
-        cm = cm / cm.sum(axis=1, keepdims=True)
-        df_cm = pd.DataFrame(cm, range(cm.shape[0]), range(cm.shape[1]))
-
-        to_list = lambda mapping : list(mapping[i] for i in range(len(mapping)))
-        truths = np.array(to_list(results['truths']))
-        predictions = np.array(to_list(results['predictions']))
-        scores = np.array(to_list(results['scores']))
-
-        ## truths, predictions, scores are mappings 
-        ## truths : class_label -> class_label, 
-        ## predictions : class_label -> prediction, 
-        ## scores : class_label -> score,
-        ## each size is (n_classes, n_samples)
-        average_precisions, precisions, recalls = [], [], []
-        roc_aucs, fprs, tprs = [], [], []
-        for class_truths, class_predictions, class_scores in zip(truths, predictions, scores):
-            n_samples = len(class_predictions)
-            scores_mat = np.zeros((n_samples, n_classes))
-            truths_mat = np.zeros_like(scores_mat)
-            ## one hot encoding, fill with scores and label
-            scores_mat[np.arange(n_samples), class_predictions] = class_scores
-            truths_mat[np.arange(n_samples), class_truths] = 1
-
-            average_precisions.append(
-                average_precision_score(truths_mat.flatten(), scores_mat.flatten())
-            )
-            precision, recall, _ = precision_recall_curve(
-                truths_mat.flatten(),
-                scores_mat.flatten(),
-            )
-            precisions.append(precision)
-            recalls.append(recall)
-
-            roc_aucs.append(roc_auc_score(truths_mat.flatten(), scores_mat.flatten()))
-            fpr, tpr, _ = roc_curve(truths_mat.flatten(), scores_mat.flatten())
-            fprs.append(fpr)
-            tprs.append(tpr)
+
+    def save_metrics(self, output_directory, experiment_name='classification_results') :
+        n_classes = self.n_classes
+
+        ## confusion matrix of classes in truths or predictions, normalized by truths
+        cm = self.confusion[:n_classes,:n_classes].double().cpu().numpy()
+        present = np.flatnonzero(cm.sum(0) + cm.sum(1))
+        cm = cm[np.ix_(present, present)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cm = cm / cm.sum(axis=1, keepdims=True)
+        df_cm = pd.DataFrame(cm, present, present)
+
+        curves = self.curves()
+        precisions, recalls, average_precisions = curves['precision'], curves['recall'], curves['average_precision']
+        fprs, tprs, roc_aucs = curves['fpr'], curves['tpr'], curves['roc_auc']
 
         assets = {}
 
@@ -0,0 +1,304 @@
+from .metric_base import MetricBase
+from .registry import METRICS
+from pathlib import Path
+import torch
+import numpy as np
+import matplotlib.pyplot as plt
+
+from itertools import cycle
+from typing import Union, List, Dict, Tuple, Sequence
+
+## COCO area ranges (in squared unit of box coordinates)
+coco_area_ranges = {
+    'all': (0, 1e10),
+    'small': (0, 32 ** 2),
+    'medium': (32 ** 2, 96 ** 2),
+    'large': (96 ** 2, 1e10),
+}
+
+
+def box_area(boxes: np.ndarray) -> np.ndarray:
+    return (boxes[:,2] - boxes[:,0]) * (boxes[:,3] - boxes[:,1])
+
+
+def box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """pairwise iou of x1y1x2y2 boxes, [n,4] x [m,4] -> [n,m]"""
+    lt = np.maximum(boxes_a[:,None,:2], boxes_b[None,:,:2])
+    rb = np.minimum(boxes_a[:,None,2:], boxes_b[None,:,2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    union = box_area(boxes_a)[:,None] + box_area(boxes_b)[None,:] - inter
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(union > 0, inter / union, 0.)
+
+
+@METRICS.register()
+class DetectionMetrics(MetricBase):
+    """
+    COCO-style detection metrics, average precision (101-point interpolated)
+    and average recall at multiple IoU thresholds and area ranges.
+
+    Each `update` matches detections of every image to its ground truths of
+    the same class, for all IoU thresholds and area ranges at once, from one
+    IoU matrix of the image; only the scores, labels and match results of
+    detections and labels and areas of ground truths are kept as arrays,
+    so `compute` is a sort and cumulative sum for each class.
+
+    Predictions are runtime results (list of dict with 'bounding_box',
+    'class_label' and 'class_confidence' for each image) or `[n,6]` arrays of
+    `(x1, y1, x2, y2, confidence, class_label)`. Targets are list of `[m,5]`
+    arrays of `(x1, y1, x2, y2, class_label)` for each image, or dict with
+    'bounding_box' and 'class_label', or `[batch,m,5]` array padded with
+    negative class label. Predictions and targets must be in the same
+    coordinates, `area_ranges` are in its squared unit (e.g. pixels for COCO
+    ranges, the default).
+    """
+    def __init__(self, class_names=None, iou_thresholds: Sequence[float] = None,
+                 area_ranges: Dict[str,Tuple[float,float]] = None, max_detections: int = 100,
+                 *args, **kwargs):
+        super().__init__()
+        self.class_names = class_names
+        if iou_thresholds is None:
+            iou_thresholds = np.linspace(.5, .95, 10)
+        self.iou_thresholds = np.round(np.asarray(iou_thresholds, dtype=np.float64), 4)
+        self.area_ranges = dict(area_ranges or coco_area_ranges)
+        if 'all' not in self.area_ranges:
+            raise ValueError("expects 'all' in area_ranges, got {}".format(list(self.area_ranges)))
+        self.max_detections = max_detections
+        ## detections: score, class label, and whether it's matched / ignored
+        ## for each iou threshold and area range, [n_detections, T, A]
+        self.add_state('scores', [], dist_reduce_fx='cat')
+        self.add_state('labels', [], dist_reduce_fx='cat')
+        self.add_state('matched', [], dist_reduce_fx='cat')
+        self.add_state('ignored', [], dist_reduce_fx='cat')
+        ## ground truths: class label and area
+        self.add_state('gt_labels', [], dist_reduce_fx='cat')
+        self.add_state('gt_areas', [], dist_reduce_fx='cat')
+
+    def eval_init(self, *args, **kwargs) :
+        self.reset()
+
+    @staticmethod
+    def _predictions(inputs) -> List[np.ndarray]:
+        """predictions of each image as [n,6] array of (x1,y1,x2,y2,confidence,label)"""
+        predictions = []
+        for x in inputs:
+            if isinstance(x, dict):
+                boxes = x.get('bounding_box')
+                if boxes is None:
+                    predictions.append(np.zeros((0, 6)))
+                    continue
+                x = np.concatenate([
+                    np.asarray(boxes, dtype=np.float64).reshape(-1, 4),
+                    np.asarray(x['class_confidence'], dtype=np.float64).reshape(-1, 1),
+                    np.asarray(x['class_label'], dtype=np.float64).reshape(-1, 1),
+                ], axis=1)
+            elif isinstance(x, torch.Tensor):
+                x = x.detach().cpu().double().numpy()
+            predictions.append(np.asarray(x, dtype=np.float64).reshape(-1, 6))
+        return predictions
+
+    @staticmethod
+    def _targets(targets) -> List[np.ndarray]:
+        """ground truths of each image as [m,5] array of (x1,y1,x2,y2,label)"""
+        result = []
+        for y in targets:
+            if isinstance(y, dict):
+                y = np.concatenate([
+                    np.asarray(y['bounding_box'], dtype=np.float64).reshape(-1, 4),
+                    np.asarray(y['class_label'], dtype=np.float64).reshape(-1, 1),
+                ], axis=1)
+            elif isinstance(y, torch.Tensor):
+                y = y.detach().cpu().double().numpy()
+            y = np.asarray(y, dtype=np.float64).reshape(-1, 5)
+            result.append(y[y[:,4] >= 0])
+        return result
+
+    def _match(self, dets: np.ndarray, gts: np.ndarray) -> Tuple[np.ndarray,np.ndarray,np.ndarray]:
+        """match detections of an image to its ground truths, as COCOeval.evaluateImg
+
+        Returns:
+            Tuple[np.ndarray,np.ndarray,np.ndarray]: index of kept detections, and whether
+                each is matched and ignored, [n,T,A]
+        """
+        n_thr, n_area = len(self.iou_thresholds), len(self.area_ranges)
+        ranges = np.asarray(list(self.area_ranges.values()), dtype=np.float64)
+        ## keep top max_detections of each class, in decreasing score
+        order = np.lexsort((-dets[:,4], dets[:,5]))
+        labels = dets[order,5]
+        rank = np.arange(len(order)) - np.searchsorted(labels, labels, side='left')
+        keep = order[rank < self.max_detections]
+        keep = keep[np.argsort(-dets[keep,4], kind='mergesort')]
+        dets = dets[keep]
+
+        matched = np.zeros((len(dets), n_thr, n_area), dtype=bool)
+        ignored = np.zeros((len(dets), n_thr, n_area), dtype=bool)
+        if len(gts):
+            gt_areas = box_area(gts)
+            ## [A,G] ground truth outside area range
+            gt_ignored = (gt_areas[None] < ranges[:,:1]) | (gt_areas[None] > ranges[:,1:])
+            iou = box_iou(dets[:,:4], gts[:,:4])
+            iou[dets[:,5,None] != gts[None,:,4]] = -1
+            gt_matched = np.zeros((n_thr, n_area, len(gts)), dtype=bool)
+            thresholds = np.minimum(self.iou_thresholds, 1 - 1e-10)[:,None,None]
+            ## greedy in decreasing score, vectorized over thresholds and area ranges;
+            ## detections without any overlap can't be matched
+            for d in np.flatnonzero(iou.max(1) >= thresholds.min()):
+                candidate = (iou[d] >= thresholds) & ~gt_matched
+                found = candidate.any(2)
+                if not found.any():
+                    continue
+                ## prefer ground truth in area range, then higher iou
+                best = np.where(candidate, iou[d] + 2. * ~gt_ignored, -1.).argmax(2)
+                t, a = np.nonzero(found)
+                g = best[t, a]
+                gt_matched[t, a, g] = True
+                matched[d, t, a] = True
+                ignored[d, t, a] = gt_ignored[a, g]
+        ## unmatched detection outside area range is ignored
+        areas = box_area(dets)
+        outside = (areas[:,None] < ranges[None,:,0]) | (areas[:,None] > ranges[None,:,1])
+        ignored |= ~matched & outside[:,None,:]
+        return keep, matched, ignored
+
+    def update(self, inputs, targets):
+        for dets, gts in zip(self._predictions(inputs), self._targets(targets)):
+            keep, matched, ignored = self._match(dets, gts)
+            self.scores.append(torch.from_numpy(dets[keep,4]))
+            self.labels.append(torch.from_numpy(dets[keep,5]).long())
+            self.matched.append(torch.from_numpy(matched))
+            self.ignored.append(torch.from_numpy(ignored))
+            self.gt_labels.append(torch.from_numpy(gts[:,4]).long())
+            self.gt_areas.append(torch.from_numpy(box_area(gts)))
+
+    def _states(self) -> Dict[str,np.ndarray]:
+        n_thr, n_area = len(self.iou_thresholds), len(self.area_ranges)
+        ## list states are concatenated to a tensor when synced across processes
+        def cat(x, shape, dtype):
+            if isinstance(x, torch.Tensor):
+                return x.cpu().numpy()
+            return torch.cat(x).numpy() if len(x) else np.zeros(shape, dtype=dtype)
+        return dict(
+            scores=cat(self.scores, (0,), np.float64),
+            labels=cat(self.labels, (0,), np.int64),
+            matched=cat(self.matched, (0, n_thr, n_area), bool),
+            ignored=cat(self.ignored, (0, n_thr, n_area), bool),
+            gt_labels=cat(self.gt_labels, (0,), np.int64),
+            gt_areas=cat(self.gt_areas, (0,), np.float64),
+        )
+
+    @property
+    def n_classes(self) -> int:
+        """number of classes, given by `class_names` or largest label seen"""
+        if self.class_names:
+            return len(self.class_names)
+        states = self._states()
+        labels = np.concatenate([states['labels'], states['gt_labels']])
+        return int(labels.max()) + 1 if len(labels) else 0
+
+    def accumulate(self) -> Dict[str,np.ndarray]:
+        """precision and recall of each class, as COCOeval.accumulate
+
+        Returns:
+            Dict[str,np.ndarray]: 'precision' at 101 recall thresholds, [T,101,C,A], and
+                maximum 'recall', [T,C,A], -1 for class without ground truth in area range
+        """
+        states = self._states()
+        n_classes = self.n_classes
+        n_thr, n_area = len(self.iou_thresholds), len(self.area_ranges)
+        recall_thresholds = np.linspace(0, 1, 101)
+        precision = -np.ones((n_thr, len(recall_thresholds), n_classes, n_area))
+        recall = -np.ones((n_thr, n_classes, n_area))
+
+        ranges = np.asarray(list(self.area_ranges.values()), dtype=np.float64)
+        gt_areas = states['gt_areas'][:,None]
+        gt_in_range = (gt_areas >= ranges[:,0]) & (gt_areas <= ranges[:,1])
+        ## [C,A] number of ground truths in area range
+        n_gts = np.zeros((n_classes, n_area), dtype=np.int64)
+        np.add.at(n_gts, states['gt_labels'], gt_in_range)
+
+        order = np.lexsort((-states['scores'], states['labels']))
+        labels = states['labels'][order]
+        bounds = np.searchsorted(labels, np.arange(n_classes + 1))
+        matched, ignored = states['matched'][order], states['ignored'][order]
+        for c in range(n_classes):
+            if not n_gts[c].any():
+                continue
+            ## within class, sorted by decreasing score, stable as COCOeval
+            index = slice(bounds[c], bounds[c+1])
+            tp = np.cumsum(matched[index] & ~ignored[index], axis=0, dtype=np.float64)
+            fp = np.cumsum(~matched[index] & ~ignored[index], axis=0, dtype=np.float64)
+            valid = n_gts[c] > 0
+            with np.errstate(invalid='ignore', divide='ignore'):
+                rc = tp / n_gts[c]
+                pr = tp / np.maximum(tp + fp, np.spacing(1))
+            if len(tp):
+                recall[:, c, valid] = rc[-1][:, valid]
+            else:
+                recall[:, c, valid] = 0
+            ## precision envelope, then sampled at recall thresholds
+            pr = np.maximum.accumulate(pr[::-1], axis=0)[::-1]
+            for t in range(n_thr):
+                for a in np.flatnonzero(valid):
+                    q = np.zeros(len(recall_thresholds))
+                    i = np.searchsorted(rc[:,t,a], recall_thresholds, side='left')
+                    q[i < len(pr)] = pr[i[i < len(pr)], t, a]
+                    precision[t, :, c, a] = q
+        return dict(precision=precision, recall=recall, recall_thresholds=recall_thresholds)
+
+    def compute(self):
+        results = self.accumulate()
+        precision, recall = results['precision'], results['recall']
+        area_index = {name: i for i, name in enumerate(self.area_ranges)}
+        mean = lambda x: float(np.mean(x[x > -1])) if (x > -1).any() else -1.
+
+        metrics = {'mAP': mean(precision[..., area_index['all']])}
+        for iou_threshold in (.5, .75):
+            t = np.flatnonzero(np.isclose(self.iou_thresholds, iou_threshold))
+            if len(t):
+                metrics['mAP@{}'.format(iou_threshold)] = mean(precision[t[0], ..., area_index['all']])
+        for name, a in area_index.items():
+            if name != 'all':
+                metrics['mAP ({})'.format(name)] = mean(precision[..., a])
+        metrics['mAR'] = mean(recall[..., area_index['all']])
+        return metrics
+
+    def save_metrics(self, output_directory, experiment_name='detection_results') :
+        results = self.accumulate()
+        ## precision-recall curve of each class at the first iou threshold, all areas
+        precisions = results['precision'][0, :, :, list(self.area_ranges).index('all')].T
+        recall_thresholds = results['recall_thresholds']
+
+        assets = {}
+        plt.clf()
+        plt.cla()
+        ax = plt.gca()
+        plt.gcf().set_size_inches((6.4,4.8))
+        lines, labels = [], []
+        colors = cycle(['navy', 'turquoise', 'darkorange', 'cornflowerblue', 'teal'])
+        for i, (precision, color) in enumerate(zip(precisions, colors)) :
+            if (precision < 0).all():
+                continue
+            l, = ax.plot(recall_thresholds, precision, color=color)
+            class_name = 'class_{}'.format(i) if self.class_names is None else self.class_names[i]
+            label = '{} (ap :{:.2f})'.format(class_name, precision.mean())
+            lines.append(l)
+            labels.append(label)
+        plt.ylim([0.0, 1.05])
+        plt.xlim([0.0, 1.0])
+        plt.grid()
+        plt.xlabel('recall')
+        plt.ylabel('precision')
+        plt.title("Precision Recall Curve (IoU={:.2f})".format(self.iou_thresholds[0]))
+        plt.legend(lines, labels, loc='center left',
+                    prop=dict(size=8), bbox_to_anchor=(1., 0.5))
+        plt.autoscale()
+        plt.tight_layout()
+        filename = Path(output_directory) / '{}_detection_pr_curve.png'.format(experiment_name)
+        plt.savefig(filename)
+        assets.update({
+            'Detection Precision Recall' : filename,
+        })
+        return assets
+
+    def report(self, output_directory='.', experiment_name='detection_results'):
+        return self.save_metrics(output_directory,experiment_name)
@@ -1,10 +1,48 @@
 import pytorch_lightning as pl
+import torch
 import abc
+from typing import Union, Dict, Any
 
 class MetricBase(pl.metrics.Metric):
     def __init__(self, *args, **kwargs):
         super().__init__(*args,**kwargs)
-    
+        self._merge_fx = {}
+
+    def add_state(self, name, default, dist_reduce_fx=None, *args, **kwargs):
+        super().add_state(name, default, dist_reduce_fx, *args, **kwargs)
+        self._merge_fx[name] = dist_reduce_fx
+
+    def states(self) -> Dict[str,Any]:
+        """metric states, e.g. to be sent from other process and merged"""
+        return {name: getattr(self, name) for name in self._merge_fx}
+
+    @staticmethod
+    def get_state(metric: Union['MetricBase',Dict[str,Any]], name: str):
+        """state of metric, or from metric states"""
+        return metric[name] if isinstance(metric, dict) else getattr(metric, name)
+
+    def merge(self, *others: Union['MetricBase',Dict[str,Any]]) -> 'MetricBase':
+        """add states of other metrics of the same type (e.g. from other workers or
+        processes), or its `states()`, to this metric, as reduced by `dist_reduce_fx`
+        of each state
+        """
+        for other in others:
+            for name, fx in self._merge_fx.items():
+                value, other_value = getattr(self, name), MetricBase.get_state(other, name)
+                if isinstance(value, list):
+                    value.extend(other_value)
+                elif fx == 'sum':
+                    setattr(self, name, value + other_value.to(value.device))
+                elif fx == 'cat':
+                    setattr(self, name, torch.cat([value, other_value.to(value.device)]))
+                else:
+                    raise NotImplementedError("merging state {} with reduction {} is not supported"
+                        .format(name, fx))
+        # invalidate cached result of compute
+        if getattr(self, '_computed', None) is not None:
+            self._computed = None
+        return self
+
     @abc.abstractmethod
     def report(self) -> dict:
-        pass
\ No newline at end of file
+        pass
@@ -1,6 +1,6 @@
 import pytorch_lightning as pl
 from .speed import TimeData
-from .resource import GPUMonitor, CPUMonitor
+from .resource import ResourceSampler
 from ..metrics import MetricBase
 from ..reporting.report import generate_reports
 from typing import List
@@ -55,12 +55,10 @@ class Profiler(pl.profiler.profilers.BaseProfiler):
         self._start_resource_monitor()
     
     def _init_resource_monitor(self):
-        self.cpu_monitor = CPUMonitor(name='global_cpu_monitor')
-        self.gpu_monitor = GPUMonitor(name='global_gpu_monitor')
+        self.resource_monitor = ResourceSampler(name='global_resource_monitor')
     
     def _start_resource_monitor(self):
-        self.cpu_monitor.start()
-        self.gpu_monitor.start()
+        self.resource_monitor.start()
 
     def start(self, action_name: str):
         if action_name not in self.timers:
@@ -71,8 +69,7 @@ class Profiler(pl.profiler.profilers.BaseProfiler):
         self.timers[action_name].stop()
     
     def summary(self, plot_dir=None) -> str:
-        self.cpu_monitor.stop()
-        self.gpu_monitor.stop()
+        self.resource_monitor.stop()
         report_str = []
         resource_plots = []
         plot_dir = plot_dir or self.plot_dir
@@ -86,14 +83,9 @@ class Profiler(pl.profiler.profilers.BaseProfiler):
                 for field_name, path in runtime_call_outputs.items():
                     report_str.append(f'{field_name}: {str(path)}')
                     resource_plots.append((field_name,str(path)))
-        # for now just plot cpu & gpu monitor
         if plot_dir:
-            cpu_monitor_outputs = self.cpu_monitor.plot(plot_dir)
-            gpu_monitor_outputs = self.gpu_monitor.plot(plot_dir)
-            for field_name, path in cpu_monitor_outputs.items():
-                report_str.append(f'{field_name}: {str(path)}')
-                resource_plots.append((field_name,str(path)))
-            for field_name, path in gpu_monitor_outputs.items():
+            resource_monitor_outputs = self.resource_monitor.plot(plot_dir)
+            for field_name, path in resource_monitor_outputs.items():
                 report_str.append(f'{field_name}: {str(path)}')
                 resource_plots.append((field_name,str(path)))
         self.report_str = report_str
@@ -102,19 +94,26 @@ class Profiler(pl.profiler.profilers.BaseProfiler):
     
     def report(self, trainer=None, model=None, output_directory='.', experiment_name='reports'):
         if model is not None and hasattr(model, 'metrics'):
-            metric = model.metrics
+            metrics = model.metrics
             output_directory = Path(output_directory)
-            if isinstance(metric, MetricBase):
+            # single metric or mapping of metric name to metric
+            if isinstance(metrics, MetricBase):
+                metrics = {type(metrics).__name__: metrics}
+            if isinstance(metrics, dict) and metrics and all(isinstance(m, MetricBase) for m in metrics.values()):
                 md = MarkdownGen()
 
                 tolist = lambda x: [x[0], str(x[1])]
-                metric_results = metric.compute()
+                metric_results = {}
+                for metric in metrics.values():
+                    metric_results.update(metric.compute())
                 metric_results = list(map(tolist, metric_results.items()))
                 metric_results = md.make_table(['metric name', 'value'], metric_results)
                 md.add_section('Metrics', metric_results)
 
                 toimage = lambda x: md.make_image(x[0], x[1], x[0])
-                metric_assets = metric.report(output_directory, experiment_name)
+                metric_assets = {}
+                for metric in metrics.values():
+                    metric_assets.update(metric.report(output_directory, experiment_name))
                 metric_assets = list(map(toimage, metric_assets.items()))
                 metric_assets = md.make_lists(metric_assets)
                 md.add_section('Assets', metric_assets)
@@ -1,14 +1,21 @@
 import matplotlib.pyplot as plt
-import re
+import os
+import logging
 import time
-import psutil
 import threading
-import gpustat
 import numpy as np
 import pandas as pd
 import seaborn as sns
 
 from pathlib import Path
+from typing import Union, Dict, List
+
+try:
+    import pynvml
+except ImportError:
+    pynvml = None
+
+logger = logging.getLogger(__name__)
 
 
 def get_uname() :
@@ -21,253 +28,345 @@ def get_cpu_info() :
     result = subprocess.run(['lscpu'], stdout=subprocess.PIPE)
     return result.stdout.decode("utf-8")
 
+def _available_cpus() -> List[int] :
+    if hasattr(os, 'sched_getaffinity') :
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def _read_text(path) -> str :
+    try :
+        return Path(path).read_text()
+    except OSError :
+        return ''
+
 def get_cpu_scaling() :
-    import subprocess
-    def get_scaling_gov(cpu : int) :
-        cpu = '/sys/devices/system/cpu/cpu{}/cpufreq/scaling_governor'.format(int(cpu))
-        result = subprocess.run(['cat', cpu], stdout=subprocess.PIPE)
-        return result.stdout.decode("utf-8").rstrip()
-    nproc = int(subprocess.run(['nproc'], stdout=subprocess.PIPE).stdout)
-    scaling = [get_scaling_gov(i) for i in range(nproc)]
-    return scaling
+    """scaling governor of each available cpu, empty string when not available"""
+    cpu = '/sys/devices/system/cpu/cpu{}/cpufreq/scaling_governor'
+    return [_read_text(cpu.format(i)).rstrip() for i in _available_cpus()]
+
+def _nvml_init() -> bool :
+    if pynvml is None :
+        return False
+    try :
+        pynvml.nvmlInit()
+        return True
+    except (pynvml.NVMLError, OSError) :
+        ## e.g. libnvidia-ml.so.1: cannot open shared object file
+        return False
 
 def get_gpu_info() :
-    import subprocess
-    # result = subprocess.run("lspci | grep ' NVIDIA ' | grep ' VGA ' | cut -d" " -f 1 | xargs -i lspci -v -s {}".split(' '), shell=True, stdout=subprocess.PIPE)
-    p0 = subprocess.Popen(('lspci'), stdout=subprocess.PIPE)
-    p1 = subprocess.Popen(('grep', " NVIDIA "), stdin=p0.stdout, stdout=subprocess.PIPE)
-    p0.stdout.close()
-    p2 = subprocess.Popen(('grep', " VGA "), stdin=p1.stdout, stdout=subprocess.PIPE)
-    p3 = subprocess.Popen(('cut', '--delimiter= ', '-f', '1'), stdin=p2.stdout, stdout=subprocess.PIPE)
-    p2.stdout.close()
-    out = subprocess.check_output(('xargs', '-i', 'lspci', '-v', '-s', '{}'), stdin=p3.stdout)
-    p3.wait()
-    return out.decode("utf-8")
-
-class CPUMonitor(threading.Thread) :
-    def __init__(self, name, dt=0.5, *args, **kwargs) :
-        self._args, self._kwargs = args, kwargs
-        super(CPUMonitor, self).__init__(*args, **kwargs)
+    """name, memory and pci bus id of each gpu from NVML, or nvidia driver's
+    procfs information; empty string when there is no (nvidia) gpu
+    """
+    info = []
+    if _nvml_init() :
+        try :
+            for i in range(pynvml.nvmlDeviceGetCount()) :
+                handle = pynvml.nvmlDeviceGetHandleByIndex(i)
+                name = pynvml.nvmlDeviceGetName(handle)
+                name = name.decode() if isinstance(name, bytes) else name
+                memory = pynvml.nvmlDeviceGetMemoryInfo(handle).total / 2**20
+                bus_id = pynvml.nvmlDeviceGetPciInfo(handle).busId
+                bus_id = bus_id.decode() if isinstance(bus_id, bytes) else bus_id
+                info.append('GPU {}: {} ({:.0f}MiB) [{}]'.format(i, name, memory, bus_id))
+            driver = pynvml.nvmlSystemGetDriverVersion()
+            info.append('Driver: {}'.format(driver.decode() if isinstance(driver, bytes) else driver))
+        except pynvml.NVMLError as e :
+            logger.warning("failed to query gpu info from NVML: {}".format(e))
+        finally :
+            pynvml.nvmlShutdown()
+    else :
+        for path in sorted(Path('/proc/driver/nvidia/gpus').glob('*/information')) :
+            info.append(_read_text(path))
+    return '\n'.join(info)
+
+
+class _ProcFile :
+    """file kept open and re-read from the start, e.g. /proc or /sys file"""
+    def __init__(self, path) :
+        try :
+            self.file = open(path, 'rb', buffering=0)
+        except OSError :
+            self.file = None
+
+    def read(self) -> bytes :
+        if self.file is None :
+            return b''
+        try :
+            self.file.seek(0)
+            return self.file.read()
+        except OSError :
+            return b''
+
+    def close(self) :
+        if self.file is not None :
+            self.file.close()
+
+
+class ResourceSampler(threading.Thread) :
+    """
+    Single thread sampling resource usage every `dt` seconds, read directly
+    from /proc and /sys, and from NVML when available (no gpu columns
+    otherwise) :
+        - 'rss' (bytes), 'ctx_voluntary' and 'ctx_involuntary' (cumulative
+          context switches) and 'process_cpu' (%) of process `pid`
+        - 'cpu_percent' (%) and 'cpu_freq' (MHz) of each cpu
+        - 'gpu_utilization' (%), 'gpu_memory' (MiB), 'gpu_temperature' (C)
+          and 'gpu_process_memory' (MiB, used by `pid`) of each gpu
+
+    Samples are stored as rows of preallocated columns (`report`), when
+    `capacity` rows are filled every other row is dropped and `dt` doubled, so
+    memory is bounded while covering the whole run. When sampling takes more
+    than `overhead_budget` of `dt`, `dt` is increased to stay within the budget.
+
+    Example:
+        ```python
+        sampler = ResourceSampler(dt=0.1)
+        sampler.start()
+        ...
+        sampler.stop()
+        sampler.to_csv('resource.csv')
+        sampler.plot('plots')
+        ```
+    """
+    def __init__(self, name='resource_sampler', dt=0.5, capacity=65536, overhead_budget=0.02,
+                 pid=None, gpu=True, *args, **kwargs) :
+        super(ResourceSampler, self).__init__(*args, daemon=True, **kwargs)
         self.name = name
-        self.cpu_percent_data = []
-        self.cv = threading.Condition()
-        self.running = False
         self.dt = dt
+        self.capacity = capacity
+        self.overhead_budget = overhead_budget
+        self.pid = pid or os.getpid()
+        self.overhead = 0. ## total sampling time
+        self._stop_event = threading.Event()
 
-    def clone(self) :
-        return CPUMonitor(self.name, self.dt, *self._args, **self._kwargs)
-    
-    def stop(self) :
-        with self.cv :
-            self.running = False
-    
-    def run(self) :
-        self.running = True
-        running = True
-        while running :
-            cpu_percent = psutil.cpu_percent(interval=self.dt, percpu=True)
-            self.cpu_percent_data.append(cpu_percent)
-            with self.cv :
-                running = self.running
-    
-    def report(self) :
-        results = dict(
-            cpu_percent=self.cpu_percent_data,
+        ## cpus listed in /proc/stat, e.g. online cpus
+        self._stat = _ProcFile('/proc/stat')
+        self.cpus = [int(line.split()[0][3:]) for line in self._stat.read().decode().splitlines()
+            if line.startswith('cpu') and line[3:4].isdigit()]
+        self._freq = [_ProcFile('/sys/devices/system/cpu/cpu{}/cpufreq/scaling_cur_freq'.format(i)) for i in self.cpus]
+        self._proc_stat = _ProcFile('/proc/{}/stat'.format(self.pid))
+        self._proc_status = _ProcFile('/proc/{}/status'.format(self.pid))
+        self._page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self._clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+        self._nvml = gpu and _nvml_init()
+        self.gpus = []
+        if self._nvml :
+            try :
+                self.gpus = [pynvml.nvmlDeviceGetHandleByIndex(i) for i in range(pynvml.nvmlDeviceGetCount())]
+            except pynvml.NVMLError as e :
+                logger.warning("failed to get gpu handles from NVML: {}".format(e))
+
+        ## width (None for scalar) and dtype of each column
+        n_cpus, n_gpus = len(self.cpus), len(self.gpus)
+        self.columns = dict(
+            time=(None, np.float64),
+            rss=(None, np.float64),
+            ctx_voluntary=(None, np.float64),
+            ctx_involuntary=(None, np.float64),
+            process_cpu=(None, np.float32),
+            cpu_percent=(n_cpus, np.float32),
+            cpu_freq=(n_cpus, np.float32),
+            gpu_utilization=(n_gpus, np.float32),
+            gpu_memory=(n_gpus, np.float32),
+            gpu_temperature=(n_gpus, np.float32),
+            gpu_process_memory=(n_gpus, np.float32),
         )
-        return results
-    
-    def plot(self, output_directory, *args, **kwargs) :
-        results = self.report()
-        output_directory = Path(output_directory)
-        output_directory = Path(output_directory)
-        output_filename = output_directory / '{}.png'.format(self.name)
-        plt.cla()
-        plt.clf()
-        sns.set(style="whitegrid")
-        fig, (ax1, ax2) = plt.subplots(2)
-        plt.gcf().set_size_inches((6.4,9.6))
-        cpu_data_array = np.asarray(self.cpu_percent_data)
-        n_cpu = 1 if len(cpu_data_array.shape)==1 else cpu_data_array.shape[-1]
-        columns = ['cpu{}'.format(i) for i in range(n_cpu)] if n_cpu > 1 else ['cpu']
-        linewidth = 0.75
-        cpu_data = pd.DataFrame(
-            cpu_data_array, columns=columns
+        self.data = {key: np.full((capacity,) if width is None else (capacity, width), np.nan, dtype=dtype)
+            for key, (width, dtype) in self.columns.items()}
+        self.n_samples = 0
+        self._t0 = None
+        self._last = None
+
+    def _read_cpu_times(self) -> np.ndarray :
+        """[n_cpus, 2] busy and total ticks of each cpu"""
+        times = np.full((len(self.cpus), 2), np.nan)
+        index = {cpu: i for i, cpu in enumerate(self.cpus)}
+        for line in self._stat.read().decode().splitlines() :
+            if not (line.startswith('cpu') and line[3:4].isdigit()) :
+                continue
+            fields = line.split()
+            i = index.get(int(fields[0][3:]))
+            if i is None :
+                continue
+            ticks = [int(x) for x in fields[1:]]
+            ## idle and iowait
+            idle = ticks[3] + (ticks[4] if len(ticks) > 4 else 0)
+            times[i] = (sum(ticks[:8]) - idle, sum(ticks[:8]))
+        return times
+
+    def _read_process(self) :
+        """rss, voluntary and involuntary context switches, cpu ticks of the process"""
+        stat = self._proc_stat.read().decode()
+        ## fields after command name, which may contain spaces
+        fields = stat[stat.rfind(')') + 2:].split()
+        if len(fields) < 22 :
+            return np.nan, np.nan, np.nan, np.nan
+        cpu_ticks = int(fields[11]) + int(fields[12])
+        rss = int(fields[21]) * self._page_size
+        voluntary = involuntary = np.nan
+        for line in self._proc_status.read().decode().splitlines() :
+            if line.startswith('voluntary_ctxt_switches') :
+                voluntary = int(line.split()[1])
+            elif line.startswith('nonvoluntary_ctxt_switches') :
+                involuntary = int(line.split()[1])
+        return rss, voluntary, involuntary, cpu_ticks
+
+    def _read_gpus(self) :
+        values = np.full((4, len(self.gpus)), np.nan)
+        for i, handle in enumerate(self.gpus) :
+            try :
+                values[0, i] = pynvml.nvmlDeviceGetUtilizationRates(handle).gpu
+                values[1, i] = pynvml.nvmlDeviceGetMemoryInfo(handle).used / 2**20
+                values[2, i] = pynvml.nvmlDeviceGetTemperature(handle, pynvml.NVML_TEMPERATURE_GPU)
+                processes = pynvml.nvmlDeviceGetComputeRunningProcesses(handle)
+                values[3, i] = sum((p.usedGpuMemory or 0) for p in processes if p.pid == self.pid) / 2**20
+            except pynvml.NVMLError :
+                pass
+        return values
+
+    def sample(self) :
+        """read resource usage, recorded as a row from the second call"""
+        t = time.perf_counter()
+        cpu_times = self._read_cpu_times()
+        rss, voluntary, involuntary, cpu_ticks = self._read_process()
+        freq = [x.read() for x in self._freq]
+        freq = [int(x) / 1e3 if x.strip() else np.nan for x in freq]
+        gpus = self._read_gpus()
+        last, self._last = self._last, (t, cpu_times, cpu_ticks)
+        if last is None :
+            self._t0 = t
+            return
+        ## utilization since previous sample
+        with np.errstate(invalid='ignore', divide='ignore') :
+            d_times = cpu_times - last[1]
+            cpu_percent = 100. * d_times[:,0] / d_times[:,1]
+        process_cpu = 100. * (cpu_ticks - last[2]) / self._clock_ticks / (t - last[0])
+
+        if self.n_samples == self.capacity :
+            self._decimate()
+        row = dict(
+            time=t - self._t0, rss=rss, ctx_voluntary=voluntary, ctx_involuntary=involuntary,
+            process_cpu=process_cpu, cpu_percent=cpu_percent, cpu_freq=freq,
+            gpu_utilization=gpus[0], gpu_memory=gpus[1], gpu_temperature=gpus[2],
+            gpu_process_memory=gpus[3],
         )
-        sns.lineplot(data=cpu_data, palette="tab10", linewidth=linewidth, dashes=False, ax=ax1)
-        ax1.set(xlabel='time (x{0:.2f}s)'.format(self.dt), ylabel='Utilization (%)')
-        ax1.set_title("CPU Utilization (%)")
+        for key, value in row.items() :
+            self.data[key][self.n_samples] = value
+        self.n_samples += 1
 
-        ax2.set_title("CPU Utilization (%)")
-        ax2.boxplot(cpu_data_array, showfliers=False)
-        plt.autoscale()
-        plt.tight_layout()
-        plt.savefig(output_filename)
+    def _decimate(self) :
+        """drop every other row, sampled with doubled interval afterward"""
+        half = (self.capacity + 1) // 2
+        for value in self.data.values() :
+            value[:half] = value[0::2]
+            value[half:] = np.nan
+        self.n_samples = half
+        self.dt *= 2
 
-        plt.gcf().set_size_inches((6.4,4.8)) ## reset back to matplotlib default
-        sns.reset_defaults()
-        
-        return {'cpu_percent' : output_filename}
-
-class GPUMonitor(threading.Thread) :
-    ## TODO : capture keyboard interrupt
-    def __init__(self, name, dt=0.1, process_regex='python*', *args, **kwargs) :
-        self._args, self._kwargs = args, kwargs
-        super(GPUMonitor,self).__init__(*args, **kwargs)
-        self._kwargs.update(dict(process_regex=process_regex))
-        self.utilization = []
-        self.memory = []
-        self.temperature = []
-        self.cv = threading.Condition()
-        self.running = False
-        self.name = name
-        self.dt = dt
-        self.process_memory = {}
-        self.process_regex = re.compile(process_regex)
-    
-    def clone(self) :
-        return GPUMonitor(self.name, self.dt, *self._args, **self._kwargs)
+    def run(self) :
+        while not self._stop_event.is_set() :
+            t0 = time.perf_counter()
+            self.sample()
+            elapsed = time.perf_counter() - t0
+            self.overhead += elapsed
+            if self.overhead_budget and elapsed > self.overhead_budget * self.dt :
+                self.dt = elapsed / self.overhead_budget
+                logger.info("resource sampling takes {:.2f}ms, interval is increased to {:.3f}s"
+                    .format(elapsed * 1e3, self.dt))
+            self._stop_event.wait(max(self.dt - elapsed, 0.))
 
     def stop(self) :
-        with self.cv :
-            self.running = False
-    
-    def run(self) :
-        self.running = True
-        running = True
-        while running :
+        self._stop_event.set()
+        if self.is_alive() and threading.current_thread() is not self :
+            self.join()
+        if self._nvml :
             try :
-                gpu = gpustat.core.GPUStatCollection.new_query()
-            except gpustat.core.N.NVMLError :
-                """
-                OSError: libnvidia-ml.so.1: cannot open shared object file: No such file or directory
-                """
-                ## TODO : emit warning
-                gpu = None
-            if not gpu is None :
-                ## TODO : support multi-gpu monitoring
-                utilization = gpu[0].utilization
-                memory = gpu[0].memory_used
-                temperature = gpu[0].temperature
-                self.utilization.append(utilization)
-                self.memory.append(memory)
-                self.temperature.append(temperature)
-                processes = gpu[0].processes
-                ## filter process by regex
-                f = lambda x : self.process_regex.match(x['command'])
-                processes = filter(f, processes)
-                for process in processes :
-                    pid = process['pid']
-                    name = process['command']
-                    memory = process['gpu_memory_usage']
-                    memory = [*self.process_memory[pid]['memory'], memory] if pid in self.process_memory else [memory]
-                    process_memory = dict(name=name, memory=memory)
-                    self.process_memory.update({pid : process_memory})
-            time.sleep(self.dt)
-            with self.cv :
-                running = self.running
-
-    def report(self) :
-        process_memory = self.process_memory
-        process_memory = [dict(name=process['name'],memory=np.mean(process['memory'])) for pid, process in process_memory.items()]
-        results = dict(
-            gpu_utilization=self.utilization,
-            gpu_memory_usage=self.memory,
-            process_memory=process_memory,
-        )
-        # print(self.process_memory)
-        return results
-    
-    def plot(self, output_directory, *args, **kwargs) :
-        if not len(self.utilization) :
-            return {}
-        results = self.report()
-        output_directory = Path(output_directory)
-        output_directory = Path(output_directory)
-        output_filenames = {}
-        ## plot gpu usage
-        output_filename = output_directory / '{}_utilization.png'.format(self.name)
-        plt.cla()
-        plt.clf()
-        sns.set(style="whitegrid")
-        fig, (ax1, ax2) = plt.subplots(2)
-        plt.gcf().set_size_inches((6.4,9.6))
-        gpu_data = np.asarray(self.utilization)
-        linewidth, columns = 0.5, ['utilization']
-        gpu_data = pd.DataFrame(
-            gpu_data, columns=columns
-        )
-        sns.lineplot(data=gpu_data, palette="tab10", linewidth=linewidth, dashes=False, ax=ax1)
-        ax1.set_title("GPU Utilization (%)")
-        ax1.set(xlabel='time (x{0:.2f}s)'.format(self.dt), ylabel='Utilization (%)')
+                pynvml.nvmlShutdown()
+            except pynvml.NVMLError :
+                pass
+            self._nvml = False
+            self.gpus = []
+        for f in [self._stat, self._proc_stat, self._proc_status, *self._freq] :
+            f.close()
 
-        ax2.set_title("GPU Utilization (%)")
-        percentile = np.percentile(gpu_data, q=np.arange(100))
-        ax2.boxplot(percentile, showfliers=False)
-        plt.autoscale()
-        plt.tight_layout()
-        plt.savefig(output_filename)
-        plt.close()
-        output_filenames.update(dict(gpu_utilization=output_filename))
+    def report(self) -> Dict[str,np.ndarray] :
+        """recorded columns, `[n_samples]` or `[n_samples, n_cpus or n_gpus]`"""
+        return {key: value[:self.n_samples] for key, value in self.data.items()}
 
-        ## plot gpu usage
-        output_filename = output_directory / '{}_temperature.png'.format(self.name)
-        plt.cla()
-        plt.clf()
-        sns.set(style="whitegrid")
-        fig, (ax1, ax2) = plt.subplots(2)
-        plt.gcf().set_size_inches((6.4,9.6))
-        gpu_data = np.asarray(self.temperature)
-        linewidth, columns = 0.5, ['temperature']
-        gpu_data = pd.DataFrame(
-            gpu_data, columns=columns
-        )
-        sns.lineplot(data=gpu_data, palette="tab10", linewidth=linewidth, dashes=False, ax=ax1)
-        ax1.set_title("GPU Temperature")
-        ax1.set(xlabel='time (x{0:.2f}s)'.format(self.dt), ylabel='Temperature')
+    def to_dataframe(self) -> pd.DataFrame :
+        """recorded samples, one column for each cpu and gpu, e.g. 'cpu_percent_0'"""
+        columns = {}
+        for key, value in self.report().items() :
+            if value.ndim == 1 :
+                columns[key] = value
+                continue
+            devices = self.cpus if key.startswith('cpu') else range(value.shape[1])
+            for i, device in enumerate(devices) :
+                columns['{}_{}'.format(key, device)] = value[:,i]
+        return pd.DataFrame(columns)
 
-        ax2.set_title("GPU Temperature")
-        percentile = np.percentile(gpu_data, q=np.arange(100))
-        ax2.boxplot(percentile, showfliers=False)
-        plt.autoscale()
-        plt.tight_layout()
-        plt.savefig(output_filename)
-        plt.close()
-        output_filenames.update(dict(gpu_temperature=output_filename))
+    def to_csv(self, filename: Union[str,Path]) -> Path :
+        self.to_dataframe().to_csv(filename, index=False)
+        return Path(filename)
 
-        ## plot gpu memory
-        output_filename = output_directory / '{}_memory.png'.format(self.name)
+    def to_parquet(self, filename: Union[str,Path]) -> Path :
+        """requires pandas' parquet engine, i.e. `pyarrow` or `fastparquet`"""
+        self.to_dataframe().to_parquet(filename, index=False)
+        return Path(filename)
+
+    @staticmethod
+    def _plot(filename, title, ylabel, t, data, columns) :
+        """time series and boxplot of `data`, [n_samples, n_columns]"""
         plt.cla()
         plt.clf()
         sns.set(style="whitegrid")
         fig, (ax1, ax2) = plt.subplots(2)
         plt.gcf().set_size_inches((6.4,9.6))
-        gpu_data = {}
-        for key, memory in self.process_memory.items() :
-            memory_used = memory['memory']
-            field_name = '{} ({})'.format(memory['name'], np.mean(memory_used))
-            columns.append(field_name)  # e.g. python (500), python3.5 (1024)
-            gpu_data[field_name] = memory_used
-        gpu_data['system'] = np.asarray(self.memory)
-        # make sure values in gpu_data have same length, so pandas won't complains
-        n_data = min(map(lambda v: len(v), gpu_data.values()))
-        for key, value in gpu_data.items():
-            gpu_data[key] = value[:n_data]
-        linewidth = 0.5
-        gpu_df = pd.DataFrame(
-            data=gpu_data
-        )
-        sns.lineplot(data=gpu_df, palette="tab10", linewidth=linewidth, dashes=False, ax=ax1)
-        ax1.set(xlabel='time (x{0:.2f}s)'.format(self.dt), ylabel='GPU Memory')
-        ax1.set_title("GPU Memory")
+        linewidth = 0.75 if data.shape[1] > 1 else 0.5
+        df = pd.DataFrame(data, index=t, columns=columns)
+        sns.lineplot(data=df, palette="tab10", linewidth=linewidth, dashes=False, ax=ax1)
+        ax1.set(xlabel='time (s)', ylabel=ylabel)
+        ax1.set_title(title)
 
-        ax2.set_title("GPU Memory")
-        ax2.boxplot(gpu_data.values(), showfliers=False)
+        ax2.set_title(title)
+        valid = [column[~np.isnan(column)] for column in data.T]
+        ax2.boxplot(valid, showfliers=False)
         plt.autoscale()
         plt.tight_layout()
-        plt.savefig(output_filename)
-        output_filenames.update(dict(gpu_memory=output_filename))
-
+        plt.savefig(filename)
+        plt.close()
         plt.gcf().set_size_inches((6.4,4.8)) ## reset back to matplotlib default
         sns.reset_defaults()
 
-        return output_filenames
\ No newline at end of file
+    def plot(self, output_directory, *args, **kwargs) :
+        if not self.n_samples :
+            return {}
+        results = self.report()
+        output_directory = Path(output_directory)
+        t = results['time']
+        output_filenames = {}
+        def plot(key, title, ylabel, data, columns) :
+            output_filename = output_directory / '{}_{}.png'.format(self.name, key)
+            ResourceSampler._plot(output_filename, title, ylabel, t, data, columns)
+            output_filenames[key] = output_filename
+        cpu_columns = ['cpu{}'.format(i) for i in self.cpus]
+        plot('cpu_percent', "CPU Utilization (%)", 'Utilization (%)', results['cpu_percent'], cpu_columns)
+        if not np.isnan(results['cpu_freq']).all() :
+            plot('cpu_freq', "CPU Frequency (MHz)", 'Frequency (MHz)', results['cpu_freq'], cpu_columns)
+        process = np.stack([results['rss'] / 2**20, results['process_cpu']], axis=1)
+        plot('process', "Process RSS (MiB) and CPU (%)", 'RSS (MiB) / CPU (%)', process, ['rss', 'cpu'])
+        ## context switches per second
+        with np.errstate(invalid='ignore', divide='ignore') :
+            dt = np.diff(t, prepend=np.nan)[:,None]
+            ctx = np.diff(np.stack([results['ctx_voluntary'], results['ctx_involuntary']], axis=1), axis=0, prepend=np.nan) / dt
+        plot('context_switches', "Context Switches (/s)", 'Context Switches (/s)', ctx, ['voluntary', 'involuntary'])
+        if results['gpu_utilization'].shape[1] :
+            gpu_columns = ['gpu{}'.format(i) for i in range(results['gpu_utilization'].shape[1])]
+            plot('gpu_utilization', "GPU Utilization (%)", 'Utilization (%)', results['gpu_utilization'], gpu_columns)
+            plot('gpu_temperature', "GPU Temperature", 'Temperature', results['gpu_temperature'], gpu_columns)
+            memory = np.concatenate([results['gpu_memory'], results['gpu_process_memory']], axis=1)
+            plot('gpu_memory', "GPU Memory (MiB)", 'GPU Memory (MiB)', memory,
+                ['system ({})'.format(c) for c in gpu_columns] + ['process ({})'.format(c) for c in gpu_columns])
+        return output_filenames
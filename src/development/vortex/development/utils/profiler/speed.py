@@ -3,45 +3,196 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 
-from time import time
+import threading
+
+from time import perf_counter_ns
 from pathlib import Path
-from typing import Union
+from typing import Union, List
 from contextlib import ContextDecorator
 
-class TimeData(ContextDecorator):
-    def __init__(self, name):
-        self.name = name
-        self.data = []
+## log-linear histogram of durations in ns (HDR histogram style), values are
+## bucketed with 2^sub_bits sub-buckets for each power of 2 (relative error
+## below 2^-(sub_bits-1)), up to 2^max_bits ns (~13 days)
+sub_bits = 8
+max_bits = 50
+_half = 1 << (sub_bits - 1)
+n_buckets = (max_bits - sub_bits + 2) * _half
+
+
+def _bucket_bounds():
+    """[lower, upper) ns bounds of each bucket"""
+    index = np.arange(n_buckets)
+    shift = np.maximum(index // _half - 1, 0)
+    lower = (index - shift * _half) << shift
+    return lower, lower + (1 << shift)
+
+bucket_lower, bucket_upper = _bucket_bounds()
+
+
+class TimeRecorder:
+    """durations recorded by a single thread: histogram, count, sum, min, max
+    and the last `capacity` samples in ring buffer, all in ns
+    """
+    __slots__ = ('counts', 'ring', 'n_samples', 'n_calls', 'total', 'min', 'max', 't0')
+
+    def __init__(self, capacity: int = 10000):
+        ## python lists, single item update is cheaper than numpy's
+        self.counts = [0] * n_buckets
+        self.ring = [0] * capacity
+        self.n_samples = 0 ## written to ring buffer
         self.n_calls = 0
-        self.total_time = 0
+        self.total = 0
+        self.min = 1 << max_bits
+        self.max = 0
         self.t0 = None
-        self.t1 = None
 
-    def update(self, dt):
+    def record(self, ns: int):
+        ns = int(ns) if ns > 0 else 0
+        if self.ring:
+            self.ring[self.n_samples % len(self.ring)] = ns
+            self.n_samples += 1
         self.n_calls += 1
-        self.total_time += dt
-        self.data.append(dt)
-    
+        self.total += ns
+        if ns < self.min:
+            self.min = ns
+        if ns > self.max:
+            self.max = ns
+        shift = ns.bit_length() - sub_bits
+        if shift < 0:
+            shift = 0
+        index = shift * _half + (ns >> shift)
+        self.counts[index if index < n_buckets else n_buckets - 1] += 1
+
+    def samples(self) -> np.ndarray:
+        """last recorded samples, in recorded order"""
+        capacity = len(self.ring)
+        ring = np.asarray(self.ring, dtype=np.int64)
+        if self.n_samples <= capacity:
+            return ring[:self.n_samples]
+        start = self.n_samples % capacity
+        return np.concatenate([ring[start:], ring[:start]])
+
+    def merge(self, *others: 'TimeRecorder') -> 'TimeRecorder':
+        """add others' records to this recorder, the ring buffer keeps the last samples
+        of this recorder followed by others'
+        """
+        counts = np.asarray(self.counts, dtype=np.int64)
+        samples = [self.samples()]
+        for other in others:
+            counts += np.asarray(other.counts, dtype=np.int64)
+            self.n_calls += other.n_calls
+            self.total += other.total
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            samples.append(other.samples())
+        self.counts = counts.tolist()
+        if self.ring:
+            samples = np.concatenate(samples)[-len(self.ring):]
+            self.ring[:len(samples)] = samples.tolist()
+            self.n_samples = len(samples)
+        return self
+
+    def quantile(self, q) -> np.ndarray:
+        """quantiles (in ns) from histogram, middle of the bucket containing each
+        quantile, clipped to recorded min and max; 0 and 1 are exact min and max
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if not self.n_calls:
+            return np.full(q.shape, np.nan)
+        rank = q * (self.n_calls - 1)
+        index = np.searchsorted(np.cumsum(self.counts, dtype=np.int64), rank, side='right')
+        index = np.minimum(index, n_buckets - 1)
+        value = (bucket_lower[index] + bucket_upper[index] - 1) / 2.
+        value = np.clip(value, self.min, self.max)
+        return np.where(q <= 0, self.min, np.where(q >= 1, self.max, value))
+
+
+class TimeData(ContextDecorator):
+    """
+    Timer with `time.perf_counter_ns`, each thread records to its own
+    `TimeRecorder` without locking; its memory is constant, i.e. histogram and
+    ring buffer of the last `capacity` samples, so `report` doesn't depend on
+    the number of samples. Timers of other threads or processes (e.g. sent
+    pickled) can be combined with `merge`.
+
+    `start` and `stop` (or context manager) must be called from the same thread.
+    """
+    def __init__(self, name, capacity: int = 10000):
+        self.name = name
+        self.capacity = capacity
+        self._local = threading.local()
+        ## appended once by each recording thread, list append is atomic
+        self._recorders: List[TimeRecorder] = []
+
+    def _recorder(self) -> TimeRecorder:
+        recorder = getattr(self._local, 'recorder', None)
+        if recorder is None:
+            recorder = self._local.recorder = TimeRecorder(self.capacity)
+            self._recorders.append(recorder)
+        return recorder
+
+    def recorder(self) -> TimeRecorder:
+        """records of all threads, merged to a new recorder"""
+        return TimeRecorder(self.capacity).merge(*list(self._recorders))
+
+    def update(self, dt):
+        """record duration `dt` in seconds"""
+        self._recorder().record(int(round(dt * 1e9)))
+
+    def update_ns(self, dt: int):
+        """record duration `dt` in ns"""
+        self._recorder().record(dt)
+
     def start(self):
-        self.t0 = time()
+        self._recorder().t0 = perf_counter_ns()
 
     def stop(self):
-        self.t1 = time()
-        self.update(self.t1 - self.t0)
+        t1 = perf_counter_ns()
+        recorder = self._recorder()
+        recorder.record(t1 - recorder.t0)
 
     def __enter__(self) :
         self.start()
         return self
-    
+
     def __exit__(self, *exc) :
         self.stop()
-    
+
+    def merge(self, *others: 'TimeData') -> 'TimeData':
+        """add records of other timers (e.g. from other processes) to this timer"""
+        for other in others:
+            self._recorders.append(other.recorder())
+        return self
+
+    def __getstate__(self):
+        return dict(name=self.name, capacity=self.capacity, _recorders=[self.recorder()])
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def n_calls(self) -> int:
+        return sum(recorder.n_calls for recorder in list(self._recorders))
+
+    @property
+    def total_time(self) -> float:
+        """total recorded time in seconds"""
+        return sum(recorder.total for recorder in list(self._recorders)) * 1e-9
+
+    @property
+    def data(self) -> np.ndarray:
+        """last `capacity` recorded samples in seconds"""
+        return self.recorder().samples() * 1e-9
+
     def report(self) :
+        recorder = self.recorder()
+        mean = recorder.total / recorder.n_calls if recorder.n_calls else np.nan
         results = dict(
-            mean=np.mean(self.data),
-            median=np.median(self.data),
-            quantile=np.quantile(self.data,q=[0.25,0.75]),
-            percentile=np.percentile(self.data,q=np.arange(100)),
+            mean=mean * 1e-9,
+            median=float(recorder.quantile(0.5)) * 1e-9,
+            quantile=recorder.quantile([0.25,0.75]) * 1e-9,
+            percentile=recorder.quantile(np.arange(100) / 100.) * 1e-9,
         )
         return results
 
@@ -1,30 +1,74 @@
+import io
+import os
+import json
+import inspect
+import multiprocessing
+import numpy as np
 import torch
 import pytorch_lightning as pl
+from pathlib import Path
+from torch.utils.data import DataLoader, Subset
+from typing import Union, List, Dict, Any
 from vortex.runtime import create_runtime_model
-from .metrics import METRICS
+from vortex.runtime.pool import RuntimePool, available_cpus
+from .metrics import METRICS, MetricBase
+
+
+def get_metric_names(model) -> List[str]:
+    """names of metrics embedded in runtime model, metrics are registered by its class names"""
+    metrics = getattr(model, 'metrics', None)
+    if metrics is None:
+        metrics = model.properties['vortex.metrics']
+        try:
+            metrics = json.loads(metrics)
+        except ValueError:
+            metrics = metrics.replace('[','').replace(']','').split(',')
+    if isinstance(metrics, str):
+        metrics = [metrics]
+    return [name.strip() for name in metrics]
+
+
+def create_metrics(names: List[str], metric_args: Dict[str,Any] = {}, class_names=None) -> Dict[str,MetricBase]:
+    """create metrics from registry
+
+    Args:
+        names (List[str]): registered metric names
+        metric_args (Dict[str,Any], optional): arguments of all metrics, or mapping of
+            metric name to its arguments. Defaults to {}.
+        class_names (optional): class names given to metrics accepting `class_names`,
+            unless given in `metric_args`. Defaults to None.
+
+    Returns:
+        Dict[str,MetricBase]: metric name to metric
+    """
+    per_metric = any(name in metric_args for name in names)
+    metrics = {}
+    for name in names:
+        args = dict(metric_args.get(name, {}) if per_metric else metric_args)
+        if class_names is not None and 'class_names' in inspect.signature(METRICS[name]).parameters:
+            args.setdefault('class_names', class_names)
+        metrics[name] = METRICS.create_from_args(name, **args)
+    return metrics
+
 
 class RuntimeWrapper(pl.LightningModule):
-    def __init__(self, path, runtime='cpu', val_args={}, metric_args={}, profiler=None):
+    def __init__(self, path, runtime='cpu', val_args={}, metric_args={}, profiler=None, runtime_args={}):
         super().__init__()
         # TODO: pass additional val args
         self.val_args = val_args
         self.metric_args = metric_args
 
         # create runtime model
-        self.model = create_runtime_model(path, runtime)
+        self.model = create_runtime_model(path, runtime, **runtime_args)
 
-        # get metrics name from model, then retrieve from registry
-        metrics = self.model.properties['vortex.metrics']
-        metrics = metrics.replace('[','').replace(']','').split(',')
-        # take first metric for now
-        # TODO: construct all metrics
-        self.metrics = METRICS.create_from_args(metrics[0], **metric_args)
+        # get metrics name from model, then retrieve all metrics from registry
+        self.metrics = create_metrics(get_metric_names(self.model), metric_args, self.model.class_names)
 
         # setup profiler
         self.profiler = profiler or pl.profiler.PassThroughProfiler()
         # infer batch size from model, assume the first input is image input
         self.batch_size = self.model.input_specs['input']['shape'][0]
-    
+
     def forward(self, *args, **kwargs):
         val_args = self.val_args
         to_numpy = lambda x: x.numpy()
@@ -33,13 +77,107 @@ class RuntimeWrapper(pl.LightningModule):
         with self.profiler.profile('runtime_call'):
             results =  self.model(*args, **kwargs, **val_args)
         return results
-    
+
     def test_step(self, batch, batch_idx):
         x, y = batch
-        y_hat = self.forward(x)
+        n = len(x)
+        # model with fixed batch size, pad partial (last) batch
+        if self.batch_size and n < self.batch_size:
+            x = torch.cat([x, x[-1:].expand(self.batch_size - n, *x.shape[1:])])
+        y_hat = self.forward(x)[:n]
+
+        for metric in self.metrics.values():
+            metric.update(y_hat, y)
 
-        fmt = self.model.output_format
-        self.metrics.update(y_hat, y)
-    
     def test_epoch_end(self, validation_step_outputs):
-        self.log_dict(self.metrics.compute())
\ No newline at end of file
+        results = {}
+        for metric in self.metrics.values():
+            results.update(metric.compute())
+        self.log_dict(results)
+
+
+def _validate_shard(path, runtime, dataset, indices, batch_size, collate_fn,
+                    val_args, metric_args, runtime_args, cpus):
+    """validate `indices` of `dataset` in worker process, returns serialized metric states"""
+    if cpus is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    wrapper = RuntimeWrapper(path, runtime, val_args, metric_args, runtime_args=runtime_args)
+    loader = DataLoader(Subset(dataset, indices), batch_size=wrapper.batch_size or batch_size,
+        collate_fn=collate_fn)
+    for batch_idx, batch in enumerate(loader):
+        wrapper.test_step(batch, batch_idx)
+    # serialized, tensors sent between processes by file descriptor needs this
+    # process alive until they are received
+    states = io.BytesIO()
+    torch.save({name: metric.states() for name, metric in wrapper.metrics.items()}, states)
+    return states.getvalue(), wrapper.model.class_names
+
+
+def validate(path: Union[str,Path], dataloader: DataLoader, n_workers: int = 2, runtime: str = 'cpu',
+             val_args: Dict[str,Any] = {}, metric_args: Dict[str,Any] = {}, runtime_args: Dict[str,Any] = {},
+             cpu_sets: Union[str,List[List[int]],None] = None, start_method: str = None) -> Dict[str,MetricBase]:
+    """Validate exported model with its embedded metrics, with dataset sharded across
+    `n_workers` processes, each with its own runtime session; metric states of all
+    workers are merged, the same as validating the whole dataset with `RuntimeWrapper`.
+
+    Example:
+        ```python
+        from vortex.development.utils.runtime_wrapper import validate
+
+        metrics = validate('model.onnx', dataset.test_dataloader(), n_workers=8, cpu_sets='cores')
+        results = {name: metric.compute() for name, metric in metrics.items()}
+        ```
+
+    Args:
+        path (Union[str,Path]): path to exported model
+        dataloader (DataLoader): dataloader of validation dataset, its `dataset`, `collate_fn`
+            and `batch_size` (for model with dynamic batch size) are used by each worker,
+            the dataset is sent to worker processes so it must be picklable
+        n_workers (int, optional): number of worker processes, validates in this process
+            when 1. Defaults to 2.
+        runtime (str, optional): backend runtime, see `create_runtime_model`. Defaults to 'cpu'.
+        val_args (Dict[str,Any], optional): additional model inputs, e.g. score_threshold. Defaults to {}.
+        metric_args (Dict[str,Any], optional): see `create_metrics`. Defaults to {}.
+        runtime_args (Dict[str,Any], optional): additional arguments to runtime model; onnx
+            session of each worker defaults to its share of available cpus as intra-op threads.
+            Defaults to {}.
+        cpu_sets (Union[str,List[List[int]],None], optional): cpus of each worker process,
+            see `RuntimePool.partition_cpus`. Defaults to None.
+        start_method (str, optional): multiprocessing start method, platform's default if None.
+            Defaults to None.
+
+    Raises:
+        ValueError: invalid `n_workers` or `cpu_sets`
+
+    Returns:
+        Dict[str,MetricBase]: metric name to merged metric
+    """
+    if n_workers < 1:
+        raise ValueError("expects 'n_workers' >= 1, got {}".format(n_workers))
+    dataset = dataloader.dataset
+    cpu_sets = RuntimePool.partition_cpus(n_workers, cpu_sets)
+    shards = np.array_split(np.arange(len(dataset)), n_workers)
+    args = []
+    for indices, cpus in zip(shards, cpu_sets):
+        worker_runtime_args = dict(runtime_args)
+        if Path(path).suffix == '.onnx' and not 'options' in worker_runtime_args:
+            n_threads = len(cpus) if cpus is not None else max(1, len(available_cpus()) // n_workers)
+            worker_runtime_args['options'] = dict(intra_op_num_threads=n_threads)
+        args.append((path, runtime, dataset, indices.tolist(), dataloader.batch_size,
+            dataloader.collate_fn, val_args, metric_args, worker_runtime_args, cpus))
+
+    if n_workers == 1:
+        # in this process, not pinned
+        results = [_validate_shard(*args[0][:-1], None)]
+    else:
+        # one shard for each worker process, data loading in workers is single-threaded
+        context = multiprocessing.get_context(start_method)
+        with context.Pool(n_workers, initializer=torch.set_num_threads, initargs=(1,), maxtasksperchild=1) as pool:
+            results = pool.starmap(_validate_shard, args)
+
+    states, class_names = zip(*results)
+    states = [torch.load(io.BytesIO(worker_states)) for worker_states in states]
+    metrics = create_metrics(list(states[0]), metric_args, class_names[0])
+    for name, metric in metrics.items():
+        metric.merge(*[worker_states[name] for worker_states in states])
+    return metrics
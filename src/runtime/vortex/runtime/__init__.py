@@ -1,3 +1,10 @@
 from .version import __version__
 from .runtime_map import model_runtime_map, check_available_runtime
-from .factory import create_runtime_model
\ No newline at end of file
+from .factory import create_runtime_model
+from .batcher import DynamicBatcher
+from .pool import RuntimePool
+from .async_runtime import AsyncRuntime
+from .image_loader import ImageLoader
+from .video import VideoStream
+from .nms import apply_nms
+from .visual import VisualRenderer
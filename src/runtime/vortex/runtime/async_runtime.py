@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import sys
+import threading
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Union, List, Dict, Any
+
+from vortex.runtime.basic_runtime import BaseRuntime
+from vortex.runtime.helper import InferenceHelper
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['AsyncRuntime']
+
+
+class AsyncRuntime:
+    """Run runtime model from asyncio code without blocking the event loop.
+
+    Image loading, resizing and the model itself run on a dedicated executor
+    of `max_concurrency` threads, so at most `max_concurrency` requests run
+    on the model at the same time and the rest are queued. Cancelling the
+    awaiting task (or hitting `timeout`) drops a queued request and stops a
+    running one before its next chunk of images.
+
+    Example:
+        ```python
+        from vortex.runtime import create_runtime_model, AsyncRuntime
+
+        model = AsyncRuntime(create_runtime_model('model.onnx', runtime='cpu'))
+
+        async def handler(request):
+            ## list of image path or np.ndarray, of any number
+            results = await model.predict_async(request.images, score_threshold=0.5, timeout=1.0)
+        ```
+    """
+    def __init__(self, model: BaseRuntime, max_concurrency: int = 1, timeout: Union[float,None] = None):
+        """Wrap runtime model and create its executor
+
+        Args:
+            model (BaseRuntime): runtime model, e.g. `OnnxRuntime` or `TorchScriptRuntime`
+                from `create_runtime_model`, or `RuntimePool`
+            max_concurrency (int, optional): maximum requests running at the same time,
+                use more than 1 when the model can run concurrently, e.g. `RuntimePool`. Defaults to 1.
+            timeout (float, optional): default timeout (in seconds) of each request,
+                None means no timeout. Defaults to None.
+        """
+        if max_concurrency < 1:
+            raise ValueError("expects 'max_concurrency' >= 1, got {}".format(max_concurrency))
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_concurrency, thread_name_prefix='vortex-async')
+
+    @property
+    def input_specs(self):
+        return self.model.input_specs
+
+    @property
+    def output_format(self):
+        return self.model.output_format
+
+    @property
+    def class_names(self):
+        return self.model.class_names
+
+    def _predict(self, images, cancelled: threading.Event, **kwargs) -> List[Dict[str,Any]]:
+        if not isinstance(images, (list, tuple)):
+            images = [images]
+        if not len(images):
+            return []
+        images = InferenceHelper.load_images(images)
+        results = []
+        for result in InferenceHelper.run_inference(self.model, images, stream=True, **kwargs):
+            results.append(result)
+            if cancelled.is_set():
+                raise asyncio.CancelledError()
+        return results
+
+    async def _run(self, fn, *args, timeout=None, **kwargs):
+        if timeout is None:
+            timeout = self.timeout
+        cancelled = threading.Event()
+        future = asyncio.wrap_future(self.executor.submit(fn, *args, cancelled, **kwargs))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            ## queued request is dropped by the executor, running one stops at next chunk
+            cancelled.set()
+            raise
+
+    async def predict_async(self, images: Union[List[Union[str,Path,np.ndarray]],np.ndarray],
+                            timeout: Union[float,None] = None, **kwargs) -> List[Dict[str,Any]]:
+        """Load, resize and run inference on images in the executor
+
+        Args:
+            images (Union[List[Union[str,Path,np.ndarray]],np.ndarray]): list of image path or
+                image array (HWC), of any number and size, or single image array
+            timeout (float, optional): maximum time to wait (in seconds), including the time
+                queued, overrides the default timeout. Defaults to None.
+            **kwargs: additional model inputs, e.g. `score_threshold`
+
+        Raises:
+            asyncio.TimeoutError: request is not finished in `timeout`
+
+        Returns:
+            List[Dict[str,Any]]: prediction results of each image, with coordinates relative to original image
+        """
+        return await self._run(self._predict, images, timeout=timeout, **kwargs)
+
+    async def call_async(self, batch: np.ndarray, timeout: Union[float,None] = None, **kwargs) -> List[Dict[str,Any]]:
+        """Same as `model(batch, **kwargs)`, for already prepared batch
+
+        Args:
+            batch (np.ndarray): batch with model's input shape
+            timeout (float, optional): maximum time to wait (in seconds). Defaults to None.
+
+        Returns:
+            List[Dict[str,Any]]: prediction results of each image in the batch
+        """
+        return await self._run(lambda batch, cancelled, **kwargs: self.model(batch, **kwargs),
+            batch, timeout=timeout, **kwargs)
+
+    def close(self, wait: bool = True):
+        """Shutdown the executor, queued requests are cancelled
+
+        Args:
+            wait (bool, optional): wait for running requests to finish. Defaults to True.
+        """
+        if sys.version_info >= (3, 9):
+            self.executor.shutdown(wait=wait, cancel_futures=True)
+        else:
+            self.executor.shutdown(wait=wait)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        self.close(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
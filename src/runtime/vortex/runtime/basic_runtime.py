@@ -1,13 +1,90 @@
 import cv2
 import numpy as np
 import logging
+import threading
 
 from collections import OrderedDict
 from typing import Union, List, Dict, Tuple
 
+from vortex.runtime.nms import apply_nms
+
 logger = logging.getLogger(__name__)
 
 
+class BatchArena:
+    """
+    Persistent NHWC batch buffer(s), images are resized directly
+    into its slot and unused slot is zeroed only when it held an image;
+    `n_buffers` buffers are used in round-robin so that a batch can be
+    prepared while the previous one is still being processed
+    """
+    def __init__(self, shape : Tuple[int,int,int,int], n_buffers : int = 2) :
+        assert len(shape)==4 and n_buffers > 0
+        self.shape = tuple(shape)
+        self.n_buffers = n_buffers
+        self.buffers = [None] * n_buffers
+        self.n_filled = [0] * n_buffers
+        self.index = 0
+        ## transform of the last filled batch
+        self.transform = None
+
+    @staticmethod
+    def resize_keep_ratio(image : np.ndarray, dst : np.ndarray, center : bool) -> Tuple[float,float,float,float] :
+        """
+        resize `image` into `dst` while preserving aspect ratio,
+        the remaining area of `dst` is zeroed
+
+        Returns:
+            tuple: (a_x, a_y, b_x, b_y) mapping relative coordinate `r` on `dst`
+                to relative coordinate on `image`, i.e. `r * a + b`
+        """
+        h, w = dst.shape[:2]
+        src_h, src_w = image.shape[:2]
+        scale = min(w / src_w, h / src_h)
+        rw, rh = max(1, int(round(src_w * scale))), max(1, int(round(src_h * scale)))
+        ox, oy = ((w - rw) // 2, (h - rh) // 2) if center else (0, 0)
+        dst[:oy] = 0
+        dst[oy+rh:] = 0
+        dst[oy:oy+rh,:ox] = 0
+        dst[oy:oy+rh,ox+rw:] = 0
+        BaseRuntime.resize_stretch(image, (rw,rh), dst=dst[oy:oy+rh,ox:ox+rw])
+        sx, sy = src_w * scale, src_h * scale
+        return w / sx, h / sy, -ox / sx, -oy / sy
+
+    def fill(self, images : List[np.ndarray], resize_kind : str = 'stretch') -> np.ndarray :
+        """
+        resize `images` into next buffer, for 'pad' (letterbox) and 'scale' (pad at
+        bottom-right) `resize_kind` the coordinate transform of each image is recorded
+        at `transform` as array of (a_x, a_y, b_x, b_y), otherwise `transform` is None
+        """
+        assert resize_kind in BaseRuntime.resize_kinds
+        n, h, w, c = self.shape
+        if len(images) > n :
+            raise ValueError("expects 'images' <= n batch ({}) got {}".format(n, len(images)))
+        i = self.index
+        self.index = (i + 1) % self.n_buffers
+        dtype = images[0].dtype
+        if self.buffers[i] is None or self.buffers[i].dtype != dtype :
+            self.buffers[i] = np.zeros(self.shape, dtype=dtype)
+            self.n_filled[i] = 0
+        batch = self.buffers[i]
+        if resize_kind == 'stretch' :
+            for image, slot in zip(images, batch) :
+                BaseRuntime.resize_stretch(image, (w,h), dst=slot)
+            self.transform = None
+        else :
+            center = resize_kind == 'pad'
+            self.transform = np.asarray([
+                self.resize_keep_ratio(image, slot, center) for image, slot in zip(images, batch)
+            ], dtype=np.float32)
+        ## zero slots still holding image from previous batch
+        n_images = len(images)
+        if self.n_filled[i] > n_images :
+            batch[n_images:self.n_filled[i]] = 0
+        self.n_filled[i] = n_images
+        return batch
+
+
 class BaseRuntime:
     """
     Standardized runtime class;
@@ -19,7 +96,18 @@ class BaseRuntime:
     call_signature = {
         'return' : np.ndarray,
     }
-    def __init__(self, input_specs : OrderedDict, output_name : Union[List[str],str], output_format : Dict[str,Dict[str,np.ndarray]], class_names : List[str]) :
+    ## 'stretch' : resize to model input size
+    ## 'pad' : resize preserving aspect ratio, image is centered (letterbox)
+    ## 'scale' : resize preserving aspect ratio, padded at bottom-right
+    resize_kinds = ('stretch', 'pad', 'scale')
+    coordinate_fields = ('bounding_box', 'landmarks')
+    ## output name of the number of valid detections of each image, for padded
+    ## detection output of shape [n, max_detections, ...]
+    valid_counts_name = 'n_valid'
+    ## arguments of `apply_nms`, for model exported without nms
+    nms_args = ('iou_threshold', 'score_threshold', 'pre_nms_topk', 'max_detections')
+
+    def __init__(self, input_specs : OrderedDict, output_name : Union[List[str],str], output_format : Dict[str,Dict[str,np.ndarray]], class_names : List[str], resize_kind : str = 'stretch', runtime_nms : bool = False, nms_strategy : Union[str,Dict] = 'hard') :
         if isinstance(output_name, str) :
             self.output_name = [output_name]
         elif isinstance(output_name, list) :
@@ -41,6 +129,9 @@ class BaseRuntime:
                 for key, value in self.output_format.items()
         )
         self.output_fields = sorted(self.output_format.keys())
+        self.output_plan = type(self).compile_output_format(self.output_format)
+        ## true when `predict` returns buffer that is overwritten on the next call
+        self.output_reused = False
         assert len(input_specs), "input specs can't be empty"
         assert all(isinstance(spec, (OrderedDict,dict)) and \
             'shape' in spec and 'type' in spec and \
@@ -55,58 +146,211 @@ class BaseRuntime:
             assert all(isinstance(name, str) for name in class_names.values())
             assert all(isinstance(key, int) for key in class_names.keys())
         self.class_names = class_names
+        if not resize_kind in BaseRuntime.resize_kinds :
+            raise ValueError("unsupported resize_kind {}, supported : {}".format(resize_kind, BaseRuntime.resize_kinds))
+        self.resize_kind = resize_kind
+        ## model is exported without nms, `__call__` applies it on decoded output
+        self.runtime_nms = runtime_nms
+        ## name of `nms_strategies` or dictionary of its name and arguments
+        self.nms_strategy = nms_strategy
+        self.arena = None
 
     def predict(self, *args, **kwargs):
         raise NotImplementedError
+
+    @property
+    def arena(self) -> BatchArena :
+        ## input buffer is owned by the calling thread, so concurrent
+        ## callers of `prepare_batch` don't overwrite each other's batch
+        return getattr(self.__dict__.setdefault('_local', threading.local()), 'arena', None)
+
+    @arena.setter
+    def arena(self, value : BatchArena) :
+        self.__dict__.setdefault('_local', threading.local()).arena = value
     
     @staticmethod
     def is_available() :
         raise NotImplementedError
     
     @staticmethod
-    def resize_stretch(image : np.ndarray, size : Tuple[int,int]) :
-        return cv2.resize(image, size)
+    def resize_stretch(image : np.ndarray, size : Tuple[int,int], dst : np.ndarray = None) :
+        resized = cv2.resize(image, size, dst=dst)
+        if dst is not None and not np.shares_memory(resized, dst) :
+            ## opencv allocates new array when dst is not compatible
+            dst[...] = resized
+            resized = dst
+        return resized
     
-    ## TODO : implement resize pad
-    # @staticmethod
-    # def resize_pad(image : np.ndarray, size : Tuple[int,int]) :
-    #     return image
-
     @staticmethod
-    def resize_batch(images : List[np.ndarray], size : Tuple[int,int,int,int], resize_kind='stretch') :
+    def batch_shape(size : Tuple[int,int,int,int]) -> Tuple[int,int,int,int] :
+        """
+        helper function to get NHWC shape of batched image
+        from model's input shape, i.e. [n,w,h,c] or [n,c,w,h]
+        """
+        assert len(size)==4
+        n, w, h, c = size if size[-1]==3 else tuple(size[i] for i in [0,3,1,2])
+        return n, h, w, c
+
+    @classmethod
+    def resize_batch(cls, images : List[np.ndarray], size : Tuple[int,int,int,int], resize_kind='stretch') :
         """
         helper function to resize list of 
         np.ndarray (of possibly different size) 
         to single np array of same size
         """
-        assert resize_kind in ['stretch'] and len(size)==4
-        n, h, w, c = size if size[-1]==3 else tuple(size[i] for i in [0,3,1,2])
-        resize = lambda x: BaseRuntime.resize_stretch(x, (h,w))
-        dtype = images[0].dtype
-        n_pad = n - len(images)
-        batch_pad = [np.zeros((h,w,c),dtype=dtype)] * n_pad
-        batch_image = list(map(resize, images))
-        batch_image = batch_image + batch_pad
-        return np.stack(batch_image)
+        return BatchArena(cls.batch_shape(size), n_buffers=1).fill(images, resize_kind)
+
+    def prepare_batch(self, images : List[np.ndarray], resize_kind : str = None, return_transform : bool = False) :
+        """
+        same as `resize_batch` but images are resized directly into
+        reusable input buffer owned by this runtime instance (per thread);
+        returned array is reused (overwritten) two calls later;
+        `resize_kind` defaults to the one embedded in model,
+        with `return_transform` the coordinate transform (see `transform_coordinates`)
+        is also returned, None when no transform needed
+        """
+        if resize_kind is None :
+            resize_kind = self.resize_kind
+        if self.arena is None :
+            self.arena = BatchArena(type(self).batch_shape(self.input_specs['input']['shape']))
+        batch = self.arena.fill(images, resize_kind)
+        if return_transform :
+            return batch, self.arena.transform
+        return batch
+
+    @classmethod
+    def transform_coordinates(cls, results : List[Dict[str,np.ndarray]], transform : np.ndarray) -> List[Dict[str,np.ndarray]] :
+        """
+        apply per-image affine transform `r * a + b` to coordinate fields,
+        done in single vectorized op for all images
+
+        Args:
+            results (List[Dict[str,np.ndarray]]): prediction results, modified in-place
+            transform (np.ndarray): array of shape [n,4] as (a_x, a_y, b_x, b_y) for each image
+        """
+        transform = np.asarray(transform)
+        for key in cls.coordinate_fields :
+            index = [i for i, result in enumerate(results) if result.get(key) is not None]
+            if not len(index) :
+                continue
+            values = [results[i][key] for i in index]
+            shapes = [value.shape for value in values]
+            values = [value.reshape(-1, value.shape[-1]) for value in values]
+            counts = [len(value) for value in values]
+            coords = np.concatenate(values)
+            if not np.issubdtype(coords.dtype, np.floating) :
+                coords = coords.astype(np.float32)
+            t = np.repeat(transform[index], counts, axis=0)
+            coords[:,0::2] = coords[:,0::2] * t[:,[0]] + t[:,[2]]
+            coords[:,1::2] = coords[:,1::2] * t[:,[1]] + t[:,[3]]
+            for i, shape, value in zip(index, shapes, np.split(coords, np.cumsum(counts)[:-1])) :
+                results[i][key] = value.reshape(shape)
+        return results
 
     def __call__(self, *args, **kwargs):
-        predict_args = {}
+        predict_args, nms_args = {}, {}
         for name, value in kwargs.items() :
+            if self.runtime_nms and name in BaseRuntime.nms_args :
+                nms_args[name] = value
             if not name in self.input_specs :
-                logger.info('additional input arguments {} ignored'.format(name))
+                if not name in nms_args :
+                    logger.info('additional input arguments {} ignored'.format(name))
                 continue
             ## note : onnx input dtype includes 'tensor()', e.g. 'tensor(uint8)'
             dtype = self.input_specs[name]['type'].replace('tensor(','').replace(')','')
             predict_args[name] = np.array([value], dtype=dtype) if isinstance(value, (float,int)) \
                 else np.asarray(value, dtype=dtype)
         outputs = self.predict(*args, **predict_args)
+        results = self.decode(outputs)
+        if self.output_reused :
+            ## decoded fields may be views of output buffer overwritten by the next `predict`,
+            ## copy only those (e.g. valid detections) instead of the whole output
+            results = [
+                OrderedDict((key, value.copy() if value is not None and value.base is not None else value)
+                    for key, value in result.items())
+                    for result in results
+            ]
+        if self.runtime_nms :
+            results = apply_nms(results, strategy=self.nms_strategy, **nms_args)
+        return results
+
+    @staticmethod
+    def is_padded(outputs : Union[np.ndarray,List[np.ndarray]]) -> bool :
+        """
+        whether `outputs` is padded batch output of shape [n,max_detections,...]
+        with number of valid detections of each image, i.e. `[output, n_valid]`
+        """
+        return isinstance(outputs, (list, tuple)) and len(outputs) == 2 \
+            and all(isinstance(output, np.ndarray) for output in outputs) \
+            and outputs[0].ndim == 3 and outputs[1].ndim == 1 \
+            and np.issubdtype(outputs[1].dtype, np.integer) and len(outputs[0]) == len(outputs[1])
+
+    @staticmethod
+    def compile_output_format(output_format : Dict[str,Dict[str,np.ndarray]]) -> Dict[str,Tuple[int,Union[int,slice,np.ndarray],int]] :
+        """
+        precompile `output_format` into (axis, index, length) of each field,
+        contiguous indices are converted to slice so the field is decoded as view
+        """
+        plan = OrderedDict()
+        for key in sorted(output_format.keys()) :
+            axis = int(np.asarray(output_format[key]['axis']).reshape(-1)[0])
+            indices = np.asarray(output_format[key]['indices'], dtype=np.intp)
+            if indices.ndim == 0 :
+                index, length = int(indices), None
+            elif len(indices) and indices[0] >= 0 and np.all(np.diff(indices) == 1) :
+                index, length = slice(int(indices[0]), int(indices[-1]) + 1), len(indices)
+            else :
+                index, length = indices, None
+            plan[key] = (axis, index, length)
+        return plan
+
+    def _take(self, output : np.ndarray, key : str, batched : bool) -> np.ndarray :
+        axis, index, length = self.output_plan[key]
+        if axis >= 0 :
+            ## batched output has additional leading batch dimension
+            field = output[(slice(None),) * (axis + int(batched)) + (index,)]
+        else :
+            field = output[(Ellipsis, index) + (slice(None),) * (-axis - 1)]
+        if length is not None and field.shape[axis + int(batched and axis >= 0)] != length :
+            raise IndexError("indices of output '{}' out of bounds for output shape {}".format(key, output.shape))
+        return field
+
+    def decode_batch(self, outputs : np.ndarray) -> Dict[str,np.ndarray] :
+        """
+        decode batched `predict` output of shape [n,...] into array of
+        each output field with leading batch dimension, decoded with
+        precompiled `output_plan`; contiguous fields are views of `outputs`,
+        all fields are None when the output is empty
+        """
+        empty = not all(outputs.shape[1:])
+        return OrderedDict(
+            (key, None if empty else self._take(outputs, key, batched=True)) for key in self.output_fields
+        )
+
+    def decode(self, outputs : Union[np.ndarray,List[np.ndarray]]) -> List[Dict[str,np.ndarray]] :
+        """
+        decode `predict` output into list of dictionary of each output field,
+        see `decode_batch`; `outputs` may also be list of per-image output,
+        or padded output with number of valid detections (see `is_padded`),
+        in which case each image's fields are trimmed to its valid detections
+        """
+        if type(self).is_padded(outputs) :
+            output, n_valid = outputs
+            fields = self.decode_batch(output)
+            return [
+                OrderedDict((key, None if value is None or not n else value[i][:n]) for key, value in fields.items())
+                    for i, n in enumerate(n_valid.tolist())
+            ]
+        if isinstance(outputs, np.ndarray) and outputs.ndim > 1 :
+            fields = self.decode_batch(outputs)
+            return [
+                OrderedDict((key, None if value is None else value[i]) for key, value in fields.items())
+                    for i in range(len(outputs))
+            ]
         results = []
-        for output in outputs:
-            result = OrderedDict()
-            for key in self.output_fields:
-                result[key] = np.take(
-                                output, axis=int(self.output_format[key]['axis']),
-                                indices=self.output_format[key]['indices'],
-                            ) if all(output.shape) else None 
-            results.append(result)
+        for output in outputs :
+            empty = not all(output.shape)
+            results.append(OrderedDict(
+                (key, None if empty else self._take(output, key, batched=False)) for key in self.output_fields
+            ))
         return results
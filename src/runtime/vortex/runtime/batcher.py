@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+import numpy as np
+
+from collections import deque
+from concurrent.futures import Future
+from typing import Union, Dict, Any
+
+from vortex.runtime.basic_runtime import BaseRuntime
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['DynamicBatcher']
+
+_STOP = object()
+
+
+class _Request:
+    __slots__ = ('image', 'future', 't_enqueue')
+
+    def __init__(self, image: np.ndarray):
+        self.image = image
+        self.future = Future()
+        self.t_enqueue = time.perf_counter()
+
+
+class DynamicBatcher:
+    """Collect single-image requests from many callers and run them
+    as one batch on a runtime model.
+
+    A batch is flushed to the model when it is full (model's batch size)
+    or when the oldest request in it has waited for `max_latency` seconds.
+    Each caller receives its own result, the same dictionary a plain
+    `model(batch)` call would return for that image.
+
+    Example:
+        ```python
+        from vortex.runtime import create_runtime_model, DynamicBatcher
+
+        model = create_runtime_model('model.onnx', runtime='cpu')
+        with DynamicBatcher(model, max_latency=0.005, score_threshold=0.5) as batcher:
+            ## blocking call, safe from multiple threads
+            result = batcher(image)
+            ## or non-blocking
+            future = batcher.submit(image)
+            ## or from asyncio task
+            result = await batcher.predict_async(image)
+            print(batcher.stats())
+        ```
+    """
+    def __init__(self, model: BaseRuntime, max_latency: float = 0.01,
+                 max_queue_size: int = 0, latency_window: int = 1024, **kwargs):
+        """Create batcher and start its worker thread
+
+        Args:
+            model (BaseRuntime): runtime model, e.g. from `create_runtime_model`
+            max_latency (float, optional): maximum time (in seconds) a request waits
+                for the batch to be filled before it is flushed. Defaults to 0.01.
+            max_queue_size (int, optional): maximum pending requests, `submit` blocks
+                when full; 0 means unbounded. Defaults to 0.
+            latency_window (int, optional): number of latest requests used for
+                latency statistics. Defaults to 1024.
+            **kwargs: additional model inputs passed on every batch, e.g. `score_threshold`
+        """
+        if max_latency < 0:
+            raise ValueError("expects 'max_latency' >= 0, got {}".format(max_latency))
+        self.model = model
+        self.max_latency = max_latency
+        self.input_shape = model.input_specs['input']['shape']
+        self.batch_size = self.input_shape[0]
+        self.kwargs = kwargs
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        ## `_closed` is checked and requests are enqueued under this lock, so none
+        ## is enqueued after the worker is stopped; submitter waiting for room in
+        ## full queue releases it, and is notified when the worker takes a request
+        self._submit_lock = threading.Lock()
+        self._not_full = threading.Condition(self._submit_lock)
+        self._stopping = False
+        self._latency = deque(maxlen=latency_window)
+        self._n_requests = 0
+        self._n_batches = 0
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='vortex-batcher', daemon=True)
+        self._worker.start()
+
+    @property
+    def class_names(self):
+        return self.model.class_names
+
+    def submit(self, image: np.ndarray) -> Future:
+        """Enqueue single image for inference
+
+        Args:
+            image (np.ndarray): image in HWC format, of any size
+
+        Raises:
+            RuntimeError: batcher is already closed
+
+        Returns:
+            Future: future resolved with prediction result of `image`
+        """
+        request = _Request(image)
+        with self._not_full:
+            while True:
+                if self._closed:
+                    raise RuntimeError("batcher is closed")
+                try:
+                    self._queue.put_nowait(request)
+                    return request.future
+                except queue.Full:
+                    ## doesn't block other submitters and `close` while waiting
+                    self._not_full.wait()
+
+    def __call__(self, image: np.ndarray, timeout: Union[float,None] = None) -> Dict[str,Any]:
+        """Run inference on single image, blocks until result is ready
+
+        Args:
+            image (np.ndarray): image in HWC format, of any size
+            timeout (float, optional): maximum time to wait for result. Defaults to None.
+
+        Returns:
+            Dict[str,Any]: prediction result
+        """
+        return self.submit(image).result(timeout=timeout)
+
+    async def predict_async(self, image: np.ndarray) -> Dict[str,Any]:
+        """Run inference on single image from asyncio task without blocking event loop
+
+        Args:
+            image (np.ndarray): image in HWC format, of any size
+
+        Returns:
+            Dict[str,Any]: prediction result
+        """
+        return await asyncio.wrap_future(self.submit(image))
+
+    def _get(self, timeout: Union[float,None] = None, block: bool = True):
+        request = self._queue.get(block, timeout)
+        if self._queue.maxsize > 0:
+            with self._not_full:
+                self._not_full.notify()
+        return request
+
+    def _collect(self, first: _Request):
+        requests = [first]
+        stop = False
+        deadline = first.t_enqueue + self.max_latency
+        while len(requests) < self.batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                if timeout > 0:
+                    request = self._get(timeout=timeout)
+                else:
+                    ## deadline passed, only take what is already waiting
+                    request = self._get(block=False)
+            except queue.Empty:
+                break
+            if request is _STOP:
+                stop = True
+                break
+            requests.append(request)
+        return requests, stop
+
+    def _process(self, requests):
+        requests = [r for r in requests if r.future.set_running_or_notify_cancel()]
+        if not len(requests):
+            return
+        try:
+            batch, transform = self.model.prepare_batch([r.image for r in requests], return_transform=True)
+            results = self.model(batch, **self.kwargs)
+            if transform is not None:
+                results = self.model.transform_coordinates(results[:len(requests)], transform)
+        except Exception as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+        t_done = time.perf_counter()
+        with self._lock:
+            self._n_batches += 1
+            self._n_requests += len(requests)
+            self._latency.extend(t_done - r.t_enqueue for r in requests)
+        for request, result in zip(requests, results):
+            request.future.set_result(result)
+
+    def _run(self):
+        stop = False
+        ## `_stopping` when the queue was full on `close`
+        while not stop and not self._stopping:
+            first = self._get()
+            if first is _STOP:
+                break
+            requests, stop = self._collect(first)
+            self._process(requests)
+        ## fail requests that are still pending
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not _STOP and request.future.set_running_or_notify_cancel():
+                request.future.set_exception(RuntimeError("batcher is closed"))
+
+    def stats(self) -> Dict[str,Union[int,float]]:
+        """Batcher statistics, useful to tune `max_latency` against throughput
+
+        Returns:
+            Dict[str,Union[int,float]]: dictionary containing 'queue_depth',
+                'n_requests', 'n_batches', 'fill_ratio' (average requests per batch
+                relative to batch size), 'latency_p50' and 'latency_p99' (in seconds,
+                from submit to result available)
+        """
+        with self._lock:
+            latency = np.asarray(self._latency)
+            n_requests, n_batches = self._n_requests, self._n_batches
+        fill_ratio = n_requests / (n_batches * self.batch_size) if n_batches else 0.
+        p50, p99 = np.percentile(latency, [50, 99]) if len(latency) else (0., 0.)
+        return dict(
+            queue_depth=self._queue.qsize(),
+            n_requests=n_requests,
+            n_batches=n_batches,
+            fill_ratio=fill_ratio,
+            latency_p50=float(p50),
+            latency_p99=float(p99),
+        )
+
+    def close(self, timeout: Union[float,None] = None):
+        """Stop worker thread, requests already in a batch are completed,
+        the rest are failed with RuntimeError
+
+        Args:
+            timeout (float, optional): maximum time to wait for worker thread. Defaults to None.
+        """
+        with self._not_full:
+            if self._closed:
+                return
+            self._closed = True
+            ## submitters waiting for room are rejected
+            self._not_full.notify_all()
+        try:
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            ## worker stops after its current batch instead
+            self._stopping = True
+        self._worker.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,20 +1,23 @@
 import cv2
 import numpy as np
 import time
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Tuple, Union, List, Dict, Sequence
+from typing import Tuple, Union, List, Dict, Sequence, Iterable, Iterator
 
 import vortex.runtime as vrt
+from vortex.runtime.basic_runtime import BaseRuntime
+from vortex.runtime.image_loader import ImageLoader
+from vortex.runtime.visual import VisualRenderer
 
 class Visual:
-    """Helper class for various drawing routine accepting formated result
+    """Helper class for various drawing routine accepting formated result,
+    multiple items and results are drawn by `renderer` (see `VisualRenderer`)
     """
-    colors = [
-        (255, 0, 0), (0, 255, 0), (0, 0, 255),
-        (255, 127, 127), (127, 255, 127), (127, 127, 255),
-        (255, 0, 255), (0, 255, 255), (255, 255, 255),
-    ] * 115 ## >= imagenet
+    colors = VisualRenderer.colors
     font, font_scale, line_type = cv2.FONT_HERSHEY_SIMPLEX, 1, 2
+    renderer = VisualRenderer(font, font_scale, thickness=line_type)
 
     def __init__(self, class_names):
         self.class_names = class_names
@@ -51,13 +54,7 @@ class Visual:
             np.ndarray: array with visualization
         """        
         color_map = color_map if color_map else cls.colors
-        for bbox, label, confidence in zip(bboxes, classes, confidences) :
-            label = int(label)
-            color = color_map[label]
-            x1, y1, x2, y2 = bbox
-            vis = cls.draw_bbox(vis, (x1,y1), (x2,y2), color=color)
-            vis = cls.draw_label(vis, label, confidence, (x1,y1), color, class_names=class_names)
-        return vis
+        return cls.renderer.draw_bboxes(vis, bboxes, classes, confidences, color_map, class_names=class_names)
 
     @classmethod
     def draw_landmarks(cls, vis: np.ndarray, landmarks, color: Tuple[int,int,int]=None, radius=2, thickness=-1) :
@@ -74,13 +71,7 @@ class Visual:
             np.ndarray: array with visualization
         """        
         color = color if color else cls.colors[0]
-        for landmark in landmarks :
-            assert (len(landmark) % 2) == 0
-            xpts, ypts = landmark[0::2], landmark[1::2]
-            for x, y in zip(xpts, ypts) :
-                pt = int(x), int(y)
-                cv2.circle(vis, pt, radius=radius, color=color, thickness=thickness)
-        return vis
+        return cls.renderer.draw_landmarks(vis, landmarks, color, radius=radius, thickness=thickness)
 
     @classmethod
     def draw_label(cls, vis, obj_class, confidence, bl, color, class_names=None) :
@@ -121,10 +112,7 @@ class Visual:
         """        
         if color_map is None:
             color_map = cls.colors
-        for obj_class, confidence, bl in zip(obj_classes, confidences, bls) :
-            color = color_map[int(obj_class)]
-            vis = cls.draw_label(vis, obj_class, confidence, bl, color, class_names=class_names)
-        return vis
+        return cls.renderer.draw_labels(vis, obj_classes, confidences, bls, color_map, class_names=class_names)
     
     @classmethod
     def draw(cls, result: dict, vis: np.ndarray, class_names=None, color_map=None):
@@ -141,30 +129,7 @@ class Visual:
         """        
         if color_map is None:
             color_map = cls.colors
-        class_label = None
-        if 'class_label' in result:
-            class_label = result['class_label']
-        else:
-            class_label = np.zeros((result['class_confidence'].shape[0], 1))
-        class_confidence = result['class_confidence']
-
-        if 'bounding_box' in result:
-            assert 'class_confidence' in result
-            bounding_box = result['bounding_box']
-            if bounding_box is not None:
-                vis = cls.draw_bboxes(vis, bounding_box, class_label, class_confidence, 
-                                class_names=class_names, color_map=color_map)
-        else:
-            label_pts = np.asarray([[0, int(vis.shape[0]*0.95)]] * len(class_label))
-            label_pts = [tuple(label_pt) for label_pt in label_pts.tolist()]
-            vis = cls.draw_labels(vis, class_label.astype(np.int), class_confidence, label_pts, 
-                              color_map=color_map, class_names=class_names)
-
-        if 'landmarks' in result:
-            landmarks = result['landmarks']
-            if landmarks is not None:
-                vis = cls.draw_landmarks(vis, landmarks)
-        return vis
+        return cls.renderer.draw(result, vis, color_map, class_names=class_names)
 
     @classmethod
     def visualize_result(cls, vis: np.ndarray, results: List[Dict[str,np.ndarray]] , class_names=None, color_map=None):
@@ -187,7 +152,7 @@ class Visual:
 
     @classmethod
     def visualize(cls, batch_vis: List, batch_results: List, class_names=None) -> List:
-        """draw batched prediction result on `vis`
+        """draw batched prediction result on `vis`, images are drawn in parallel
 
         Args:
             batch_vis (List): batch image for visualization
@@ -197,9 +162,7 @@ class Visual:
         Returns:
             np.ndarray: array with visualiazation
         """
-        f = lambda vis, results: cls.visualize_result(vis=vis, results=[results], class_names=class_names)
-        result_vis = list(map(f, batch_vis, batch_results))
-        return result_vis
+        return cls.renderer.render(batch_vis, batch_results, cls.colors, class_names=class_names)
     
     def __call__(self, batch_vis: List, batch_results: List):
         return self.visualize(batch_vis, batch_results, self.class_names)
@@ -212,6 +175,19 @@ class InferenceHelper:
     def __init__(self, model):
         self.model = model
         self.class_names = model.class_names
+        # runs the model while the next chunk is resized, see `_run_inference_chunks`
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='vortex-helper')
+
+    def close(self):
+        """shut down the helper's inference thread
+        """
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
     
     @staticmethod
     def create_runtime_model(**kwargs):
@@ -223,34 +199,107 @@ class InferenceHelper:
         model = vrt.create_runtime_model(**kwargs)
         return InferenceHelper(model)
 
+    @staticmethod
+    def _chunks(iterable: Iterable, n: int) -> Iterator[List]:
+        """split iterable to lists of at most `n` element
+        """
+        iterator = iter(iterable)
+        while True:
+            chunk = list(itertools.islice(iterator, n))
+            if not chunk:
+                return
+            yield chunk
+
     @classmethod
-    def run_inference(cls, model, batch_imgs, **kwargs):
-        """run inference on batched (possibly non-uniform size) image
+    def _run_inference_chunks(cls, model, chunks: Iterable[List[np.ndarray]], executor: ThreadPoolExecutor=None, **kwargs):
+        """run inference on each chunk, resize of the next chunk is done
+        while the model is running on current chunk in a worker thread
 
         Args:
             model (runtime): vortex rt model
-            batch_imgs (list): list image for inference
+            chunks (Iterable[List[np.ndarray]]): list of image, each at most model's batch size
+            executor (ThreadPoolExecutor, optional): single worker executor running the model,
+                created for this call if not given. Defaults to None.
 
-        Returns:
-            list of dict: list of dictionary corresponding to each image
+        Yields:
+            tuple: list of results corresponding to each image in chunk, model's running time
+                and coordinate transform from resize (None for 'stretch' resize)
         """
-        input_shape = model.input_specs['input']['shape']
-        n = input_shape[0]
-        # TODO allows batch > n, by running multiple times
-        assert len(batch_imgs) <= n, "expects 'images' <= n batch ({}) got {}".format(n, len(batch_imgs))
+        def run(batch_imgs, n_valid):
+            start_time = time.time()
+            results = model(batch_imgs, **kwargs)
+            # discard results from padded image
+            return results[:n_valid], time.time() - start_time
+        if executor is None:
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                yield from cls._run_inference_chunks(model, chunks, executor, **kwargs)
+            return
+        running = None
+        for chunk in chunks:
+            # resize input, following model's resize kind
+            batch_imgs, transform = model.prepare_batch(chunk, return_transform=True)
+            future = executor.submit(run, batch_imgs, len(chunk))
+            if running is not None:
+                yield (*running[0].result(), running[1])
+            running = future, transform
+        if running is not None:
+            yield (*running[0].result(), running[1])
+
+    @classmethod
+    def run_inference(cls, model, batch_imgs, stream: bool=False, executor: ThreadPoolExecutor=None, **kwargs):
+        """run inference on batched (possibly non-uniform size) image,
+        images are splitted to model's batch size and run sequentially
 
-        # stretch resize input
-        batch_imgs = type(model).resize_batch([mat.copy() for mat in batch_imgs], input_shape)
-        results = model(batch_imgs, **kwargs)
+        Args:
+            model (runtime): vortex rt model
+            batch_imgs (iterable): list or iterator of image for inference
+            stream (bool, optional): return generator instead of list. Defaults to False.
+            executor (ThreadPoolExecutor, optional): single worker executor running the model,
+                e.g. helper's `executor`. Defaults to None.
 
+        Returns:
+            list of dict: list of dictionary corresponding to each image,
+                or generator of it if `stream` is True
+        """
+        n = model.input_specs['input']['shape'][0]
+        chunks = cls._chunks(batch_imgs, n)
+        def run_chunks():
+            for results, _, transform in cls._run_inference_chunks(model, chunks, executor, **kwargs):
+                # map coordinates back to be relative to original image
+                if transform is not None:
+                    results = BaseRuntime.transform_coordinates(results, transform)
+                yield from results
+        results = run_chunks()
+        if not stream:
+            results = list(results)
         return results
 
     @classmethod
-    def load_images(cls, images):
-        """load images from list of files
+    def run_video(cls, model, source, drop_frames: bool=False, queue_size: int=None, **kwargs):
+        """run inference on frames of video file, camera or stream,
+        frames are read in background thread and batched up to model's batch size
 
         Args:
-            images (list): list of files
+            model (runtime): vortex rt model
+            source: video file, stream url, camera index, `cv2.VideoCapture`, or iterable of frames
+            drop_frames (bool, optional): drop oldest frames when inference can't keep up. Defaults to False.
+            queue_size (int, optional): maximum frames read ahead. Defaults to twice model's batch size.
+
+        Returns:
+            VideoStream: iterable of (frame_idx, timestamp, result), see `VideoStream.stats`
+                for fps and per-stage latency
+        """
+        from vortex.runtime.video import VideoStream
+        return VideoStream(model, source, queue_size=queue_size, drop_frames=drop_frames, **kwargs)
+
+    @classmethod
+    def load_images(cls, images, loader: ImageLoader=None):
+        """load images from list of files, decoded in parallel
+
+        Args:
+            images (list): list of files, encoded image bytes or np.ndarray
+            loader (ImageLoader, optional): image loader, e.g. with reduced resolution decoding.
+                Defaults to None.
 
         Raises:
             TypeError: unknown type passed
@@ -258,30 +307,20 @@ class InferenceHelper:
         Returns:
             list: list of loaded np.ndarray
         """
-        # Check image availability if image path is provided
-        if isinstance(images[0],str) or isinstance(images[0],Path):
-            image_paths = [Path(image) for image in images]
-            for image_path in image_paths :
-                assert image_path.exists(), "image {} doesn't exist".format(str(image_path))
-            # TODO make sure to load with 3 channel
-            batch_mat = [cv2.imread(image) for image in images]
-        elif isinstance(images[0],np.ndarray):
-            batch_mat = images
-            assert all(len(image.shape) == 3 for image in batch_mat), \
-                "Provided 'images' list member in numpy ndarray must be of dim 3, [h , w , c]"
-        else:
-            raise TypeError("'images' arguments must be provided with list of image path or list of "
-                "numpy ndarray, found {}".format(type(images[0])))
-        return batch_mat
+        loader = loader or ImageLoader()
+        return loader.load(images)
     
     @classmethod
-    def adjust_coordinates(cls, batch_vis, batch_results, coordinate_fmt='relative'):
-        """adjust prediction results for visualization
+    def adjust_coordinates(cls, batch_vis, batch_results, coordinate_fmt='relative', transforms=None):
+        """adjust prediction results for visualization,
+        all coordinates in batch are transformed in single vectorized op
 
         Args:
             batch_vis (list): list of image for visualization
             batch_results (list): prediction results to be transformed
             coordinate_fmt (str, optional): output coordinat format. Defaults to 'relative'.
+            transforms (np.ndarray, optional): coordinate transform for each image from runtime's
+                `prepare_batch`, needed when model's input is resized with 'pad' or 'scale'. Defaults to None.
 
         Returns:
             list: list of transformed prediction results
@@ -289,25 +328,18 @@ class InferenceHelper:
         known_coordinate_fmt = ['relative', 'absolute']
         assert coordinate_fmt in known_coordinate_fmt, \
             f"available 'output_coordinate_format': {known_coordinate_fmt}"
-        def adjust_coordinate(vis, result):
-            # assume HWC format
-            im_h, im_w, im_c = vis.shape
-            if 'bounding_box' in result:
-                bounding_box = result['bounding_box']
-                if bounding_box is not None:
-                    bounding_box[...,0::2] *= im_w
-                    bounding_box[...,1::2] *= im_h
-                    result['bounding_box'] = bounding_box
-            if 'landmarks' in result:
-                landmarks = result['landmarks']
-                if landmarks is not None:
-                    landmarks[...,0::2] *= im_w
-                    landmarks[...,1::2] *= im_h
-                    result['landmarks'] = landmarks
-            return result
+        n = len(batch_results)
+        if transforms is not None:
+            transforms = np.array(transforms, dtype=np.float32)
+        elif coordinate_fmt == 'relative':
+            transforms = np.tile(np.asarray([1., 1., 0., 0.], dtype=np.float32), (n, 1))
+        else:
+            return batch_results
         if coordinate_fmt == 'relative':
-            batch_results = list(map(adjust_coordinate, batch_vis, batch_results))
-        return batch_results
+            # assume HWC format, scale (a_x, a_y, b_x, b_y) with (w, h, w, h)
+            im_size = np.asarray([vis.shape[1::-1] for vis in batch_vis[:n]], dtype=np.float32)
+            transforms *= np.tile(im_size, 2)
+        return BaseRuntime.transform_coordinates(batch_results, transforms)
 
     @classmethod
     def save_images(cls, filenames: List, batch_vis: List, output_dir: Union[str,Path]='.', output_file_prefix='prediction'):
@@ -339,54 +371,29 @@ class InferenceHelper:
         return filenames_
 
     @classmethod
-    def run_and_visualize(cls, model,
-            images: Union[List[str],np.ndarray],
+    def _process_results(cls, images, batch_mat, results, dt, transform, load_time,
             output_coordinate_format: str='relative',
             visualize: bool=False,
             dump_visual: bool=False,
             output_dir: Union[str,Path]='.',
             class_names=None,
-            visual=None,
-            **kwargs) -> dict:
-        """run inference on model with given images paths
-
-        Args:
-            model (vrt.BaseRuntime): vorted rt model
-            images (Union[List[str],np.ndarray]): list of image's path
-            output_coordinate_format (str, optional): output coordinate format. Defaults to 'relative'.
-            visualize (bool, optional): visualize output. Defaults to False.
-            dump_visual (bool, optional): save images. Defaults to False.
-            output_dir (Union[str,Path], optional): output directory. Defaults to '.'.
-
-        Returns:
-            dict: prediction results
-        """    
-        if isinstance(images, (str,Path)):
-            images = [images]
-
-        # load images
-        batch_mat = cls.load_images(images)
-
-        # copy image for visualization
-        batch_vis = [mat.copy() for mat in batch_mat]
-        batch_imgs = batch_mat
-
-        # simple measurement
-        start_time = time.time()
-        # actually run inference
-        results = cls.run_inference(model, batch_imgs, **kwargs)
-        end_time = time.time()
-        dt = end_time - start_time
+            visual=None) -> dict:
+        start_time = time.perf_counter()
+        # copy image for visualization, only when it's given by caller
+        batch_vis = [mat.copy() if visualize and isinstance(image, np.ndarray) else mat
+            for image, mat in zip(images, batch_mat)]
 
         # Transform coordinate-based result from relative coordinates to absolute value
         results = cls.adjust_coordinates(
             batch_vis=batch_vis, batch_results=results,
-            coordinate_fmt=output_coordinate_format
+            coordinate_fmt=output_coordinate_format,
+            transforms=transform
         )
 
         results = dict(
             prediction=results,
             runtime=dt,
+            timings=dict(load=load_time, inference=dt),
         )
 
         visual = visual or cls.Visual
@@ -396,12 +403,96 @@ class InferenceHelper:
             result_vis = visual.visualize(batch_vis=batch_vis, class_names=class_names, batch_results=results['prediction'])
             results['visualization'] = result_vis
             # Dump prediction only support when given image is list of filenames
-            if dump_visual and isinstance(images,list):
+            if dump_visual and isinstance(images,list) and isinstance(images[0],(str,Path)):
                 saved_images = cls.save_images(images, batch_vis)
                 saved_images = [str(img) for img in saved_images]
                 print('prediction saved to {}'.format(str(', '.join(saved_images))))
 
+        results['timings']['postprocess'] = time.perf_counter() - start_time
         return results
+
+    @classmethod
+    def _run_and_visualize_stream(cls, model, images, process_args: dict, loader: ImageLoader=None,
+                                  executor: ThreadPoolExecutor=None, **kwargs):
+        n = model.input_specs['input']['shape'][0]
+        loader = loader or ImageLoader()
+        loaded = []
+        def load_chunks():
+            batches = loader.batches(images, n)
+            while True:
+                # load images, decoded in parallel ahead of the model
+                start_time = time.perf_counter()
+                batch = next(batches, None)
+                if batch is None:
+                    return
+                chunk, batch_mat = batch
+                loaded.append((chunk, batch_mat, time.perf_counter() - start_time))
+                yield batch_mat
+        for results, dt, transform in cls._run_inference_chunks(model, load_chunks(), executor, **kwargs):
+            chunk, batch_mat, load_time = loaded.pop(0)
+            yield cls._process_results(chunk, batch_mat, results, dt, transform, load_time, **process_args)
+
+    @classmethod
+    def run_and_visualize(cls, model,
+            images: Union[List[str],np.ndarray,Iterable],
+            output_coordinate_format: str='relative',
+            visualize: bool=False,
+            dump_visual: bool=False,
+            output_dir: Union[str,Path]='.',
+            class_names=None,
+            visual=None,
+            stream: bool=False,
+            loader: ImageLoader=None,
+            executor: ThreadPoolExecutor=None,
+            **kwargs) -> dict:
+        """run inference on model with given images paths
+
+        Args:
+            model (vrt.BaseRuntime): vorted rt model
+            images (Union[List[str],np.ndarray,Iterable]): list or iterator of image's path
+            output_coordinate_format (str, optional): output coordinate format. Defaults to 'relative'.
+            visualize (bool, optional): visualize output. Defaults to False.
+            dump_visual (bool, optional): save images. Defaults to False.
+            output_dir (Union[str,Path], optional): output directory. Defaults to '.'.
+            stream (bool, optional): return generator yielding results for each model's batch,
+                instead of results for all images. Defaults to False.
+            loader (ImageLoader, optional): image loader to decode images in parallel, images are
+                decoded ahead of the model while it runs. With reduced resolution decoding
+                (`min_size`), 'absolute' coordinates and visualization are relative to the
+                decoded image. Defaults to None.
+            executor (ThreadPoolExecutor, optional): single worker executor running the model,
+                e.g. helper's `executor`. Defaults to None.
+
+        Returns:
+            dict: prediction results including 'timings' of each stage ('load', 'inference' and
+                'postprocess' in seconds), or generator of it if `stream` is True
+        """    
+        if isinstance(images, (str,Path)):
+            images = [images]
+
+        process_args = dict(
+            output_coordinate_format=output_coordinate_format,
+            visualize=visualize, dump_visual=dump_visual,
+            output_dir=output_dir, class_names=class_names,
+            visual=visual,
+        )
+        results = cls._run_and_visualize_stream(model, images, process_args, loader=loader,
+            executor=executor, **kwargs)
+        if stream:
+            return results
+
+        # merge results from all batch
+        merged = dict(prediction=[], runtime=0., timings=dict(load=0., inference=0., postprocess=0.))
+        if visualize:
+            merged['visualization'] = []
+        for result in results:
+            merged['prediction'].extend(result['prediction'])
+            merged['runtime'] += result['runtime']
+            for stage, elapsed in result['timings'].items():
+                merged['timings'][stage] += elapsed
+            if visualize:
+                merged['visualization'].extend(result['visualization'])
+        return merged
     
     def __call__(self, *args, **kwargs):
         """Run and visualize
@@ -409,4 +500,5 @@ class InferenceHelper:
         Returns:
             dict: dictionary containing 'prediction' and optionally 'visualization'
         """
-        return self.run_and_visualize(self.model, class_names=self.class_names, *args, **kwargs)
\ No newline at end of file
+        return self.run_and_visualize(self.model, class_names=self.class_names,
+            executor=self.executor, *args, **kwargs)
\ No newline at end of file
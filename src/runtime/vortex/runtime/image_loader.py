@@ -0,0 +1,196 @@
+import cv2
+import itertools
+import logging
+import threading
+import time
+import numpy as np
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Union, List, Dict, Tuple, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['ImageLoader']
+
+
+class ImageLoader:
+    """Decode images in parallel on a thread pool, with bounded prefetch.
+
+    Accepts image path (str or Path), encoded image (bytes) or already
+    decoded image (np.ndarray, HWC), mixed in the same list. With `min_size`,
+    images are decoded at reduced resolution (1/2, 1/4 or 1/8, using
+    `cv2.IMREAD_REDUCED_COLOR_*`) as long as the decoded image is still
+    at least `min_size`, e.g. model's input size.
+
+    Example:
+        ```python
+        from vortex.runtime import ImageLoader
+
+        loader = ImageLoader(n_workers=8, prefetch=2)
+        for paths, images in loader.batches(sorted(Path('images').glob('*.jpg')), batch_size=16):
+            batch = model.prepare_batch(images)
+            ...
+        print(loader.stats())
+        ```
+    """
+    reduced_flags = {
+        1 : cv2.IMREAD_COLOR,
+        2 : cv2.IMREAD_REDUCED_COLOR_2,
+        4 : cv2.IMREAD_REDUCED_COLOR_4,
+        8 : cv2.IMREAD_REDUCED_COLOR_8,
+    }
+
+    def __init__(self, n_workers: int = 4, prefetch: int = 2, min_size: Union[Tuple[int,int],None] = None):
+        """Create image loader
+
+        Args:
+            n_workers (int, optional): number of decoding threads. Defaults to 4.
+            prefetch (int, optional): number of batches decoded ahead of the consumer,
+                bounding the memory used by decoded images. Defaults to 2.
+            min_size (Tuple[int,int], optional): minimum (width, height) of decoded image,
+                enables reduced resolution decoding; None to always decode at full resolution.
+                Defaults to None.
+        """
+        if n_workers < 1:
+            raise ValueError("expects 'n_workers' >= 1, got {}".format(n_workers))
+        if prefetch < 0:
+            raise ValueError("expects 'prefetch' >= 0, got {}".format(prefetch))
+        self.n_workers = n_workers
+        self.prefetch = prefetch
+        self.min_size = min_size
+        self._factor = max(ImageLoader.reduced_flags)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self._n_images = 0
+            self._decode_time = 0.
+            self._wait_time = 0.
+
+    def stats(self) -> Dict[str,Union[int,float]]:
+        """Loader timings, useful to check whether decoding is the bottleneck
+
+        Returns:
+            Dict[str,Union[int,float]]: dictionary containing 'n_images', 'decode_time' (total
+                decoding time of all workers, in seconds) and 'wait_time' (time the consumer
+                was blocked waiting for decoded images, in seconds)
+        """
+        with self._lock:
+            return dict(n_images=self._n_images, decode_time=self._decode_time, wait_time=self._wait_time)
+
+    @staticmethod
+    def _read(image: Union[str,Path,bytes], flags: int) -> np.ndarray:
+        if isinstance(image, (str, Path)):
+            return cv2.imread(str(image), flags)
+        return cv2.imdecode(np.frombuffer(image, dtype=np.uint8), flags)
+
+    def _read_reduced(self, image: Union[str,Path,bytes]) -> np.ndarray:
+        min_w, min_h = self.min_size
+        ## start from last used factor, images from the same source mostly have the same size
+        factor = self._factor
+        while True:
+            decoded = self._read(image, ImageLoader.reduced_flags[factor])
+            if decoded is None or factor == 1:
+                break
+            h, w = decoded.shape[:2]
+            if w >= min_w and h >= min_h:
+                break
+            factor //= 2
+        if decoded is not None:
+            h, w = decoded.shape[:2]
+            if factor < max(ImageLoader.reduced_flags) and w >= 2 * min_w and h >= 2 * min_h:
+                factor *= 2
+            self._factor = factor
+        return decoded
+
+    def load_image(self, image: Union[str,Path,bytes,np.ndarray]) -> np.ndarray:
+        """Decode single image
+
+        Args:
+            image (Union[str,Path,bytes,np.ndarray]): image path, encoded image, or decoded image
+
+        Raises:
+            FileNotFoundError: image path doesn't exist
+            ValueError: image can't be decoded, or array is not HWC image
+            TypeError: unknown image type
+
+        Returns:
+            np.ndarray: decoded image in HWC BGR format
+        """
+        start = time.perf_counter()
+        if isinstance(image, np.ndarray):
+            if image.ndim != 3:
+                raise ValueError("Provided 'images' list member in numpy ndarray must be of dim 3, [h , w , c]")
+            decoded = image
+        elif isinstance(image, (str, Path, bytes, bytearray, memoryview)):
+            decoded = self._read(image, cv2.IMREAD_COLOR) if self.min_size is None \
+                else self._read_reduced(image)
+            if decoded is None:
+                if isinstance(image, (str, Path)) and not Path(image).exists():
+                    raise FileNotFoundError("image {} doesn't exist".format(str(image)))
+                raise ValueError("failed to decode image {}".format(
+                    str(image) if isinstance(image, (str, Path)) else type(image)))
+        else:
+            raise TypeError("'images' arguments must be provided with list of image path, encoded image "
+                "bytes or numpy ndarray, found {}".format(type(image)))
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._n_images += 1
+            self._decode_time += elapsed
+        return decoded
+
+    def batches(self, images: Iterable, batch_size: int) -> Iterator[Tuple[List,List[np.ndarray]]]:
+        """Decode images in parallel, in order, at most `prefetch` batches ahead
+
+        Args:
+            images (Iterable): list or iterator of image path, encoded image, or decoded image
+            batch_size (int): number of images of each batch
+
+        Yields:
+            tuple: list of the given images and list of decoded images, of at most `batch_size`
+        """
+        iterator = iter(images)
+        window = (self.prefetch + 1) * batch_size
+        pending = deque()
+        with ThreadPoolExecutor(self.n_workers, thread_name_prefix='vortex-loader') as executor:
+            try:
+                for image in itertools.islice(iterator, window):
+                    pending.append((image, executor.submit(self.load_image, image)))
+                inputs, decoded = [], []
+                while pending:
+                    image, future = pending.popleft()
+                    start = time.perf_counter()
+                    result = future.result()
+                    with self._lock:
+                        self._wait_time += time.perf_counter() - start
+                    for next_image in itertools.islice(iterator, 1):
+                        pending.append((next_image, executor.submit(self.load_image, next_image)))
+                    inputs.append(image)
+                    decoded.append(result)
+                    if len(decoded) == batch_size:
+                        yield inputs, decoded
+                        inputs, decoded = [], []
+                if decoded:
+                    yield inputs, decoded
+            finally:
+                ## stopped early, don't decode the rest
+                for _, future in pending:
+                    future.cancel()
+
+    def load(self, images: Iterable) -> List[np.ndarray]:
+        """Decode all images in parallel
+
+        Args:
+            images (Iterable): list of image path, encoded image, or decoded image
+
+        Returns:
+            List[np.ndarray]: decoded images
+        """
+        images = list(images)
+        if len(images) <= 1:
+            return [self.load_image(image) for image in images]
+        with ThreadPoolExecutor(min(self.n_workers, len(images)), thread_name_prefix='vortex-loader') as executor:
+            return list(executor.map(self.load_image, images))
@@ -0,0 +1,372 @@
+import numpy as np
+
+from collections import OrderedDict
+from typing import Union, List, Dict, Tuple
+
+__all__ = [
+    'nms', 'batched_nms', 'soft_nms', 'diou_nms', 'weighted_box_fusion',
+    'nms_strategies', 'apply_nms',
+]
+
+
+## groups are suppressed together in chunks of at most this many iou matrix
+## elements, larger group is suppressed alone (with greedy loop for hard nms)
+max_matrix_size = 1 << 22
+
+
+def _pairwise_iou(boxes : np.ndarray) -> np.ndarray :
+    ## boxes [..., M, 4] -> iou [..., M, M], computed in place to limit temporaries
+    x1, y1, x2, y2 = (np.ascontiguousarray(boxes[...,i]) for i in range(4))
+    areas = (x2 - x1) * (y2 - y1)
+    w = np.minimum(x2[...,:,None], x2[...,None,:])
+    w -= np.maximum(x1[...,:,None], x1[...,None,:])
+    np.clip(w, 0, None, out=w)
+    h = np.minimum(y2[...,:,None], y2[...,None,:])
+    h -= np.maximum(y1[...,:,None], y1[...,None,:])
+    np.clip(h, 0, None, out=h)
+    inter = np.multiply(w, h, out=w)
+    union = np.add(areas[...,:,None], areas[...,None,:], out=h)
+    union -= inter
+    with np.errstate(divide='ignore', invalid='ignore') :
+        return np.divide(inter, union, out=inter)
+
+
+def _pairwise_diou(boxes : np.ndarray, beta : float = 1.) -> np.ndarray :
+    ## iou penalized by squared center distance over squared diagonal of enclosing box,
+    ## in double precision as the difference is compared to threshold
+    boxes = boxes.astype(np.float64)
+    x1, y1, x2, y2 = (np.ascontiguousarray(boxes[...,i]) for i in range(4))
+    cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+    distance = np.square(cx[...,:,None] - cx[...,None,:]) + np.square(cy[...,:,None] - cy[...,None,:])
+    w = np.maximum(x2[...,:,None], x2[...,None,:]) - np.minimum(x1[...,:,None], x1[...,None,:])
+    h = np.maximum(y2[...,:,None], y2[...,None,:]) - np.minimum(y1[...,:,None], y1[...,None,:])
+    with np.errstate(divide='ignore', invalid='ignore') :
+        penalty = np.nan_to_num(distance / (np.square(w) + np.square(h)))
+    return _pairwise_iou(boxes) - np.power(penalty, beta)
+
+
+def _suppress(overlap : np.ndarray, valid : np.ndarray) -> np.ndarray :
+    """
+    greedy suppression of groups at once, boxes of each group are sorted by
+    decreasing score, `overlap` [G,M,M] is whether two boxes overlap and
+    `valid` [G,M] masks its padding; box is kept iff no kept box before it
+    overlaps, solved by fixed-point iteration from keeping all boxes, which
+    converges to the greedy result in as many iterations as the longest
+    chain of suppression (mostly a few)
+    """
+    ## overlap[g,j,i] : box j (before i) suppresses box i when j is kept
+    overlap = overlap & np.tri(overlap.shape[1], k=-1, dtype=bool).T
+    overlap &= valid[:,:,None]
+    overlap = overlap.astype(np.float32)
+    keep = valid
+    while True :
+        suppressed = np.matmul(keep[:,None,:].astype(np.float32), overlap)[:,0] > 0
+        updated = valid & ~suppressed
+        if np.array_equal(updated, keep) :
+            return keep
+        keep = updated
+
+
+def _greedy_nms(boxes : np.ndarray, iou_threshold : float) -> np.ndarray :
+    ## boxes [N,4] sorted by decreasing score, returns mask of kept boxes
+    x1, y1, x2, y2 = boxes[:,0], boxes[:,1], boxes[:,2], boxes[:,3]
+    areas = (x2 - x1) * (y2 - y1)
+    keep = np.zeros(len(boxes), dtype=bool)
+    order = np.arange(len(boxes))
+    with np.errstate(divide='ignore', invalid='ignore') :
+        while order.size :
+            i, rest = order[0], order[1:]
+            keep[i] = True
+            w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+            h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+            inter = w * h
+            iou = inter / (areas[i] + areas[rest] - inter)
+            order = rest[~(iou > iou_threshold)]
+    return keep
+
+
+def _hard_groups(boxes, scores, valid, iou_threshold) :
+    if len(boxes) == 1 and boxes.shape[1] ** 2 > max_matrix_size :
+        return _greedy_nms(boxes[0], iou_threshold)[None], boxes, scores
+    return _suppress(_pairwise_iou(boxes) > iou_threshold, valid), boxes, scores
+
+
+def _diou_groups(boxes, scores, valid, iou_threshold, beta=1.) :
+    return _suppress(_pairwise_diou(boxes, beta) > iou_threshold, valid), boxes, scores
+
+
+def _soft_groups(boxes, scores, valid, iou_threshold, sigma=0.5, min_score=1e-3, linear=False) :
+    ## the next kept box of each group is the one with highest decayed score,
+    ## sequential by definition but all groups are decayed at once
+    iou = _pairwise_iou(boxes)
+    n_groups, size = scores.shape
+    groups = np.arange(n_groups)
+    scores = np.where(valid, scores, 0.).astype(np.float64)
+    alive = valid.copy()
+    keep = np.zeros_like(valid)
+    decayed = np.zeros_like(scores)
+    for _ in range(size) :
+        i = np.where(alive, scores, -1.).argmax(axis=1)
+        best = scores[groups, i]
+        active = alive[groups, i] & (best >= min_score)
+        if not active.any() :
+            break
+        keep[groups[active], i[active]] = True
+        decayed[groups[active], i[active]] = best[active]
+        alive[groups, i] = False
+        overlap = iou[groups, i]
+        decay = np.where(overlap > iou_threshold, 1. - overlap, 1.) if linear \
+            else np.exp(-np.square(overlap) / sigma)
+        scores = np.where(active[:,None], scores * decay, scores)
+    return keep, boxes, decayed
+
+
+def _wbf_groups(boxes, scores, valid, iou_threshold) :
+    ## clusters are the boxes suppressed by each kept box, fused weighted by score
+    overlap = _pairwise_iou(boxes) > iou_threshold
+    keep = _suppress(overlap, valid)
+    size = boxes.shape[1]
+    member = (overlap | np.eye(size, dtype=bool)) & keep[:,:,None] & valid[:,None,:]
+    ## first (highest score) kept box overlapping each box
+    cluster = member.argmax(axis=1)
+    assign = (cluster[:,None,:] == np.arange(size)[None,:,None]) & valid[:,None,:]
+    weights = assign * np.where(valid, scores, 0.)[:,None,:]
+    total = weights.sum(axis=2)
+    with np.errstate(divide='ignore', invalid='ignore') :
+        fused = np.matmul(weights, boxes.astype(np.float64)) / total[:,:,None]
+        fused_scores = total / assign.sum(axis=2)
+    fused = np.where(keep[:,:,None], fused, boxes)
+    fused_scores = np.where(keep, fused_scores, scores)
+    return keep, fused.astype(boxes.dtype), fused_scores.astype(scores.dtype)
+
+
+def _batched(suppress, boxes : np.ndarray, scores : np.ndarray, idxs : np.ndarray, iou_threshold : float, **kwargs) :
+    """
+    group boxes by index, padded to [groups, largest group, 4] in chunks of
+    similar sized groups, and run `suppress` on all groups of each chunk at once;
+    returns indices of kept boxes in decreasing order of (updated) scores,
+    with their (updated) boxes and scores
+    """
+    if not len(boxes) :
+        return np.empty((0,), dtype=np.intp), boxes[:0], scores[:0]
+    ## sorted by group, then by decreasing score
+    order = np.lexsort((-scores, idxs))
+    groups, starts, counts = np.unique(idxs[order], return_index=True, return_counts=True)
+    keep = np.zeros(len(order), dtype=bool)
+    new_boxes, new_scores = boxes[order], scores[order]
+    ## groups of up to twice the size of the smallest one are chunked together, to limit padding
+    by_size = np.argsort(counts, kind='stable')
+    sizes = counts[by_size]
+    begin = 0
+    while begin < len(by_size) :
+        end = begin + 1
+        while end < len(by_size) and sizes[end] <= 2 * max(sizes[begin], 8) \
+                and (end - begin + 1) * sizes[end] ** 2 <= max_matrix_size :
+            end += 1
+        chunk = by_size[begin:end]
+        size = counts[chunk[-1]]
+        ## padded position of each box of the chunk
+        offset = np.arange(size)
+        valid = offset[None,:] < counts[chunk][:,None]
+        index = np.where(valid, starts[chunk][:,None] + offset[None,:], 0)
+        kept, chunk_boxes, chunk_scores = suppress(new_boxes[index], new_scores[index], valid, iou_threshold, **kwargs)
+        keep[index[kept]] = True
+        new_boxes[index[kept]] = chunk_boxes[kept]
+        new_scores[index[kept]] = chunk_scores[kept]
+        begin = end
+    new_boxes, new_scores = new_boxes[keep], new_scores[keep]
+    sort = np.argsort(-new_scores, kind='stable')
+    return order[keep][sort], new_boxes[sort], new_scores[sort]
+
+
+def nms(boxes : np.ndarray, scores : np.ndarray, iou_threshold : float) -> np.ndarray :
+    """
+    non-maximum suppression, same as `torchvision.ops.nms`
+
+    Args:
+        boxes (np.ndarray): boxes of shape [N,4] in (x1, y1, x2, y2) format
+        scores (np.ndarray): score of each box, of shape [N]
+        iou_threshold (float): discards all overlapping boxes with IoU > iou_threshold
+
+    Returns:
+        np.ndarray: indices of kept boxes, in decreasing order of scores
+    """
+    return batched_nms(boxes, scores, np.zeros(len(boxes), dtype=np.int64), iou_threshold)
+
+
+def batched_nms(boxes : np.ndarray, scores : np.ndarray, idxs : np.ndarray, iou_threshold : float) -> np.ndarray :
+    """
+    non-maximum suppression that is not applied between boxes of different
+    `idxs` (e.g. category or image), same as `torchvision.ops.batched_nms`;
+    boxes are grouped by index and padded to [groups, largest group, 4] so
+    that all groups are suppressed together
+
+    Args:
+        boxes (np.ndarray): boxes of shape [N,4] in (x1, y1, x2, y2) format
+        scores (np.ndarray): score of each box, of shape [N]
+        idxs (np.ndarray): group index of each box, of shape [N]
+        iou_threshold (float): discards all overlapping boxes with IoU > iou_threshold
+
+    Returns:
+        np.ndarray: indices of kept boxes, in decreasing order of scores
+    """
+    return _batched(_hard_groups, boxes, scores, idxs, iou_threshold)[0]
+
+
+def soft_nms(boxes : np.ndarray, scores : np.ndarray, idxs : np.ndarray, iou_threshold : float,
+             sigma : float = 0.5, min_score : float = 1e-3, linear : bool = False) -> Tuple[np.ndarray,np.ndarray] :
+    """
+    Soft-NMS (Bodla et al., 2017), instead of discarding overlapping boxes,
+    their scores are decayed by `exp(-iou^2 / sigma)` (gaussian, `iou_threshold`
+    is not used) or by `1 - iou` when IoU > iou_threshold (linear); not applied
+    between boxes of different `idxs`
+
+    Args:
+        boxes (np.ndarray): boxes of shape [N,4] in (x1, y1, x2, y2) format
+        scores (np.ndarray): score of each box, of shape [N]
+        idxs (np.ndarray): group index of each box, of shape [N]
+        iou_threshold (float): IoU above which scores are decayed, for linear method
+        sigma (float, optional): gaussian decay parameter. Defaults to 0.5.
+        min_score (float, optional): discards boxes with decayed score below it. Defaults to 1e-3.
+        linear (bool, optional): use linear instead of gaussian decay. Defaults to False.
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray]: indices of kept boxes and their decayed scores,
+            in decreasing order of decayed scores
+    """
+    keep, _, scores = _batched(_soft_groups, boxes, scores, idxs, iou_threshold,
+        sigma=sigma, min_score=min_score, linear=linear)
+    return keep, scores
+
+
+def diou_nms(boxes : np.ndarray, scores : np.ndarray, idxs : np.ndarray, iou_threshold : float, beta : float = 1.) -> np.ndarray :
+    """
+    DIoU-NMS (Zheng et al., 2020), suppresses boxes with IoU minus
+    normalized center distance, `(d^2 / c^2)^beta`, above `iou_threshold`,
+    so overlapping boxes with distant centers (e.g. occluded objects) are
+    kept; not applied between boxes of different `idxs`
+
+    Args:
+        boxes (np.ndarray): boxes of shape [N,4] in (x1, y1, x2, y2) format
+        scores (np.ndarray): score of each box, of shape [N]
+        idxs (np.ndarray): group index of each box, of shape [N]
+        iou_threshold (float): discards all overlapping boxes with DIoU > iou_threshold
+        beta (float, optional): exponent of center distance penalty. Defaults to 1.
+
+    Returns:
+        np.ndarray: indices of kept boxes, in decreasing order of scores
+    """
+    return _batched(_diou_groups, boxes, scores, idxs, iou_threshold, beta=beta)[0]
+
+
+def weighted_box_fusion(boxes : np.ndarray, scores : np.ndarray, idxs : np.ndarray,
+                        iou_threshold : float) -> Tuple[np.ndarray,np.ndarray,np.ndarray] :
+    """
+    weighted box fusion (Solovyev et al., 2019) of single model's boxes, each
+    box kept by nms is replaced by the score-weighted average of the boxes it
+    suppresses (including itself), with their average score; not applied
+    between boxes of different `idxs`
+
+    Args:
+        boxes (np.ndarray): boxes of shape [N,4] in (x1, y1, x2, y2) format
+        scores (np.ndarray): score of each box, of shape [N]
+        idxs (np.ndarray): group index of each box, of shape [N]
+        iou_threshold (float): boxes with IoU > iou_threshold are fused
+
+    Returns:
+        Tuple[np.ndarray,np.ndarray,np.ndarray]: indices of kept boxes, their fused boxes
+            and scores, in decreasing order of fused scores
+    """
+    return _batched(_wbf_groups, boxes, scores, idxs, iou_threshold)
+
+
+## nms strategies for `apply_nms`, by name, each returns indices of kept
+## boxes with their (updated) boxes and scores; embedded in exported model
+## as index to this mapping
+nms_strategies = OrderedDict([
+    ('hard', lambda boxes, scores, idxs, iou_threshold : _batched(_hard_groups, boxes, scores, idxs, iou_threshold)),
+    ('soft_gaussian', lambda boxes, scores, idxs, iou_threshold, sigma=0.5, min_score=1e-3 :
+        _batched(_soft_groups, boxes, scores, idxs, iou_threshold, sigma=sigma, min_score=min_score)),
+    ('soft_linear', lambda boxes, scores, idxs, iou_threshold, min_score=1e-3 :
+        _batched(_soft_groups, boxes, scores, idxs, iou_threshold, min_score=min_score, linear=True)),
+    ('diou', lambda boxes, scores, idxs, iou_threshold, beta=1. :
+        _batched(_diou_groups, boxes, scores, idxs, iou_threshold, beta=beta)),
+    ('wbf', weighted_box_fusion),
+])
+
+
+def apply_nms(results : List[Dict[str,np.ndarray]], iou_threshold : float = 0.5, score_threshold : float = None,
+              pre_nms_topk : int = 0, max_detections : int = 0, strategy : Union[str,Dict] = 'hard',
+              box_field : str = 'bounding_box', score_field : str = 'class_confidence',
+              label_field : str = 'class_label') -> List[Dict[str,np.ndarray]] :
+    """
+    class-aware non-maximum suppression on decoded detection results of
+    each image, for model exported without nms; candidates of all images
+    are suppressed with a single run of the nms strategy, other fields (e.g.
+    'landmarks') are selected along with the boxes, boxes and scores are
+    replaced with the ones updated by the strategy (e.g. decayed scores)
+
+    Args:
+        results (List[Dict[str,np.ndarray]]): decoded results of each image, e.g. from `BaseRuntime.decode`
+        iou_threshold (float, optional): discards overlapping boxes with IoU > iou_threshold. Defaults to 0.5.
+        score_threshold (float, optional): discards boxes with score <= score_threshold,
+            None for no thresholding. Defaults to None.
+        pre_nms_topk (int, optional): maximum candidates of each image, 0 for no limit. Defaults to 0.
+        max_detections (int, optional): maximum detections of each image, 0 for no limit. Defaults to 0.
+        strategy (Union[str,Dict], optional): name of nms strategy in `nms_strategies`, or dictionary
+            of its 'name' and arguments, e.g. `dict(name='soft_gaussian', sigma=0.5)`. Defaults to 'hard'.
+
+    Returns:
+        List[Dict[str,np.ndarray]]: results of each image with the same fields, kept detections are
+            in decreasing order of scores, all fields are None when nothing is kept
+    """
+    strategy = dict(name=strategy) if isinstance(strategy, str) else dict(strategy)
+    name = strategy.pop('name')
+    if not name in nms_strategies :
+        raise ValueError("unsupported nms strategy {}, supported : {}".format(name, list(nms_strategies)))
+    selected, boxes, scores, idxs = [], [], [], []
+    n_classes = 1
+    for i, result in enumerate(results) :
+        if result.get(box_field) is None :
+            selected.append(np.empty((0,), dtype=np.intp))
+            continue
+        score = np.asarray(result[score_field]).reshape(-1)
+        index = np.flatnonzero(score > score_threshold) if score_threshold is not None \
+            else np.arange(len(score))
+        if pre_nms_topk > 0 and len(index) > pre_nms_topk :
+            index = index[np.argsort(-score[index], kind='stable')[:pre_nms_topk]]
+        selected.append(index)
+        boxes.append(result[box_field][index])
+        scores.append(score[index])
+        label = np.asarray(result[label_field]).reshape(-1)[index].astype(np.int64) \
+            if result.get(label_field) is not None else np.zeros(len(index), dtype=np.int64)
+        n_classes = max(n_classes, int(label.max()) + 1 if len(label) else 1)
+        idxs.append((i, label))
+    if not boxes :
+        return [OrderedDict((key, None) for key in result) for result in results]
+    ## group index of image i and class c is i * n_classes + c
+    image = np.concatenate([np.full(len(label), i, dtype=np.int64) for i, label in idxs])
+    label = np.concatenate([label for _, label in idxs])
+    offsets = np.cumsum([0] + [len(index) for index in selected])
+    keep, boxes, scores = nms_strategies[name](np.concatenate(boxes), np.concatenate(scores),
+        image * n_classes + label, iou_threshold, **strategy)
+    ## stable sort by image keeps decreasing order of scores of each image
+    sort = np.argsort(image[keep], kind='stable')
+    keep, boxes, scores = keep[sort], boxes[sort], scores[sort]
+    bounds = np.searchsorted(image[keep], np.arange(len(results) + 1))
+    outputs = []
+    for i, result in enumerate(results) :
+        begin, end = bounds[i], bounds[i+1]
+        if max_detections > 0 :
+            end = min(end, begin + max_detections)
+        if begin == end :
+            outputs.append(OrderedDict((key, None) for key in result))
+            continue
+        index = selected[i][keep[begin:end] - offsets[i]]
+        output = OrderedDict(
+            (key, None if value is None else value[index]) for key, value in result.items()
+        )
+        output[box_field] = boxes[begin:end].reshape(output[box_field].shape)
+        output[score_field] = scores[begin:end].reshape(output[score_field].shape)
+        outputs.append(output)
+    return outputs
@@ -0,0 +1 @@
+from .onnxruntime import OnnxRuntimeOptions
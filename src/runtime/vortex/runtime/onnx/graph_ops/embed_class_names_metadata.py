@@ -57,6 +57,21 @@ class EmbedClassNamesMetadata(GraphOpsBase):
             Dict[int,str]: a mapping from class label (int) to class name
         """
         class_labels = parse_metadata(model, cls.field_name)
+        return cls.to_class_names(class_labels)
+
+    @classmethod
+    def to_class_names(cls, class_labels: Union[List[str],Dict,None]) -> Dict[int,str]:
+        """Convert parsed `class_labels` metadata to class_names mapping
+
+        Args:
+            class_labels (Union[List[str],Dict,None]): json-parsed metadata value
+
+        Raises:
+            ValueError: if class_labels is None
+
+        Returns:
+            Dict[int,str]: a mapping from class label (int) to class name
+        """
         if class_labels is None:
             raise ValueError("model doesn't contains classs_labels")
         class_names = dict(enumerate(class_labels)) \
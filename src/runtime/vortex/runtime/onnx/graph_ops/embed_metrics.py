@@ -50,10 +50,25 @@ class EmbedMetrics(GraphOpsBase):
             Union[List,None]: list of string representing metric names
         """
         metrics = get_metadata_prop(model, cls.prefix)
+        if metrics is not None:
+            metrics = metrics.value
+        return cls.parse_metadata_map({cls.prefix: metrics})
+
+    @classmethod
+    def parse_metadata_map(cls, metadata) -> Union[List,None]:
+        """Retrieve embedded metrics from metadata key-value mapping,
+        e.g. from `onnxruntime.InferenceSession.get_modelmeta().custom_metadata_map`
+
+        Args:
+            metadata (Dict[str,str]): metadata props of the model
+
+        Returns:
+            Union[List,None]: list of string representing metric names
+        """
+        metrics = metadata.get(cls.prefix)
         if metrics is not None:
             # should be list of str
-            metrics = str(metrics.value)
-            metrics = json.loads(metrics)
+            metrics = json.loads(str(metrics))
         return metrics
     
     def run(self, model: onnx.ModelProto) -> onnx.ModelProto:
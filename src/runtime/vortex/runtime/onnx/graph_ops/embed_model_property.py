@@ -4,8 +4,8 @@ import json
 from typing import Dict, Any
 from .base_ops import GraphOpsBase
 from .embed_metadata import embed_metadata, parse_metadata
-from .embed_class_names_metadata import embed_class_names_metadata, parse_class_names_metadata
-from .embed_output_format_metadata import embed_output_format_metadata, parse_output_format_metadata
+from .embed_class_names_metadata import EmbedClassNamesMetadata, embed_class_names_metadata
+from .embed_output_format_metadata import EmbedOutputFormatMetadata, embed_output_format_metadata
 
 logger = logging.getLogger(__name__)
 
@@ -43,17 +43,38 @@ class EmbedModelProperty(GraphOpsBase):
         Returns:
             Dict[str,Any]: dictionary contains 'output_format' and 'class_names'
         """
-        output_format = parse_output_format_metadata(model)
-        class_names = parse_class_names_metadata(model)
+        metadata = {prop.key: prop.value for prop in model.metadata_props}
+        return cls.parse_metadata_map(metadata)
+
+    @classmethod
+    def parse_metadata_map(cls, metadata: Dict[str,str]) -> Dict[str,Any]:
+        """Extract output_format and class_names from metadata key-value mapping,
+        e.g. from `onnxruntime.InferenceSession.get_modelmeta().custom_metadata_map`,
+        without loading the model itself
+
+        Args:
+            metadata (Dict[str,str]): metadata props of the model
+
+        Raises:
+            ValueError: if metadata doesn't contains `class_labels`
+
+        Returns:
+            Dict[str,Any]: dictionary contains 'output_format' and 'class_names'
+        """
+        prefix = EmbedOutputFormatMetadata.prefix + '.'
+        output_format = {key[len(prefix):]: json.loads(str(value))
+            for key, value in metadata.items() if key.startswith(prefix)}
+        class_labels = metadata.get(EmbedClassNamesMetadata.field_name)
+        if class_labels is not None:
+            class_labels = json.loads(str(class_labels))
+        class_names = EmbedClassNamesMetadata.to_class_names(class_labels)
         properties = dict(output_format=output_format,class_names=class_names)
-        props = model.metadata_props
-        for prop in model.metadata_props:
-            key = prop.key
+        for key, value in metadata.items():
             if 'output_format' in key:
                 continue
             if 'class_labels' in key:
                 continue
-            properties[key] = json.loads(str(prop.value))
+            properties[key] = json.loads(str(value))
         return properties
     
     def run(self, model: onnx.ModelProto) -> onnx.ModelProto:
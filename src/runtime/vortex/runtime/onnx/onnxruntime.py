@@ -1,13 +1,38 @@
 import numpy as np
 import logging
+import hashlib
+import os
+import threading
+import uuid
 
 from vortex.runtime.basic_runtime import BaseRuntime
 
 from pathlib import Path
-from typing import Union, List, Tuple, Any
+from collections import OrderedDict
+from typing import Union, List, Tuple, Any, NamedTuple
 
 logger = logging.getLogger(__name__)
 
+
+class OnnxRuntimeOptions(NamedTuple):
+    """Session options for onnxruntime, see `onnxruntime.SessionOptions`;
+    when `cache_dir` is given, optimized graph is saved there, keyed by
+    model's hash and these options, and reused on the next session creation
+    """
+    intra_op_num_threads: int = 0       # 0 : onnxruntime default
+    inter_op_num_threads: int = 0       # 0 : onnxruntime default
+    execution_mode: Union[str,int] = 'sequential'
+    graph_optimization_level: Union[str,int] = 'basic'
+    enable_cpu_mem_arena: bool = True
+    enable_mem_pattern: bool = True
+    enable_mem_reuse: bool = True
+    optimized_model_filepath: str = None
+    cache_dir: str = None
+    # additional `SessionOptions.add_session_config_entry` key-values,
+    # e.g. {'session.intra_op_thread_affinities': '1;2;3'}
+    config_entries: dict = None
+
+
 class OnnxRuntime(BaseRuntime) :
     """
     Standardized runtime class for onnxruntime environment;
@@ -16,22 +41,74 @@ class OnnxRuntime(BaseRuntime) :
         'disable_all' : 0,
         'enable_basic' : 1,
         'enable_extended' : 2,
+        'enable_all' : 99,
         'disable' : 0,
         'basic' : 1,
         'extended' : 2,
+        'all' : 99,
     }
     execution_mode = {
         'sequential' : 0,
         'parallel' : 1,
     }
-    def __init__(self, model : Union[str,Path], providers : Any, fallback : bool, input_name : str = 'input', output_name : Union[str,List[str]] = 'output', execution_mode : Union[str,int] = 'sequential', graph_optimization_level : Union[str,int] = 'basic') :
-        self._init_session(model, providers, fallback, execution_mode, graph_optimization_level)
-        self._init_properties(model, input_name, output_name)
+    ## session config entries which don't change the optimized graph, not in cache key
+    cache_ignored_entries = ('session.intra_op_thread_affinities',)
+    ## onnxruntime type string to numpy dtype, for binding output buffer
+    output_dtype = {
+        'tensor(float)' : np.float32,
+        'tensor(double)' : np.float64,
+        'tensor(float16)' : np.float16,
+        'tensor(int64)' : np.int64,
+        'tensor(int32)' : np.int32,
+        'tensor(uint8)' : np.uint8,
+        'tensor(bool)' : np.bool_,
+    }
+    def __init__(self, model : Union[str,Path], providers : Any, fallback : bool, input_name : str = 'input', output_name : Union[str,List[str]] = 'output', execution_mode : Union[str,int] = 'sequential', graph_optimization_level : Union[str,int] = 'basic', resize_kind : str = None, io_binding : bool = False, options : Union[OnnxRuntimeOptions,dict] = None) :
+        if options is None :
+            options = OnnxRuntimeOptions(execution_mode=execution_mode, graph_optimization_level=graph_optimization_level)
+        elif isinstance(options, dict) :
+            options = OnnxRuntimeOptions(**options)
+        self.options = options
+        self._init_session(model, providers, fallback, options)
+        self._init_properties(model, input_name, output_name, resize_kind)
+        ## io binding of each thread, see `_init_io_binding`
+        if io_binding and not type(self).supports_io_binding():
+            import onnxruntime
+            logger.warning("io binding to output buffer is not supported by onnxruntime {}, "
+                "falling back to session.run".format(onnxruntime.__version__))
+            io_binding = False
+        self._io_binding = io_binding
+        self._local = threading.local()
+        if io_binding:
+            self._init_io_binding()
 
-    def _init_session(self, model: Union[str,Path], providers: Any, fallback: bool, execution_mode, graph_optimization_level):
+    @staticmethod
+    def cache_key(model : Union[str,Path], providers : Any, options : OnnxRuntimeOptions) -> str :
+        """key of optimized graph cache, from model's content, providers,
+        options affecting graph optimization (optimization level, execution mode
+        and session config entries, apart from `cache_ignored_entries`) and
+        onnxruntime version
+        """
         import onnxruntime
-        import onnx
+        digest = hashlib.sha256()
+        with open(str(model), 'rb') as f :
+            for chunk in iter(lambda: f.read(1 << 20), b'') :
+                digest.update(chunk)
+        graph_optimization_level = OnnxRuntime.graph_optimization_level.get(
+            options.graph_optimization_level, options.graph_optimization_level)
+        execution_mode = OnnxRuntime.execution_mode.get(options.execution_mode, options.execution_mode)
+        config_entries = sorted((key, str(value)) for key, value in (options.config_entries or {}).items()
+            if not key in OnnxRuntime.cache_ignored_entries)
+        digest.update(repr((
+            providers, graph_optimization_level, execution_mode, config_entries, onnxruntime.__version__
+        )).encode())
+        return digest.hexdigest()[:16]
 
+    def _init_session(self, model: Union[str,Path], providers: Any, fallback: bool, options: OnnxRuntimeOptions):
+        import onnxruntime
+
+        graph_optimization_level = options.graph_optimization_level
+        execution_mode = options.execution_mode
         sess_options = onnxruntime.SessionOptions()
         if graph_optimization_level in OnnxRuntime.graph_optimization_level.keys() :
             graph_optimization_level = OnnxRuntime.graph_optimization_level[graph_optimization_level]
@@ -50,28 +127,66 @@ class OnnxRuntime(BaseRuntime) :
         execution_mode = onnxruntime.capi.onnxruntime_pybind11_state.ExecutionMode(execution_mode)
         sess_options.graph_optimization_level = graph_optimization_level
         sess_options.execution_mode = execution_mode
-        self.session = onnxruntime.InferenceSession(str(model),sess_options=sess_options,providers=providers)
+        sess_options.intra_op_num_threads = options.intra_op_num_threads
+        sess_options.inter_op_num_threads = options.inter_op_num_threads
+        sess_options.enable_cpu_mem_arena = options.enable_cpu_mem_arena
+        sess_options.enable_mem_pattern = options.enable_mem_pattern
+        sess_options.enable_mem_reuse = options.enable_mem_reuse
+        if options.optimized_model_filepath is not None :
+            sess_options.optimized_model_filepath = str(options.optimized_model_filepath)
+        config_entries = options.config_entries or {}
+        if config_entries and not hasattr(sess_options, 'add_session_config_entry') :
+            logger.warning("session config entries {} ignored, not supported by onnxruntime {}".format(
+                list(config_entries), onnxruntime.__version__))
+            config_entries = {}
+        for key, value in config_entries.items() :
+            sess_options.add_session_config_entry(key, str(value))
+
+        session_model, cached = str(model), None
+        if options.cache_dir is not None :
+            cache_dir = Path(options.cache_dir)
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            key = type(self).cache_key(model, providers, options)
+            cached = cache_dir / '{}.{}.onnx'.format(Path(model).stem, key)
+            if cached.exists() :
+                logger.info("using optimized graph from cache {}".format(cached))
+                session_model = str(cached)
+                # already optimized
+                sess_options.graph_optimization_level = onnxruntime.capi.onnxruntime_pybind11_state.GraphOptimizationLevel(0)
+                cached = None
+            elif options.optimized_model_filepath is None :
+                # write to temporary file first, other session (in this or other process)
+                # may create the same cache
+                sess_options.optimized_model_filepath = str(cached.with_suffix('.{}.tmp'.format(uuid.uuid4().hex)))
+            else :
+                cached = None
+        self.session = onnxruntime.InferenceSession(session_model,sess_options=sess_options,providers=providers)
+        if cached is not None :
+            os.replace(sess_options.optimized_model_filepath, str(cached))
+            logger.info("optimized graph saved to cache {}".format(cached))
         if not fallback:
             logging.info("disabling onnx runtime fallback")
             self.session.disable_fallback()
 
-    def _init_properties(self, model, input_name, output_name):
-        import onnx
-        from vortex.runtime.onnx.graph_ops.helper import get_output_format, get_input_specs, get_output_names, get_class_names
+    def _init_properties(self, model, input_name, output_name, resize_kind=None):
         from vortex.runtime.onnx.graph_ops.embed_model_property import EmbedModelProperty
         from vortex.runtime.onnx.graph_ops.embed_metrics import EmbedMetrics
-        onnx_protobuf = onnx.load(model)
-        # read/parse properties
+        # read properties from session, avoid loading model's protobuf (and its weights) twice
+        metadata = self.session.get_modelmeta().custom_metadata_map
         try:
-            props = EmbedModelProperty.parse(onnx_protobuf)
+            props = EmbedModelProperty.parse_metadata_map(metadata)
             output_format = props['output_format']
             class_names   = props['class_names']
         except:
-            output_format = get_output_format(onnx_protobuf)
-            class_names = get_class_names(onnx_protobuf)
+            # properties embedded as graph's constants, deprecated
+            output_format, class_names = type(self)._parse_deprecated_properties(model)
+            props = {}
+        # resize kind from model, if not explicitly given
+        if resize_kind is None:
+            resize_kind = props.get('resize_kind', 'stretch')
         # input specs and output_names
-        input_specs  = get_input_specs(onnx_protobuf)
-        output_names = get_output_names(onnx_protobuf)
+        input_specs  = type(self).get_input_specs(self.session)
+        output_names = type(self).get_output_names(self.session)
         if not isinstance(output_name, list) :
             output_name = [output_name]
         assert all(name in output_names for name in output_name), \
@@ -81,12 +196,45 @@ class OnnxRuntime(BaseRuntime) :
             output_name=output_name, 
             output_format=output_format,
             class_names=class_names,
+            resize_kind=resize_kind,
+            runtime_nms=bool(props.get('runtime_nms', False)),
+            nms_strategy=props.get('nms_strategy', 'hard'),
         )
         assert len(self.output_name) == 1
-        self.metrics = EmbedMetrics.parse(onnx_protobuf)
-        self.properties = {}
-        for prop in onnx_protobuf.metadata_props:
-            self.properties[prop.key] = prop.value
+        ## padded detection output, also fetch number of valid detections of each image
+        self.fetch_names = list(self.output_name)
+        if OnnxRuntime.valid_counts_name in output_names and not OnnxRuntime.valid_counts_name in self.output_name :
+            self.fetch_names.append(OnnxRuntime.valid_counts_name)
+        self.metrics = EmbedMetrics.parse_metadata_map(metadata)
+        self.properties = dict(metadata)
+
+    @staticmethod
+    def _parse_deprecated_properties(model):
+        import onnx
+        from vortex.runtime.onnx.graph_ops.helper import get_output_format, get_class_names
+        logger.warning("model doesn't have metadata props, loading output_format "
+            "and class_names from graph, consider re-exporting the model")
+        onnx_protobuf = onnx.load(str(model))
+        return get_output_format(onnx_protobuf), get_class_names(onnx_protobuf)
+
+    @staticmethod
+    def get_input_specs(session) -> OrderedDict :
+        """input specs from session's inputs, the same as
+        `vortex.runtime.onnx.graph_ops.helper.get_input_specs` but without the model protobuf;
+        dynamic dimension is represented as 0
+        """
+        input_specs = OrderedDict()
+        for node in session.get_inputs() :
+            dtype = node.type.replace('tensor(','').replace(')','')
+            dtype = dtype if dtype != 'float' else 'float32' ## explicit float32
+            shape = [dim if isinstance(dim, int) else 0 for dim in node.shape]
+            input_specs[node.name] = dict(shape=shape, type=dtype)
+        return input_specs
+
+    @staticmethod
+    def get_output_names(session, ignore_suffix=['_axis', '_indices', '_label']) -> List[str] :
+        ignored = lambda x : any(suffix in x for suffix in ignore_suffix)
+        return [node.name for node in session.get_outputs() if not ignored(node.name)]
 
     @staticmethod
     def is_available() :
@@ -97,32 +245,110 @@ class OnnxRuntime(BaseRuntime) :
         except ImportError :
             return False
     
+    @staticmethod
+    def supports_io_binding() -> bool:
+        """whether `IOBinding` can bind cpu input and output buffer (by pointer)
+        and copy outputs to cpu, which older onnxruntime (e.g. 1.3.0) doesn't have
+        """
+        import inspect
+        try:
+            from onnxruntime.capi.onnxruntime_inference_collection import IOBinding
+        except ImportError:
+            return False
+        if not all(hasattr(IOBinding, name) for name in ('bind_cpu_input', 'bind_output', 'copy_outputs_to_cpu')):
+            return False
+        try:
+            return 'buffer_ptr' in inspect.signature(IOBinding.bind_output).parameters
+        except (TypeError, ValueError):
+            return False
+
+    @property
+    def io_binding(self):
+        """io binding of the calling thread, None when io binding is disabled"""
+        if not self._io_binding:
+            return None
+        if not hasattr(self._local, 'io_binding'):
+            self._init_io_binding()
+        return self._local.io_binding
+
+    @property
+    def output_buffers(self) -> dict:
+        """bound output buffers of the calling thread"""
+        return self._local.output_buffers if self.io_binding is not None else {}
+
+    def _init_io_binding(self):
+        """create io binding of the calling thread, output with static shape is
+        bound to preallocated buffer, otherwise onnxruntime allocates it on each run;
+        `IOBinding` isn't thread-safe and bound buffers are overwritten by the next
+        run, so each thread has its own, and its decoded output is copied by
+        `__call__` before the thread runs again
+        """
+        local = self._local
+        local.io_binding = self.session.io_binding()
+        local.bound_inputs = {}
+        local.output_buffers = {}
+        outputs = {output.name : output for output in self.session.get_outputs()}
+        for name in self.fetch_names:
+            output = outputs[name]
+            static = all(isinstance(dim, int) and dim > 0 for dim in output.shape)
+            if static and output.type in OnnxRuntime.output_dtype:
+                buffer = np.empty(output.shape, dtype=OnnxRuntime.output_dtype[output.type])
+                local.io_binding.bind_output(name, 'cpu', 0, buffer.dtype, buffer.shape, buffer.ctypes.data)
+                local.output_buffers[name] = buffer
+                self.output_reused = True
+            else:
+                logger.info("output {} has dynamic shape {}, output buffer is not reused".format(name, output.shape))
+                local.io_binding.bind_output(name, 'cpu')
+
+    def _run_with_io_binding(self, run_args):
+        io_binding = self.io_binding
+        local = self._local
+        for name, value in run_args.items():
+            # rebind only when given new array, e.g. next buffer from arena
+            if local.bound_inputs.get(name) is not value:
+                value = np.ascontiguousarray(value)
+                io_binding.bind_cpu_input(name, value)
+                # keep reference, binding only holds the pointer
+                local.bound_inputs[name] = value
+        self.session.run_with_iobinding(io_binding)
+        outputs = None
+        results = []
+        for i, name in enumerate(self.fetch_names):
+            if name in local.output_buffers:
+                results.append(local.output_buffers[name])
+                continue
+            if outputs is None:
+                outputs = io_binding.copy_outputs_to_cpu()
+            results.append(outputs[i])
+        return results[0] if len(results) == 1 else results
+
     def predict(self, *args, **kwargs) -> np.ndarray :
+        """run the model, when `io_binding` is enabled and model's output
+        has static shape, the returned array is reused on the next call
+        from the same thread;
+        when the model has `n_valid` output (padded detection output),
+        returns `[output, n_valid]`
+        """
         run_args = {name : value for name, value in zip(self.input_specs, args)}
         run_args = {**run_args, **kwargs}
+        if self._io_binding:
+            return self._run_with_io_binding(run_args)
         outputs = self.session.run(
-            self.output_name, run_args
+            self.fetch_names, run_args
         )
-        return outputs[0]
+        return outputs[0] if len(outputs) == 1 else outputs
 
     @staticmethod
-    def resize_batch(images : List[np.ndarray], size : Tuple[int,int,int,int], resize_kind='stretch') :
+    def batch_shape(size : Tuple[int,int,int,int]) -> Tuple[int,int,int,int] :
         """
-        helper function to resize list of 
-        np.ndarray (of possibly different size) 
-        to single np array of same size
+        helper function to get NHWC shape of batched image
+        from model's input shape, i.e. [n,h,w,c] or [n,c,h,w]
 
         this is the same as BaseRuntime implementation, apart from h,w is flipped
         """
-        assert resize_kind in ['stretch'] and len(size) == 4
-        n, w, h, c = size if size[-1]==3 else tuple(size[i] for i in [0,3,1,2])
-        resize = lambda x: BaseRuntime.resize_stretch(x, (h,w))
-        dtype = images[0].dtype
-        n_pad = n - len(images)
-        batch_pad = [np.zeros((h,w,c),dtype=dtype)] * n_pad
-        batch_image = list(map(resize, images))
-        batch_image = batch_image + batch_pad
-        return np.stack(batch_image)
+        assert len(size) == 4
+        n, h, w, c = size if size[-1]==3 else tuple(size[i] for i in [0,3,1,2])
+        return n, h, w, c
 
 class OnnxRuntimeCpu(OnnxRuntime) :
     def __init__(self, model : Union[str,Path], fallback : bool = False, *args, **kwargs) :
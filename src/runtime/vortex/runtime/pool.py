@@ -0,0 +1,306 @@
+import logging
+import os
+import threading
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor, Future
+from pathlib import Path
+from typing import Union, List, Dict, Tuple
+
+from vortex.runtime.basic_runtime import BaseRuntime, BatchArena
+from vortex.runtime.factory import create_runtime_model
+from vortex.runtime.runtime_map import model_runtime_map
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['RuntimePool']
+
+
+def _onnxruntime_version() -> Tuple[int,int]:
+    """(major, minor) version of installed onnxruntime
+    """
+    import onnxruntime
+    major, minor = onnxruntime.__version__.split('.')[:2]
+    return int(major), int(minor)
+
+
+def _parse_cpulist(cpulist: str) -> List[int]:
+    """parse linux cpulist format, e.g. '0-3,8-11'
+    """
+    cpus = []
+    for part in cpulist.strip().split(','):
+        if not part:
+            continue
+        start, _, stop = part.partition('-')
+        cpus.extend(range(int(start), int(stop or start) + 1))
+    return cpus
+
+
+def available_cpus() -> List[int]:
+    """cpus this process is allowed to run on
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def numa_nodes() -> List[List[int]]:
+    """available cpus of each NUMA node, single node when topology is not available
+    """
+    cpus = set(available_cpus())
+    nodes = []
+    for cpulist in sorted(Path('/sys/devices/system/node').glob('node[0-9]*/cpulist'),
+                          key=lambda p: int(p.parent.name[4:])):
+        node = [cpu for cpu in _parse_cpulist(cpulist.read_text()) if cpu in cpus]
+        if node:
+            nodes.append(node)
+    return nodes if nodes else [sorted(cpus)]
+
+
+class RuntimePool(BaseRuntime):
+    """Multiple runtime sessions of the same model, used as a single runtime.
+
+    Each session has its own worker thread and (for onnx model) its own
+    intra-op thread pool, optionally pinned to a set of cpus. A batch given
+    to `predict` (or `__call__`) is dispatched to one of the sessions, so
+    callers from multiple threads run in parallel instead of being
+    serialized on a single session.
+
+    Example:
+        ```python
+        from vortex.runtime import RuntimePool
+        from vortex.runtime.helper import InferenceHelper
+
+        ## 8 sessions, each pinned to its own cores of the same NUMA node
+        model = RuntimePool('model.onnx', runtime='cpu', n_sessions=8, cpu_sets='numa')
+        ## the same as single runtime
+        results = model(model.prepare_batch(images), score_threshold=0.5)
+        ## or non-blocking, e.g. to keep all sessions busy from single thread
+        futures = [model.submit(batch, score_threshold=0.5) for batch in batches]
+        ```
+    """
+    policies = ('round_robin', 'least_loaded')
+
+    def __init__(self, model_path: Union[str,Path], runtime: str = 'cpu', n_sessions: int = 2,
+                 cpu_sets: Union[str,List[List[int]],None] = None, threads_per_session: int = None,
+                 policy: str = 'least_loaded', output_name=["output"], **kwargs):
+        """Create `n_sessions` runtime model using `create_runtime_model`
+
+        Args:
+            model_path (Union[str,Path]): path to model file
+            runtime (str, optional): backend runtime, see `model_runtime_map`. Defaults to 'cpu'.
+            n_sessions (int, optional): number of sessions. Defaults to 2.
+            cpu_sets (Union[str,List[List[int]],None], optional): cpus of each session,
+                'cores' splits available cpus evenly, 'numa' distributes sessions to NUMA nodes
+                then splits each node's cpus, or explicit list of cpu ids for each session;
+                None for no pinning. Defaults to None.
+            threads_per_session (int, optional): intra-op threads of each session, defaults to
+                number of cpus in its cpu set, or available cpus divided by `n_sessions`.
+            policy (str, optional): 'round_robin' or 'least_loaded'. Defaults to 'least_loaded'.
+            output_name (list, optional): model output(s) name. Defaults to ["output"].
+            **kwargs: additional arguments to runtime class, e.g. `options` for onnx model
+
+        Raises:
+            ValueError: unknown `policy` or invalid `n_sessions` / `cpu_sets`
+            RuntimeError: `runtime` is not supported for the model
+        """
+        if not policy in RuntimePool.policies:
+            raise ValueError("unsupported policy {}, supported : {}".format(policy, RuntimePool.policies))
+        if n_sessions < 1:
+            raise ValueError("expects 'n_sessions' >= 1, got {}".format(n_sessions))
+        model_type = Path(model_path).name.rsplit('.', 1)[1]
+        if not runtime in model_runtime_map[model_type]:
+            raise RuntimeError("runtime {} not supported yet; available : {}".format(
+                runtime, ', '.join(model_runtime_map[model_type].keys())
+            ))
+        self.cpu_sets = type(self).partition_cpus(n_sessions, cpu_sets)
+        self.policy = policy
+
+        self.sessions = []
+        for cpus in self.cpu_sets:
+            n_threads = threads_per_session
+            if n_threads is None:
+                n_threads = len(cpus) if cpus is not None else max(1, len(available_cpus()) // n_sessions)
+            session_kwargs = dict(kwargs)
+            if model_type == 'onnx':
+                session_kwargs['options'] = type(self)._onnx_options(kwargs.get('options'), n_threads, cpus)
+            self.sessions.append(create_runtime_model(model_path, runtime, output_name, **session_kwargs))
+        if model_type != 'onnx' and (threads_per_session is not None or cpu_sets is not None):
+            logger.info("intra-op threads is only partitioned for onnx model, "
+                "only the worker thread of each session is pinned")
+
+        self._lock = threading.Lock()
+        self._in_flight = [0] * n_sessions
+        self._n_dispatched = [0] * n_sessions
+        self._next = 0
+        self.executors = [
+            ThreadPoolExecutor(1, thread_name_prefix='vortex-pool-{}'.format(i),
+                initializer=type(self)._pin_thread, initargs=(cpus,))
+            for i, cpus in enumerate(self.cpu_sets)
+        ]
+
+        session = self.sessions[0]
+        super().__init__(
+            input_specs=session.input_specs,
+            output_name=session.output_name,
+            output_format=session.output_format,
+            class_names=session.class_names,
+            resize_kind=session.resize_kind,
+            runtime_nms=session.runtime_nms,
+            nms_strategy=session.nms_strategy,
+        )
+        ## reused output of session is copied by its worker, see `_predict`
+        self.output_reused = False
+        for name in ('properties', 'metrics'):
+            if hasattr(session, name):
+                setattr(self, name, getattr(session, name))
+
+    @staticmethod
+    def partition_cpus(n_sessions: int, cpu_sets: Union[str,List[List[int]],None]) -> List[Union[List[int],None]]:
+        """cpu set of each session, see `cpu_sets` argument of `RuntimePool`
+        """
+        if cpu_sets is None:
+            return [None] * n_sessions
+        if cpu_sets == 'cores':
+            cpus = available_cpus()
+            if len(cpus) < n_sessions:
+                raise ValueError("only {} cpus available for {} sessions".format(len(cpus), n_sessions))
+            return [chunk.tolist() for chunk in np.array_split(cpus, n_sessions)]
+        if cpu_sets == 'numa':
+            nodes = numa_nodes()
+            ## sessions are assigned to nodes in round-robin, then node's cpus are split
+            node_sessions = [list(range(i, n_sessions, len(nodes))) for i in range(len(nodes))]
+            partitions = [None] * n_sessions
+            for cpus, sessions in zip(nodes, node_sessions):
+                if not sessions:
+                    continue
+                if len(cpus) < len(sessions):
+                    raise ValueError("only {} cpus available on NUMA node for {} sessions".format(len(cpus), len(sessions)))
+                for i, chunk in zip(sessions, np.array_split(cpus, len(sessions))):
+                    partitions[i] = chunk.tolist()
+            return partitions
+        if isinstance(cpu_sets, str):
+            raise ValueError("unsupported cpu_sets {}, expects 'cores', 'numa' or list of cpu ids".format(cpu_sets))
+        cpu_sets = [list(cpus) for cpus in cpu_sets]
+        if len(cpu_sets) != n_sessions or not all(len(cpus) for cpus in cpu_sets):
+            raise ValueError("expects non-empty cpu set for each of {} sessions, got {}".format(n_sessions, cpu_sets))
+        return cpu_sets
+
+    @staticmethod
+    def _onnx_options(options, n_threads: int, cpus: Union[List[int],None]):
+        from vortex.runtime.onnx.onnxruntime import OnnxRuntimeOptions
+        if options is None:
+            options = OnnxRuntimeOptions()
+        elif isinstance(options, dict):
+            options = OnnxRuntimeOptions(**options)
+        config_entries = dict(options.config_entries or {})
+        if cpus is not None and n_threads > 1 and not _onnxruntime_version() >= (1, 14):
+            import onnxruntime
+            logger.info("intra-op thread affinity requires onnxruntime>=1.14, got {}, "
+                "only the worker thread of each session is pinned".format(onnxruntime.__version__))
+        elif cpus is not None and n_threads > 1:
+            ## the calling (worker) thread is the first intra-op thread, it is pinned separately;
+            ## onnxruntime's processor ids start from 1
+            affinities = [cpus[i % len(cpus)] + 1 for i in range(1, n_threads)]
+            config_entries.setdefault('session.intra_op_thread_affinities',
+                ';'.join(str(cpu) for cpu in affinities))
+        return options._replace(
+            intra_op_num_threads=n_threads,
+            inter_op_num_threads=1,
+            config_entries=config_entries,
+        )
+
+    @staticmethod
+    def _pin_thread(cpus: Union[List[int],None]):
+        if cpus is None or not hasattr(os, 'sched_setaffinity'):
+            return
+        try:
+            ## pid 0 is the calling thread
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            logger.warning("failed to pin worker thread to cpus {} : {}".format(cpus, e))
+
+    def prepare_batch(self, images: List[np.ndarray], resize_kind: str = None, return_transform: bool = False):
+        """same as `BaseRuntime.prepare_batch`, using batch shape of the sessions' runtime
+        """
+        if resize_kind is None:
+            resize_kind = self.resize_kind
+        if self.arena is None:
+            self.arena = BatchArena(type(self.sessions[0]).batch_shape(self.input_specs['input']['shape']))
+        batch = self.arena.fill(images, resize_kind)
+        if return_transform:
+            return batch, self.arena.transform
+        return batch
+
+    def resize_batch(self, images: List[np.ndarray], size: Tuple[int,int,int,int], resize_kind: str = 'stretch'):
+        """same as `BaseRuntime.resize_batch`, using batch shape of the sessions' runtime
+        """
+        return type(self.sessions[0]).resize_batch(images, size, resize_kind)
+
+    def _select(self) -> int:
+        if self.policy == 'round_robin':
+            index = self._next
+            self._next = (index + 1) % len(self.sessions)
+            return index
+        ## least loaded, ties are broken by the least dispatched
+        return min(range(len(self.sessions)), key=lambda i: (self._in_flight[i], self._n_dispatched[i]))
+
+    def _dispatch(self, fn, *args, **kwargs) -> Future:
+        with self._lock:
+            index = self._select()
+            self._in_flight[index] += 1
+            self._n_dispatched[index] += 1
+        future = self.executors[index].submit(fn, self.sessions[index], *args, **kwargs)
+        future.add_done_callback(lambda f: self._done(index))
+        return future
+
+    def _done(self, index: int):
+        with self._lock:
+            self._in_flight[index] -= 1
+
+    @staticmethod
+    def _predict(session, *args, **kwargs):
+        ## output buffer reused by session (e.g. onnx io binding) is overwritten
+        ## by the next batch dispatched to the worker, copied before returning
+        outputs = session.predict(*args, **kwargs)
+        if session.output_reused:
+            outputs = outputs.copy() if isinstance(outputs, np.ndarray) \
+                else [output.copy() for output in outputs]
+        return outputs
+
+    def predict(self, *args, **kwargs) -> np.ndarray:
+        """run one of the sessions, blocks until the output is ready
+        """
+        return self._dispatch(type(self)._predict, *args, **kwargs).result()
+
+    def submit(self, *args, **kwargs) -> Future:
+        """non-blocking `__call__`, `args` and `kwargs` must not be modified
+        until the future is done
+
+        Returns:
+            Future: future resolved with prediction results of the batch
+        """
+        return self._dispatch(lambda session, *args, **kwargs: session(*args, **kwargs), *args, **kwargs)
+
+    def stats(self) -> Dict[str,List[int]]:
+        """number of batches in flight and dispatched so far of each session
+        """
+        with self._lock:
+            return dict(in_flight=list(self._in_flight), n_dispatched=list(self._n_dispatched))
+
+    def close(self):
+        """wait for pending batches and stop worker threads
+        """
+        for executor in self.executors:
+            executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def is_available():
+        return any(Runtime.is_available() for runtime_map in model_runtime_map.values()
+            for Runtime in runtime_map.values())
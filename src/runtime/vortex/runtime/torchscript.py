@@ -1,6 +1,8 @@
+import threading
 import numpy as np
 
 from vortex.runtime.basic_runtime import BaseRuntime
+from vortex.runtime.nms import nms_strategies
 from pathlib import Path
 from typing import Union
 from collections import OrderedDict
@@ -12,8 +14,23 @@ from collections import OrderedDict
 # ]
 
 class TorchScriptRuntime(BaseRuntime):
+    ## cached input tensors of additional inputs (e.g. thresholds), by value
+    max_cached_inputs = 64
+    dtypes = ('float32', 'float16', 'bfloat16')
+
     def __init__(self, model: Union[str, Path], device: Union[str,None], 
-                 *args, **kwargs):
+                 resize_kind: str = None, optimize: bool = False, channels_last: bool = False,
+                 dtype: str = 'float32', *args, **kwargs):
+        """
+        Args:
+            model (Union[str, Path]): torchscript model file or loaded `torch.jit.ScriptModule`
+            device (Union[str,None]): torch device
+            resize_kind (str, optional): override embedded resize kind. Defaults to None.
+            optimize (bool, optional): freeze model and apply `torch.jit.optimize_for_inference`. Defaults to False.
+            channels_last (bool, optional): convert model's weights to channels last memory format. Defaults to False.
+            dtype (str, optional): compute dtype, 'float16' or 'bfloat16' runs the model
+                under autocast. Defaults to 'float32'.
+        """
         import torch
         import torchvision
         if isinstance(model, (str, Path)):
@@ -49,16 +66,104 @@ class TorchScriptRuntime(BaseRuntime):
                 if name.endswith('_label')
         ]
         class_names = list(map(lambda x: x[0], sorted(class_names, key=lambda x: x[1])))
+        # resize kind is embedded as index to BaseRuntime.resize_kinds
+        buffers = dict(self.model.named_buffers(recurse=False))
+        if resize_kind is None:
+            resize_kind = BaseRuntime.resize_kinds[buffers['resize_kind'].item()] \
+                if 'resize_kind' in buffers else 'stretch'
+        # model exported without nms, applied by runtime
+        runtime_nms = 'runtime_nms' in buffers and bool(buffers['runtime_nms'].item())
+        # nms strategy is embedded as index to nms_strategies, with its arguments
+        nms_strategy = dict(
+            name=list(nms_strategies)[buffers['nms_strategy'].item()] if 'nms_strategy' in buffers else 'hard',
+            **{name.replace('nms_strategy_', '', 1): value.item()
+                for name, value in buffers.items() if name.startswith('nms_strategy_')}
+        )
         super(TorchScriptRuntime, self).__init__(
             input_specs=input_spec, 
             output_name="output", 
             output_format=output_format, 
             class_names=class_names,
+            resize_kind=resize_kind,
+            runtime_nms=runtime_nms,
+            nms_strategy=nms_strategy,
         )
         self.input_pos = {
             name: getattr(self.model, name + '_input_pos').item() for name in input_spec.keys()
         }
-        
+        if not dtype in TorchScriptRuntime.dtypes:
+            raise ValueError("unsupported dtype {}, supported : {}".format(dtype, TorchScriptRuntime.dtypes))
+        if dtype != 'float32' and not hasattr(torch, 'autocast'):
+            raise RuntimeError("dtype {} runs the model under `torch.autocast`, which requires "
+                "torch>=1.10, got {}".format(dtype, torch.__version__))
+        if optimize and not hasattr(torch.jit, 'optimize_for_inference'):
+            raise RuntimeError("optimize requires `torch.jit.freeze` and `torch.jit.optimize_for_inference` "
+                "(torch>=1.9), got {}".format(torch.__version__))
+        self.dtype = dtype
+        self.channels_last = channels_last
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+        ## properties are read from buffers above, freezing may remove unused buffers
+        self.optimize = optimize
+        if optimize:
+            self.model = torch.jit.optimize_for_inference(torch.jit.freeze(self.model))
+        self._cached_inputs = {}
+        ## pinned staging buffer of each thread, see `_to_device`
+        self._local = threading.local()
+
+    def _to_device(self, x: np.ndarray):
+        """numpy input to device tensor, zero-copy on cpu, otherwise
+        through reusable pinned host buffer for asynchronous transfer;
+        each thread has its own buffer, refilled only after its previous
+        transfer is done (output is copied back to host in `predict`)
+        """
+        import torch
+        x = torch.from_numpy(np.ascontiguousarray(x))
+        if self.device is None or self.device.type == 'cpu':
+            return x
+        staging = getattr(self._local, 'staging', None)
+        if staging is None or staging.shape != x.shape or staging.dtype != x.dtype:
+            staging = torch.empty(x.shape, dtype=x.dtype).pin_memory()
+            self._local.staging = staging
+        staging.copy_(x)
+        return staging.to(self.device, non_blocking=True)
+
+    def _cached_input(self, name: str, value):
+        """additional input as device tensor, cached by its value
+        """
+        import torch
+        value = np.asarray(value)
+        key = (name, value.dtype.str, value.shape, value.tobytes())
+        tensor = self._cached_inputs.get(key)
+        if tensor is None:
+            if len(self._cached_inputs) >= type(self).max_cached_inputs:
+                self._cached_inputs.clear()
+            tensor = torch.tensor(value, device=self.device)
+            self._cached_inputs[key] = tensor
+        return tensor
+
+    @staticmethod
+    def _to_numpy(output, device=None):
+        """device output to numpy, reduced precision floating output (e.g. under
+        autocast) is cast to float32; tuple of outputs with the same trailing shape
+        on non-cpu device is transferred with a single copy, on cpu each output
+        is converted without copy
+        """
+        import torch
+        def to_float(out):
+            return out.float() if out.dtype in (torch.float16, torch.bfloat16) else out
+        if isinstance(output, torch.Tensor):
+            return to_float(output).cpu().numpy()
+        if not len(output):
+            return list(output)
+        on_cpu = device is None or device.type == 'cpu'
+        if not on_cpu and len(output) > 1 and all(out.dim() and out.shape[1:] == output[0].shape[1:]
+                and out.dtype == output[0].dtype for out in output):
+            sizes = [len(out) for out in output]
+            merged = to_float(torch.cat(list(output))).cpu().numpy()
+            return np.split(merged, np.cumsum(sizes)[:-1])
+        return list(to_float(out).cpu().numpy() for out in output)
+
     ## TODO : check signature properly (?)
     def predict(self, x, *args, **kwargs) -> np.ndarray:
         import torch
@@ -69,13 +174,13 @@ class TorchScriptRuntime(BaseRuntime):
 
         args, kwargs = self._resolve_inputs(*args, **kwargs)
         with torch.no_grad():
-            x = torch.as_tensor(x, device=self.device)
-            output = self.model(x, *args, **kwargs)
-        if isinstance(output, torch.Tensor):
-            output = output.cpu().numpy()
-        elif isinstance(output, tuple):
-            output = list(out.cpu().numpy() for out in output)
-        return output
+            x = self._to_device(x)
+            if self.dtype == 'float32':
+                output = self.model(x, *args, **kwargs)
+            else:
+                with torch.autocast(self.device.type, dtype=getattr(torch, self.dtype)):
+                    output = self.model(x, *args, **kwargs)
+        return self._to_numpy(output, self.device)
 
     @staticmethod
     def is_available(device="cpu"):
@@ -94,16 +199,17 @@ class TorchScriptRuntime(BaseRuntime):
             return False
 
     def _resolve_inputs(self, *args, **kwargs):
-        import torch
         args = list(args)
         for name, val in kwargs.items():
-            args.insert(self.input_pos[name]-1, torch.tensor(val, device=self.device))
+            args.insert(self.input_pos[name]-1, self._cached_input(name, val))
         return tuple(args), {}
 
 
 class TorchScriptRuntimeCpu(TorchScriptRuntime):
-    def __init__(self, model: Union[str, Path], *args, **kwargs):
-        super(TorchScriptRuntimeCpu, self).__init__(model, device="cpu")
+    def __init__(self, model: Union[str, Path], resize_kind: str = None, optimize: bool = False,
+                 channels_last: bool = False, dtype: str = 'float32', *args, **kwargs):
+        super(TorchScriptRuntimeCpu, self).__init__(model, device="cpu", resize_kind=resize_kind,
+            optimize=optimize, channels_last=channels_last, dtype=dtype)
 
     @staticmethod
     def is_available():
@@ -111,13 +217,15 @@ class TorchScriptRuntimeCpu(TorchScriptRuntime):
 
 class TorchScriptRuntimeCuda(TorchScriptRuntime):
     def __init__(self, model: Union[str, Path], device_id: Union[int,None] = None,
-                 *args, **kwargs):
+                 resize_kind: str = None, optimize: bool = False, channels_last: bool = False,
+                 dtype: str = 'float32', *args, **kwargs):
         if not self.is_valid_device(device_id):
             raise RuntimeError("CUDA GPU device {} is not available".format(device_id))
         device = "cuda"
         if device_id is not None:
             device = device + ":{}".format(device_id)
-        super(TorchScriptRuntimeCuda, self).__init__(model, device=device)
+        super(TorchScriptRuntimeCuda, self).__init__(model, device=device, resize_kind=resize_kind,
+            optimize=optimize, channels_last=channels_last, dtype=dtype)
 
     @staticmethod
     def is_available(device_id: Union[int] = None):
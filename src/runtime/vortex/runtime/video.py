@@ -0,0 +1,230 @@
+import cv2
+import logging
+import queue
+import threading
+import time
+import numpy as np
+
+from collections import deque
+from pathlib import Path
+from typing import Union, Dict, Any, Iterable, Iterator, Tuple
+
+from vortex.runtime.basic_runtime import BaseRuntime
+
+logger = logging.getLogger(__name__)
+
+__all__ = ['VideoStream']
+
+_EOS = object()
+
+
+class _Frame:
+    __slots__ = ('index', 'timestamp', 'image', 't_read', 'decode_time')
+
+    def __init__(self, index, timestamp, image, t_read, decode_time):
+        self.index = index
+        self.timestamp = timestamp
+        self.image = image
+        self.t_read = t_read
+        self.decode_time = decode_time
+
+
+class VideoStream:
+    """Run runtime model over frames of a video file, camera or stream.
+
+    Frames are read by a background thread into a bounded queue, the
+    model takes as many queued frames as available up to its batch size,
+    so batches are full when the model is the bottleneck while a frame
+    doesn't wait for a full batch otherwise. With `drop_frames`, the
+    oldest queued frame is dropped when the queue is full instead of
+    blocking the reader, e.g. for live stream.
+
+    Example:
+        ```python
+        from vortex.runtime import create_runtime_model, VideoStream
+
+        model = create_runtime_model('model.onnx', runtime='cpu')
+        stream = VideoStream(model, 'video.mp4', score_threshold=0.5)
+        for frame_idx, timestamp, result in stream:
+            ...
+        print(stream.stats())
+        ```
+    """
+    def __init__(self, model: BaseRuntime, source: Union[str,Path,int,cv2.VideoCapture,Iterable[np.ndarray]],
+                 queue_size: int = None, drop_frames: bool = False, latency_window: int = 1024, **kwargs):
+        """Create video stream, frames are read when iterated
+
+        Args:
+            model (BaseRuntime): runtime model
+            source (Union[str,Path,int,cv2.VideoCapture,Iterable[np.ndarray]]): anything accepted
+                by `cv2.VideoCapture` (file, stream url or camera index), opened capture, or
+                iterable of frames (HWC) as local stand-in for a stream
+            queue_size (int, optional): maximum frames read ahead, defaults to twice model's batch size
+            drop_frames (bool, optional): drop oldest frame when queue is full. Defaults to False.
+            latency_window (int, optional): number of latest frames used for latency statistics. Defaults to 1024.
+            **kwargs: additional model inputs, e.g. `score_threshold`
+        """
+        self.model = model
+        self.source = source
+        self.batch_size = model.input_specs['input']['shape'][0]
+        self.queue_size = queue_size or 2 * self.batch_size
+        self.drop_frames = drop_frames
+        self.kwargs = kwargs
+        self._latency = {stage: deque(maxlen=latency_window) for stage in ('decode', 'queue', 'inference', 'latency')}
+        self._lock = threading.Lock()
+        self._n_frames = 0
+        self._n_dropped = 0
+        self._n_batches = 0
+        self._t_start = None
+        self._t_end = None
+
+    def _open(self):
+        if isinstance(self.source, cv2.VideoCapture):
+            return self.source
+        if isinstance(self.source, (str, Path, int)):
+            capture = cv2.VideoCapture(self.source if isinstance(self.source, int) else str(self.source))
+            if not capture.isOpened():
+                raise RuntimeError("failed to open video source {}".format(self.source))
+            return capture
+        return None
+
+    def _frames(self, capture) -> Iterator[Tuple[np.ndarray,float]]:
+        """yield frame and its timestamp in seconds, from stream position for
+        video file, otherwise from the time it is read
+        """
+        if capture is None:
+            for image in self.source:
+                yield image, time.perf_counter() - self._t_start
+            return
+        use_position = capture.get(cv2.CAP_PROP_FRAME_COUNT) > 0
+        while True:
+            ok, image = capture.read()
+            if not ok:
+                return
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1e3 if use_position \
+                else time.perf_counter() - self._t_start
+            yield image, timestamp
+
+    def _put(self, frames: queue.Queue, item, stop: threading.Event):
+        if self.drop_frames and item is not _EOS:
+            while True:
+                try:
+                    frames.put_nowait(item)
+                    return
+                except queue.Full:
+                    try:
+                        frames.get_nowait()
+                        with self._lock:
+                            self._n_dropped += 1
+                    except queue.Empty:
+                        pass
+        while not stop.is_set():
+            try:
+                frames.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _read(self, capture, frames: queue.Queue, stop: threading.Event, errors: list):
+        try:
+            index = 0
+            iterator = self._frames(capture)
+            while not stop.is_set():
+                start = time.perf_counter()
+                frame = next(iterator, None)
+                if frame is None:
+                    break
+                t_read = time.perf_counter()
+                self._put(frames, _Frame(index, frame[1], frame[0], t_read, t_read - start), stop)
+                index += 1
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if capture is not None and capture is not self.source:
+                capture.release()
+            self._put(frames, _EOS, stop)
+
+    def _chunks(self, frames: queue.Queue, pending: deque):
+        """take frames available in queue, up to model's batch size, waits only for the first one
+        """
+        done = False
+        while not done:
+            frame = frames.get()
+            if frame is _EOS:
+                return
+            chunk = [frame]
+            while len(chunk) < self.batch_size:
+                try:
+                    frame = frames.get_nowait()
+                except queue.Empty:
+                    break
+                if frame is _EOS:
+                    done = True
+                    break
+                chunk.append(frame)
+            t_batch = time.perf_counter()
+            with self._lock:
+                for frame in chunk:
+                    self._latency['decode'].append(frame.decode_time)
+                    self._latency['queue'].append(t_batch - frame.t_read)
+            pending.append(chunk)
+            yield [frame.image for frame in chunk]
+
+    def __iter__(self) -> Iterator[Tuple[int,float,Dict[str,Any]]]:
+        """Read frames and run inference
+
+        Yields:
+            tuple: frame index (of all read frames, including the dropped ones),
+                timestamp in seconds, and prediction result of the frame
+        """
+        from vortex.runtime.helper import InferenceHelper
+        capture = self._open()
+        frames = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = []
+        pending = deque()
+        self._t_start = time.perf_counter()
+        reader = threading.Thread(target=self._read, args=(capture, frames, stop, errors),
+            name='vortex-video-reader', daemon=True)
+        reader.start()
+        try:
+            chunks = self._chunks(frames, pending)
+            for results, dt, transform in InferenceHelper._run_inference_chunks(self.model, chunks, **self.kwargs):
+                chunk = pending.popleft()
+                if transform is not None:
+                    results = BaseRuntime.transform_coordinates(results, transform)
+                t_done = time.perf_counter()
+                with self._lock:
+                    self._n_batches += 1
+                    self._n_frames += len(chunk)
+                    self._latency['inference'].extend([dt] * len(chunk))
+                    self._latency['latency'].extend(t_done - frame.t_read for frame in chunk)
+                    self._t_end = t_done
+                for frame, result in zip(chunk, results):
+                    yield frame.index, frame.timestamp, result
+        finally:
+            stop.set()
+            reader.join()
+        if errors:
+            raise errors[0]
+
+    def stats(self) -> Dict[str,Union[int,float]]:
+        """Stream statistics
+
+        Returns:
+            Dict[str,Union[int,float]]: dictionary containing 'n_frames' (processed frames),
+                'n_dropped', 'n_batches', 'fps' (end-to-end processed frames per second), and
+                median and 99th percentile (in seconds) of each stage: 'decode', 'queue' (from
+                read to batched), 'inference' (model's batch), and 'latency' (from read to result
+                available), e.g. 'decode_p50' and 'latency_p99'
+        """
+        with self._lock:
+            stats = dict(n_frames=self._n_frames, n_dropped=self._n_dropped, n_batches=self._n_batches)
+            elapsed = (self._t_end - self._t_start) if self._t_end is not None else 0.
+            stats['fps'] = self._n_frames / elapsed if elapsed > 0 else 0.
+            for stage, values in self._latency.items():
+                values = np.asarray(values)
+                p50, p99 = np.percentile(values, [50, 99]) if len(values) else (0., 0.)
+                stats['{}_p50'.format(stage)] = float(p50)
+                stats['{}_p99'.format(stage)] = float(p99)
+        return stats
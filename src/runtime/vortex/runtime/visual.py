@@ -0,0 +1,237 @@
+import cv2
+import threading
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, List, Dict, Sequence
+
+__all__ = ['VisualRenderer']
+
+
+class VisualRenderer:
+    """Draw prediction results (bounding boxes, labels and landmarks) with
+    cached label sprites and a few cv2 / numpy calls per image, instead of
+    `cv2.rectangle`, `cv2.putText` and `cv2.circle` for each item.
+
+    Label text is rasterized once and cached as sprite (colored patch and
+    mask) for each (class, color) and each (confidence, color): a label
+    ('name : 0.87') is both sprites copied side by side with `cv2.copyTo`.
+    Rectangles of the same color are drawn with a single `cv2.polylines`
+    and all landmark points with a single numpy assignment. Images of
+    a batch are drawn in parallel on a thread pool.
+
+    Drawn pixels are the same as drawing each item with cv2, except that
+    boxes are drawn grouped by color, then labels over them, and text is
+    not antialiased (cv2 >= 5 antialiases text, older versions don't).
+
+    Example:
+        ```python
+        from vortex.runtime import VisualRenderer
+
+        renderer = VisualRenderer(n_workers=4)
+        batch_vis = renderer.render(batch_vis, results, class_names=model.class_names)
+        ```
+    """
+    colors = [
+        (255, 0, 0), (0, 255, 0), (0, 0, 255),
+        (255, 127, 127), (127, 255, 127), (127, 127, 255),
+        (255, 0, 255), (0, 255, 255), (255, 255, 255),
+    ] * 115 ## >= imagenet
+
+    def __init__(self, font: int = cv2.FONT_HERSHEY_SIMPLEX, font_scale: float = 1, thickness: int = 2,
+                 radius: int = 2, n_workers: int = 4, max_sprites: int = 4096):
+        """Create renderer
+
+        Args:
+            font (int, optional): cv2 hershey font of label. Defaults to cv2.FONT_HERSHEY_SIMPLEX.
+            font_scale (float, optional): font scale of label. Defaults to 1.
+            thickness (int, optional): stroke thickness of label. Defaults to 2.
+            radius (int, optional): radius of landmark point. Defaults to 2.
+            n_workers (int, optional): number of threads drawing images of a batch. Defaults to 4.
+            max_sprites (int, optional): maximum number of cached sprites, cache is cleared
+                when it's full. Defaults to 4096.
+        """
+        if n_workers < 1:
+            raise ValueError("expects 'n_workers' >= 1, got {}".format(n_workers))
+        self.font = font
+        self.font_scale = font_scale
+        self.thickness = thickness
+        self.radius = radius
+        self.n_workers = n_workers
+        self.max_sprites = max_sprites
+        self._sprites = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _color(color, channels: int) -> Tuple:
+        """color as drawn by cv2 on image with `channels`"""
+        color = tuple(int(c) for c in color[:channels])
+        return color + (0,) * (channels - len(color))
+
+    def _cache(self, key, sprite):
+        if len(self._sprites) >= self.max_sprites:
+            self._sprites.clear()
+        self._sprites[key] = sprite
+        return sprite
+
+    def point_sprite(self, radius: int, thickness: int = -1) -> Tuple[np.ndarray,np.ndarray]:
+        """cached pixel offsets (dy, dx) of a point drawn with `cv2.circle`, relative to its center
+        """
+        key = ('point', radius, thickness)
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            size = radius + max(thickness, 1) + 1
+            canvas = np.zeros((2 * size + 1,) * 2, dtype=np.uint8)
+            cv2.circle(canvas, (size, size), radius=radius, color=255, thickness=thickness)
+            dy, dx = np.nonzero(canvas)
+            sprite = self._cache(key, (dy - size, dx - size))
+        return sprite
+
+    def sprite(self, text: str, color: Tuple, channels: int = 3) -> Tuple[np.ndarray,np.ndarray,int,int,int]:
+        """cached sprite of `text` drawn with `color`
+
+        Returns:
+            Tuple[np.ndarray,np.ndarray,int,int,int]: colored patch, its mask, (x, y) of text's
+                bottom-left origin in the patch and horizontal advance to the next text
+        """
+        key = (text, tuple(color), channels)
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            color = VisualRenderer._color(color, channels)
+            (width, height), baseline = cv2.getTextSize(text, self.font, self.font_scale, self.thickness)
+            pad = self.thickness + 2
+            mask = np.zeros((height + baseline + 2 * pad, width + 2 * pad), dtype=np.uint8)
+            cv2.putText(mask, text, (pad, height + pad), self.font, self.font_scale, 255, self.thickness)
+            mask = (mask >= 128).astype(np.uint8)
+            patch = np.empty(mask.shape + (channels,), dtype=np.uint8)
+            patch[:] = color
+            ## advance of the text followed by another, as placed by cv2.putText
+            advance = cv2.getTextSize(text + '0', self.font, self.font_scale, self.thickness)[0][0] \
+                - cv2.getTextSize('0', self.font, self.font_scale, self.thickness)[0][0]
+            sprite = self._cache(key, (patch, mask, pad, height + pad, advance))
+        return sprite
+
+    def _blit(self, vis: np.ndarray, text: str, color: Tuple, bl: Tuple[int,int]) -> int:
+        """copy sprite of `text` to `vis` with its origin at `bl`, returns the advance
+        """
+        channels = vis.shape[2] if vis.ndim == 3 else 1
+        patch, mask, ox, oy, advance = self.sprite(text, color, channels)
+        x0, y0 = bl[0] - ox, bl[1] - oy
+        xa, ya = max(x0, 0), max(y0, 0)
+        xb, yb = min(x0 + mask.shape[1], vis.shape[1]), min(y0 + mask.shape[0], vis.shape[0])
+        if xa < xb and ya < yb:
+            patch = patch[ya-y0:yb-y0, xa-x0:xb-x0]
+            cv2.copyTo(patch if vis.ndim == 3 else patch[..., 0], mask[ya-y0:yb-y0, xa-x0:xb-x0], vis[ya:yb, xa:xb])
+        return advance
+
+    @staticmethod
+    def _label_text(obj_class: int, confidence: float, class_names=None) -> Tuple[str,str]:
+        class_name = class_names[obj_class] if class_names else 'class_{}'.format(obj_class)
+        return '{} : '.format(class_name), '{:.2f}'.format(confidence)
+
+    def draw_labels(self, vis: np.ndarray, obj_classes, confidences, bls: Sequence[Tuple[int,int]],
+                    color_map: Sequence = None, class_names=None) -> np.ndarray:
+        """draw labels at bottom-left points `bls` on `vis`, see `Visual.draw_labels`
+        """
+        color_map = color_map or self.colors
+        obj_classes = np.asarray(obj_classes).reshape(-1).astype(np.int64).tolist()
+        confidences = np.asarray(confidences, dtype=np.float64).reshape(-1).tolist()
+        for obj_class, confidence, (x, y) in zip(obj_classes, confidences, bls):
+            name, conf = VisualRenderer._label_text(obj_class, confidence, class_names)
+            color = color_map[obj_class]
+            advance = self._blit(vis, name, color, (int(x), int(y)))
+            self._blit(vis, conf, color, (int(x) + advance, int(y)))
+        return vis
+
+    def draw_bboxes(self, vis: np.ndarray, bboxes, classes, confidences, color_map: Sequence = None,
+                    class_names=None) -> np.ndarray:
+        """draw bounding boxes and their labels on `vis`, see `Visual.draw_bboxes`
+        """
+        color_map = color_map or self.colors
+        bboxes = np.asarray(bboxes).reshape(-1, 4).astype(np.int32)
+        classes = np.asarray(classes).reshape(-1).astype(np.int64)
+        channels = vis.shape[2] if vis.ndim == 3 else 1
+        ## corners of each box, as drawn by cv2.rectangle
+        corners = bboxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+        groups = {}
+        for i, obj_class in enumerate(classes.tolist()):
+            groups.setdefault(VisualRenderer._color(color_map[obj_class], channels), []).append(i)
+        for color, index in groups.items():
+            cv2.polylines(vis, list(corners[index]), True, color, 1)
+        return self.draw_labels(vis, classes, confidences, bboxes[:, :2].tolist(), color_map, class_names)
+
+    def draw_landmarks(self, vis: np.ndarray, landmarks, color: Tuple[int,int,int] = None,
+                       radius: int = None, thickness: int = -1) -> np.ndarray:
+        """draw landmark points on `vis`, see `Visual.draw_landmarks`
+        """
+        color = color or self.colors[0]
+        landmarks = np.asarray(landmarks)
+        assert landmarks.shape[-1] % 2 == 0
+        points = landmarks.reshape(-1, 2).astype(np.int64)
+        dy, dx = self.point_sprite(self.radius if radius is None else radius, thickness)
+        ys = (points[:, 1:2] + dy).reshape(-1)
+        xs = (points[:, 0:1] + dx).reshape(-1)
+        valid = (ys >= 0) & (ys < vis.shape[0]) & (xs >= 0) & (xs < vis.shape[1])
+        channels = vis.shape[2] if vis.ndim == 3 else 1
+        color = VisualRenderer._color(color, channels)
+        vis[ys[valid], xs[valid]] = color if vis.ndim == 3 else color[0]
+        return vis
+
+    def draw(self, result: Dict[str,np.ndarray], vis: np.ndarray, color_map: Sequence = None,
+             class_names=None) -> np.ndarray:
+        """draw single prediction result on `vis`, see `Visual.draw`
+
+        Returns:
+            np.ndarray: `vis` with visualization
+        """
+        color_map = color_map or self.colors
+        if 'class_label' in result:
+            class_label = result['class_label']
+        else:
+            class_label = np.zeros((result['class_confidence'].shape[0], 1))
+        class_confidence = result['class_confidence']
+
+        if 'bounding_box' in result:
+            bounding_box = result['bounding_box']
+            if bounding_box is not None:
+                vis = self.draw_bboxes(vis, bounding_box, class_label, class_confidence,
+                    color_map=color_map, class_names=class_names)
+        else:
+            bls = [(0, int(vis.shape[0]*0.95))] * len(class_label)
+            vis = self.draw_labels(vis, class_label, class_confidence, bls,
+                color_map=color_map, class_names=class_names)
+
+        landmarks = result.get('landmarks')
+        if landmarks is not None:
+            vis = self.draw_landmarks(vis, landmarks, color_map[0])
+        return vis
+
+    def render(self, batch_vis: List[np.ndarray], batch_results: List[Dict[str,np.ndarray]],
+               color_map: Sequence = None, class_names=None) -> List[np.ndarray]:
+        """draw prediction result of each image, images are drawn in parallel
+
+        Args:
+            batch_vis (List[np.ndarray]): images for visualization, drawn in place
+            batch_results (List[Dict[str,np.ndarray]]): prediction result of each image
+            color_map (Sequence, optional): mapping from int label to color. Defaults to `colors`.
+            class_names (mapping, optional): mapping from int label to human-readable str. Defaults to None.
+
+        Returns:
+            List[np.ndarray]: images with visualization
+        """
+        draw = lambda vis, result: self.draw(result, vis, color_map, class_names)
+        if self.n_workers == 1 or len(batch_results) < 2:
+            return list(map(draw, batch_vis, batch_results))
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.n_workers)
+        return list(self._executor.map(draw, batch_vis, batch_results))
+
+    def close(self):
+        """shutdown drawing threads
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
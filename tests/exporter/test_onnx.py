@@ -0,0 +1,121 @@
+import json
+import numpy as np
+import onnx
+import pytest
+import torch
+import torchvision
+
+pytest.importorskip('onnxruntime')
+try:
+    from vortex.development.exporter import onnx as exporter
+except ImportError as e:
+    ## e.g. symbolic helpers removed from newer torch.onnx
+    pytest.skip(str(e), allow_module_level=True)
+
+from vortex.development.networks.models.model import ModelBase
+from vortex.development.networks.models.backbone import Backbone
+from vortex.development.networks.modules.backbones import get_backbone
+from vortex.development.networks.modules.postprocess.yolov3 import YoloV3PostProcess
+from vortex.runtime import create_runtime_model, apply_nms
+from vortex.runtime.helper import InferenceHelper
+
+from ..models.test_yolo_postprocess import make_predictions, img_size
+from ..models.test_nms_strategy import strategy_args
+
+n_anchors = 200
+
+
+class DetectionModel(ModelBase):
+    """predicts fixed candidates, with detection postprocess"""
+    output_format = dict(
+        bounding_box=dict(indices=[0, 1, 2, 3], axis=1),
+        class_confidence=dict(indices=[4], axis=1),
+        class_label=dict(indices=[5], axis=1),
+    )
+    available_metrics = []
+    input_names = ['input', 'score_threshold', 'iou_threshold']
+    output_names = ['output', 'n_valid']
+
+    def __init__(self, **postprocess_args):
+        super().__init__()
+        self.class_names = ['a', 'b', 'c', 'd']
+        self.register_buffer('predictions', make_predictions(n_batch=1, n_anchors=n_anchors))
+        self.postprocess = YoloV3PostProcess(img_size=img_size, max_detections=n_anchors, **postprocess_args)
+
+    def get_example_inputs(self):
+        return (torch.zeros(1, img_size, img_size, 3, dtype=torch.uint8), torch.tensor([0.5]), torch.tensor([0.4]))
+
+    def predict(self, input, score_threshold, iou_threshold):
+        predictions = self.predictions + input.float().mean() * 0
+        return self.postprocess(predictions, score_threshold, iou_threshold)
+
+    def on_export_start(self, exporter, dataset=None):
+        pass
+
+
+def export(tmp_path, model):
+    tmp_path.mkdir(exist_ok=True)
+    filename = tmp_path / 'model.onnx'
+    exporter.ONNXExporter(shape_inference=False)(model, filename, dynamo=False)
+    props = {prop.key: prop.value for prop in onnx.load(str(filename)).metadata_props}
+    return create_runtime_model(filename, 'cpu'), props
+
+
+def test_runtime_nms(tmp_path):
+    model = DetectionModel(nms=False).eval()
+    runtime, props = export(tmp_path, model)
+    assert props['runtime_nms'] == 'true'
+    assert runtime.runtime_nms
+
+    ## candidates are suppressed by the runtime, with score threshold on class confidence
+    candidates, n_valid = model.postprocess(model.predictions, torch.tensor([0.5]), torch.tensor([0.4]))
+    candidates = candidates[0, :n_valid[0]]
+    candidates = candidates[candidates[:, 4] > 0.5]
+    keep = torchvision.ops.batched_nms(candidates[:, :4], candidates[:, 4], candidates[:, 5].long(), 0.4)
+    expected = candidates[keep].numpy()
+    assert 0 < len(expected) < len(candidates)
+    results = runtime(np.zeros((1, img_size, img_size, 3), dtype=np.uint8), score_threshold=0.5, iou_threshold=0.4)
+    np.testing.assert_allclose(results[0]['bounding_box'], expected[:, :4], rtol=1e-5)
+    np.testing.assert_allclose(results[0]['class_confidence'][:, 0], expected[:, 4], rtol=1e-5)
+    np.testing.assert_array_equal(results[0]['class_label'][:, 0], expected[:, 5])
+
+
+@pytest.mark.parametrize('name', list(strategy_args))
+def test_nms_strategy(tmp_path, name):
+    ## hard nms is exported unless nms is disabled
+    model = DetectionModel(nms=name != 'hard', nms_strategy=name, nms_strategy_args=strategy_args[name]).eval()
+    runtime, props = export(tmp_path, model)
+    spec = dict(name=name, **strategy_args[name])
+    assert json.loads(props['nms_strategy']) == spec
+    assert runtime.runtime_nms and runtime.nms_strategy == spec
+
+    ## candidates of the exported model with the embedded strategy applied
+    candidates, n_valid = DetectionModel(nms=False).postprocess(model.predictions, torch.tensor([0.5]), torch.tensor([0.4]))
+    candidates = candidates[0, :n_valid[0]].numpy()
+    expected = apply_nms([dict(bounding_box=candidates[:, :4], class_confidence=candidates[:, 4:5],
+        class_label=candidates[:, 5:])], iou_threshold=0.4, score_threshold=0.5, strategy=spec)
+    results = runtime(np.zeros((1, img_size, img_size, 3), dtype=np.uint8), score_threshold=0.5, iou_threshold=0.4)
+    for key in ('bounding_box', 'class_confidence', 'class_label'):
+        np.testing.assert_allclose(results[0][key], expected[0][key], rtol=1e-5)
+
+
+def test_resize_kind(tmp_path):
+    model = DetectionModel().eval()
+    assert model.resize_kind == 'stretch'
+    stretch_runtime, _ = export(tmp_path / 'stretch', model)
+
+    ## letterbox configured by backbone
+    backbone = get_backbone('darknet7', n_classes=4)
+    backbone.default_config = backbone.default_config._replace(resize='pad')
+    model.backbone = Backbone(backbone, stages_output='classifier')
+    assert model.resize_kind == 'pad'
+    runtime, props = export(tmp_path / 'pad', model)
+    assert json.loads(props['resize_kind']) == 'pad' and runtime.resize_kind == 'pad'
+
+    ## image twice as wide is padded at top and bottom, normalized boxes are mapped back to it
+    image = np.zeros((img_size, img_size * 2, 3), dtype=np.uint8)
+    expected = InferenceHelper.run_inference(stretch_runtime, [image], score_threshold=0.5, iou_threshold=0.4)
+    results = InferenceHelper.run_inference(runtime, [image], score_threshold=0.5, iou_threshold=0.4)
+    expected, results = expected[0]['bounding_box'], results[0]['bounding_box']
+    assert len(expected) > 0
+    np.testing.assert_allclose(results, expected * [1, 2, 1, 2] - [0, 0.5, 0, 0.5], rtol=1e-5, atol=1e-6)
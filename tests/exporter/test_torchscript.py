@@ -0,0 +1,98 @@
+import logging
+import pytest
+import torch
+import torch.nn as nn
+
+from vortex.development.exporter.torchscript import TorchScriptExporter
+from vortex.development.networks.modules.utils.layers import BatchNormAct2d
+from vortex.runtime import create_runtime_model
+
+
+class Postprocess(nn.Module):
+    additional_inputs = (('score_threshold', (1,)),)
+
+    def forward(self, x, score_threshold):
+        confidence, label = x.softmax(dim=1).max(dim=1)
+        confidence = torch.where(confidence > score_threshold, confidence, torch.zeros_like(confidence))
+        return torch.stack([label.float(), confidence], dim=1)
+
+
+class Predictor(nn.Module):
+    output_format = dict(
+        class_label=dict(indices=[0], axis=0),
+        class_confidence=dict(indices=[1], axis=0),
+    )
+
+    def __init__(self):
+        super().__init__()
+        self.model = nn.Sequential(
+            nn.Conv2d(3, 8, 3, padding=1, bias=False), BatchNormAct2d(8),
+            nn.Conv2d(8, 3, 3, padding=1), nn.BatchNorm2d(3),
+        )
+        self.postprocess = Postprocess()
+        for m in self.model.modules():
+            if isinstance(m, nn.BatchNorm2d):
+                nn.init.uniform_(m.running_mean, -1, 1)
+                nn.init.uniform_(m.running_var, 0.5, 2)
+
+    def forward(self, input, score_threshold):
+        x = input.permute(0, 3, 1, 2).float() / 255.
+        return self.postprocess(self.model(x).mean(dim=(2, 3)), score_threshold)
+
+
+def test_freeze(tmp_path, caplog):
+    predictor = Predictor().eval()
+    filename = tmp_path / 'model.pt'
+    exporter = TorchScriptExporter(filename, image_size=16, n_batch=2, freeze=True, n_benchmark=2)
+    with caplog.at_level(logging.INFO):
+        assert exporter(predictor, class_names=['a', 'b', 'c'])
+    assert exporter.report['max_difference'] <= 1e-4
+    assert set(exporter.report['latency']) == {'eager', 'traced', 'frozen'}
+    assert 'median latency' in caplog.text
+
+    ## batch norms are folded into convolutions, weights are constants
+    exported = torch.jit.load(str(filename))
+    assert not list(exported.named_modules())[1:]
+    assert 'batch_norm' not in str(exported.graph)
+
+    model = create_runtime_model(filename, 'cpu')
+    assert model.class_names == ['a', 'b', 'c']
+    assert list(model.input_specs) == ['input', 'score_threshold']
+    assert model.output_format == Predictor.output_format
+    results = model(model.prepare_batch([torch.zeros(16, 16, 3, dtype=torch.uint8).numpy()]),
+        score_threshold=[0.])
+    assert len(results) == 2 and results[0]['class_label'].shape == (1,)
+
+
+def test_freeze_parity(tmp_path):
+    exporter = TorchScriptExporter(tmp_path / 'model.pt', image_size=16, freeze=True, parity_tolerance=-1)
+    with pytest.raises(RuntimeError):
+        exporter(Predictor(), class_names=['a', 'b', 'c'])
+
+
+def test_max_difference():
+    x = torch.ones(2, 3)
+    assert TorchScriptExporter.max_difference((x, [x]), (x + 1, [x])) == 1.
+    assert TorchScriptExporter.max_difference(x, x[:1]) == float('inf')
+    assert TorchScriptExporter.max_difference((x,), (x, x)) == float('inf')
+
+
+def test_runtime_nms_strategy(tmp_path):
+    from vortex.development.networks.modules.postprocess.utils.nms_strategy import SoftGaussianNMS
+
+    predictor = Predictor().eval()
+    predictor.postprocess.runtime_nms = True
+    predictor.postprocess.nms_strategy = SoftGaussianNMS(sigma=0.25)
+    filename = tmp_path / 'model.pt'
+    assert TorchScriptExporter(filename, image_size=16, n_batch=2)(predictor, class_names=['a', 'b', 'c'])
+    model = create_runtime_model(filename, 'cpu')
+    assert model.runtime_nms
+    assert model.nms_strategy == dict(name='soft_gaussian', sigma=0.25, min_score=pytest.approx(1e-3))
+
+
+def test_freeze_unsupported_torch(tmp_path, monkeypatch):
+    ## e.g. on torch 1.6
+    monkeypatch.delattr(torch.jit, 'freeze')
+    with pytest.raises(RuntimeError):
+        TorchScriptExporter(tmp_path / 'model.pt', image_size=16, freeze=True)
+    assert TorchScriptExporter(tmp_path / 'model.pt', image_size=16)(Predictor().eval(), class_names=['a', 'b', 'c'])
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+import torch
+import torchvision
+
+from vortex.development.networks.modules.postprocess.yolov3 import YoloV3PostProcess
+from vortex.development.networks.modules.postprocess.utils.nms_strategy import NMS_STRATEGIES
+from vortex.runtime.nms import nms_strategies
+
+from .test_yolo_postprocess import make_predictions, img_size
+
+strategy_args = {
+    'hard': {},
+    'soft_gaussian': dict(sigma=0.3, min_score=0.05),
+    'soft_linear': dict(min_score=0.05),
+    'diou': dict(beta=0.8),
+    'wbf': {},
+}
+
+
+def make_candidates(n=300, n_groups=4, seed=0):
+    torch.manual_seed(seed)
+    xy = torch.rand(n, 2) * 100
+    boxes = torch.cat((xy, xy + 5 + torch.rand(n, 2) * 25), 1)
+    return boxes, torch.rand(n), torch.randint(0, n_groups, (n,))
+
+
+@pytest.mark.parametrize('name', list(strategy_args))
+def test_strategy_matches_runtime(name):
+    boxes, scores, idxs = make_candidates()
+    strategy = NMS_STRATEGIES.create_from_dict(name, strategy_args[name])
+    assert strategy.spec == dict(name=name, **strategy_args[name])
+    assert strategy.exportable == (name == 'hard')
+    keep, kept_boxes, kept_scores = strategy(boxes, scores, idxs, torch.tensor([0.45]))
+    expected = nms_strategies[name](boxes.numpy(), scores.numpy(), idxs.numpy(), 0.45, **strategy_args[name])
+    np.testing.assert_array_equal(keep.numpy(), expected[0])
+    np.testing.assert_allclose(kept_boxes.numpy(), expected[1], rtol=1e-5)
+    np.testing.assert_allclose(kept_scores.numpy(), expected[2], rtol=1e-5)
+    if name == 'hard':
+        assert torch.equal(keep, torchvision.ops.batched_nms(boxes, scores, idxs, 0.45))
+    else:
+        ## kept in decreasing order of updated scores
+        assert torch.all(kept_scores[:-1] >= kept_scores[1:])
+
+
+@pytest.mark.parametrize('name', ['soft_gaussian', 'diou'])
+def test_strategy_torch_1_6(monkeypatch, name):
+    ## stable `torch.sort` and `torch.nan_to_num` are not available in supported torch (<=1.6)
+    sort = torch.sort
+    def legacy_sort(*args, **kwargs):
+        if 'stable' in kwargs:
+            raise TypeError("sort() got an unexpected keyword argument 'stable'")
+        return sort(*args, **kwargs)
+    monkeypatch.setattr(torch, 'sort', legacy_sort)
+    monkeypatch.delattr(torch, 'nan_to_num')
+    boxes, scores, idxs = make_candidates()
+    ## ties are kept in order of index
+    scores[1::2] = scores[::2]
+    keep = NMS_STRATEGIES.create_from_dict(name, strategy_args[name])(boxes, scores, idxs, torch.tensor([0.45]))[0]
+    expected = nms_strategies[name](boxes.numpy(), scores.numpy(), idxs.numpy(), 0.45, **strategy_args[name])
+    np.testing.assert_array_equal(keep.numpy(), expected[0])
+
+
+def test_strategy_empty():
+    boxes, scores, idxs = make_candidates(n=0)
+    for name, args in strategy_args.items():
+        keep, kept_boxes, kept_scores = NMS_STRATEGIES.create_from_dict(name, args)(
+            boxes, scores, idxs, torch.tensor([0.45]))
+        assert len(keep) == len(kept_boxes) == len(kept_scores) == 0
+
+
+@pytest.mark.parametrize('name', ['soft_gaussian', 'diou', 'wbf'])
+def test_postprocess_strategy(name):
+    predictions = make_predictions()
+    inputs = (predictions, torch.tensor([0.5]), torch.tensor([0.4]))
+    postprocess = YoloV3PostProcess(img_size=img_size, nms_strategy=name, nms_strategy_args=strategy_args[name])
+    assert postprocess.runtime_nms
+    expected = postprocess(*inputs)
+    detections, n_valid = YoloV3PostProcess(img_size=img_size, max_detections=300,
+        nms_strategy=name, nms_strategy_args=strategy_args[name])(*inputs)
+    for i, result in enumerate(expected):
+        assert n_valid[i] == len(result)
+        assert torch.allclose(detections[i, :n_valid[i]], result, atol=1e-6)
+
+    ## not exported, traced model outputs sorted and padded candidates
+    postprocess = YoloV3PostProcess(img_size=img_size, max_detections=300, nms_strategy=name).eval()
+    traced = torch.jit.trace(postprocess, inputs, check_trace=False)
+    candidates = YoloV3PostProcess(img_size=img_size, max_detections=300, nms=False)(*inputs)
+    for output, expected_output in zip(traced(*inputs), candidates):
+        assert torch.equal(output, expected_output)
+
+
+def test_hard_strategy_exported():
+    postprocess = YoloV3PostProcess(img_size=img_size, nms_strategy='hard')
+    assert not postprocess.runtime_nms
+    assert YoloV3PostProcess(img_size=img_size, nms=False).runtime_nms
@@ -0,0 +1,248 @@
+import io
+import numpy as np
+import pytest
+import torch
+import torchvision
+
+from vortex.development.networks.modules.postprocess.yolov3 import YoloV3PostProcess
+from vortex.development.networks.modules.postprocess.utils.nms import batched_nms, padded_batched_nms
+
+img_size = 64
+
+
+def make_predictions(n_batch=3, n_anchors=200, n_classes=4, seed=0):
+    torch.manual_seed(seed)
+    predictions = torch.rand(n_batch, n_anchors, 5 + n_classes)
+    predictions[..., :2] *= img_size
+    predictions[..., 2:4] *= img_size / 4
+    return predictions
+
+
+class FixedIoU(torch.nn.Module):
+    """export iou_threshold as constant, made as input by `IOUThresholdAsInput`"""
+    def __init__(self, postprocess, iou_threshold):
+        super().__init__()
+        self.postprocess = postprocess
+        self.iou_threshold = iou_threshold
+
+    def forward(self, input, score_threshold, *args):
+        return self.postprocess(input, score_threshold, torch.tensor([self.iou_threshold]), *args)
+
+
+def test_padded_nms_matches_per_image():
+    predictions = make_predictions()
+    score_threshold, iou_threshold = torch.tensor([0.5]), torch.tensor([0.4])
+    expected = YoloV3PostProcess(img_size=img_size)(predictions, score_threshold, iou_threshold)
+    detections, n_valid = YoloV3PostProcess(img_size=img_size, max_detections=150)(
+        predictions, score_threshold, iou_threshold)
+    assert detections.shape == (3, 150, 6)
+    assert n_valid.dtype == torch.long
+    for i, result in enumerate(expected):
+        assert n_valid[i] == len(result)
+        assert torch.allclose(detections[i, :n_valid[i]], result)
+        assert torch.all(detections[i, n_valid[i]:] == 0)
+
+    ## truncated to max_detections, highest scores first
+    detections, n_valid = YoloV3PostProcess(img_size=img_size, max_detections=10)(
+        predictions, score_threshold, iou_threshold)
+    assert n_valid.tolist() == [10] * 3
+    for i, result in enumerate(expected):
+        assert torch.allclose(detections[i], result[:10])
+
+
+def test_padded_nms_empty():
+    postprocess = YoloV3PostProcess(img_size=img_size, max_detections=5)
+    detections, n_valid = postprocess(make_predictions(), torch.tensor([2.]), torch.tensor([0.4]))
+    assert detections.shape == (3, 5, 6)
+    assert n_valid.tolist() == [0, 0, 0]
+    assert torch.all(detections == 0)
+
+
+def test_padded_nms_torchscript():
+    predictions = make_predictions()
+    postprocess = YoloV3PostProcess(img_size=img_size, max_detections=100).eval()
+    inputs = (predictions, torch.tensor([0.5]), torch.tensor([0.4]))
+    expected = postprocess(*inputs)
+    ## as done by torchscript exporter
+    postprocess.nms.nms_fn = torch.jit.script(padded_batched_nms)
+    traced = torch.jit.trace(postprocess, inputs)
+    for output, expected_output in zip(traced(*inputs), expected):
+        assert torch.equal(output, expected_output)
+    ## different number of candidates than traced
+    detections, n_valid = traced(predictions, torch.tensor([0.9]), torch.tensor([0.4]))
+    assert torch.all(n_valid < expected[1])
+    _, n_valid = traced(predictions, torch.tensor([2.]), torch.tensor([0.4]))
+    assert n_valid.tolist() == [0, 0, 0]
+
+
+def test_padded_nms_onnx():
+    onnx = pytest.importorskip('onnx')
+    ort = pytest.importorskip('onnxruntime')
+    from vortex.runtime.onnx.graph_ops.nms_iou_threshold_as_input import IOUThresholdAsInput
+
+    predictions = make_predictions()
+    postprocess = YoloV3PostProcess(img_size=img_size, max_detections=100).eval()
+    f = io.BytesIO()
+    torch.onnx.export(FixedIoU(postprocess, 0.4), (predictions, torch.tensor([0.5])), f, opset_version=11,
+        input_names=['input', 'score_threshold'], output_names=['output', 'n_valid'], dynamo=False)
+    model = IOUThresholdAsInput().run(onnx.load_from_string(f.getvalue()))
+    ## single nms for the whole batch
+    assert [node.op_type for node in model.graph.node].count('NonMaxSuppression') == 1
+
+    session = ort.InferenceSession(model.SerializeToString(), providers=['CPUExecutionProvider'])
+    for score_threshold, iou_threshold in [(0.5, 0.4), (0.8, 0.6), (2., 0.4)]:
+        expected, expected_n_valid = postprocess(predictions, torch.tensor([score_threshold]), torch.tensor([iou_threshold]))
+        output, n_valid = session.run(None, dict(
+            input=predictions.numpy(),
+            score_threshold=np.array([score_threshold], dtype=np.float32),
+            iou_threshold=np.array([iou_threshold], dtype=np.float32),
+        ))
+        np.testing.assert_array_equal(n_valid, expected_n_valid.numpy())
+        np.testing.assert_allclose(output, expected.numpy(), atol=1e-6)
+
+
+def reference_batched_nms(boxes, scores, idxs, iou_threshold):
+    keep = []
+    for idx in torch.unique(idxs):
+        indices = torch.nonzero(idxs == idx, as_tuple=False).squeeze(1)
+        keep.append(indices[torchvision.ops.nms(boxes[indices], scores[indices], iou_threshold)])
+    keep = torch.cat(keep)
+    return keep[torch.argsort(scores[keep], descending=True)]
+
+
+@pytest.mark.parametrize("image_size,n_classes", [(64, 4), (4096, 1200), (10000, 50)])
+def test_batched_nms_large_coordinates(image_size, n_classes):
+    torch.manual_seed(0)
+    n_boxes = 2000
+    xy = torch.rand(n_boxes, 2) * image_size
+    wh = torch.rand(n_boxes, 2) * image_size / 8 + 1
+    boxes = torch.cat((xy, xy + wh), 1)
+    scores = torch.rand(n_boxes)
+    ## few classes repeated on the same boxes, so boxes of different classes fully overlap
+    idxs = torch.randint(0, n_classes, (n_boxes,))
+    boxes[1::2] = boxes[::2]
+    idxs[1::2] = (idxs[::2] + 1) % n_classes
+    keep = batched_nms(boxes, scores, idxs, 0.5)
+    expected = reference_batched_nms(boxes, scores, idxs, 0.5)
+    assert keep.tolist() == expected.tolist()
+
+    ## all images of the batch at once
+    batch_indexes = torch.arange(n_boxes) % 2
+    detections = torch.cat((boxes, scores.unsqueeze(1)), 1)
+    padded, n_valid = padded_batched_nms(detections, boxes, scores, idxs, batch_indexes,
+        2, torch.tensor([0.5]), torch.tensor([n_boxes]))
+    for i in range(2):
+        indices = torch.nonzero(batch_indexes == i, as_tuple=False).squeeze(1)
+        expected = indices[reference_batched_nms(boxes[indices], scores[indices], idxs[indices], 0.5)]
+        assert n_valid[i] == len(expected)
+        assert torch.equal(padded[i, :n_valid[i]], detections[expected])
+
+
+class PaddedNMS(torch.nn.Module):
+    def forward(self, boxes, scores, class_indexes, batch_indexes, iou_threshold):
+        detections = torch.cat((boxes, scores.unsqueeze(1), class_indexes.unsqueeze(1).float()), 1)
+        return padded_batched_nms(detections, boxes, scores, class_indexes, batch_indexes,
+            6, iou_threshold, torch.tensor([1000]))
+
+
+def test_padded_nms_onnx_large_coordinates():
+    ## offset of image and class as float32 would exceed 2^24 in exported graph
+    onnx = pytest.importorskip('onnx')
+    ort = pytest.importorskip('onnxruntime')
+    torch.manual_seed(0)
+    n_boxes, image_size, n_classes = 3000, 4096, 1200
+    xy = torch.rand(n_boxes, 2) * image_size
+    boxes = torch.cat((xy, xy + torch.rand(n_boxes, 2) * 64 + 1), 1)
+    ## boxes slightly shifted, with iou around the threshold
+    boxes[1::2] = boxes[::2] + torch.rand(n_boxes // 2, 1) * 8
+    ## distinct scores, images are sorted in float32
+    scores = torch.randperm(n_boxes).float() / n_boxes
+    class_indexes = torch.randint(n_classes - 10, n_classes, (n_boxes,))
+    class_indexes[1::2] = class_indexes[::2]
+    batch_indexes = torch.randint(0, 6, (n_boxes,))
+    batch_indexes[1::2] = batch_indexes[::2]
+    inputs = (boxes, scores, class_indexes, batch_indexes, torch.tensor([0.5]))
+    f = io.BytesIO()
+    torch.onnx.export(PaddedNMS(), inputs, f, opset_version=11, dynamo=False,
+        input_names=['boxes', 'scores', 'class_indexes', 'batch_indexes', 'iou_threshold'])
+    model = onnx.load_from_string(f.getvalue())
+    assert [node.op_type for node in model.graph.node].count('NonMaxSuppression') == 1
+
+    session = ort.InferenceSession(model.SerializeToString(), providers=['CPUExecutionProvider'])
+    for iou_threshold in (0.5, 0.7):
+        inputs = inputs[:4] + (torch.tensor([iou_threshold]),)
+        expected, expected_n_valid = PaddedNMS()(*inputs)
+        output, n_valid = session.run(None, {node.name: x.numpy() for node, x in zip(model.graph.input, inputs)})
+        np.testing.assert_array_equal(n_valid, expected_n_valid.numpy())
+        np.testing.assert_allclose(output, expected.numpy())
+
+
+def test_pre_nms_topk():
+    predictions = make_predictions()
+    postprocess = YoloV3PostProcess(img_size=img_size, max_detections=100, pre_nms_topk=20)
+    assert [name for name, _ in postprocess.additional_inputs] == \
+        ['score_threshold', 'iou_threshold', 'pre_nms_topk', 'max_detections']
+    score_threshold = torch.tensor([0.5])
+    _, scores, _, batch_indexes, _ = postprocess.decoder.decode_batch(predictions, score_threshold, torch.tensor([20]))
+    assert torch.bincount(batch_indexes).tolist() == [20, 20, 20]
+    ## highest scores of each image passing the threshold
+    all_scores = predictions[..., 4] * predictions[..., 5:].max(2)[0]
+    for i in range(3):
+        passing = all_scores[i][predictions[i, :, 4] > score_threshold]
+        expected = torch.sort(passing, descending=True)[0][:20]
+        assert torch.equal(torch.sort(scores[batch_indexes == i], descending=True)[0], expected)
+    ## no limit
+    _, _, _, batch_indexes, _ = postprocess.decoder.decode_batch(predictions, score_threshold, torch.tensor([0]))
+    _, _, _, expected, _ = postprocess.decoder.decode_batch(predictions, score_threshold)
+    assert torch.equal(torch.sort(batch_indexes)[0], expected)
+
+    detections, n_valid = postprocess(predictions, score_threshold, torch.tensor([0.4]))
+    assert detections.shape == (3, 100, 6) and torch.all(n_valid <= 20)
+    detections, n_valid = postprocess(predictions, score_threshold, torch.tensor([0.4]),
+        torch.tensor([0]), torch.tensor([5]))
+    assert detections.shape == (3, 5, 6) and n_valid.tolist() == [5, 5, 5]
+    with pytest.raises(ValueError):
+        YoloV3PostProcess(img_size=img_size, pre_nms_topk=20)
+
+
+@pytest.mark.parametrize("export", ["torchscript", "onnx"])
+def test_limits_as_input(export):
+    predictions = make_predictions()
+    postprocess = YoloV3PostProcess(img_size=img_size, max_detections=100, pre_nms_topk=50).eval()
+    inputs = (predictions, torch.tensor([0.3]), torch.tensor([50.]), torch.tensor([100.]))
+    if export == "torchscript":
+        postprocess.nms.nms_fn = torch.jit.script(padded_batched_nms)
+        model = torch.jit.trace(FixedIoU(postprocess, 0.4), inputs)
+        run = lambda *args: [output.numpy() for output in model(predictions, *[torch.tensor([float(arg)]) for arg in args])]
+    else:
+        onnx = pytest.importorskip('onnx')
+        ort = pytest.importorskip('onnxruntime')
+        f = io.BytesIO()
+        torch.onnx.export(FixedIoU(postprocess, 0.4), inputs, f, opset_version=11, dynamo=False,
+            input_names=['input', 'score_threshold', 'pre_nms_topk', 'max_detections'],
+            output_names=['output', 'n_valid'])
+        session = ort.InferenceSession(f.getvalue(), providers=['CPUExecutionProvider'])
+        run = lambda *args: session.run(None, dict(input=predictions.numpy(),
+            **{name: np.array([arg], dtype=np.float32) for name, arg in
+                zip(['score_threshold', 'pre_nms_topk', 'max_detections'], args)}))
+    for score_threshold, pre_nms_topk, max_detections in [(0.3, 50, 100), (0.5, 10, 4), (0.5, 0, 200)]:
+        expected, expected_n_valid = postprocess(predictions, torch.tensor([score_threshold]), torch.tensor([0.4]),
+            torch.tensor([pre_nms_topk]), torch.tensor([max_detections]))
+        output, n_valid = run(score_threshold, pre_nms_topk, max_detections)
+        assert output.shape == (3, max_detections, 6)
+        np.testing.assert_array_equal(n_valid, expected_n_valid.numpy())
+        np.testing.assert_allclose(output, expected.numpy(), atol=1e-6)
+
+
+def test_decode_batch_torch_1_6(monkeypatch):
+    ## `torch.div(rounding_mode=...)` is not available in supported torch (<=1.6)
+    div = torch.div
+    def legacy_div(*args, **kwargs):
+        if 'rounding_mode' in kwargs:
+            raise TypeError("div() got an unexpected keyword argument 'rounding_mode'")
+        return div(*args, **kwargs)
+    monkeypatch.setattr(torch, 'div', legacy_div)
+    predictions = make_predictions()
+    detections, n_valid = YoloV3PostProcess(img_size=img_size, max_detections=100, pre_nms_topk=50)(
+        predictions, torch.tensor([0.5]), torch.tensor([0.4]))
+    assert detections.shape == (3, 100, 6) and n_valid.shape == (3,)
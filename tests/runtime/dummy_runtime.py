@@ -0,0 +1,127 @@
+import time
+import numpy as np
+from collections import OrderedDict
+
+from vortex.runtime.basic_runtime import BaseRuntime
+
+
+class DummyRuntime(BaseRuntime):
+    """numpy-only runtime, predicts mean pixel value of each image as 'class_label'
+    """
+    def __init__(self, batch_size=4, image_size=8, delay=0., resize_kind='stretch', output_format=None):
+        input_specs = OrderedDict(
+            input=dict(shape=[batch_size, image_size, image_size, 3], type='uint8'),
+            score_threshold=dict(shape=[1], type='float32'),
+        )
+        if output_format is None:
+            output_format = dict(
+                class_label=dict(indices=[0], axis=0),
+                class_confidence=dict(indices=[1], axis=0),
+            )
+        super().__init__(
+            input_specs=input_specs,
+            output_name='output',
+            output_format=output_format,
+            class_names=['a', 'b'],
+            resize_kind=resize_kind,
+        )
+        self.delay = delay
+        self.batches = []
+
+    def predict(self, x, score_threshold=None) -> np.ndarray:
+        self.batches.append(x.shape[0])
+        if self.delay:
+            time.sleep(self.delay)
+        label = x.reshape(x.shape[0], -1).mean(axis=1)
+        confidence = np.ones_like(label) if score_threshold is None \
+            else np.full_like(label, score_threshold[0])
+        return np.stack([label, confidence], axis=1)
+
+    @staticmethod
+    def is_available():
+        return True
+
+
+def make_image(value, size=(10, 12)):
+    return np.full((*size, 3), value, dtype=np.uint8)
+
+
+def make_onnx_model(filename, batch_size=4, image_size=8, dynamic_output=False, **props):
+    """onnx model predicting mean of each channel, embedded with vortex properties
+    """
+    import onnx
+    from onnx import helper, TensorProto
+    from vortex.runtime.onnx.graph_ops.embed_model_property import embed_model_property
+
+    input = helper.make_tensor_value_info('input', TensorProto.UINT8, [batch_size, image_size, image_size, 3])
+    output_shape = ['n', 3] if dynamic_output else [batch_size, 3]
+    output = helper.make_tensor_value_info('output', TensorProto.FLOAT, output_shape)
+    nodes = [
+        helper.make_node('Cast', ['input'], ['input_float'], to=TensorProto.FLOAT),
+        helper.make_node('ReduceMean', ['input_float'], ['mean'], axes=[1,2], keepdims=0),
+    ]
+    if dynamic_output:
+        ## data-dependent output shape, all rows are kept
+        nodes += [
+            helper.make_node('ReduceMax', ['mean'], ['max'], axes=[1], keepdims=0),
+            helper.make_node('Constant', [], ['min_value'], value_float=-1.),
+            helper.make_node('Greater', ['max', 'min_value'], ['keep']),
+            helper.make_node('Compress', ['mean', 'keep'], ['output'], axis=0),
+        ]
+    else:
+        nodes.append(helper.make_node('Identity', ['mean'], ['output']))
+    graph = helper.make_graph(nodes, 'dummy', [input], [output])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 7
+    props.setdefault('output_format', dict(
+        class_label=dict(indices=[0], axis=0),
+        class_confidence=dict(indices=[1], axis=0),
+    ))
+    props.setdefault('class_names', ['a', 'b', 'c'])
+    model = embed_model_property(model, props)
+    onnx.save(model, str(filename))
+    return filename
+
+
+def make_torchscript_model(filename, batch_size=4, image_size=8, class_names=('a', 'b', 'c'), linear_output=False):
+    """traced conv-bn model predicting argmax of pooled channels, embedded with
+    vortex properties the same way as torchscript exporter; with `linear_output`
+    the output is from identity linear layer, which stays in reduced precision
+    under autocast
+    """
+    import torch
+    from torch import nn
+
+    class Predictor(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.conv = nn.Conv2d(3, len(class_names), 3, padding=1, bias=False)
+            self.bn = nn.BatchNorm2d(len(class_names))
+            self.linear = nn.Linear(2, 2) if linear_output else nn.Identity()
+            if linear_output:
+                nn.init.eye_(self.linear.weight)
+                nn.init.zeros_(self.linear.bias)
+
+        def forward(self, input, score_threshold):
+            x = input.permute(0, 3, 1, 2).float() / 255.
+            x = torch.relu(self.bn(self.conv(x))).mean(dim=(2, 3)).softmax(dim=1)
+            confidence, label = x.max(dim=1)
+            confidence = torch.where(confidence > score_threshold, confidence, torch.zeros_like(confidence))
+            return self.linear(torch.stack([label.float(), confidence], dim=1))
+
+    torch.manual_seed(0)
+    predictor = Predictor().eval()
+    predictor.register_buffer('input_input_shape', torch.tensor([batch_size, image_size, image_size, 3]))
+    predictor.register_buffer('input_input_pos', torch.tensor(0))
+    predictor.register_buffer('score_threshold_input_shape', torch.tensor([1]))
+    predictor.register_buffer('score_threshold_input_pos', torch.tensor(1))
+    for idx, name in enumerate(['class_label', 'class_confidence']):
+        predictor.register_buffer(name + '_indices', torch.tensor([idx]))
+        predictor.register_buffer(name + '_axis', torch.tensor(0))
+    for idx, name in enumerate(class_names):
+        predictor.register_buffer('{}_label'.format(name), torch.tensor(idx))
+    example = (torch.randint(0, 255, (batch_size, image_size, image_size, 3), dtype=torch.uint8), torch.tensor([0.]))
+    with torch.no_grad():
+        model = torch.jit.trace(predictor, example)
+    model.save(str(filename))
+    return filename
@@ -56,4 +56,14 @@ def test_embed_model_property():
     assert metadata['class_names'] == {0: 'cat', 1: 'dog'}
 
     model = dummy_model()
-    assert not check_metadata(model)
\ No newline at end of file
+    assert not check_metadata(model)
+
+def test_parse_metadata_map():
+    model = dummy_model()
+    props = dict(output_format=out_fmt, class_names=class_names, other_prop=1234)
+    model = graph_ops.create_from_args('EmbedModelProperty', props=props)(model)
+    metadata = {prop.key: prop.value for prop in model.metadata_props}
+    model_property = graph_ops.get('EmbedModelProperty')
+    assert model_property.parse_metadata_map(metadata) == model_property.parse(model)
+    with pytest.raises(ValueError):
+        model_property.parse_metadata_map({'other_prop': '1234'})
@@ -0,0 +1,58 @@
+import asyncio
+import cv2
+import pytest
+
+from vortex.runtime import AsyncRuntime
+
+from .dummy_runtime import DummyRuntime, make_image
+
+
+def test_predict_async(tmp_path):
+    model = DummyRuntime(batch_size=4)
+    filenames = []
+    for i in range(3):
+        filenames.append(str(tmp_path / '{}.png'.format(i)))
+        cv2.imwrite(filenames[-1], make_image(i + 10))
+
+    async def run(runtime):
+        loop_alive = asyncio.ensure_future(asyncio.sleep(0))
+        arrays, paths, single = await asyncio.gather(
+            runtime.predict_async([make_image(i) for i in range(6)], score_threshold=0.5),
+            runtime.predict_async(filenames),
+            runtime.predict_async(make_image(7)),
+        )
+        assert loop_alive.done()
+        batch = runtime.model.prepare_batch([make_image(3)])
+        return arrays, paths, single, await runtime.call_async(batch)
+
+    with AsyncRuntime(model) as runtime:
+        arrays, paths, single, called = asyncio.run(run(runtime))
+    assert [r['class_label'][0] for r in arrays] == list(range(6))
+    assert all(r['class_confidence'][0] == pytest.approx(0.5) for r in arrays)
+    assert [r['class_label'][0] for r in paths] == [10, 11, 12]
+    assert len(single) == 1 and single[0]['class_label'][0] == 7
+    assert len(called) == 4 and called[0]['class_label'][0] == 3
+
+
+def test_predict_async_timeout_and_cancel():
+    model = DummyRuntime(batch_size=2, delay=0.2)
+
+    async def run(runtime):
+        running = asyncio.ensure_future(runtime.predict_async([make_image(1)] * 6))
+        queued = asyncio.ensure_future(runtime.predict_async([make_image(2)]))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        with pytest.raises(asyncio.TimeoutError):
+            await runtime.predict_async([make_image(3)], timeout=0.01)
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        running.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+
+    with AsyncRuntime(model, max_concurrency=1) as runtime:
+        asyncio.run(run(runtime))
+    ## queued requests never run, running request stops before its last chunk
+    assert len(model.batches) < 3
+    with pytest.raises(ValueError):
+        AsyncRuntime(model, max_concurrency=0)
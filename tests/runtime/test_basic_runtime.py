@@ -0,0 +1,160 @@
+import numpy as np
+import pytest
+
+from vortex.runtime.basic_runtime import BaseRuntime, BatchArena
+from vortex.runtime.onnx.onnxruntime import OnnxRuntime
+
+from .dummy_runtime import DummyRuntime, make_image
+
+
+def test_resize_batch_shape():
+    images = [make_image(1, size=(20, 30)), make_image(2, size=(7, 5))]
+    ## base runtime input shape is [n,w,h,c]
+    batch = BaseRuntime.resize_batch(images, (3, 16, 8, 3))
+    assert batch.shape == (3, 8, 16, 3)
+    ## onnx runtime input shape is [n,h,w,c]
+    batch = OnnxRuntime.resize_batch(images, (3, 16, 8, 3))
+    assert batch.shape == (3, 16, 8, 3)
+    assert batch.dtype == np.uint8
+    assert np.all(batch[0] == 1) and np.all(batch[1] == 2) and np.all(batch[2] == 0)
+    with pytest.raises(ValueError):
+        BaseRuntime.resize_batch(images * 2, (3, 16, 8, 3))
+
+
+def test_batch_arena_reuse():
+    arena = BatchArena((4, 8, 8, 3), n_buffers=2)
+    first = arena.fill([make_image(i+1) for i in range(4)])
+    second = arena.fill([make_image(9)])
+    assert first is not second
+    assert np.all(first[3] == 4)
+    ## first buffer is reused, stale slots are zeroed
+    third = arena.fill([make_image(5), make_image(6)])
+    assert third is first
+    assert np.all(third[0] == 5) and np.all(third[1] == 6)
+    assert not third[2:].any()
+    assert np.all(second[0] == 9) and not second[1:].any()
+    ## different dtype reallocate buffer
+    fourth = arena.fill([make_image(1).astype(np.float32)])
+    assert fourth.dtype == np.float32 and fourth is not second
+
+
+def test_prepare_batch():
+    model = DummyRuntime(batch_size=2, image_size=8)
+    batch = model.prepare_batch([make_image(3)])
+    assert batch.shape == (2, 8, 8, 3)
+    assert np.all(batch[0] == 3) and not batch[1].any()
+    assert model.prepare_batch([make_image(3)]) is not batch
+    assert model.prepare_batch([make_image(3)]) is batch
+
+
+@pytest.mark.parametrize("resize_kind", ["pad", "scale"])
+def test_resize_keep_ratio(resize_kind):
+    arena = BatchArena((2, 8, 8, 3), n_buffers=1)
+    ## h=10, w=20 -> 4x8 region on 8x8 input
+    batch = arena.fill([make_image(5, size=(10, 20)), make_image(7, size=(8, 8))], resize_kind)
+    top = 2 if resize_kind == "pad" else 0
+    assert np.all(batch[0, top:top+4] == 5)
+    assert not batch[0, :top].any() and not batch[0, top+4:].any()
+    assert np.all(batch[1] == 7)
+    expected = [[1., 2., 0., -top / 4], [1., 1., 0., 0.]]
+    np.testing.assert_allclose(arena.transform, expected)
+
+    ## back to original relative coordinate
+    results = [
+        dict(bounding_box=np.array([[0., top/8, 1., top/8 + .5]]), landmarks=None),
+        dict(bounding_box=np.array([[0., .25, .5, 1.]]), landmarks=np.array([[.5, .5]])),
+    ]
+    results = BaseRuntime.transform_coordinates(results, arena.transform)
+    np.testing.assert_allclose(results[0]['bounding_box'], [[0., 0., 1., 1.]], atol=1e-6)
+    np.testing.assert_allclose(results[1]['bounding_box'], [[0., .25, .5, 1.]])
+    np.testing.assert_allclose(results[1]['landmarks'], [[.5, .5]])
+    assert results[0]['landmarks'] is None
+
+
+def test_resize_kind():
+    with pytest.raises(ValueError):
+        DummyRuntime(resize_kind='crop')
+    model = DummyRuntime(batch_size=2, resize_kind='pad')
+    batch, transform = model.prepare_batch([make_image(3, size=(4, 8))], return_transform=True)
+    assert transform.shape == (1, 4)
+    batch, transform = model.prepare_batch([make_image(3)], resize_kind='stretch', return_transform=True)
+    assert transform is None
+
+
+def test_onnx_runtime_resize_kind(tmp_path):
+    from vortex.runtime import create_runtime_model
+    from .dummy_runtime import make_onnx_model
+
+    filename = make_onnx_model(tmp_path / 'model_pad.onnx', resize_kind='pad')
+    model = create_runtime_model(filename, 'cpu')
+    assert model.resize_kind == 'pad'
+    model = create_runtime_model(filename, 'cpu', resize_kind='scale')
+    assert model.resize_kind == 'scale'
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    model = create_runtime_model(filename, 'cpu')
+    assert model.resize_kind == 'stretch'
+    results = model(model.prepare_batch([make_image(i) for i in range(4)]))
+    assert [int(r['class_label'][0]) for r in results] == list(range(4))
+
+
+def reference_decode(outputs, output_format):
+    ## per-image, per-field np.take
+    results = []
+    for output in outputs:
+        results.append({key: np.take(output, axis=fmt['axis'], indices=fmt['indices'])
+            if all(output.shape) else None for key, fmt in output_format.items()})
+    return results
+
+
+@pytest.mark.parametrize("output_format", [
+    dict(bounding_box=dict(indices=[0, 1, 2, 3], axis=1), class_label=dict(indices=[4], axis=1),
+         class_confidence=dict(indices=[5], axis=1), landmarks=dict(indices=[6, 7, 8, 9], axis=1)),
+    dict(reordered=dict(indices=[3, 1, 0], axis=1), single=dict(indices=2, axis=1)),
+    dict(rows=dict(indices=[1, 2], axis=0), last=dict(indices=[4, 5], axis=-1)),
+])
+def test_decode(output_format):
+    model = DummyRuntime(output_format=output_format)
+    outputs = np.random.rand(3, 7, 10).astype(np.float32)
+    results = model.decode(outputs)
+    expected = reference_decode(outputs, output_format)
+    assert len(results) == 3
+    for result, reference in zip(results, expected):
+        assert list(result.keys()) == sorted(output_format.keys())
+        for key, value in reference.items():
+            np.testing.assert_array_equal(result[key], value)
+    ## per-image list output, e.g. different number of detections
+    outputs = [outputs[0], outputs[1, :3], outputs[2, :0]]
+    results = model.decode(outputs)
+    for result, reference in zip(results, reference_decode(outputs, output_format)):
+        for key, value in reference.items():
+            if value is None:
+                assert result[key] is None
+            else:
+                np.testing.assert_array_equal(result[key], value)
+
+
+def test_decode_batch_views():
+    output_format = dict(bounding_box=dict(indices=[0, 1, 2, 3], axis=1), class_label=dict(indices=[4], axis=1))
+    model = DummyRuntime(output_format=output_format)
+    outputs = np.random.rand(2, 5, 6).astype(np.float32)
+    fields = model.decode_batch(outputs)
+    assert fields['bounding_box'].shape == (2, 5, 4)
+    assert fields['class_label'].shape == (2, 5, 1)
+    assert all(np.shares_memory(field, outputs) for field in fields.values())
+    assert all(value is None for value in model.decode_batch(outputs[:, :0]).values())
+    with pytest.raises(IndexError):
+        DummyRuntime(output_format=dict(x=dict(indices=[5, 6, 7], axis=1))).decode(outputs)
+
+
+def test_decode_padded():
+    output_format = dict(bounding_box=dict(indices=[0, 1, 2, 3], axis=1), class_label=dict(indices=[5], axis=1))
+    model = DummyRuntime(output_format=output_format)
+    outputs = np.random.rand(3, 5, 6).astype(np.float32)
+    n_valid = np.array([5, 2, 0], dtype=np.int64)
+    assert model.is_padded([outputs, n_valid])
+    assert not model.is_padded([outputs[0], outputs[1]])
+    results = model.decode([outputs, n_valid])
+    assert len(results) == 3
+    np.testing.assert_array_equal(results[0]['bounding_box'], outputs[0, :, :4])
+    np.testing.assert_array_equal(results[1]['class_label'], outputs[1, :2, 5:])
+    assert all(value is None for value in results[2].values())
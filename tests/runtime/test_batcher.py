@@ -0,0 +1,121 @@
+import asyncio
+import time
+import numpy as np
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+from vortex.runtime import DynamicBatcher
+
+from .dummy_runtime import DummyRuntime, make_image
+
+
+def test_batcher_full_batch():
+    model = DummyRuntime(batch_size=4, delay=0.01)
+    with DynamicBatcher(model, max_latency=1.0, score_threshold=0.25) as batcher:
+        futures = [batcher.submit(make_image(i)) for i in range(8)]
+        results = [f.result(timeout=5) for f in futures]
+        stats = batcher.stats()
+    for i, result in enumerate(results):
+        assert result['class_label'][0] == i
+        assert result['class_confidence'][0] == pytest.approx(0.25)
+    assert model.batches == [4, 4]
+    assert stats['n_requests'] == 8
+    assert stats['n_batches'] == 2
+    assert stats['fill_ratio'] == pytest.approx(1.0)
+    assert stats['queue_depth'] == 0
+    assert 0 < stats['latency_p50'] <= stats['latency_p99']
+
+
+def test_batcher_deadline_flush():
+    model = DummyRuntime(batch_size=4)
+    with DynamicBatcher(model, max_latency=0.01) as batcher:
+        result = batcher(make_image(7), timeout=5)
+        stats = batcher.stats()
+    assert result['class_label'][0] == 7
+    assert stats['n_batches'] == 1
+    assert stats['fill_ratio'] == pytest.approx(0.25)
+
+
+def test_batcher_threads():
+    model = DummyRuntime(batch_size=4)
+    with DynamicBatcher(model, max_latency=0.005) as batcher:
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda i: batcher(make_image(i)), range(64)))
+        stats = batcher.stats()
+    assert [int(r['class_label'][0]) for r in results] == list(range(64))
+    assert stats['n_requests'] == 64
+    assert sum(model.batches) == 64
+
+
+def test_batcher_asyncio():
+    model = DummyRuntime(batch_size=4)
+
+    async def run(batcher):
+        return await asyncio.gather(*[batcher.predict_async(make_image(i)) for i in range(6)])
+
+    with DynamicBatcher(model, max_latency=0.01) as batcher:
+        results = asyncio.run(run(batcher))
+    assert [int(r['class_label'][0]) for r in results] == list(range(6))
+
+
+def test_batcher_error_and_close():
+    model = DummyRuntime(batch_size=2)
+    batcher = DynamicBatcher(model, max_latency=0.)
+    with pytest.raises(Exception):
+        ## not HWC image
+        batcher(np.zeros((4,), dtype=np.uint8), timeout=5)
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.submit(make_image(0))
+    with pytest.raises(ValueError):
+        DynamicBatcher(model, max_latency=-1)
+
+
+def test_batcher_close_while_submitting():
+    ## every request submitted before close is resolved, the rest are rejected
+    for _ in range(20):
+        batcher = DynamicBatcher(DummyRuntime(batch_size=4), max_latency=0.)
+        futures = []
+        def submit(i):
+            try:
+                futures.append(batcher.submit(make_image(i)))
+            except RuntimeError:
+                pass
+        with ThreadPoolExecutor(4) as executor:
+            for i in range(40):
+                executor.submit(submit, i)
+            batcher.close()
+        for future in futures:
+            assert future.exception(timeout=5) is None or isinstance(future.exception(), RuntimeError)
+
+
+def test_batcher_close_full_queue():
+    model = DummyRuntime(batch_size=1, delay=0.2)
+    batcher = DynamicBatcher(model, max_latency=0., max_queue_size=2)
+    futures = [batcher.submit(make_image(i)) for i in range(3)]
+    ## queue is full while the first batch is running
+    batcher.close(timeout=5)
+    assert not batcher._worker.is_alive()
+    assert futures[0].result(timeout=5)['class_label'][0] == 0
+    for future in futures[1:]:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+
+
+def test_batcher_close_waiting_submitter():
+    model = DummyRuntime(batch_size=1, delay=0.5)
+    batcher = DynamicBatcher(model, max_latency=0., max_queue_size=1)
+    running = batcher.submit(make_image(0))
+    time.sleep(0.1)
+    queued = batcher.submit(make_image(1))
+    with ThreadPoolExecutor(1) as executor:
+        ## blocked on full queue, without holding the lock close needs
+        waiting = executor.submit(batcher.submit, make_image(2))
+        time.sleep(0.1)
+        assert not waiting.done()
+        batcher.close(timeout=5)
+        with pytest.raises(RuntimeError):
+            waiting.result(timeout=5)
+    assert running.result(timeout=5)['class_label'][0] == 0
+    with pytest.raises(RuntimeError):
+        queued.result(timeout=5)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from vortex.runtime.helper import InferenceHelper
+
+from .dummy_runtime import DummyRuntime, make_image
+
+
+@pytest.mark.parametrize("n_images", [1, 4, 10])
+def test_run_inference_chunked(n_images):
+    model = DummyRuntime(batch_size=4)
+    images = [make_image(i) for i in range(n_images)]
+    results = InferenceHelper.run_inference(model, images, score_threshold=0.5)
+    assert isinstance(results, list)
+    assert len(results) == n_images
+    assert [int(r['class_label'][0]) for r in results] == list(range(n_images))
+    assert all(r['class_confidence'][0] == pytest.approx(0.5) for r in results)
+    assert model.batches == [4] * (-(-n_images // 4))
+
+
+def test_run_inference_stream():
+    model = DummyRuntime(batch_size=4)
+    images = (make_image(i) for i in range(9))
+    results = InferenceHelper.run_inference(model, images, stream=True)
+    assert not isinstance(results, list)
+    assert [int(r['class_label'][0]) for r in results] == list(range(9))
+
+
+def test_run_and_visualize_chunked():
+    model = DummyRuntime(batch_size=4)
+    images = [make_image(i) for i in range(6)]
+    results = InferenceHelper.run_and_visualize(model, images)
+    assert len(results['prediction']) == 6
+    assert results['runtime'] > 0
+
+    results = InferenceHelper.run_and_visualize(model, iter(images), stream=True)
+    results = list(results)
+    assert [len(r['prediction']) for r in results] == [4, 2]
+    predictions = [p for r in results for p in r['prediction']]
+    assert [int(p['class_label'][0]) for p in predictions] == list(range(6))
+
+
+def test_helper_executor():
+    model = DummyRuntime(batch_size=4)
+    images = [make_image(i) for i in range(6)]
+    with InferenceHelper(model) as helper:
+        executor = helper.executor
+        for _ in range(3):
+            results = helper(images)
+            assert [int(p['class_label'][0]) for p in results['prediction']] == list(range(6))
+        ## inference thread is created once per helper
+        assert helper.executor is executor and len(executor._threads) == 1
+    with pytest.raises(RuntimeError):
+        executor.submit(print)
+
+
+def test_adjust_coordinates():
+    batch_vis = [make_image(0, size=(10, 20)), make_image(0, size=(4, 4))]
+    results = [
+        dict(bounding_box=np.array([[0., .25, 1., .75]])),
+        dict(bounding_box=np.array([[.5, .5, 1., 1.]]), landmarks=np.array([[.25, .5]])),
+    ]
+    transforms = [[1., 2., 0., -.5], [1., 1., 0., 0.]]
+    results = InferenceHelper.adjust_coordinates(batch_vis, results, transforms=transforms)
+    np.testing.assert_allclose(results[0]['bounding_box'], [[0., 0., 20., 10.]])
+    np.testing.assert_allclose(results[1]['bounding_box'], [[2., 2., 4., 4.]])
+    np.testing.assert_allclose(results[1]['landmarks'], [[1., 2.]])
+
+    results = [dict(bounding_box=np.array([[.5, .5, 1., 1.]]))]
+    results = InferenceHelper.adjust_coordinates(batch_vis, results, coordinate_fmt='absolute')
+    np.testing.assert_allclose(results[0]['bounding_box'], [[.5, .5, 1., 1.]])
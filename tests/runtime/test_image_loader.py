@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+import pytest
+
+from pathlib import Path
+from vortex.runtime import ImageLoader
+from vortex.runtime.helper import InferenceHelper
+
+from .dummy_runtime import DummyRuntime, make_image
+
+
+def write_image(path, value, size=(10, 12)):
+    cv2.imwrite(str(path), make_image(value, size=size))
+    return path
+
+
+def test_load_mixed_inputs(tmp_path):
+    _, encoded = cv2.imencode('.png', make_image(3))
+    images = [
+        str(write_image(tmp_path / '0.png', 0)),
+        write_image(tmp_path / '1.png', 1),
+        make_image(2),
+        encoded.tobytes(),
+    ] * 3
+    loader = ImageLoader(n_workers=3, prefetch=1)
+    loaded = loader.load(images)
+    assert [int(image[0, 0, 0]) for image in loaded] == [0, 1, 2, 3] * 3
+    assert all(image.shape == (10, 12, 3) for image in loaded)
+    assert loaded[2] is images[2]
+
+    batches = list(loader.batches(iter(images), batch_size=5))
+    assert [len(decoded) for _, decoded in batches] == [5, 5, 2]
+    assert [image for inputs, _ in batches for image in inputs] == images
+    assert [int(image[0, 0, 0]) for _, decoded in batches for image in decoded] == [0, 1, 2, 3] * 3
+    stats = loader.stats()
+    assert stats['n_images'] == 24
+    assert stats['decode_time'] > 0 and stats['wait_time'] >= 0
+
+
+def test_load_errors(tmp_path):
+    loader = ImageLoader()
+    with pytest.raises(FileNotFoundError):
+        loader.load([tmp_path / 'missing.png'])
+    with pytest.raises(ValueError):
+        loader.load([b'not an image'])
+    with pytest.raises(ValueError):
+        loader.load([np.zeros((4, 4), dtype=np.uint8)])
+    with pytest.raises(TypeError):
+        loader.load([1])
+    with pytest.raises(ValueError):
+        ImageLoader(n_workers=0)
+
+
+def test_reduced_decode(tmp_path):
+    filename = write_image(tmp_path / 'large.jpg', 100, size=(640, 800))
+    loader = ImageLoader(min_size=(100, 100))
+    assert loader.load([filename, filename])[1].shape == (160, 200, 3)
+    loader = ImageLoader(min_size=(700, 600))
+    assert loader.load([filename])[0].shape == (640, 800, 3)
+
+
+def test_run_and_visualize_loader(tmp_path):
+    model = DummyRuntime(batch_size=4)
+    images = [str(write_image(tmp_path / '{}.png'.format(i), i)) for i in range(6)]
+    images[3] = make_image(3)
+    results = InferenceHelper.run_and_visualize(model, images, loader=ImageLoader(n_workers=2))
+    assert [int(r['class_label'][0]) for r in results['prediction']] == list(range(6))
+    assert set(results['timings']) == {'load', 'inference', 'postprocess'}
+    assert results['timings']['inference'] == pytest.approx(results['runtime'])
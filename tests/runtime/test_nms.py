@@ -0,0 +1,143 @@
+import numpy as np
+import pytest
+import torch
+import torchvision
+
+from collections import OrderedDict
+
+from vortex.runtime import create_runtime_model
+from vortex.runtime.basic_runtime import BaseRuntime
+from vortex.runtime.nms import nms, batched_nms, apply_nms
+
+from .dummy_runtime import make_onnx_model
+
+
+def make_boxes(n, seed=0, size=100.):
+    rng = np.random.RandomState(seed)
+    xy = rng.uniform(0, size, (n, 2))
+    wh = rng.uniform(1, size / 4, (n, 2))
+    boxes = np.concatenate([xy, xy + wh], axis=1).astype(np.float32)
+    scores = rng.uniform(0, 1, n).astype(np.float32)
+    return boxes, scores
+
+
+@pytest.mark.parametrize('iou_threshold', [0.3, 0.5, 0.7])
+def test_nms(iou_threshold):
+    boxes, scores = make_boxes(500)
+    expected = torchvision.ops.nms(torch.from_numpy(boxes), torch.from_numpy(scores), iou_threshold)
+    np.testing.assert_array_equal(nms(boxes, scores, iou_threshold), expected.numpy())
+
+
+@pytest.mark.parametrize('max_matrix_size', [1 << 22, 2000])
+def test_batched_nms(monkeypatch, max_matrix_size):
+    ## small matrix size, larger groups are suppressed with greedy loop
+    monkeypatch.setattr('vortex.runtime.nms.max_matrix_size', max_matrix_size)
+    boxes, scores = make_boxes(500)
+    idxs = np.random.RandomState(1).randint(0, 5, len(boxes))
+    expected = torchvision.ops.batched_nms(torch.from_numpy(boxes), torch.from_numpy(scores),
+        torch.from_numpy(idxs), 0.5)
+    np.testing.assert_array_equal(batched_nms(boxes, scores, idxs, 0.5), expected.numpy())
+    assert batched_nms(boxes[:0], scores[:0], idxs[:0], 0.5).shape == (0,)
+
+
+def make_results(n_images, n_boxes=200, n_classes=3):
+    results = []
+    for i in range(n_images):
+        boxes, scores = make_boxes(n_boxes, seed=i)
+        labels = np.random.RandomState(i).randint(0, n_classes, (n_boxes, 1)).astype(np.float32)
+        results.append(OrderedDict(
+            bounding_box=boxes, class_confidence=scores[:,None], class_label=labels,
+            landmarks=np.tile(boxes, 2),
+        ))
+    return results
+
+
+def reference_nms(result, iou_threshold, score_threshold, pre_nms_topk, max_detections):
+    scores = result['class_confidence'][:,0]
+    index = np.flatnonzero(scores > score_threshold)
+    if pre_nms_topk:
+        index = index[np.argsort(-scores[index], kind='stable')[:pre_nms_topk]]
+    keep = torchvision.ops.batched_nms(torch.from_numpy(result['bounding_box'][index]),
+        torch.from_numpy(scores[index]), torch.from_numpy(result['class_label'][index,0]).long(),
+        iou_threshold).numpy()
+    if max_detections:
+        keep = keep[:max_detections]
+    return index[keep]
+
+
+@pytest.mark.parametrize('pre_nms_topk,max_detections', [(0, 0), (50, 0), (0, 10), (50, 10)])
+def test_apply_nms(pre_nms_topk, max_detections):
+    results = make_results(3)
+    ## image without candidates
+    results.append(OrderedDict((key, None) for key in results[0]))
+    outputs = apply_nms(results, iou_threshold=0.5, score_threshold=0.2,
+        pre_nms_topk=pre_nms_topk, max_detections=max_detections)
+    assert len(outputs) == len(results)
+    for result, output in zip(results[:-1], outputs[:-1]):
+        index = reference_nms(result, 0.5, 0.2, pre_nms_topk, max_detections)
+        assert list(output.keys()) == list(result.keys())
+        for key, value in result.items():
+            np.testing.assert_array_equal(output[key], value[index])
+    assert all(value is None for value in outputs[-1].values())
+
+    ## nothing above threshold
+    outputs = apply_nms(results[:1], score_threshold=1.)
+    assert all(value is None for value in outputs[0].values())
+
+
+class CandidateRuntime(BaseRuntime):
+    """returns the given candidates of each image, as model exported without nms
+    """
+    def __init__(self, candidates, runtime_nms=True):
+        super().__init__(
+            input_specs=OrderedDict(input=dict(shape=[len(candidates), 8, 8, 3], type='uint8')),
+            output_name='output',
+            output_format=dict(
+                bounding_box=dict(indices=[0, 1, 2, 3], axis=1),
+                class_confidence=dict(indices=[4], axis=1),
+                class_label=dict(indices=[5], axis=1),
+            ),
+            class_names=['a', 'b', 'c'],
+            runtime_nms=runtime_nms,
+        )
+        self.candidates = candidates
+
+    def predict(self, x) -> np.ndarray:
+        return self.candidates
+
+    @staticmethod
+    def is_available():
+        return True
+
+
+def test_runtime_nms():
+    results = make_results(2)
+    candidates = np.stack([
+        np.concatenate([r['bounding_box'], r['class_confidence'], r['class_label']], axis=1) for r in results
+    ])
+    batch = np.zeros((2, 8, 8, 3), dtype=np.uint8)
+    outputs = CandidateRuntime(candidates)(batch, iou_threshold=0.4, score_threshold=0.3, max_detections=5)
+    for result, output in zip(results, outputs):
+        index = reference_nms(result, 0.4, 0.3, 0, 5)
+        np.testing.assert_array_equal(output['bounding_box'], result['bounding_box'][index])
+        np.testing.assert_array_equal(output['class_label'], result['class_label'][index])
+
+    ## embedded nms strategy, scores are decayed instead of discarded
+    model = CandidateRuntime(candidates)
+    model.nms_strategy = dict(name='soft_linear', min_score=0.1)
+    outputs = model(batch, iou_threshold=0.4, score_threshold=0.3)
+    for result, output in zip(results, outputs):
+        assert len(output['bounding_box']) > len(reference_nms(result, 0.4, 0.3, 0, 0))
+        assert np.all(output['class_confidence'] >= 0.1)
+        assert np.all(np.diff(output['class_confidence'][:,0]) <= 0)
+
+    ## nms arguments are ignored when model already has nms
+    outputs = CandidateRuntime(candidates, runtime_nms=False)(batch, iou_threshold=0.4)
+    assert len(outputs[0]['bounding_box']) == len(candidates[0])
+
+
+@pytest.mark.parametrize('runtime_nms', [True, False])
+def test_runtime_nms_property(tmp_path, runtime_nms):
+    props = dict(runtime_nms=True) if runtime_nms else {}
+    filename = make_onnx_model(tmp_path / 'model.onnx', **props)
+    assert create_runtime_model(filename, 'cpu').runtime_nms == runtime_nms
@@ -0,0 +1,195 @@
+import numpy as np
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+
+from vortex.runtime import create_runtime_model
+
+from .dummy_runtime import make_onnx_model, make_image
+
+
+@pytest.mark.parametrize("dynamic_output", [False, True])
+def test_io_binding(tmp_path, dynamic_output):
+    filename = make_onnx_model(tmp_path / 'model.onnx', dynamic_output=dynamic_output)
+    model = create_runtime_model(filename, 'cpu')
+    bound_model = create_runtime_model(filename, 'cpu', io_binding=True)
+    assert model.io_binding is None
+    assert bound_model.io_binding is not None
+    assert bool(bound_model.output_buffers) != dynamic_output
+
+    previous = None
+    for values in [range(4), range(10, 13)]:
+        images = [make_image(i) for i in values]
+        expected = model.predict(model.prepare_batch(images))
+        output = bound_model.predict(bound_model.prepare_batch(images))
+        np.testing.assert_allclose(output, expected)
+        results = bound_model(bound_model.prepare_batch(images))
+        assert [int(r['class_label'][0]) for r in results[:len(images)]] == list(values)
+        ## decoded results are not overwritten by the next run
+        if previous is not None:
+            assert [int(r['class_label'][0]) for r in previous[:4]] == list(range(4))
+        previous = results
+
+    first = bound_model.predict(bound_model.prepare_batch(images))
+    second = bound_model.predict(bound_model.prepare_batch(images))
+    ## static output buffer is reused
+    assert (first is second) != dynamic_output
+
+
+def test_io_binding_threads(tmp_path):
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    model = create_runtime_model(filename, 'cpu', io_binding=True)
+    batches = [model.prepare_batch([make_image(i)] * 4).copy() for i in range(8)]
+
+    ## each thread has its own binding and output buffers
+    def run(i):
+        return [[int(r['class_label'][0]) for r in model(batches[i % 8])] for _ in range(50)]
+    with ThreadPoolExecutor(8) as executor:
+        outputs = list(executor.map(run, range(8)))
+    for i, labels in enumerate(outputs):
+        assert labels == [[i] * 4] * 50
+    assert model.io_binding is not None and model.output_buffers
+
+
+def test_io_binding_unsupported(tmp_path, monkeypatch):
+    ## e.g. onnxruntime 1.3.0, without copying outputs to cpu
+    from onnxruntime.capi.onnxruntime_inference_collection import IOBinding
+    monkeypatch.delattr(IOBinding, 'copy_outputs_to_cpu')
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    model = create_runtime_model(filename, 'cpu', io_binding=True)
+    assert model.io_binding is None and not model.output_reused
+    results = model(model.prepare_batch([make_image(i) for i in range(4)]))
+    assert [int(r['class_label'][0]) for r in results] == list(range(4))
+
+
+def test_session_options(tmp_path):
+    from vortex.runtime.onnx import OnnxRuntimeOptions
+
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    options = OnnxRuntimeOptions(intra_op_num_threads=1, inter_op_num_threads=1,
+        graph_optimization_level='enable_all', enable_cpu_mem_arena=False)
+    model = create_runtime_model(filename, 'cpu', options=options)
+    assert model.options == options
+    assert model.session.get_session_options().intra_op_num_threads == 1
+    assert not model.session.get_session_options().enable_cpu_mem_arena
+    model = create_runtime_model(filename, 'cpu', options=dict(execution_mode='parallel'))
+    assert model.options.execution_mode == 'parallel'
+    with pytest.raises(ValueError):
+        create_runtime_model(filename, 'cpu', options=dict(graph_optimization_level='max'))
+
+
+def test_session_config_entries_unsupported(tmp_path, monkeypatch, caplog):
+    ## e.g. onnxruntime 1.3.0
+    import onnxruntime
+    monkeypatch.delattr(onnxruntime.SessionOptions, 'add_session_config_entry')
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    model = create_runtime_model(filename, 'cpu', options=dict(config_entries={'session.set_denormal_as_zero': '1'}))
+    assert 'session.set_denormal_as_zero' in caplog.text
+    results = model(model.prepare_batch([make_image(i) for i in range(4)]))
+    assert [int(r['class_label'][0]) for r in results] == list(range(4))
+
+
+def test_optimized_graph_cache(tmp_path):
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    cache_dir = tmp_path / 'cache'
+    options = dict(graph_optimization_level='all', cache_dir=str(cache_dir))
+    model = create_runtime_model(filename, 'cpu', options=options)
+    cached = list(cache_dir.iterdir())
+    assert len(cached) == 1 and cached[0].suffix == '.onnx'
+    assert cached[0].name.startswith('model.')
+
+    ## second session is created from cache
+    cached_model = create_runtime_model(filename, 'cpu', options=options)
+    assert list(cache_dir.iterdir()) == cached
+    images = [make_image(i) for i in range(4)]
+    np.testing.assert_allclose(
+        cached_model.predict(cached_model.prepare_batch(images)),
+        model.predict(model.prepare_batch(images))
+    )
+    assert cached_model.class_names == model.class_names
+
+    ## different options, different cache
+    create_runtime_model(filename, 'cpu', options=dict(options, graph_optimization_level='basic'))
+    assert len(list(cache_dir.iterdir())) == 2
+
+
+def test_optimized_graph_cache_key(tmp_path):
+    from vortex.runtime.onnx import OnnxRuntimeOptions
+    from vortex.runtime.onnx.onnxruntime import OnnxRuntime
+
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    providers = ['CPUExecutionProvider']
+    key = lambda **kwargs: OnnxRuntime.cache_key(filename, providers, OnnxRuntimeOptions(**kwargs))
+    ## config entries change the optimized graph
+    assert key() != key(config_entries={'optimization.disable_specified_optimizers': 'ConstantFolding'})
+    assert key(graph_optimization_level='all') == key(graph_optimization_level=99)
+    assert key() != key(execution_mode='parallel')
+    ## threads and thread affinities don't
+    assert key() == key(intra_op_num_threads=2, config_entries={'session.intra_op_thread_affinities': '1;2'})
+
+
+def test_optimized_graph_cache_threads(tmp_path):
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    cache_dir = tmp_path / 'cache'
+    options = dict(graph_optimization_level='all', cache_dir=str(cache_dir))
+    ## sessions created at once in this process write their own temporary file
+    with ThreadPoolExecutor(4) as executor:
+        models = list(executor.map(lambda _: create_runtime_model(filename, 'cpu', options=options), range(8)))
+    cached = list(cache_dir.iterdir())
+    assert len(cached) == 1 and cached[0].suffix == '.onnx'
+    images = [make_image(i) for i in range(4)]
+    for model in models:
+        assert [int(r['class_label'][0]) for r in model(model.prepare_batch(images))] == list(range(4))
+
+
+def test_properties_from_session(tmp_path, monkeypatch):
+    import onnx
+    from vortex.runtime.onnx.graph_ops.embed_model_property import parse_model_property
+
+    filename = make_onnx_model(tmp_path / 'model.onnx', resize_kind='pad')
+    expected = parse_model_property(onnx.load(str(filename)))
+    ## model's protobuf should only be loaded by onnxruntime
+    monkeypatch.setattr(onnx, 'load', lambda *args, **kwargs: pytest.fail("onnx.load called"))
+    model = create_runtime_model(filename, 'cpu')
+    assert model.class_names == expected['class_names']
+    assert model.output_format == expected['output_format']
+    assert model.resize_kind == 'pad'
+    assert model.input_specs['input'] == dict(shape=[4, 8, 8, 3], type='uint8')
+    assert set(model.properties) == {'class_labels', 'output.class_label',
+        'output.class_confidence', 'resize_kind'}
+
+
+@pytest.mark.parametrize("io_binding", [False, True])
+def test_padded_output(tmp_path, io_binding):
+    import onnx
+    from onnx import helper, numpy_helper, TensorProto
+    from vortex.runtime.onnx.graph_ops.embed_model_property import embed_model_property
+
+    ## padded detections of each image and its number of valid detections
+    detections = np.random.rand(2, 3, 6).astype(np.float32)
+    n_valid = np.array([1, 0], dtype=np.int64)
+    nodes = [
+        helper.make_node('Constant', [], ['output'], value=numpy_helper.from_array(detections)),
+        helper.make_node('Constant', [], ['n_valid'], value=numpy_helper.from_array(n_valid)),
+    ]
+    graph = helper.make_graph(nodes, 'padded',
+        [helper.make_tensor_value_info('input', TensorProto.UINT8, [2, 8, 8, 3])],
+        [helper.make_tensor_value_info('output', TensorProto.FLOAT, [2, 3, 6]),
+         helper.make_tensor_value_info('n_valid', TensorProto.INT64, [2])])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', 13)])
+    model.ir_version = 7
+    model = embed_model_property(model, dict(
+        output_format=dict(bounding_box=dict(indices=[0, 1, 2, 3], axis=1), class_label=dict(indices=[5], axis=1)),
+        class_names=['a'],
+    ))
+    filename = tmp_path / 'padded.onnx'
+    onnx.save(model, str(filename))
+
+    model = create_runtime_model(filename, 'cpu', io_binding=io_binding)
+    assert model.output_name == ['output']
+    output, valid = model.predict(model.prepare_batch([make_image(0)]))
+    np.testing.assert_array_equal(output, detections)
+    np.testing.assert_array_equal(valid, n_valid)
+    results = model(model.prepare_batch([make_image(0)]))
+    np.testing.assert_array_equal(results[0]['bounding_box'], detections[0, :1, :4])
+    assert results[1]['bounding_box'] is None
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from concurrent.futures import ThreadPoolExecutor
+from vortex.runtime import RuntimePool, create_runtime_model
+from vortex.runtime.helper import InferenceHelper
+
+from .dummy_runtime import make_onnx_model, make_image
+
+
+@pytest.mark.parametrize("policy", ["round_robin", "least_loaded"])
+def test_pool_predict(tmp_path, policy):
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    model = create_runtime_model(filename, 'cpu')
+    with RuntimePool(filename, 'cpu', n_sessions=3, policy=policy) as pool:
+        assert pool.input_specs == model.input_specs
+        assert pool.output_format == model.output_format
+        assert pool.class_names == model.class_names
+        assert pool.properties == model.properties
+        assert all(session.options.intra_op_num_threads >= 1 for session in pool.sessions)
+
+        batches = [model.resize_batch([make_image(i + j) for j in range(4)],
+            model.input_specs['input']['shape']) for i in range(6)]
+        expected = [model(batch) for batch in batches]
+        results = [pool(batch) for batch in batches]
+        futures = [pool.submit(batch) for batch in batches]
+        for result, future, reference in zip(results, futures, expected):
+            for r, f, e in zip(result, future.result(timeout=5), reference):
+                np.testing.assert_allclose(r['class_label'], e['class_label'])
+                np.testing.assert_allclose(f['class_label'], e['class_label'])
+        stats = pool.stats()
+    assert sum(stats['n_dispatched']) == 12
+    assert stats['in_flight'] == [0, 0, 0]
+    if policy == 'round_robin':
+        assert stats['n_dispatched'] == [4, 4, 4]
+
+
+def test_pool_threads(tmp_path):
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    with RuntimePool(filename, 'cpu', n_sessions=2, cpu_sets=[[0], [0]]) as pool:
+        def run(i):
+            ## input buffer is per thread
+            batch = pool.prepare_batch([make_image(i)] * 4)
+            return pool(batch)[0]['class_label'][0]
+        with ThreadPoolExecutor(4) as executor:
+            labels = list(executor.map(run, range(32)))
+        assert labels == pytest.approx(list(range(32)))
+
+        results = InferenceHelper.run_inference(pool, [make_image(i) for i in range(10)])
+        assert [r['class_label'][0] for r in results] == pytest.approx(list(range(10)))
+
+
+def test_partition_cpus():
+    assert RuntimePool.partition_cpus(2, None) == [None, None]
+    assert RuntimePool.partition_cpus(2, [[0, 1], (2, 3)]) == [[0, 1], [2, 3]]
+    cpus = RuntimePool.partition_cpus(1, 'cores')
+    assert len(cpus) == 1 and len(cpus[0]) >= 1
+    cpus = RuntimePool.partition_cpus(1, 'numa')
+    assert len(cpus) == 1 and len(cpus[0]) >= 1
+    with pytest.raises(ValueError):
+        RuntimePool.partition_cpus(2, [[0]])
+    with pytest.raises(ValueError):
+        RuntimePool.partition_cpus(2, 'sockets')
+
+    options = RuntimePool._onnx_options(dict(graph_optimization_level='all'), 3, [4, 5, 6])
+    assert options.intra_op_num_threads == 3
+    assert options.inter_op_num_threads == 1
+    assert options.graph_optimization_level == 'all'
+    assert options.config_entries == {'session.intra_op_thread_affinities': '6;7'}
+
+
+def test_onnx_options_old_onnxruntime(monkeypatch, caplog):
+    ## intra-op thread affinity isn't supported, only the worker thread is pinned
+    import logging
+    import onnxruntime
+    monkeypatch.setattr(onnxruntime, '__version__', '1.3.0')
+    with caplog.at_level(logging.INFO):
+        options = RuntimePool._onnx_options(None, 3, [4, 5, 6])
+    assert options.intra_op_num_threads == 3
+    assert options.config_entries == {}
+    assert 'onnxruntime>=1.14' in caplog.text
+
+
+def test_pool_invalid(tmp_path):
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    with pytest.raises(ValueError):
+        RuntimePool(filename, 'cpu', policy='random')
+    with pytest.raises(ValueError):
+        RuntimePool(filename, 'cpu', n_sessions=0)
+    with pytest.raises(RuntimeError):
+        RuntimePool(filename, 'openvino')
+
+
+def test_pool_io_binding(tmp_path):
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    with RuntimePool(filename, 'cpu', n_sessions=1, io_binding=True) as pool:
+        assert pool.sessions[0].output_reused and not pool.output_reused
+        ## session's output buffer is copied by its worker, not overwritten by the next batch
+        batches = [pool.resize_batch([make_image(i)] * 4, pool.input_specs['input']['shape']) for i in range(2)]
+        first = pool.predict(batches[0])
+        second = pool.predict(batches[1])
+        assert first is not second
+        assert [int(r['class_label'][0]) for r in pool.decode(first)] == [0] * 4
+        futures = [pool.submit(batches[i % 2]) for i in range(8)]
+        for i, future in enumerate(futures):
+            assert [int(r['class_label'][0]) for r in future.result(timeout=5)] == [i % 2] * 4
+
+
+def test_pool_resize_batch(tmp_path):
+    from vortex.runtime.basic_runtime import BaseRuntime
+    from vortex.runtime.onnx.onnxruntime import OnnxRuntime
+
+    filename = make_onnx_model(tmp_path / 'model.onnx')
+    images = [make_image(i) for i in range(4)]
+    with RuntimePool(filename, 'cpu', n_sessions=1) as pool:
+        ## non-square input, batch shape of the sessions' runtime
+        batch = pool.resize_batch(images, (4, 8, 6, 3))
+        assert batch.shape == OnnxRuntime.resize_batch(images, (4, 8, 6, 3)).shape == (4, 8, 6, 3)
+        assert batch.shape != BaseRuntime.resize_batch(images, (4, 8, 6, 3)).shape
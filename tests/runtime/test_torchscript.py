@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from vortex.runtime import create_runtime_model
+
+from .dummy_runtime import make_torchscript_model, make_image
+
+torch = pytest.importorskip('torch')
+
+
+@pytest.mark.parametrize("options", [
+    dict(optimize=True),
+    dict(channels_last=True),
+    dict(optimize=True, channels_last=True),
+    dict(dtype='bfloat16'),
+])
+def test_options(tmp_path, options):
+    filename = make_torchscript_model(tmp_path / 'model.pt')
+    model = create_runtime_model(filename, 'cpu')
+    optimized = create_runtime_model(filename, 'cpu', **options)
+    assert optimized.input_specs == model.input_specs
+    assert optimized.output_format == model.output_format
+    assert optimized.class_names == model.class_names == ['a', 'b', 'c']
+
+    images = [make_image(i * 60, size=(8, 8)) for i in range(4)]
+    batch = model.prepare_batch(images)
+    expected = model.predict(batch, score_threshold=np.array([0.], dtype=np.float32))
+    output = optimized.predict(batch, score_threshold=np.array([0.], dtype=np.float32))
+    tolerance = 1e-2 if 'dtype' in options else 1e-5
+    np.testing.assert_allclose(output, expected, atol=tolerance)
+
+    with pytest.raises(ValueError):
+        create_runtime_model(filename, 'cpu', dtype='int8')
+
+
+def test_cached_inputs(tmp_path):
+    filename = make_torchscript_model(tmp_path / 'model.pt')
+    model = create_runtime_model(filename, 'cpu')
+    batch = model.prepare_batch([make_image(i) for i in range(4)])
+    model(batch, score_threshold=np.array([0.5], dtype=np.float32))
+    model(batch, score_threshold=np.array([0.5], dtype=np.float32))
+    assert len(model._cached_inputs) == 1
+    results = model(batch, score_threshold=np.array([1.], dtype=np.float32))
+    assert len(model._cached_inputs) == 2
+    assert all(r['class_confidence'][0] == 0 for r in results)
+
+
+def test_tuple_output():
+    from vortex.runtime.torchscript import TorchScriptRuntime
+
+    outputs = (torch.arange(6.).reshape(2, 3), torch.ones(3, 3), torch.zeros(0, 3))
+    converted = TorchScriptRuntime._to_numpy(outputs)
+    assert [out.shape for out in converted] == [(2, 3), (3, 3), (0, 3)]
+    for out, expected in zip(converted, outputs):
+        np.testing.assert_array_equal(out, expected.numpy())
+    ## merged into single copy from non-cpu device
+    converted = TorchScriptRuntime._to_numpy(outputs, torch.device('cuda'))
+    for out, expected in zip(converted, outputs):
+        np.testing.assert_array_equal(out, expected.numpy())
+    ## different trailing shape, converted separately
+    converted = TorchScriptRuntime._to_numpy((torch.ones(2, 3), torch.ones(2)))
+    assert [out.shape for out in converted] == [(2, 3), (2,)]
+    ## reduced precision output
+    converted = TorchScriptRuntime._to_numpy((torch.ones(2, 3, dtype=torch.bfloat16), torch.ones(2)))
+    assert [out.dtype for out in converted] == [np.float32, np.float32]
+
+
+def test_bfloat16_output(tmp_path):
+    ## output of linear layer stays in bfloat16 under autocast
+    filename = make_torchscript_model(tmp_path / 'model.pt', linear_output=True)
+    model = create_runtime_model(filename, 'cpu')
+    converted = create_runtime_model(filename, 'cpu', dtype='bfloat16')
+    batch = model.prepare_batch([make_image(i * 60, size=(8, 8)) for i in range(4)])
+    expected = model.predict(batch, score_threshold=np.array([0.], dtype=np.float32))
+    output = converted.predict(batch, score_threshold=np.array([0.], dtype=np.float32))
+    assert output.dtype == np.float32
+    np.testing.assert_allclose(output, expected, atol=1e-2)
+    results = converted(batch, score_threshold=np.array([0.], dtype=np.float32))
+    assert len(results) == 4
+
+
+def test_options_unsupported_torch(tmp_path, monkeypatch):
+    filename = make_torchscript_model(tmp_path / 'model.pt')
+    ## e.g. on torch 1.6
+    monkeypatch.delattr(torch, 'autocast')
+    monkeypatch.delattr(torch.jit, 'optimize_for_inference')
+    with pytest.raises(RuntimeError):
+        create_runtime_model(filename, 'cpu', dtype='bfloat16')
+    with pytest.raises(RuntimeError):
+        create_runtime_model(filename, 'cpu', optimize=True)
+    assert create_runtime_model(filename, 'cpu').dtype == 'float32'
+
+
+@pytest.mark.parametrize("device", [
+    'cpu',
+    pytest.param('cuda', marks=pytest.mark.skipif(not torch.cuda.is_available(), reason="requires cuda")),
+])
+def test_threads(tmp_path, device):
+    from concurrent.futures import ThreadPoolExecutor
+
+    filename = make_torchscript_model(tmp_path / 'model.pt')
+    model = create_runtime_model(filename, device)
+    batches = [model.prepare_batch([make_image(i * 30, size=(8, 8))] * 4).copy() for i in range(8)]
+    expected = [model.predict(batch, score_threshold=np.array([0.], dtype=np.float32)) for batch in batches]
+
+    ## each thread stages its input in its own buffer
+    def run(i):
+        return [model.predict(batches[i], score_threshold=np.array([0.], dtype=np.float32)) for _ in range(20)]
+    with ThreadPoolExecutor(8) as executor:
+        outputs = list(executor.map(run, range(8)))
+    for output, reference in zip(outputs, expected):
+        for out in output:
+            np.testing.assert_allclose(out, reference, atol=1e-5)
@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+import pytest
+
+from vortex.runtime import VideoStream
+from vortex.runtime.helper import InferenceHelper
+
+from .dummy_runtime import DummyRuntime, make_image
+
+
+def write_video(filename, n_frames, fps=10.):
+    writer = cv2.VideoWriter(str(filename), cv2.VideoWriter_fourcc(*'MJPG'), fps, (16, 12))
+    for i in range(n_frames):
+        writer.write(make_image(i * 10, size=(12, 16)))
+    writer.release()
+    return filename
+
+
+def test_video_file(tmp_path):
+    filename = write_video(tmp_path / 'video.avi', 10)
+    model = DummyRuntime(batch_size=4)
+    stream = InferenceHelper.run_video(model, filename, score_threshold=0.5)
+    outputs = list(stream)
+    assert [idx for idx, _, _ in outputs] == list(range(10))
+    assert [ts for _, ts, _ in outputs] == pytest.approx([i * 0.1 for i in range(10)])
+    ## lossy encoded
+    assert [r['class_label'][0] for _, _, r in outputs] == pytest.approx([i * 10 for i in range(10)], abs=2)
+    assert all(r['class_confidence'][0] == pytest.approx(0.5) for _, _, r in outputs)
+    stats = stream.stats()
+    assert stats['n_frames'] == 10 and stats['n_dropped'] == 0
+    assert stats['fps'] > 0
+    assert 0 < stats['latency_p50'] <= stats['latency_p99']
+    assert stats['inference_p50'] > 0
+    assert stats['n_batches'] == len(model.batches) >= 3
+
+
+def test_frame_iterable_drop_frames():
+    model = DummyRuntime(batch_size=2, delay=0.05)
+    frames = [make_image(i) for i in range(20)]
+    stream = VideoStream(model, frames, queue_size=2, drop_frames=True)
+    outputs = list(stream)
+    indices = [idx for idx, _, _ in outputs]
+    stats = stream.stats()
+    assert stats['n_dropped'] > 0
+    assert stats['n_frames'] + stats['n_dropped'] == 20
+    assert indices == sorted(indices) and indices[-1] == 19
+    assert all(r['class_label'][0] == idx for idx, _, r in outputs)
+
+    ## without dropping, every frame is processed
+    stream = VideoStream(DummyRuntime(batch_size=2), frames, queue_size=2)
+    assert [idx for idx, _, _ in stream] == list(range(20))
+
+
+def test_video_stop_early_and_errors(tmp_path):
+    model = DummyRuntime(batch_size=2)
+    stream = VideoStream(model, (make_image(i) for i in range(1000)))
+    for idx, _, _ in stream:
+        if idx == 5:
+            break
+    with pytest.raises(RuntimeError):
+        list(VideoStream(model, tmp_path / 'missing.avi'))
+    with pytest.raises(Exception):
+        ## not HWC frame
+        list(VideoStream(model, [np.zeros((4,), dtype=np.uint8)]))
@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+import pytest
+
+from vortex.runtime.helper import Visual
+from vortex.runtime.visual import VisualRenderer
+
+class_names = ['person', 'bicycle', 'traffic light']
+
+
+def reference_draw(vis, result, color_map=VisualRenderer.colors, class_names=None):
+    """draw each item with cv2; boxes grouped by color then labels, text without antialiasing"""
+    def draw_label(obj_class, confidence, bl):
+        class_name = class_names[obj_class] if class_names else 'class_{}'.format(obj_class)
+        mask = np.zeros(vis.shape[:2], dtype=np.uint8)
+        cv2.putText(mask, '{0} : {1:.2f}'.format(class_name, confidence), bl, cv2.FONT_HERSHEY_SIMPLEX, 1, 255, 2)
+        vis[mask >= 128] = color_map[obj_class] if vis.ndim == 3 else color_map[obj_class][0]
+    labels = result['class_label'][:,0].astype(int)
+    confidences = result['class_confidence'][:,0]
+    if 'bounding_box' in result:
+        boxes = result['bounding_box'].astype(int).tolist()
+        for color in dict.fromkeys(color_map[label] for label in labels):
+            for (x1, y1, x2, y2), label in zip(boxes, labels):
+                if color_map[label] == color:
+                    cv2.rectangle(vis, (x1, y1), (x2, y2), color, 1)
+        for (x1, y1, x2, y2), label, confidence in zip(boxes, labels, confidences):
+            draw_label(label, confidence, (x1, y1))
+    else:
+        for label, confidence in zip(labels, confidences):
+            draw_label(label, confidence, (0, int(vis.shape[0]*0.95)))
+    for x, y in result.get('landmarks', np.zeros((0, 2))).reshape(-1, 2):
+        cv2.circle(vis, (int(x), int(y)), radius=2, color=color_map[0], thickness=-1)
+    return vis
+
+
+def make_result(n=40, seed=0, size=(120, 160), grid=False):
+    rng = np.random.RandomState(seed)
+    if grid:
+        ## labels don't overlap each other, boxes overlap other boxes and labels
+        xy = np.stack(np.meshgrid([-20, 290, 600], np.arange(30, size[0], 60)), -1).reshape(-1, 2)
+        n = len(xy)
+    else:
+        ## boxes partly outside the image and overlapping each other
+        xy = rng.uniform(-30, size[1], (n, 2))
+    boxes = np.concatenate([xy, xy + rng.uniform(1, 200, (n, 2))], axis=1)
+    return dict(
+        bounding_box=boxes.astype(np.float32),
+        class_confidence=rng.uniform(0, 1, (n, 1)).astype(np.float32),
+        class_label=rng.randint(0, len(class_names), (n, 1)).astype(np.float32),
+        landmarks=rng.uniform(-5, size[1], (n, 4)).astype(np.float32),
+    )
+
+
+@pytest.mark.parametrize('names', [None, class_names])
+def test_draw_matches_cv2(names):
+    renderer = VisualRenderer(n_workers=2)
+    for seed in range(3):
+        for size, grid in [((120, 160), False), ((400, 640), True)]:
+            result = make_result(seed=seed, size=size, grid=grid)
+            expected = reference_draw(np.zeros(size + (3,), dtype=np.uint8), result, class_names=names)
+            vis = renderer.draw(result, np.zeros(size + (3,), dtype=np.uint8), class_names=names)
+            np.testing.assert_array_equal(vis, expected)
+
+    ## classification result, grayscale image
+    result = dict(class_label=np.array([[1.]]), class_confidence=np.array([[0.875]]))
+    expected = reference_draw(np.zeros((64, 400), dtype=np.uint8), result, class_names=names)
+    vis = Visual.draw(result, np.zeros((64, 400), dtype=np.uint8), class_names=names)
+    np.testing.assert_array_equal(vis, expected)
+
+
+def test_render_batch():
+    renderer = VisualRenderer(n_workers=3, max_sprites=8)
+    results = [make_result(seed=i, size=(400, 640), grid=True) for i in range(5)]
+    results.append(dict(bounding_box=None, class_confidence=None, class_label=None))
+    batch_vis = renderer.render([np.zeros((400, 640, 3), dtype=np.uint8) for _ in results], results,
+        class_names=class_names)
+    for vis, result in zip(batch_vis[:-1], results[:-1]):
+        expected = reference_draw(np.zeros_like(vis), result, class_names=class_names)
+        np.testing.assert_array_equal(vis, expected)
+    assert not batch_vis[-1].any()
+    assert len(renderer._sprites) <= 8
+    renderer.close()
+
+    batch_vis = Visual.visualize([np.zeros((400, 640, 3), dtype=np.uint8)], results[:1])
+    expected = reference_draw(np.zeros((400, 640, 3), dtype=np.uint8), results[0])
+    np.testing.assert_array_equal(batch_vis[0], expected)
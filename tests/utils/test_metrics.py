@@ -0,0 +1,209 @@
+import numpy as np
+import pytest
+import torch
+
+from sklearn.metrics import precision_recall_fscore_support, average_precision_score, roc_auc_score
+
+pytest.importorskip('pytorch_lightning.metrics')
+
+from vortex.development.utils.metrics import ClassificationMetrics, DetectionMetrics
+
+
+def make_predictions(n=2000, n_classes=7, n_bins=1000, seed=0):
+    rng = np.random.RandomState(seed)
+    targets = rng.randint(0, n_classes, n)
+    ## mostly correct, confidence at bin centers so histogram is exact
+    predictions = np.where(rng.rand(n) < 0.6, targets, rng.randint(0, n_classes, n))
+    confidences = (rng.randint(0, n_bins, n) + 0.5) / n_bins
+    inputs = torch.from_numpy(np.stack([predictions, confidences], 1)).float()
+    return inputs, torch.from_numpy(targets)
+
+
+def test_classification_metrics():
+    inputs, targets = make_predictions()
+    metric = ClassificationMetrics()
+    for i in range(0, len(targets), 300):
+        metric.update(inputs[i:i+300], targets[i:i+300])
+    assert metric.n_classes == 7
+
+    results = metric.compute()
+    y_true, y_pred = targets.numpy(), inputs[:,0].long().numpy()
+    assert results['accuracy'] == pytest.approx(np.mean(y_true == y_pred))
+    for avg in ('micro', 'macro', 'weighted'):
+        p, r, f1, _ = precision_recall_fscore_support(y_true, y_pred, average=avg)
+        assert results['precision ({})'.format(avg)] == pytest.approx(p)
+        assert results['recall ({})'.format(avg)] == pytest.approx(r)
+        assert results['f1_score ({})'.format(avg)] == pytest.approx(f1)
+
+    curves = metric.curves()
+    for c in range(metric.n_classes):
+        scores = np.where(y_pred == c, inputs[:,1].numpy(), 0.)
+        assert curves['average_precision'][c] == pytest.approx(average_precision_score(y_true == c, scores))
+        assert curves['roc_auc'][c] == pytest.approx(roc_auc_score(y_true == c, scores))
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="requires cuda")
+def test_classification_metrics_cuda(tmp_path):
+    inputs, targets = make_predictions()
+    expected = ClassificationMetrics()
+    expected.update(inputs, targets)
+    metric = ClassificationMetrics().cuda()
+    metric.update(inputs.cuda(), targets.cuda())
+    assert metric.confusion.is_cuda
+    for key, value in expected.curves().items():
+        np.testing.assert_allclose(metric.curves()[key], value)
+    assert metric.save_metrics(tmp_path)
+
+
+def test_classification_metrics_merge():
+    inputs, targets = make_predictions()
+    expected = ClassificationMetrics()
+    expected.update(inputs, targets)
+
+    ## workers see different classes, states are grown to the largest label
+    workers = [ClassificationMetrics(), ClassificationMetrics()]
+    low = torch.max(inputs[:,0].long(), targets) < 4
+    for worker, index in zip(workers, (low, ~low)):
+        worker.update(inputs[index], targets[index])
+    assert workers[0].n_classes == 4 and workers[1].n_classes == 7
+    merged = ClassificationMetrics().merge(*[worker.states() for worker in workers])
+    assert merged.compute() == expected.compute()
+    merged = workers[0].merge(workers[1])
+    assert merged.compute() == expected.compute()
+
+    merged.reset()
+    assert merged.confusion.sum() == 0
+    ## given class names, states are allocated up front
+    metric = ClassificationMetrics(class_names=['a', 'b', 'c'])
+    assert metric.n_classes == 3 and metric.confusion.shape == (3, 3)
+
+
+def reference_coco_eval(predictions, targets, n_classes, iou_thresholds, area_ranges, max_det=100):
+    """straightforward port of COCOeval (evaluateImg, accumulate), without crowd"""
+    def iou(a, b):
+        w = max(0., min(a[2], b[2]) - max(a[0], b[0]))
+        h = max(0., min(a[3], b[3]) - max(a[1], b[1]))
+        union = (a[2]-a[0])*(a[3]-a[1]) + (b[2]-b[0])*(b[3]-b[1]) - w*h
+        return w*h / union if union > 0 else 0.
+    area = lambda b: (b[2]-b[0])*(b[3]-b[1])
+    rec_thrs = np.linspace(0, 1, 101)
+    precision = -np.ones((len(iou_thresholds), 101, n_classes, len(area_ranges)))
+    for k in range(n_classes):
+        for a, (lo, hi) in enumerate(area_ranges):
+            evals = []
+            for dets, gts in zip(predictions, targets):
+                gt = [g for g in gts if g[4] == k]
+                dt = [d for d in dets if d[5] == k]
+                gt_ig = np.array([area(g) < lo or area(g) > hi for g in gt], dtype=bool)
+                gt = [gt[i] for i in np.argsort(gt_ig, kind='mergesort')]
+                gt_ig = np.sort(gt_ig, kind='mergesort')
+                dt = [dt[i] for i in np.argsort([-d[4] for d in dt], kind='mergesort')[:max_det]]
+                dtm = np.zeros((len(iou_thresholds), len(dt)))
+                dt_ig = np.zeros((len(iou_thresholds), len(dt)), dtype=bool)
+                gtm = np.zeros((len(iou_thresholds), len(gt)))
+                for t, thr in enumerate(iou_thresholds):
+                    for d, det in enumerate(dt):
+                        best, m = min(thr, 1 - 1e-10), -1
+                        for g, truth in enumerate(gt):
+                            if gtm[t, g] > 0:
+                                continue
+                            if m > -1 and not gt_ig[m] and gt_ig[g]:
+                                break
+                            if iou(det, truth) < best:
+                                continue
+                            best, m = iou(det, truth), g
+                        if m == -1:
+                            continue
+                        dt_ig[t, d] = gt_ig[m]
+                        dtm[t, d] = 1
+                        gtm[t, m] = 1
+                outside = np.array([area(d) < lo or area(d) > hi for d in dt], dtype=bool).reshape(1, -1)
+                dt_ig |= (dtm == 0) & outside
+                evals.append((np.array([d[4] for d in dt]), dtm, dt_ig, (~gt_ig).sum()))
+            npig = sum(e[3] for e in evals)
+            if npig == 0:
+                continue
+            scores = np.concatenate([e[0] for e in evals])
+            inds = np.argsort(-scores, kind='mergesort')
+            dtm = np.concatenate([e[1] for e in evals], axis=1)[:, inds]
+            dt_ig = np.concatenate([e[2] for e in evals], axis=1)[:, inds]
+            tps = np.cumsum((dtm > 0) & ~dt_ig, axis=1).astype(float)
+            fps = np.cumsum((dtm == 0) & ~dt_ig, axis=1).astype(float)
+            for t, (tp, fp) in enumerate(zip(tps, fps)):
+                rc = tp / npig
+                pr = list(tp / (fp + tp + np.spacing(1)))
+                for i in range(len(tp) - 1, 0, -1):
+                    pr[i-1] = max(pr[i-1], pr[i])
+                q = np.zeros(101)
+                for r, i in enumerate(np.searchsorted(rc, rec_thrs, side='left')):
+                    if i < len(pr):
+                        q[r] = pr[i]
+                precision[t, :, k, a] = q
+    return precision
+
+
+def make_detections(n_images=12, n_classes=4, size=200., seed=0):
+    rng = np.random.RandomState(seed)
+    predictions, targets = [], []
+    for _ in range(n_images):
+        n = rng.randint(0, 8)
+        xy = rng.uniform(0, size, (n, 2))
+        gts = np.concatenate([xy, xy + rng.uniform(2, size / 2, (n, 2)), rng.randint(0, n_classes, (n, 1))], 1)
+        ## jittered copies of ground truths, with some wrong labels, and random boxes
+        dets = np.repeat(gts, 2, axis=0)
+        dets[:,:4] += rng.normal(0, 4, (len(dets), 4))
+        dets[:,4] = np.where(rng.rand(len(dets)) < 0.2, rng.randint(0, n_classes, len(dets)), dets[:,4])
+        xy = rng.uniform(0, size, (5, 2))
+        noise = np.concatenate([xy, xy + rng.uniform(2, size / 2, (5, 2)), rng.randint(0, n_classes, (5, 1))], 1)
+        dets = np.concatenate([dets, noise])
+        predictions.append(dict(
+            bounding_box=dets[:,:4].astype(np.float32),
+            class_confidence=rng.uniform(0, 1, (len(dets), 1)).astype(np.float32),
+            class_label=dets[:,4:].astype(np.float32),
+        ))
+        targets.append(torch.from_numpy(gts))
+    return predictions, targets
+
+
+def test_detection_metrics():
+    predictions, targets = make_detections()
+    area_ranges = {'all': (0, 1e10), 'small': (0, 40 ** 2), 'medium': (40 ** 2, 80 ** 2), 'large': (80 ** 2, 1e10)}
+    metric = DetectionMetrics(area_ranges=area_ranges, max_detections=6)
+    for i in range(0, len(targets), 5):
+        metric.update(predictions[i:i+5], targets[i:i+5])
+    results = metric.accumulate()
+
+    dets = [np.concatenate([p['bounding_box'], p['class_confidence'], p['class_label']], 1).astype(np.float64)
+        for p in predictions]
+    expected = reference_coco_eval(dets, [t.numpy() for t in targets], metric.n_classes,
+        metric.iou_thresholds, list(area_ranges.values()), max_det=6)
+    np.testing.assert_allclose(results['precision'], expected)
+
+    metrics = metric.compute()
+    assert metrics['mAP'] == pytest.approx(np.mean(expected[..., 0][expected[..., 0] > -1]))
+    assert set(metrics) == {'mAP', 'mAP@0.5', 'mAP@0.75', 'mAP (small)', 'mAP (medium)', 'mAP (large)', 'mAR'}
+
+
+def test_detection_metrics_inputs():
+    predictions, targets = make_detections()
+    expected = DetectionMetrics()
+    expected.update(predictions, targets)
+
+    ## [n,6] predictions and padded [batch,m,5] targets, merged from two workers
+    arrays = [np.concatenate([p['bounding_box'], p['class_confidence'], p['class_label']], 1) for p in predictions]
+    padded = -np.ones((len(targets), max(len(t) for t in targets), 5))
+    for i, t in enumerate(targets):
+        padded[i, :len(t)] = t.numpy()
+    workers = [DetectionMetrics(), DetectionMetrics()]
+    workers[0].update(arrays[:6], torch.from_numpy(padded[:6]))
+    workers[1].update([torch.from_numpy(x) for x in arrays[6:]], padded[6:])
+    merged = DetectionMetrics().merge(workers[0].states(), workers[1].states())
+    assert merged.compute() == expected.compute()
+    assert workers[0].merge(workers[1]).compute() == expected.compute()
+
+    ## perfect predictions
+    metric = DetectionMetrics()
+    metric.update([np.concatenate([t[:,:4], np.ones((len(t), 1)), t[:,4:]], 1) for t in targets], targets)
+    assert metric.compute()['mAP'] == pytest.approx(1.)
+    metric.reset()
+    assert metric.compute()['mAP'] == -1
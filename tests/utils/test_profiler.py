@@ -0,0 +1,66 @@
+import pickle
+import threading
+import numpy as np
+import pytest
+
+from vortex.development.utils.profiler.speed import TimeData, TimeRecorder
+
+
+def test_time_recorder_quantile():
+    rng = np.random.RandomState(0)
+    samples = rng.lognormal(np.log(2e6), 1., 20000).astype(np.int64)
+    recorder = TimeRecorder(capacity=100)
+    for ns in samples:
+        recorder.record(ns)
+    q = np.arange(100) / 100.
+    expected = np.percentile(samples, q * 100)
+    np.testing.assert_allclose(recorder.quantile(q), expected, rtol=1e-2)
+    assert recorder.quantile(0.) == samples.min() and recorder.quantile(1.) == samples.max()
+    assert recorder.n_calls == len(samples) and recorder.total == samples.sum()
+    ## last samples in ring buffer
+    np.testing.assert_array_equal(recorder.samples(), samples[-100:])
+    ## exact for small values
+    small = TimeRecorder()
+    for ns in [3, 1, 2, 2]:
+        small.record(ns)
+    np.testing.assert_array_equal(small.quantile([0., 0.5, 1.]), [1, 2, 3])
+    assert np.isnan(TimeRecorder().quantile(0.5))
+
+
+def test_time_data_threads():
+    timer = TimeData('test', capacity=50)
+    def record(value):
+        for _ in range(1000):
+            timer.update(value * 1e-3)
+        with timer:
+            pass
+    threads = [threading.Thread(target=record, args=(i + 1,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(timer._recorders) == 4
+    assert timer.n_calls == 4004
+    assert timer.total_time == pytest.approx(10., rel=1e-3)
+    assert len(timer.data) == 50
+
+    ## merged with timer from other process
+    other = pickle.loads(pickle.dumps(timer))
+    assert other.n_calls == 4004
+    other.update(5e-3)
+    timer.merge(other)
+    assert timer.n_calls == 8009
+    report = timer.report()
+    assert report['mean'] == pytest.approx(timer.total_time / timer.n_calls)
+    assert report['median'] == pytest.approx(2.5e-3, rel=0.5)
+    np.testing.assert_allclose(report['quantile'], [1e-3, 3e-3], rtol=1e-2)
+    assert len(report['percentile']) == 100
+
+
+def test_time_data_plot(tmp_path):
+    timer = TimeData('runtime_call', capacity=20)
+    for i in range(30):
+        timer.update((i + 1) * 1e-3)
+    np.testing.assert_allclose(timer.data, np.arange(11, 31) * 1e-3)
+    outputs = timer.plot(tmp_path)
+    assert outputs['timedata'].exists()
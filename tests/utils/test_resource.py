@@ -0,0 +1,63 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import pytest
+
+from vortex.development.utils.profiler.resource import ResourceSampler, get_cpu_scaling, get_gpu_info
+
+pytestmark = pytest.mark.skipif(not os.path.exists('/proc/stat'), reason="requires procfs")
+
+
+def test_resource_sampler(tmp_path):
+    sampler = ResourceSampler(dt=0.01, overhead_budget=0., gpu=False)
+    sampler.start()
+    ## some work to sample
+    x = np.random.rand(512, 512)
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < 0.3:
+        x = x @ x.T / 512
+    sampler.stop()
+    assert not sampler.is_alive()
+    assert sampler.n_samples >= 5
+
+    results = sampler.report()
+    assert np.all(np.diff(results['time']) > 0)
+    assert np.all(results['rss'] > 0)
+    assert np.all(np.diff(results['ctx_voluntary']) >= 0)
+    assert results['cpu_percent'].shape == (sampler.n_samples, len(sampler.cpus))
+    assert results['gpu_utilization'].shape == (sampler.n_samples, 0)
+    assert np.nanmax(results['process_cpu']) > 0
+
+    filename = sampler.to_csv(tmp_path / 'resource.csv')
+    df = pd.read_csv(filename)
+    assert len(df) == sampler.n_samples
+    assert 'cpu_percent_{}'.format(sampler.cpus[0]) in df.columns
+    np.testing.assert_allclose(df['rss'], results['rss'])
+
+    outputs = sampler.plot(tmp_path)
+    assert {'cpu_percent', 'process', 'context_switches'} <= set(outputs)
+    assert all(path.exists() for path in outputs.values())
+
+
+def test_resource_sampler_bounded():
+    ## full buffer is decimated, interval doubled
+    sampler = ResourceSampler(dt=0.01, capacity=8, overhead_budget=0., gpu=False)
+    for _ in range(20):
+        sampler.sample()
+    assert sampler.n_samples == 7 and sampler.dt == pytest.approx(0.08)
+    assert np.all(np.diff(sampler.report()['time']) > 0)
+    sampler.stop()
+
+    ## sampling can't take 1e-9 of the interval, which is increased
+    sampler = ResourceSampler(dt=0.01, overhead_budget=1e-9, gpu=False)
+    sampler.start()
+    time.sleep(0.05)
+    sampler.stop()
+    assert sampler.dt > 0.01
+
+
+def test_system_info():
+    scaling = get_cpu_scaling()
+    assert isinstance(scaling, list) and all(isinstance(x, str) for x in scaling)
+    assert isinstance(get_gpu_info(), str)
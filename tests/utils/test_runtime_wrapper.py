@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import torch
+
+from torch.utils.data import DataLoader, TensorDataset
+
+pytest.importorskip('onnxruntime')
+pytest.importorskip('pytorch_lightning.metrics')
+
+from vortex.development.utils.runtime_wrapper import RuntimeWrapper, validate, get_metric_names
+
+from ..runtime.dummy_runtime import make_onnx_model
+
+
+def make_model(filename, metrics=('ClassificationMetrics',)):
+    import onnx
+    from vortex.runtime.onnx.graph_ops.embed_metadata import EmbedMetadata
+    make_onnx_model(filename)
+    model = EmbedMetadata.apply(onnx.load(str(filename)), key='vortex.metrics', value=list(metrics))
+    onnx.save(model, str(filename))
+    return filename
+
+
+def make_dataset(n=22, seed=0):
+    ## dummy model predicts mean of first channel as label, second channel as confidence
+    rng = np.random.RandomState(seed)
+    labels = rng.randint(0, 3, n)
+    predictions = np.where(rng.rand(n) < 0.7, labels, rng.randint(0, 3, n))
+    images = np.zeros((n, 8, 8, 3), dtype=np.uint8)
+    images[..., 0] = predictions[:, None, None]
+    images[..., 1] = 1
+    return TensorDataset(torch.from_numpy(images), torch.from_numpy(labels)), predictions, labels
+
+
+def test_runtime_wrapper(tmp_path):
+    path = make_model(tmp_path / 'model.onnx')
+    dataset, predictions, labels = make_dataset()
+    wrapper = RuntimeWrapper(str(path))
+    assert get_metric_names(wrapper.model) == ['ClassificationMetrics']
+    assert list(wrapper.metrics) == ['ClassificationMetrics']
+    ## class names from model
+    assert wrapper.metrics['ClassificationMetrics'].n_classes == 3
+    ## last batch is partial
+    for batch_idx, batch in enumerate(DataLoader(dataset, batch_size=4)):
+        wrapper.test_step(batch, batch_idx)
+    results = wrapper.metrics['ClassificationMetrics'].compute()
+    assert results['accuracy'] == pytest.approx(np.mean(predictions == labels))
+
+
+@pytest.mark.parametrize('n_workers', [1, 3])
+def test_validate(tmp_path, n_workers):
+    path = make_model(tmp_path / 'model.onnx', metrics=['ClassificationMetrics', 'ClassificationMetrics'])
+    dataset, predictions, labels = make_dataset()
+    wrapper = RuntimeWrapper(str(path))
+    for batch_idx, batch in enumerate(DataLoader(dataset, batch_size=4)):
+        wrapper.test_step(batch, batch_idx)
+    expected = wrapper.metrics['ClassificationMetrics']
+
+    metrics = validate(str(path), DataLoader(dataset, batch_size=4), n_workers=n_workers,
+        metric_args={'ClassificationMetrics': dict(n_bins=100)})
+    metric = metrics['ClassificationMetrics']
+    assert metric.n_bins == 100
+    assert metric.compute() == expected.compute()
+    assert torch.equal(metric.confusion, expected.confusion)